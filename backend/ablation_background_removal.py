@@ -11,6 +11,8 @@ so the thesis can include a concrete ablation table.
 Usage:
     cd backend
     python ablation_background_removal.py
+    python ablation_background_removal.py --no-cache   # re-run inference for both conditions
+    python ablation_background_removal.py --manifest splits.json   # test split of a manifest
 
 Requirements:
     pip install rembg onnxruntime     # for condition B
@@ -20,15 +22,24 @@ Outputs:
     - ablation_results.json  (machine-readable summary)
 
 Notes:
-    * If rembg is not installed, only condition A is evaluated and the
-      script prints a clear warning.
-    * Background removal is applied in memory; no files are written.
+    * Background-removal masks are computed once (in parallel, one rembg
+      session per worker process) and stored in a content-addressed cache
+      (``.cache/bg_removed``, see ``app/utils/bg_cache.py``).  Repeated
+      ablation runs only pay for classifier inference.
+    * Classifier outputs for both conditions go through the shared inference
+      cache (``.cache/inference``, see ``app/utils/inference_cache.py``), so
+      re-running with an unchanged checkpoint and test split skips inference
+      entirely; condition A is shared with evaluate.py / error_analysis.py.
+    * If rembg is not installed and the cache does not already cover the
+      test split, only condition A is evaluated and the script prints a
+      clear warning.
 """
 from __future__ import annotations
 
+import argparse
 import json
+import os
 import sys
-from io import BytesIO
 from pathlib import Path
 from typing import Any
 
@@ -38,6 +49,12 @@ import torch.nn as nn
 from PIL import Image
 from torch.utils.data import DataLoader, Dataset
 from torchvision import models, transforms
+from tqdm import tqdm
+
+from app.utils.bg_cache import BackgroundRemovalCache
+from app.utils.dataset_manifest import split_samples
+from app.utils.inference_cache import InferenceCache, collect_logits, transform_id
+from app.utils.metrics import compute_metrics
 
 # ---------------------------------------------------------------------------
 # Configuration (must match train.py)
@@ -47,6 +64,7 @@ MODEL_PATH = "models/cardamom_model.pt"
 NUM_CLASSES = 4
 IMG_SIZE = 224
 BATCH_SIZE = 16   # smaller batch for background-removal condition (CPU heavy)
+BG_WORKERS = max(1, (os.cpu_count() or 2) // 2)   # rembg processes when filling the cache
 
 DEVICE = torch.device(
     "cuda" if torch.cuda.is_available()
@@ -142,74 +160,26 @@ class RawTestDataset(Dataset):
 
 
 class BgRemovedTestDataset(Dataset):
-    """Loads test images and removes the background using rembg."""
+    """Loads test images with backgrounds removed via the on-disk mask cache."""
 
-    def __init__(self, samples, transform, remove_bg_fn):
+    def __init__(self, samples, transform, cache: BackgroundRemovalCache):
         self.samples = samples
         self.transform = transform
-        self._remove_bg = remove_bg_fn
+        self.cache = cache
 
     def __len__(self):
         return len(self.samples)
 
     def __getitem__(self, idx):
         path, label, _ = self.samples[idx]
-        with open(path, "rb") as fh:
-            raw_bytes = fh.read()
-        try:
-            out_bytes = self._remove_bg(raw_bytes)
-            image = Image.open(BytesIO(out_bytes)).convert("RGB")
-        except Exception:
-            # Fallback to original image on any rembg error
-            image = Image.open(path).convert("RGB")
+        # Falls back to the original image if rembg failed on this file
+        image = self.cache.loader(str(path))
         return self.transform(image), label
 
 # ---------------------------------------------------------------------------
 # Evaluation
 # ---------------------------------------------------------------------------
 
-def compute_metrics(y_true: np.ndarray, y_pred: np.ndarray,
-                    num_classes: int) -> dict[str, Any]:
-    cm = np.zeros((num_classes, num_classes), dtype=int)
-    for t, p in zip(y_true, y_pred):
-        cm[t, p] += 1
-
-    eps = 1e-12
-    precision, recall, f1 = [], [], []
-    for i in range(num_classes):
-        tp = cm[i, i]
-        fp = cm[:, i].sum() - tp
-        fn = cm[i, :].sum() - tp
-        p_i = tp / (tp + fp + eps)
-        r_i = tp / (tp + fn + eps)
-        f1_i = 2 * p_i * r_i / (p_i + r_i + eps)
-        precision.append(float(p_i))
-        recall.append(float(r_i))
-        f1.append(float(f1_i))
-
-    return {
-        "accuracy": float(cm.trace() / (cm.sum() + eps)),
-        "macro_precision": float(np.mean(precision)),
-        "macro_recall": float(np.mean(recall)),
-        "macro_f1": float(np.mean(f1)),
-        "per_class_precision": precision,
-        "per_class_recall": recall,
-        "per_class_f1": f1,
-        "confusion_matrix": cm.tolist(),
-    }
-
-
-def evaluate(model: nn.Module, loader: DataLoader) -> tuple[np.ndarray, np.ndarray]:
-    y_true, y_pred = [], []
-    with torch.no_grad():
-        for inputs, labels in loader:
-            inputs = inputs.to(DEVICE)
-            preds = model(inputs).argmax(dim=1).cpu().numpy()
-            y_pred.extend(preds.tolist())
-            y_true.extend(labels.numpy().tolist())
-    return np.array(y_true), np.array(y_pred)
-
-
 def print_metrics(label: str, metrics: dict, class_names: list[str]) -> None:
     print(f"\n  ── {label} ──")
     print(f"    Accuracy        : {metrics['accuracy']*100:.2f}%")
@@ -225,52 +195,88 @@ def print_metrics(label: str, metrics: dict, class_names: list[str]) -> None:
 # ---------------------------------------------------------------------------
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Background-removal ablation on the test split.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run inference instead of reusing cached model outputs")
+    parser.add_argument("--manifest", default=None,
+                        help="Use the test split of a manifest (split_dataset.py --manifest)")
+    args = parser.parse_args()
+    data = args.manifest or f"{DATASET_PATH}/test"
+
     print("\n" + "=" * 60)
     print("Background-Removal Ablation Study")
     print(f"Model  : EfficientNetV2-S")
     print(f"Device : {DEVICE}")
-    print(f"Data   : {DATASET_PATH}/test")
+    print(f"Data   : {data}")
     print("=" * 60)
 
-    model = load_model()
-    samples, class_names = _collect_test_samples(DATASET_PATH)
+    if not Path(MODEL_PATH).exists():
+        print(f"❌ Model not found: {Path(MODEL_PATH).absolute()}")
+        print("   Train the model first:  python train.py")
+        sys.exit(1)
+    if args.manifest:
+        samples, class_names = split_samples(args.manifest, "test")
+    else:
+        samples, class_names = _collect_test_samples(DATASET_PATH)
     print(f"\nTest samples: {len(samples)}")
     for cls in class_names:
         cnt = sum(1 for _, _, c in samples if c == cls)
         print(f"  {cls}: {cnt}")
 
     transform = get_eval_transform()
+    inference_cache = InferenceCache(enabled=not args.no_cache)
+    model: nn.Module | None = None
+
+    def cached_predictions(dataset: Dataset, tf_id: str) -> tuple[np.ndarray, np.ndarray]:
+        def compute():
+            nonlocal model
+            if model is None:
+                model = load_model()
+            loader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=False,
+                                num_workers=2, pin_memory=False)
+            return collect_logits(model, loader, DEVICE)
+
+        result = inference_cache.get_or_compute(MODEL_PATH, samples, tf_id, compute, class_names)
+        if result.cached:
+            print(f"    ✅ Reused cached model outputs ({result.key[:12]})")
+        return result.labels, result.preds
+
     results: dict[str, Any] = {
         "model": "EfficientNetV2-S",
-        "dataset": DATASET_PATH,
+        "dataset": args.manifest or DATASET_PATH,
         "classes": class_names,
     }
 
     # ── Condition A: Raw images ──────────────────────────────────────────────
     print("\n[A] Evaluating on raw images (no background removal)…")
     raw_ds = RawTestDataset(samples, transform)
-    raw_loader = DataLoader(raw_ds, batch_size=BATCH_SIZE, shuffle=False,
-                            num_workers=2, pin_memory=False)
-    y_true_a, y_pred_a = evaluate(model, raw_loader)
+    y_true_a, y_pred_a = cached_predictions(raw_ds, transform_id(transform))
     metrics_a = compute_metrics(y_true_a, y_pred_a, len(class_names))
     print_metrics("Condition A – Raw images", metrics_a, class_names)
     results["condition_A_raw"] = metrics_a
 
     # ── Condition B: Background-removed images ───────────────────────────────
+    cache = BackgroundRemovalCache()
+    paths = [p for p, _, _ in samples]
+    n_missing = len(cache.missing(paths))
     try:
-        from rembg import remove as rembg_remove
-    except ImportError:
-        print("\n⚠️  rembg is not installed – skipping condition B.")
-        print("   Install with:  pip install rembg onnxruntime")
+        if n_missing:
+            print(f"\n    Filling mask cache for {n_missing} images "
+                  f"({BG_WORKERS} workers) → {cache.root}")
+            print("    Note: First run downloads the ONNX model weights (~170 MB).")
+        with tqdm(total=n_missing, desc="    rembg", unit="img", disable=not n_missing) as bar:
+            failures = cache.ensure(paths, workers=BG_WORKERS, progress=bar.update)
+    except RuntimeError as exc:
+        print(f"\n⚠️  {exc}")
+        print("   Skipping condition B.")
         results["condition_B_bg_removed"] = None
     else:
+        for path, err in failures:
+            print(f"    ⚠️  rembg failed for {path}: {err} (using original image)")
         print("\n[B] Evaluating on background-removed images (rembg)…")
-        print("    Note: First run downloads the ONNX model weights (~170 MB).")
-        bg_ds = BgRemovedTestDataset(samples, transform, rembg_remove)
-        bg_loader = DataLoader(bg_ds, batch_size=BATCH_SIZE, shuffle=False,
-                               num_workers=0,   # rembg is not fork-safe
-                               pin_memory=False)
-        y_true_b, y_pred_b = evaluate(model, bg_loader)
+        bg_ds = BgRemovedTestDataset(samples, transform, cache)
+        y_true_b, y_pred_b = cached_predictions(
+            bg_ds, f"{transform_id(transform)}|bg-removed:{cache.model_name}")
         metrics_b = compute_metrics(y_true_b, y_pred_b, len(class_names))
         print_metrics("Condition B – Background removed", metrics_b, class_names)
         results["condition_B_bg_removed"] = metrics_b
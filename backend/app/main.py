@@ -10,11 +10,31 @@ POST /predict
     When include_severity=true is included in the form data the response also
     contains a Grad-CAM heatmap overlay and a heuristic severity estimate.
 
+    With CASCADE_MODEL_PATH set, a small model answers confident "Healthy"
+    predictions and everything else is escalated to the full model; the
+    response's ``stage`` field ("fast" / "full") records which one answered.
+    Grad-CAM always runs on the full model.
+
 POST /predict/batch
     Accepts up to 10 images and returns a list of predictions.
 
+POST /similar
+    Returns the prediction for one image plus the K most similar reference
+    leaves from the offline index named by SIMILARITY_INDEX_PATH (built by
+    build_similarity_index.py, see app/utils/similarity_index.py).  The query
+    embedding comes from the same forward pass as the prediction.  An index
+    built from a different checkpoint than the serving model, or with other
+    background handling than the server's (--bg-removed iff rembg is
+    installed), returns 409; startup warns about it.
+
 GET /health
-    Returns service health status, model load state, and device info.
+    Returns service health status, model load state, and device info, plus
+    the loaded model versions and their memory footprint.
+
+With MODELS_DIR set, models are served from a ModelRegistry (see
+app/models/registry.py) that hot-reloads new versions in the background;
+both predict endpoints accept an optional ``model_version`` form field to pin
+one of the loaded versions.
 """
 
 from __future__ import annotations
@@ -26,7 +46,6 @@ import logging
 import os
 import time
 from contextlib import asynccontextmanager
-from pathlib import Path
 from typing import Annotated, AsyncGenerator, List, Optional
 
 import numpy as np
@@ -38,13 +57,22 @@ from PIL import Image
 from pydantic import BaseModel, Field
 
 from .models.classifier import (
+    DEFAULT_CASCADE_ARCHITECTURE,
+    DEFAULT_CASCADE_THRESHOLD,
     DEFAULT_CONFIDENCE_THRESHOLD,
     DEFAULT_TOP_K,
     DEFAULT_USE_TTA,
     DiseaseClassifier,
     PredictionResult,
+    load_model_metadata,
 )
-from .models.u2net_segmenter import U2NetSegmenter
+from .models.registry import (
+    DEFAULT_MAX_LOADED,
+    DEFAULT_POLL_INTERVAL,
+    ModelRegistry,
+    classifier_memory_bytes,
+)
+from .models.u2net_segmenter import SegmentationResult, U2NetSegmenter
 from .utils.grad_cam import generate_gradcam_heatmap
 from .utils.image_preprocess import preprocess_image
 from .utils.overlay import overlay_and_encode
@@ -54,6 +82,7 @@ from .utils.severity import (
     get_heatmap_threshold,
     get_stage_thresholds,
 )
+from .utils.similarity_index import SimilarityIndex, load_index
 
 # ---------------------------------------------------------------------------
 # Logging
@@ -83,6 +112,7 @@ def _log_prediction(
     latency_ms: float,
     use_tta: bool,
     cam_method: str,
+    stage: str = "full",
 ) -> None:
     record = {
         "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
@@ -93,6 +123,7 @@ def _log_prediction(
         "severity": include_severity,
         "tta": use_tta,
         "cam": cam_method,
+        "stage": stage,
         "latency_ms": round(latency_ms, 1),
     }
     _pred_logger.info(json.dumps(record, ensure_ascii=False))
@@ -112,11 +143,16 @@ def _log_prediction(
 _classifier: DiseaseClassifier | None = None
 _segmenter: U2NetSegmenter | None = None
 _model_metadata: dict = {}
+_registry: ModelRegistry | None = None
+_similarity_index: SimilarityIndex | None = None
+
+DEFAULT_SIMILAR_K = 5
+MAX_SIMILAR_K = 50
 
 
 @asynccontextmanager
 async def lifespan(application: FastAPI) -> AsyncGenerator[None, None]:
-    global _classifier, _segmenter, _model_metadata
+    global _classifier, _segmenter, _model_metadata, _registry, _similarity_index
 
     print("=" * 60)
     print("  Cardamom Leaf Disease Detection API – Starting up")
@@ -137,30 +173,84 @@ async def lifespan(application: FastAPI) -> AsyncGenerator[None, None]:
     )
     top_k = int(os.environ.get("TOP_K", DEFAULT_TOP_K))
 
-    _classifier = DiseaseClassifier(
-        model_path=model_path,
-        confidence_threshold=confidence_threshold,
-        top_k=top_k,
-    )
-    print(f"  ✓   Classifier ready  (threshold={confidence_threshold}, top_k={top_k})")
-
-    # Load or build model metadata
-    meta_path = Path(model_path).with_suffix(".json")
-    if meta_path.exists():
-        with open(meta_path) as f:
-            _model_metadata = json.load(f)
-        print(f"  ✓   Model metadata loaded from {meta_path}")
+    # Optional two-stage cascade: a small model answers confident "Healthy".
+    cascade_path = os.environ.get("CASCADE_MODEL_PATH") or None
+    cascade_threshold = float(os.environ.get("CASCADE_THRESHOLD", DEFAULT_CASCADE_THRESHOLD))
+    cascade_architecture = DEFAULT_CASCADE_ARCHITECTURE
+    if cascade_path:
+        cascade_meta = load_model_metadata(cascade_path) or {}
+        cascade_architecture = cascade_meta.get("architecture", DEFAULT_CASCADE_ARCHITECTURE)
+
+    def build_classifier(path: str, metadata: dict) -> DiseaseClassifier:
+        return DiseaseClassifier(
+            model_path=path,
+            confidence_threshold=confidence_threshold,
+            top_k=top_k,
+            architecture=metadata.get("architecture", "efficientnet_v2_s"),
+            cascade_model_path=cascade_path,
+            cascade_threshold=cascade_threshold,
+            cascade_architecture=cascade_architecture,
+            temperature=float(metadata.get("temperature", 1.0)),
+            # Only trust a temperature fitted on this very checkpoint.
+            calibration_sha256=(metadata.get("calibration") or {}).get("checkpoint_sha256", ""),
+        )
+
+    models_dir = os.environ.get("MODELS_DIR")
+    if models_dir:
+        _registry = ModelRegistry(
+            models_dir,
+            build_classifier,
+            default_version=os.environ.get("MODEL_VERSION") or None,
+            poll_interval=float(os.environ.get("MODEL_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)),
+            max_loaded=int(os.environ.get("MAX_LOADED_MODELS", DEFAULT_MAX_LOADED)),
+        )
+        _registry.refresh()
+        _registry.start()
+        loaded = sorted(e.version for e in _registry.entries())
+        print(f"  ✓   Model registry on {models_dir}  (active={_registry.active_version}, "
+              f"loaded={loaded}, poll={_registry.poll_interval:.0f}s)")
     else:
-        _model_metadata = {
-            "model_path": model_path,
-            "model_loaded": os.path.isfile(model_path),
-            "note": "No model_metadata.json found alongside checkpoint.",
-        }
+        # Metadata comes first: it names the architecture of the checkpoint.
+        metadata = load_model_metadata(model_path)
+        if metadata is not None:
+            _model_metadata = metadata
+            print(f"  ✓   Model metadata loaded from {metadata['metadata_path']}")
+        else:
+            _model_metadata = {
+                "model_path": model_path,
+                "model_loaded": os.path.isfile(model_path),
+                "note": "No model_metadata.json found alongside checkpoint.",
+            }
+        _classifier = build_classifier(model_path, _model_metadata)
+        print(
+            f"  ✓   Classifier ready  (threshold={confidence_threshold}, top_k={top_k}, "
+            f"precision={_classifier.precision}, architecture={_classifier.architecture}, "
+            f"temperature={_classifier.temperature:g})"
+        )
+    if cascade_path:
+        print(f"  ✓   Cascade: {cascade_architecture} first  (threshold={cascade_threshold})")
+
+    index_path = os.environ.get("SIMILARITY_INDEX_PATH") or None
+    if index_path:
+        try:
+            _similarity_index = load_index(index_path)
+            print(f"  ✓   Similarity index: {_similarity_index.kind}, {len(_similarity_index)} "
+                  f"reference images, layer={_similarity_index.layer}")
+            active = _registry.get() if _registry is not None else None
+            serving = active.classifier if active is not None else _classifier
+            reason = _index_mismatch(_similarity_index, serving, _segmenter) if serving else None
+            if reason:
+                print(f"  ⚠️   {reason}  (/similar will return 409)")
+        except (FileNotFoundError, ValueError) as exc:
+            print(f"  ⚠️   Similarity index disabled: {exc}")
 
     print("=" * 60)
 
     yield
 
+    if _registry is not None:
+        _registry.stop()
+
 
 # ---------------------------------------------------------------------------
 # App
@@ -270,6 +360,31 @@ class PredictResponse(BaseModel):
     model_version: Optional[str] = Field(
         None, description="Model version tag from model_metadata.json, if available."
     )
+    stage: str = Field(
+        "full",
+        description='Model that answered: "fast" (cascade model) or "full".',
+    )
+
+
+class SimilarLeaf(BaseModel):
+    path: str = Field(..., description="Reference image path, relative to the indexed dataset.")
+    class_name: str
+    similarity: float = Field(..., description="Cosine similarity of the embeddings (approximate for ivfpq).")
+
+
+class SimilarResponse(BaseModel):
+    prediction: PredictResponse
+    neighbors: list[SimilarLeaf] = Field(..., description="Most similar reference leaves, best first.")
+    index_kind: str = Field(..., description='"exact" or "ivfpq".')
+    embedding_layer: str = Field(..., description='"pooled" (trunk features) or "head".')
+
+
+class ModelVersionInfo(BaseModel):
+    version: Optional[str] = None
+    architecture: Optional[str] = None
+    active: bool = False
+    memory_mb: Optional[float] = None
+    loaded_at: Optional[float] = None
 
 
 class HealthResponse(BaseModel):
@@ -279,6 +394,10 @@ class HealthResponse(BaseModel):
     device: str
     model_version: Optional[str] = None
     model_accuracy: Optional[float] = None
+    model_architecture: Optional[str] = None
+    cascade_enabled: bool = False
+    precision: Optional[str] = None
+    loaded_versions: list[ModelVersionInfo] = []
 
 
 # ---------------------------------------------------------------------------
@@ -341,12 +460,40 @@ def _check_image_quality(image: Image.Image) -> None:
 # ---------------------------------------------------------------------------
 
 
+def _resolve_model(model_version: Optional[str]) -> tuple[DiseaseClassifier, dict]:
+    """Classifier and metadata serving this request (pinned version or active).
+
+    The pair is resolved once per request; a registry swap while the request
+    runs does not affect it.
+    """
+    if _registry is not None:
+        entry = _registry.get(model_version)
+        if entry is None:
+            if model_version:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Model version '{model_version}' is not loaded.",
+                )
+            raise HTTPException(status_code=503, detail="Model not loaded yet.")
+        return entry.classifier, entry.metadata
+
+    if _classifier is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet.")
+    if model_version and model_version != _model_metadata.get("version"):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Model version '{model_version}' is not loaded.",
+        )
+    return _classifier, _model_metadata
+
+
 def _prediction_to_response(
     result: PredictionResult,
     threshold: float,
     heatmap_b64: Optional[str] = None,
     severity: Optional[SeverityResult] = None,
     cam_method: str = "none",
+    model_version: Optional[str] = None,
 ) -> PredictResponse:
     return PredictResponse(
         top_class=result.top_class,
@@ -367,7 +514,88 @@ def _prediction_to_response(
         severity_percent=severity.severity_percent if severity else None,
         severity_method=severity.severity_method if severity else "none",
         cam_method=cam_method,
-        model_version=_model_metadata.get("version"),
+        model_version=model_version,
+        stage=result.stage,
+    )
+
+
+def _index_mismatch(
+    index: SimilarityIndex,
+    classifier: DiseaseClassifier,
+    segmenter: Optional[U2NetSegmenter],
+) -> Optional[str]:
+    """Why *index* cannot serve queries embedded by *classifier*, or None.
+
+    Embedding size alone does not catch a retrain or registry swap with the
+    same architecture, nor references embedded with different background
+    handling than the query; neighbours would then come from a foreign
+    embedding space.  Indexes without the fields (built elsewhere) are not
+    checked.
+    """
+    for key, served in (
+        ("model_sha256", getattr(classifier, "checkpoint_sha256", None)),
+        ("architecture", getattr(classifier, "architecture", None)),
+    ):
+        expected = index.meta.get(key)
+        if expected and served and expected != served:
+            return (f"Similarity index was built with {key} {str(expected)[:12]} but the "
+                    f"served model has {str(served)[:12]}; rebuild it for this model.")
+    bg_removed = index.meta.get("bg_removed")
+    segmenting = segmenter is not None and segmenter.enabled
+    if bg_removed is not None and bool(bg_removed) != segmenting:
+        return (f"Similarity index was built {'with' if bg_removed else 'without'} background "
+                f"removal but queries are {'' if segmenting else 'not '}segmented; rebuild it "
+                f"{'with' if segmenting else 'without'} --bg-removed.")
+    return None
+
+
+def _check_index_model(
+    index: SimilarityIndex,
+    classifier: DiseaseClassifier,
+    segmenter: Optional[U2NetSegmenter],
+) -> None:
+    """Raise 409 if *index* does not match the serving model and preprocessing."""
+    reason = _index_mismatch(index, classifier, segmenter)
+    if reason is not None:
+        raise HTTPException(status_code=409, detail=reason)
+
+
+def _run_similar_sync(
+    image: Image.Image,
+    classifier: DiseaseClassifier,
+    segmenter: Optional[U2NetSegmenter],
+    index: SimilarityIndex,
+    confidence_threshold: float,
+    k: int,
+    model_version: Optional[str] = None,
+) -> SimilarResponse:
+    """Blocking prediction + retrieval – runs in a thread-pool worker."""
+    if segmenter is not None:
+        image = segmenter.segment(image).image
+
+    classifier.confidence_threshold = float(confidence_threshold)
+    result, embedding = classifier.predict_with_embedding(image, index.layer)
+    if embedding.shape[-1] != index.dim:
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                f"Similarity index expects {index.dim}-d '{index.layer}' embeddings but the "
+                f"model produced {embedding.shape[-1]}-d; rebuild it for this model."
+            ),
+        )
+
+    return SimilarResponse(
+        prediction=_prediction_to_response(
+            result=result,
+            threshold=float(confidence_threshold),
+            model_version=model_version,
+        ),
+        neighbors=[
+            SimilarLeaf(path=n.path, class_name=n.class_name, similarity=round(n.score, 4))
+            for n in index.neighbors(embedding, k)
+        ],
+        index_kind=index.kind,
+        embedding_layer=index.layer,
     )
 
 
@@ -397,10 +625,16 @@ def _run_predict_sync(
     severity_heatmap_threshold: Optional[float],
     use_tta: bool,
     cam_method: str,
+    model_version: Optional[str] = None,
 ) -> PredictResponse:
     """Blocking inference – runs in a thread-pool worker."""
+    # Per-request context: the leaf mask from background removal is kept so
+    # severity can be measured over leaf pixels without re-segmenting.
     if segmenter is not None:
-        image = segmenter.remove_background(image)
+        seg = segmenter.segment(image)
+    else:
+        seg = SegmentationResult(image=image, mask=None)
+    image = seg.image
 
     classifier.confidence_threshold = float(confidence_threshold)
     classifier.top_k = min(int(top_k), 10)
@@ -454,6 +688,7 @@ def _run_predict_sync(
             heatmap_np,
             threshold=ht,
             thresholds=get_stage_thresholds(),
+            leaf_mask=seg.mask,
         )
 
     return _prediction_to_response(
@@ -462,6 +697,7 @@ def _run_predict_sync(
         heatmap_b64=heatmap_b64,
         severity=severity,
         cam_method=cam_method if include_severity else "none",
+        model_version=model_version,
     )
 
 
@@ -474,19 +710,44 @@ def _run_predict_sync(
 async def health() -> HealthResponse:
     from .models.classifier import CLASS_NAMES as _cls
 
-    loaded = _classifier is not None
+    classifier, metadata = _classifier, _model_metadata
+    versions: list[ModelVersionInfo] = []
+    if _registry is not None:
+        active = _registry.get()
+        classifier, metadata = (active.classifier, active.metadata) if active else (None, {})
+        for entry in sorted(_registry.entries(), key=lambda e: e.version):
+            versions.append(ModelVersionInfo(
+                version=entry.version,
+                architecture=entry.metadata.get("architecture", "efficientnet_v2_s"),
+                active=entry is active,
+                memory_mb=round(entry.memory_bytes / 2**20, 1),
+                loaded_at=entry.loaded_at,
+            ))
+    elif isinstance(classifier, DiseaseClassifier):
+        versions.append(ModelVersionInfo(
+            version=metadata.get("version"),
+            architecture=classifier.architecture,
+            active=True,
+            memory_mb=round(classifier_memory_bytes(classifier) / 2**20, 1),
+        ))
+
+    loaded = classifier is not None
     try:
-        device_str = str(_classifier.device) if _classifier else "cpu"
+        device_str = str(classifier.device) if classifier else "cpu"
     except Exception:
         device_str = "cpu"
 
     return HealthResponse(
         status="ok",
         model_loaded=loaded,
-        model_classes=_model_metadata.get("class_names", _cls),
+        model_classes=metadata.get("class_names", _cls),
         device=device_str,
-        model_version=_model_metadata.get("version"),
-        model_accuracy=_model_metadata.get("test_accuracy"),
+        model_version=metadata.get("version"),
+        model_accuracy=metadata.get("test_accuracy"),
+        model_architecture=getattr(classifier, "architecture", None),
+        cascade_enabled=bool(getattr(classifier, "cascade_enabled", False)),
+        precision=getattr(classifier, "precision", None),
+        loaded_versions=versions,
     )
 
 
@@ -533,11 +794,14 @@ async def predict(
         "gradcam",
         description='CAM method to use when include_severity=true. "gradcam" or "gradcam++".',
     ),
+    model_version: Optional[str] = Form(
+        None,
+        description="Pin one of the loaded model versions (see /health). Defaults to the active one.",
+    ),
 ) -> PredictResponse:
     await _check_api_key(request)
 
-    if _classifier is None:
-        raise HTTPException(status_code=503, detail="Model not loaded yet.")
+    classifier, metadata = _resolve_model(model_version)
 
     if file.content_type not in ("image/jpeg", "image/png", "image/webp"):
         raise HTTPException(
@@ -564,7 +828,7 @@ async def predict(
     response: PredictResponse = await asyncio.to_thread(
         _run_predict_sync,
         image,
-        _classifier,
+        classifier,
         _segmenter,
         confidence_threshold,
         top_k,
@@ -572,6 +836,7 @@ async def predict(
         severity_heatmap_threshold,
         use_tta,
         cam_method,
+        metadata.get("version"),
     )
 
     latency_ms = (time.perf_counter() - t0) * 1000
@@ -584,6 +849,7 @@ async def predict(
         latency_ms=latency_ms,
         use_tta=use_tta,
         cam_method=cam_method,
+        stage=response.stage,
     )
 
     return response
@@ -598,6 +864,7 @@ async def predict_batch(
     include_severity: bool = Form(False),
     use_tta: bool = Form(DEFAULT_USE_TTA),
     cam_method: str = Form("gradcam"),
+    model_version: Optional[str] = Form(None),
 ) -> List[PredictResponse]:
     """Run prediction on up to 10 images in a single call.
 
@@ -606,8 +873,8 @@ async def predict_batch(
     """
     await _check_api_key(request)
 
-    if _classifier is None:
-        raise HTTPException(status_code=503, detail="Model not loaded yet.")
+    # One model for the whole batch, even if a new version is swapped in.
+    classifier, metadata = _resolve_model(model_version)
 
     if len(files) > 10:
         raise HTTPException(status_code=400, detail="Batch size limit is 10 images.")
@@ -641,7 +908,7 @@ async def predict_batch(
         response: PredictResponse = await asyncio.to_thread(
             _run_predict_sync,
             image,
-            _classifier,
+            classifier,
             _segmenter,
             confidence_threshold,
             top_k,
@@ -649,6 +916,7 @@ async def predict_batch(
             None,  # severity_heatmap_threshold
             use_tta,
             cam_method,
+            metadata.get("version"),
         )
         latency_ms = (time.perf_counter() - t0) * 1000
         _log_prediction(
@@ -660,7 +928,64 @@ async def predict_batch(
             latency_ms=latency_ms,
             use_tta=use_tta,
             cam_method=cam_method,
+            stage=response.stage,
         )
         results.append(response)
 
     return results
+
+
+@app.post("/similar", response_model=SimilarResponse)
+async def similar(
+    request: Request,
+    file: Annotated[UploadFile, File(description="Leaf image (JPEG/PNG/WebP)")],
+    k: int = Form(
+        DEFAULT_SIMILAR_K,
+        ge=1,
+        le=MAX_SIMILAR_K,
+        description="Number of similar reference leaves to return.",
+    ),
+    confidence_threshold: float = Form(DEFAULT_CONFIDENCE_THRESHOLD, ge=0.0, le=1.0),
+    model_version: Optional[str] = Form(None),
+) -> SimilarResponse:
+    """Predict one image and return the K most similar labelled reference leaves.
+
+    Lets agronomists check a prediction against known examples.  The
+    embedding is taken from the prediction's own forward pass, so the only
+    extra work is the index lookup.
+    """
+    await _check_api_key(request)
+
+    classifier, metadata = _resolve_model(model_version)
+    index = _similarity_index
+    if index is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Similarity index not loaded (set SIMILARITY_INDEX_PATH).",
+        )
+    _check_index_model(index, classifier, _segmenter)
+
+    if file.content_type not in ("image/jpeg", "image/png", "image/webp"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type '{file.content_type}'. Use JPEG/PNG/WebP.",
+        )
+
+    raw = await file.read()
+    try:
+        image = Image.open(io.BytesIO(raw)).convert("RGB")
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"Cannot read image: {exc}") from exc
+
+    _check_image_quality(image)
+
+    return await asyncio.to_thread(
+        _run_similar_sync,
+        image,
+        classifier,
+        _segmenter,
+        index,
+        confidence_threshold,
+        k,
+        metadata.get("version"),
+    )
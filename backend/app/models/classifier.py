@@ -16,13 +16,62 @@ Inference contract
 - ``is_uncertain``   – ``True`` when the prediction is below the threshold.
 - ``top_k``          – list of (class_name, probability) for the K most
                        probable classes (default K=3).
+
+Architectures
+-------------
+``architecture`` selects the network the checkpoint was trained with:
+``efficientnet_v2_s`` (default, ``train.py``) or ``mobilenet_v3_small`` (the
+distilled student written by ``distill.py``).  The serving app reads it from
+the checkpoint's metadata file (see :func:`load_model_metadata`).
+
+Cascade
+-------
+With ``cascade_model_path`` set, a small fast model (``cascade_architecture``,
+MobileNetV3-Small by default) classifies every image first.  Its answer is
+kept only when it predicts one of ``cascade_accept_classes`` (``Healthy`` by
+default – the bulk of the traffic) with probability ≥ ``cascade_threshold``;
+low-confidence or disease predictions are escalated to the full model (with
+TTA when requested).  ``PredictionResult.stage`` records which model answered:
+``"fast"`` or ``"full"``.
+
+Embeddings
+----------
+:meth:`DiseaseClassifier.forward_features` returns, from one forward pass of
+the full model, the class probabilities together with two embeddings:
+``"pooled"`` – the globally average-pooled trunk features (1280-d for
+EfficientNetV2-S) – and ``"head"`` – the input of the final linear layer
+(the 512-d ReLU activation of the EfficientNetV2-S head).
+:meth:`DiseaseClassifier.predict_with_embedding` is the single-image form
+used by the ``/similar`` endpoint (see :mod:`app.utils.similarity_index`).
+``checkpoint_sha256`` (hashed once at load) identifies the weights an index
+was built from, so the endpoint can refuse an index from another model.
+
+Temperature scaling
+-------------------
+``temperature`` (the ``"temperature"`` key written to the metadata file by
+``calibrate.py``) divides the full model's logits before the softmax.  It is
+folded into the weights and bias of the final linear layer at load time, so
+calibrated probabilities cost nothing extra per request.  ``1.0`` (the
+default) leaves the checkpoint untouched.  ``calibration_sha256`` is the
+checkpoint hash recorded by ``calibrate.py``; when given and different from
+the loaded checkpoint (e.g. after a retrain), the stale temperature is
+ignored with a warning.
+
+CPU precision
+-------------
+``precision`` (or the ``CPU_PRECISION`` env var) selects ``fp32`` (default),
+``bf16`` or ``auto``.  In bf16 mode the model runs channels_last under
+``torch.autocast("cpu", dtype=torch.bfloat16)``; CPUs without native bf16
+support fall back to fp32 (see :mod:`app.utils.cpu_precision`).
 """
 
 from __future__ import annotations
 
+import json
 import logging
 import os
 from dataclasses import dataclass, field
+from pathlib import Path
 
 import numpy as np
 import torch
@@ -30,6 +79,14 @@ import torch.nn.functional as F
 from PIL import Image
 from torchvision import models, transforms
 
+from ..utils.cpu_precision import (
+    autocast_context,
+    prepare_input,
+    prepare_model,
+    resolve_cpu_precision,
+)
+from ..utils.hashing import file_sha256
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -44,9 +101,20 @@ CLASS_NAMES: list[str] = [
     "Phyllosticta Leaf Spot",
 ]
 
+ARCHITECTURES: tuple[str, ...] = ("efficientnet_v2_s", "mobilenet_v3_small")
+DEFAULT_ARCHITECTURE: str = "efficientnet_v2_s"
+METADATA_FILENAME: str = "model_metadata.json"
+
+DEFAULT_CASCADE_ARCHITECTURE: str = "mobilenet_v3_small"
+DEFAULT_CASCADE_THRESHOLD: float = 0.90
+DEFAULT_CASCADE_ACCEPT_CLASSES: tuple[str, ...] = ("Healthy",)
+
 DEFAULT_CONFIDENCE_THRESHOLD: float = 0.60
 DEFAULT_TOP_K: int = 3
 
+EMBEDDING_LAYERS: tuple[str, ...] = ("pooled", "head")
+DEFAULT_EMBEDDING_LAYER: str = "pooled"
+
 _IMAGENET_MEAN = [0.485, 0.456, 0.406]
 _IMAGENET_STD = [0.229, 0.224, 0.225]
 
@@ -76,6 +144,7 @@ class PredictionResult:
     top_probability: float  # 0–1
     is_uncertain: bool
     top_k: list[TopKPrediction] = field(default_factory=list)
+    stage: str = "full"  # "fast" when the cascade model answered
 
 
 # ---------------------------------------------------------------------------
@@ -93,13 +162,90 @@ _preprocess = transforms.Compose(
 )
 
 
+def preprocess(image: Image.Image) -> torch.Tensor:
+    """Return the normalised ``(3, 224, 224)`` model input for *image*.
+
+    Picklable and thread-safe, so DataLoader workers can run it for
+    :meth:`DiseaseClassifier.predict_proba_batch`.
+    """
+    return _preprocess(image.convert("RGB"))
+
+
+# ---------------------------------------------------------------------------
+# Model construction
+# ---------------------------------------------------------------------------
+
+
+def build_architecture(architecture: str = DEFAULT_ARCHITECTURE) -> torch.nn.Module:
+    """Return an untrained network of *architecture* with a CLASS_NAMES head.
+
+    The heads must match the training scripts: ``train.py`` for
+    EfficientNetV2-S, ``distill.py`` / ``baseline_comparison.py`` for
+    MobileNetV3-Small.
+
+    Raises:
+        ValueError: for an architecture not in :data:`ARCHITECTURES`.
+    """
+    if architecture == "efficientnet_v2_s":
+        model = models.efficientnet_v2_s(weights=None)
+        num_features = model.classifier[1].in_features
+        model.classifier = torch.nn.Sequential(
+            torch.nn.Dropout(p=0.3),
+            torch.nn.Linear(num_features, 512),
+            torch.nn.ReLU(),
+            torch.nn.Dropout(p=0.2),
+            torch.nn.Linear(512, len(CLASS_NAMES)),
+        )
+        return model
+    if architecture == "mobilenet_v3_small":
+        model = models.mobilenet_v3_small(weights=None)
+        model.classifier[-1] = torch.nn.Linear(model.classifier[-1].in_features, len(CLASS_NAMES))
+        return model
+    raise ValueError(f"Unknown architecture {architecture!r}; expected one of {ARCHITECTURES}")
+
+
+def fold_temperature(model: torch.nn.Module, temperature: float) -> torch.nn.Module:
+    """Scale the final linear layer of *model* by ``1 / temperature`` in place.
+
+    ``softmax((W x + b) / T)`` equals ``softmax((W / T) x + b / T)``, so the
+    calibrated model is exactly as fast as the uncalibrated one.
+    """
+    head = model.classifier[-1]
+    with torch.no_grad():
+        head.weight.div_(temperature)
+        if head.bias is not None:
+            head.bias.div_(temperature)
+    return model
+
+
+def load_model_metadata(model_path: str) -> dict | None:
+    """Return the metadata stored next to *model_path*, if any.
+
+    ``<checkpoint stem>.json`` is preferred so several checkpoints can share a
+    directory; ``model_metadata.json`` in the same directory is the fallback.
+    """
+    path = Path(model_path)
+    for candidate in (path.with_suffix(".json"), path.parent / METADATA_FILENAME):
+        if candidate.is_file():
+            with open(candidate, encoding="utf-8") as fh:
+                metadata = json.load(fh)
+            metadata.setdefault("metadata_path", str(candidate))
+            return metadata
+    return None
+
+
 # ---------------------------------------------------------------------------
 # Classifier
 # ---------------------------------------------------------------------------
 
 
 class DiseaseClassifier:
-    """EfficientNetV2-S disease classifier with top-k and uncertainty output."""
+    """Disease classifier with top-k and uncertainty output.
+
+    EfficientNetV2-S by default; pass ``architecture="mobilenet_v3_small"``
+    for a distilled student checkpoint.  ``cascade_model_path`` enables the
+    two-stage cascade described in the module docstring.
+    """
 
     def __init__(
         self,
@@ -107,8 +253,20 @@ class DiseaseClassifier:
         confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD,
         top_k: int = DEFAULT_TOP_K,
         device: str | None = None,
+        precision: str | None = None,
+        architecture: str = DEFAULT_ARCHITECTURE,
+        cascade_model_path: str | None = None,
+        cascade_threshold: float = DEFAULT_CASCADE_THRESHOLD,
+        cascade_architecture: str = DEFAULT_CASCADE_ARCHITECTURE,
+        cascade_accept_classes: tuple[str, ...] = DEFAULT_CASCADE_ACCEPT_CLASSES,
+        temperature: float = 1.0,
+        calibration_sha256: str | None = None,
     ) -> None:
+        if temperature <= 0:
+            raise ValueError(f"temperature must be positive, got {temperature}")
+        self.architecture = architecture
         self.confidence_threshold = confidence_threshold
+        self.temperature = float(temperature)
         self.top_k = min(top_k, len(CLASS_NAMES))
         self.device = torch.device(
             device if device else ("cuda" if torch.cuda.is_available() else "cpu")
@@ -116,8 +274,12 @@ class DiseaseClassifier:
 
         self._model = self._build_model()
 
+        self.weights_loaded = False
+        self.checkpoint_sha256: str | None = None
         if model_path and os.path.isfile(model_path):
-            self._load_weights(model_path)
+            self.weights_loaded = self._load_weights(model_path)
+            if self.weights_loaded:
+                self.checkpoint_sha256 = file_sha256(model_path)
         else:
             if model_path:
                 logger.warning(
@@ -131,69 +293,74 @@ class DiseaseClassifier:
                     "Using untrained weights – predictions will be random."
                 )
 
+        if (self.temperature != 1.0 and calibration_sha256 is not None
+                and calibration_sha256 != self.checkpoint_sha256):
+            logger.warning(
+                "⚠️  Temperature %g was fitted on a different checkpoint – ignoring it "
+                "(T=1.0). Re-run calibrate.py for '%s'.",
+                self.temperature, model_path,
+            )
+            self.temperature = 1.0
+        if self.temperature != 1.0:
+            fold_temperature(self._model, self.temperature)
+
         self._model.eval()
         self._model.to(self.device)
 
+        self.precision = resolve_cpu_precision(precision, self.device)
+        self._model = prepare_model(self._model, self.precision)
+        logger.info("Classifier precision: %s on %s", self.precision, self.device)
+
+        self.cascade_threshold = cascade_threshold
+        self.cascade_accept_classes = tuple(cascade_accept_classes)
+        self._cascade_model: torch.nn.Module | None = None
+        if cascade_model_path:
+            if os.path.isfile(cascade_model_path):
+                model = build_architecture(cascade_architecture)
+                if self._load_weights(cascade_model_path, model):
+                    model.eval().to(self.device)
+                    self._cascade_model = prepare_model(model, self.precision)
+                    logger.info(
+                        "Cascade enabled: %s answers %s at p >= %.2f",
+                        cascade_architecture, ", ".join(self.cascade_accept_classes),
+                        cascade_threshold,
+                    )
+            else:
+                logger.warning(
+                    "⚠️  Cascade model not found at '%s' – cascade disabled.",
+                    cascade_model_path,
+                )
+
     # ------------------------------------------------------------------
     # Private helpers
     # ------------------------------------------------------------------
 
     def _build_model(self) -> torch.nn.Module:
-        # Must match the architecture used in train.py
-        model = models.efficientnet_v2_s(weights=None)
+        return build_architecture(self.architecture)
 
-        num_features = model.classifier[1].in_features
-        model.classifier = torch.nn.Sequential(
-            torch.nn.Dropout(p=0.3),
-            torch.nn.Linear(num_features, 512),
-            torch.nn.ReLU(),
-            torch.nn.Dropout(p=0.2),
-            torch.nn.Linear(512, len(CLASS_NAMES)),
-        )
-        return model
-
-    def _load_weights(self, path: str) -> None:
+    def _load_weights(self, path: str, model: torch.nn.Module | None = None) -> bool:
+        model = self._model if model is None else model
         try:
             state = torch.load(path, map_location=self.device)
             # Accept both raw state-dicts and checkpoint dicts.
             if isinstance(state, dict) and "state_dict" in state:
                 state = state["state_dict"]
-            self._model.load_state_dict(state)
+            model.load_state_dict(state)
             logger.info("✓  Loaded model weights from '%s'.", path)
+            return True
         except Exception as exc:
             logger.error("Failed to load model weights from '%s': %s", path, exc)
+            return False
 
-    # ------------------------------------------------------------------
-    # Public API
-    # ------------------------------------------------------------------
-
-    def predict(self, image: Image.Image, use_tta: bool = False) -> PredictionResult:
-        """Run inference on a PIL image and return a :class:`PredictionResult`.
-
-        Args:
-            image:    PIL image to classify.
-            use_tta:  When True, runs Test-Time Augmentation (5 flips/rotations)
-                      and averages the softmax probabilities before deciding the
-                      top class.  Slightly slower but more stable on borderline
-                      inputs.
-        """
-        rgb = image.convert("RGB")
-
-        if use_tta:
-            probs_list = []
-            for aug in _TTA_AUGMENTS:
-                augmented = aug(rgb)
-                tensor = _preprocess(augmented).unsqueeze(0).to(self.device)
-                with torch.no_grad():
-                    logits = self._model(tensor)
-                    probs_list.append(F.softmax(logits, dim=1).squeeze(0).cpu().numpy())
-            probs_np: np.ndarray = np.mean(probs_list, axis=0)
-        else:
-            tensor = _preprocess(rgb).unsqueeze(0).to(self.device)
-            with torch.no_grad():
-                logits = self._model(tensor)
-                probs_np = F.softmax(logits, dim=1).squeeze(0).cpu().numpy()
+    def _forward(self, tensor: torch.Tensor, model: torch.nn.Module | None = None) -> torch.Tensor:
+        """Softmax probabilities for a preprocessed batch (fp32, on CPU)."""
+        model = self._model if model is None else model
+        tensor = prepare_input(tensor.to(self.device), self.precision)
+        with torch.no_grad(), autocast_context(self.precision, self.device):
+            logits = model(tensor)
+        return F.softmax(logits.float(), dim=1).cpu()
 
+    def _result_from_probs(self, probs_np: np.ndarray, stage: str) -> PredictionResult:
         # Top-k indices sorted by descending probability
         top_k_count = min(self.top_k, len(CLASS_NAMES))
         top_indices = np.argsort(probs_np)[::-1][:top_k_count]
@@ -215,4 +382,110 @@ class DiseaseClassifier:
             top_probability=top_probability,
             is_uncertain=is_uncertain,
             top_k=top_k_list,
+            stage=stage,
         )
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    @property
+    def cascade_enabled(self) -> bool:
+        return self._cascade_model is not None
+
+    def stage_probabilities(
+        self, image: Image.Image, stage: str = "full", use_tta: bool = False
+    ) -> np.ndarray:
+        """Class probabilities of one cascade stage (``"fast"`` or ``"full"``).
+
+        The fast stage never uses TTA – its whole point is a single cheap pass.
+        """
+        rgb = image.convert("RGB")
+        if stage == "fast":
+            if self._cascade_model is None:
+                raise ValueError("No cascade model loaded")
+            tensor = _preprocess(rgb).unsqueeze(0)
+            return self._forward(tensor, self._cascade_model).squeeze(0).numpy()
+
+        if use_tta:
+            probs_list = []
+            for aug in _TTA_AUGMENTS:
+                augmented = aug(rgb)
+                tensor = _preprocess(augmented).unsqueeze(0)
+                probs_list.append(self._forward(tensor).squeeze(0).numpy())
+            return np.mean(probs_list, axis=0)
+        tensor = _preprocess(rgb).unsqueeze(0)
+        return self._forward(tensor).squeeze(0).numpy()
+
+    def predict_proba_batch(self, batch: torch.Tensor) -> np.ndarray:
+        """Full-model class probabilities for a batch of :func:`preprocess` outputs.
+
+        Args:
+            batch: ``(N, 3, 224, 224)`` float tensor.
+
+        Returns:
+            ``(N, len(CLASS_NAMES))`` float32 array, columns in CLASS_NAMES order.
+        """
+        return self._forward(batch).numpy()
+
+    def forward_features(self, batch: torch.Tensor) -> dict[str, np.ndarray]:
+        """Full-model probabilities and embeddings for a batch, in one pass.
+
+        Args:
+            batch: ``(N, 3, 224, 224)`` float tensor of :func:`preprocess` outputs.
+
+        Returns:
+            float32 arrays keyed ``"probs"`` ``(N, len(CLASS_NAMES))`` and one
+            ``(N, D)`` entry per name in :data:`EMBEDDING_LAYERS`.
+        """
+        model = self._model
+        tensor = prepare_input(batch.to(self.device), self.precision)
+        with torch.no_grad(), autocast_context(self.precision, self.device):
+            pooled = torch.flatten(model.avgpool(model.features(tensor)), 1)
+            head = model.classifier[:-1](pooled)
+            logits = model.classifier[-1](head)
+        return {
+            "probs": F.softmax(logits.float(), dim=1).cpu().numpy(),
+            "pooled": pooled.float().cpu().numpy(),
+            "head": head.float().cpu().numpy(),
+        }
+
+    def predict_with_embedding(
+        self, image: Image.Image, layer: str = DEFAULT_EMBEDDING_LAYER
+    ) -> tuple[PredictionResult, np.ndarray]:
+        """Full-model prediction plus the *layer* embedding of the same forward pass.
+
+        The cascade and TTA are bypassed: the embedding must come from the
+        model the similarity index was built with.
+
+        Raises:
+            ValueError: for a layer not in :data:`EMBEDDING_LAYERS`.
+        """
+        if layer not in EMBEDDING_LAYERS:
+            raise ValueError(f"Unknown embedding layer {layer!r}; expected one of {EMBEDDING_LAYERS}")
+        out = self.forward_features(_preprocess(image.convert("RGB")).unsqueeze(0))
+        return self._result_from_probs(out["probs"][0], stage="full"), out[layer][0]
+
+    def cascade_accepts(self, fast_probs: np.ndarray, threshold: float | None = None) -> bool:
+        """True when the fast stage's answer is final (no escalation)."""
+        threshold = self.cascade_threshold if threshold is None else threshold
+        top = int(np.argmax(fast_probs))
+        return CLASS_NAMES[top] in self.cascade_accept_classes and float(fast_probs[top]) >= threshold
+
+    def predict(self, image: Image.Image, use_tta: bool = False) -> PredictionResult:
+        """Run inference on a PIL image and return a :class:`PredictionResult`.
+
+        Args:
+            image:    PIL image to classify.
+            use_tta:  When True, runs Test-Time Augmentation (5 flips/rotations)
+                      and averages the softmax probabilities before deciding the
+                      top class.  Slightly slower but more stable on borderline
+                      inputs.  Only applies to the full model.
+        """
+        if self._cascade_model is not None:
+            fast_probs = self.stage_probabilities(image, "fast")
+            if self.cascade_accepts(fast_probs):
+                return self._result_from_probs(fast_probs, stage="fast")
+
+        probs_np = self.stage_probabilities(image, "full", use_tta=use_tta)
+        return self._result_from_probs(probs_np, stage="full")
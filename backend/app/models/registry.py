@@ -0,0 +1,274 @@
+"""
+Model registry with background hot reload.
+
+The registry watches a models directory in which every published model
+version lives in its own sub-directory::
+
+    MODELS_DIR/
+        2024-06-01/
+            cardamom_model.pt
+            model_metadata.json      # {"version": "2024-06-01", "architecture": ..., ...}
+        student-v2/
+            cardamom_student.pt
+            model_metadata.json
+
+``model_metadata.json`` marks a version as complete – publish a version by
+copying the checkpoint first and writing the metadata file last.  The
+checkpoint is the ``"checkpoint"`` entry of the metadata (relative to the
+version directory) or, without one, the single ``*.pt`` file in it.  The
+version name is the metadata ``"version"`` or the directory name.
+
+:meth:`ModelRegistry.refresh` loads new or changed versions, runs a warm-up
+prediction on each and only then publishes them by replacing the entries
+mapping in a single assignment.  Request handlers take a reference to one
+:class:`ModelEntry` per request, so in-flight requests finish on the
+classifier they started with while new requests see the new version; an
+old classifier is freed once its last request drops it.
+
+The active (default) version is ``default_version`` when given, otherwise
+the most recently published one.  At most ``max_loaded`` versions stay in
+memory (the active one always among them).
+
+Environment variables (read by ``app.main``)
+---------------------------------------------
+MODELS_DIR           enable the registry on this directory (unset = single
+                     MODEL_PATH checkpoint, loaded once)
+MODEL_VERSION        pin the default version (default: newest)
+MODEL_POLL_INTERVAL  seconds between directory scans, default 30
+MAX_LOADED_MODELS    versions kept in memory, default 3
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+import torch
+from PIL import Image
+
+from .classifier import METADATA_FILENAME, DiseaseClassifier
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL: float = 30.0
+DEFAULT_MAX_LOADED: int = 3
+
+ClassifierFactory = Callable[[str, dict], DiseaseClassifier]
+
+
+# ---------------------------------------------------------------------------
+# Data structures
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ModelEntry:
+    version: str
+    checkpoint: str
+    metadata: dict
+    classifier: DiseaseClassifier
+    memory_bytes: int
+    fingerprint: tuple
+    published_ns: int
+    loaded_at: float = field(default_factory=time.time)
+
+
+def classifier_memory_bytes(classifier: DiseaseClassifier) -> int:
+    """Bytes held by the parameters and buffers of every model in *classifier*."""
+    total = 0
+    for model in (getattr(classifier, "_model", None), getattr(classifier, "_cascade_model", None)):
+        if isinstance(model, torch.nn.Module):
+            for t in list(model.parameters()) + list(model.buffers()):
+                total += t.numel() * t.element_size()
+    return total
+
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+
+class ModelRegistry:
+    """Loads, warms and atomically swaps classifier versions from *models_dir*.
+
+    Args:
+        models_dir:       Directory holding one sub-directory per version.
+        factory:          ``factory(checkpoint_path, metadata)`` returning a
+                          :class:`DiseaseClassifier`.
+        default_version:  Version served when a request does not pin one;
+                          ``None`` means the most recently published.
+        poll_interval:    Seconds between scans of the background watcher.
+        max_loaded:       Maximum number of versions kept in memory.
+    """
+
+    def __init__(
+        self,
+        models_dir: str | Path,
+        factory: ClassifierFactory,
+        default_version: str | None = None,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        max_loaded: int = DEFAULT_MAX_LOADED,
+    ) -> None:
+        self.models_dir = Path(models_dir)
+        self.factory = factory
+        self.default_version = default_version
+        self.poll_interval = poll_interval
+        self.max_loaded = max(1, max_loaded)
+        # (entries, active version) – replaced wholesale on every change, so
+        # readers never see a partial update.
+        self._state: tuple[dict[str, ModelEntry], str | None] = ({}, None)
+        self._failed: dict[str, tuple] = {}  # version -> fingerprint that failed to load
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ------------------------------------------------------------------
+    # Discovery
+    # ------------------------------------------------------------------
+
+    def scan(self) -> dict[str, tuple[str, dict, tuple, int]]:
+        """Return ``{version: (checkpoint, metadata, fingerprint, published_ns)}``."""
+        found: dict[str, tuple[str, dict, tuple, int]] = {}
+        if not self.models_dir.is_dir():
+            return found
+        for version_dir in sorted(p for p in self.models_dir.iterdir() if p.is_dir()):
+            meta_path = version_dir / METADATA_FILENAME
+            if not meta_path.is_file():
+                continue  # not (yet) published
+            try:
+                with open(meta_path, encoding="utf-8") as fh:
+                    metadata = json.load(fh)
+            except (OSError, ValueError) as exc:
+                logger.warning("Skipping %s: unreadable metadata (%s)", version_dir, exc)
+                continue
+            if "checkpoint" in metadata:
+                checkpoint = version_dir / metadata["checkpoint"]
+            else:
+                candidates = sorted(version_dir.glob("*.pt"))
+                if len(candidates) != 1:
+                    logger.warning("Skipping %s: expected exactly one *.pt file", version_dir)
+                    continue
+                checkpoint = candidates[0]
+            if not checkpoint.is_file():
+                logger.warning("Skipping %s: checkpoint %s missing", version_dir, checkpoint)
+                continue
+            version = str(metadata.get("version") or version_dir.name)
+            ck, mt = checkpoint.stat(), meta_path.stat()
+            fingerprint = (str(checkpoint), ck.st_size, ck.st_mtime_ns, mt.st_size, mt.st_mtime_ns)
+            found[version] = (str(checkpoint), metadata, fingerprint, mt.st_mtime_ns)
+        return found
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _load(self, version: str, checkpoint: str, metadata: dict, fingerprint: tuple,
+              published_ns: int) -> ModelEntry | None:
+        try:
+            classifier = self.factory(checkpoint, metadata)
+            if not getattr(classifier, "weights_loaded", True):
+                raise RuntimeError("checkpoint could not be loaded")
+            # Warm-up: first-call allocations and kernel selection happen here,
+            # not on a user request.
+            classifier.predict(Image.new("RGB", (224, 224)))
+        except Exception as exc:
+            logger.error("✗  Model version '%s' failed to load: %s", version, exc)
+            self._failed[version] = fingerprint
+            return None
+        memory = classifier_memory_bytes(classifier)
+        logger.info("✓  Model version '%s' loaded (%.1f MB)", version, memory / 2**20)
+        return ModelEntry(version, checkpoint, dict(metadata, version=version), classifier,
+                          memory, fingerprint, published_ns)
+
+    def refresh(self) -> bool:
+        """Load new/changed versions and publish them; return True on change."""
+        with self._refresh_lock:
+            found = self.scan()
+            current, current_active = self._state
+
+            # Versions to keep in memory: the pinned default plus the newest.
+            by_age = sorted(found, key=lambda v: found[v][3], reverse=True)
+            wanted = by_age[: self.max_loaded]
+            if self.default_version in found and self.default_version not in wanted:
+                wanted = [self.default_version] + wanted[: self.max_loaded - 1]
+
+            entries: dict[str, ModelEntry] = {}
+            for version in wanted:
+                checkpoint, metadata, fingerprint, published_ns = found[version]
+                old = current.get(version)
+                if old is not None and old.fingerprint == fingerprint:
+                    entries[version] = old
+                    continue
+                if self._failed.get(version) == fingerprint:
+                    if old is not None:
+                        entries[version] = old
+                    continue
+                entry = self._load(version, checkpoint, metadata, fingerprint, published_ns)
+                if entry is not None:
+                    entries[version] = entry
+                elif old is not None:
+                    entries[version] = old  # keep serving the previous build
+
+            if self.default_version in entries:
+                active = self.default_version
+            elif entries:
+                active = max(entries, key=lambda v: entries[v].published_ns)
+            else:
+                active = None
+
+            changed = entries.keys() != current.keys() or any(
+                entries[v] is not current[v] for v in entries
+            ) or active != current_active
+            if changed:
+                # One assignment: concurrent readers see old or new, never a mix.
+                self._state = (entries, active)
+                logger.info("Model registry: active=%s loaded=%s", active, sorted(entries))
+            return changed
+
+    # ------------------------------------------------------------------
+    # Background watcher
+    # ------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Start the background thread that calls :meth:`refresh` periodically."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception:  # pragma: no cover - keep the watcher alive
+                logger.exception("Model registry refresh failed")
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    @property
+    def active_version(self) -> str | None:
+        return self._state[1]
+
+    def get(self, version: str | None = None) -> Optional[ModelEntry]:
+        """Return the entry for *version* (``None`` = active), or None."""
+        entries, active = self._state
+        if version is None:
+            version = active
+        return entries.get(version) if version is not None else None
+
+    def entries(self) -> list[ModelEntry]:
+        return list(self._state[0].values())
@@ -1,12 +1,30 @@
 """
 Background removal using rembg library.
 Falls back to passthrough if rembg is not installed.
+
+Besides the black-composited RGB image the segmenter also keeps the binary
+leaf mask so that downstream steps (severity estimation) can restrict their
+statistics to leaf pixels without running segmentation a second time.
+Results are cached in a small in-process LRU keyed by image content hash so
+repeat uploads of the same photo skip U2-Net entirely.
+
+Environment variables
+---------------------
+LEAF_MASK_CACHE_SIZE  int, default 32
+    Maximum number of segmentation results kept in the LRU cache
+    (0 disables caching).
 """
 from __future__ import annotations
 
+import hashlib
 import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Optional
 
+import numpy as np
 from PIL import Image
 
 logger = logging.getLogger(__name__)
@@ -18,26 +36,116 @@ except (ImportError, SystemExit, Exception):
     _REMBG_AVAILABLE = False
     logger.warning("rembg not installed or not usable – background removal disabled.")
 
+DEFAULT_MASK_CACHE_SIZE: int = 32
+
+# Alpha values above this are treated as leaf pixels.
+_ALPHA_THRESHOLD = 127
+
+
+@dataclass
+class SegmentationResult:
+    """Per-request segmentation output shared by classification and severity."""
+
+    image: Image.Image  # RGB, background composited onto black
+    mask: Optional[np.ndarray]  # (H, W) bool leaf mask, None when unavailable
+    content_hash: str = ""
+    cache_hit: bool = False
+
+
+def image_content_hash(image: Image.Image) -> str:
+    """Return a stable hash of the decoded pixel content of *image*."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
 
 class U2NetSegmenter:
-    def __init__(self, model_path: Optional[str] = None, device: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        device: Optional[str] = None,
+        cache_size: Optional[int] = None,
+    ) -> None:
         self.model_path = model_path
         self.device = device
+        if cache_size is None:
+            cache_size = int(os.environ.get("LEAF_MASK_CACHE_SIZE", DEFAULT_MASK_CACHE_SIZE))
+        self.cache_size = max(0, cache_size)
+        self._cache: OrderedDict[str, SegmentationResult] = OrderedDict()
+        self._lock = threading.Lock()
         if _REMBG_AVAILABLE:
             logger.info("✓ Background removal ready (rembg)")
         else:
             logger.warning("⚠️ Background removal disabled (rembg not installed)")
 
-    def remove_background(self, image: Image.Image) -> Image.Image:
+    @property
+    def enabled(self) -> bool:
+        """True when :meth:`segment` actually removes backgrounds (rembg installed)."""
+        return _REMBG_AVAILABLE
+
+    # ------------------------------------------------------------------
+    # Cache helpers
+    # ------------------------------------------------------------------
+
+    def _cache_get(self, key: str) -> Optional[SegmentationResult]:
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+            return hit
+
+    def _cache_put(self, key: str, result: SegmentationResult) -> None:
+        if self.cache_size == 0:
+            return
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def segment(self, image: Image.Image) -> SegmentationResult:
+        """Remove the background and return the composited image plus leaf mask.
+
+        When rembg is unavailable (or fails) the original RGB image is
+        returned with ``mask=None`` so callers fall back to whole-image
+        statistics.
+        """
+        rgb = image.convert("RGB")
         if not _REMBG_AVAILABLE:
-            return image
+            return SegmentationResult(image=rgb, mask=None)
+
+        key = image_content_hash(rgb)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return SegmentationResult(
+                image=cached.image,
+                mask=cached.mask,
+                content_hash=key,
+                cache_hit=True,
+            )
+
         try:
-            result = rembg_remove(image.convert("RGB"))
-            if result.mode == "RGBA":
-                black_bg = Image.new("RGB", result.size, (0, 0, 0))
-                black_bg.paste(result, mask=result.split()[3])
-                return black_bg
-            return result
+            result = rembg_remove(rgb)
         except Exception as exc:
             logger.warning("Background removal failed: %s – returning original image", exc)
-            return image
+            return SegmentationResult(image=rgb, mask=None, content_hash=key)
+
+        if result.mode == "RGBA":
+            alpha = result.split()[3]
+            black_bg = Image.new("RGB", result.size, (0, 0, 0))
+            black_bg.paste(result, mask=alpha)
+            mask = np.asarray(alpha) > _ALPHA_THRESHOLD
+            seg = SegmentationResult(image=black_bg, mask=mask, content_hash=key)
+        else:
+            seg = SegmentationResult(image=result.convert("RGB"), mask=None, content_hash=key)
+
+        self._cache_put(key, seg)
+        return seg
+
+    def remove_background(self, image: Image.Image) -> Image.Image:
+        return self.segment(image).image
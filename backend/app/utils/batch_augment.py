@@ -0,0 +1,152 @@
+"""Batched tensor augmentation for training.
+
+The torchvision PIL pipeline in ``train.py`` runs flips, rotation, colour
+jitter and affine translation one image at a time inside DataLoader workers,
+so augmentation cost grows with per-image Python overhead.  ``BatchAugment``
+applies the same family of augmentations to a whole collated uint8 batch with
+vectorised torch ops and independent random parameters per sample:
+
+* flips, rotation, translation and the final resize are folded into a single
+  affine matrix per sample and applied with one ``grid_sample`` call;
+* brightness / contrast / saturation jitter are per-sample blends;
+* the result is normalised with the ImageNet statistics.
+
+It runs wherever the batch lives (CPU or GPU).  Datasets feeding it should
+yield fixed-size uint8 ``(3, H, W)`` tensors — e.g. packed shards, or
+``Resize`` + ``PILToTensor`` for image folders (see :func:`raw_uint8_transform`).
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torchvision import transforms
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# ITU-R 601-2 luma weights, as used by torchvision's rgb_to_grayscale.
+_LUMA = (0.2989, 0.587, 0.114)
+
+
+def raw_uint8_transform(img_size: int) -> transforms.Compose:
+    """Per-image transform producing collatable uint8 tensors for ``BatchAugment``."""
+    return transforms.Compose([
+        transforms.Resize((img_size, img_size)),
+        transforms.PILToTensor(),
+    ])
+
+
+class BatchAugment(nn.Module):
+    """Random augmentation of a ``(B, 3, H, W)`` batch with per-sample parameters.
+
+    Args:
+        out_size:   Output side length (the batch is resampled to this size).
+        hflip:      Probability of a horizontal flip.
+        vflip:      Probability of a vertical flip.
+        degrees:    Maximum absolute rotation in degrees.
+        translate:  Maximum absolute shift as a fraction of the image side.
+        brightness: Brightness jitter; factor drawn from ``[1-b, 1+b]``.
+        contrast:   Contrast jitter; factor drawn from ``[1-c, 1+c]``.
+        saturation: Saturation jitter; factor drawn from ``[1-s, 1+s]``.
+        mean, std:  Normalisation statistics applied last.
+        generator:  Optional ``torch.Generator`` for reproducible parameters.
+    """
+
+    def __init__(
+        self,
+        out_size: int = 224,
+        hflip: float = 0.5,
+        vflip: float = 0.5,
+        degrees: float = 30.0,
+        translate: float = 0.1,
+        brightness: float = 0.2,
+        contrast: float = 0.2,
+        saturation: float = 0.2,
+        mean: Sequence[float] = IMAGENET_MEAN,
+        std: Sequence[float] = IMAGENET_STD,
+        generator: Optional[torch.Generator] = None,
+    ) -> None:
+        super().__init__()
+        self.out_size = out_size
+        self.hflip = hflip
+        self.vflip = vflip
+        self.degrees = degrees
+        self.translate = translate
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.generator = generator
+        self.register_buffer("mean", torch.tensor(mean).view(1, 3, 1, 1), persistent=False)
+        self.register_buffer("std", torch.tensor(std).view(1, 3, 1, 1), persistent=False)
+        self.register_buffer("luma", torch.tensor(_LUMA).view(1, 3, 1, 1), persistent=False)
+
+    # ------------------------------------------------------------------
+    # Random parameters
+    # ------------------------------------------------------------------
+
+    def _uniform(self, n: int, low: float, high: float) -> torch.Tensor:
+        return torch.rand(n, generator=self.generator) * (high - low) + low
+
+    def _jitter_factors(self, n: int, amount: float) -> Optional[torch.Tensor]:
+        if amount <= 0:
+            return None
+        return self._uniform(n, max(0.0, 1.0 - amount), 1.0 + amount)
+
+    def affine_matrices(self, n: int) -> torch.Tensor:
+        """Return ``(n, 2, 3)`` output→input sampling matrices (normalised coords)."""
+        sx = torch.where(torch.rand(n, generator=self.generator) < self.hflip, -1.0, 1.0)
+        sy = torch.where(torch.rand(n, generator=self.generator) < self.vflip, -1.0, 1.0)
+        angle = self._uniform(n, -self.degrees, self.degrees) * (math.pi / 180.0)
+        # A shift of `translate` of the side is 2*translate in [-1, 1] coordinates.
+        tx = self._uniform(n, -self.translate, self.translate) * 2.0
+        ty = self._uniform(n, -self.translate, self.translate) * 2.0
+
+        cos, sin = torch.cos(angle), torch.sin(angle)
+        theta = torch.zeros(n, 2, 3)
+        theta[:, 0, 0] = cos * sx
+        theta[:, 0, 1] = -sin * sy
+        theta[:, 1, 0] = sin * sx
+        theta[:, 1, 1] = cos * sy
+        theta[:, 0, 2] = tx
+        theta[:, 1, 2] = ty
+        return theta
+
+    # ------------------------------------------------------------------
+    # Forward
+    # ------------------------------------------------------------------
+
+    def _color_jitter(self, x: torch.Tensor) -> torch.Tensor:
+        n = x.shape[0]
+        b = self._jitter_factors(n, self.brightness)
+        if b is not None:
+            x = (x * b.to(x.device).view(n, 1, 1, 1)).clamp_(0.0, 1.0)
+        c = self._jitter_factors(n, self.contrast)
+        if c is not None:
+            c = c.to(x.device).view(n, 1, 1, 1)
+            gray_mean = (x * self.luma).sum(dim=1, keepdim=True).mean(dim=(2, 3), keepdim=True)
+            x = (c * x + (1.0 - c) * gray_mean).clamp_(0.0, 1.0)
+        s = self._jitter_factors(n, self.saturation)
+        if s is not None:
+            s = s.to(x.device).view(n, 1, 1, 1)
+            gray = (x * self.luma).sum(dim=1, keepdim=True)
+            x = (s * x + (1.0 - s) * gray).clamp_(0.0, 1.0)
+        return x
+
+    @torch.no_grad()
+    def forward(self, batch: torch.Tensor) -> torch.Tensor:
+        """Augment *batch* (uint8 or float in [0, 1]) and return a normalised float batch."""
+        x = batch.float().div_(255.0) if batch.dtype == torch.uint8 else batch.float()
+        n = x.shape[0]
+
+        theta = self.affine_matrices(n).to(device=x.device, dtype=x.dtype)
+        grid = F.affine_grid(theta, [n, x.shape[1], self.out_size, self.out_size],
+                             align_corners=False)
+        x = F.grid_sample(x, grid, mode="bilinear", padding_mode="zeros",
+                          align_corners=False)
+
+        x = self._color_jitter(x)
+        return (x - self.mean) / self.std
@@ -0,0 +1,236 @@
+"""Content-addressed on-disk cache of background-removal masks.
+
+Offline scripts (ablation, robustness, evaluation) repeatedly evaluate the
+same test images with background removal.  Running rembg inside every
+``Dataset.__getitem__`` makes each pass cost a full U2-Net inference per
+image, single-threaded.  This module stores the leaf mask produced by rembg
+once per *(image content, segmenter model)* pair so later passes only pay for
+a PNG read and a paste onto black.
+
+Layout::
+
+    <root>/<model_id>/<sha[:2]>/<sha>.png      # 8-bit L mask (255 = leaf)
+
+Keys are the SHA-256 of the source file bytes, so renamed/copied images share
+an entry and edited images get a new one.  Masks rather than composited RGB
+images are stored: they compress far better and also serve the leaf-area
+severity computation.
+
+Typical use::
+
+    cache = BackgroundRemovalCache()
+    cache.ensure(paths, workers=4)            # compute missing entries only
+    image = cache.load_image(path)            # RGB on black background
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+from PIL import Image
+
+from .hashing import file_sha256
+
+DEFAULT_CACHE_ROOT = os.environ.get("BG_CACHE_DIR", ".cache/bg_removed")
+DEFAULT_SEGMENTER_MODEL = "u2net"
+
+
+def composite_on_black(image: Image.Image, mask: Image.Image) -> Image.Image:
+    """Paste *image* onto a black canvas using *mask* (mode ``L``) as alpha."""
+    rgb = image.convert("RGB")
+    black_bg = Image.new("RGB", rgb.size, (0, 0, 0))
+    black_bg.paste(rgb, mask=mask)
+    return black_bg
+
+
+# ---------------------------------------------------------------------------
+# Worker side (top-level so it is picklable under the spawn start method)
+# ---------------------------------------------------------------------------
+
+_session = None
+
+
+def _init_worker(model_name: str) -> None:
+    global _session
+    from rembg import new_session
+
+    _session = new_session(model_name)
+
+
+def _compute_masks(jobs: list[tuple[str, str]]) -> list[tuple[str, Optional[str]]]:
+    """Compute masks for (source, destination) pairs; return (source, error)."""
+    from rembg import remove
+
+    out = []
+    for src, dst in jobs:
+        try:
+            with Image.open(src) as img:
+                mask = remove(img.convert("RGB"), session=_session, only_mask=True)
+            dst_path = Path(dst)
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dst_path.with_suffix(".tmp.png")
+            mask.convert("L").save(tmp, "PNG")
+            os.replace(tmp, dst_path)
+            out.append((src, None))
+        except Exception as exc:
+            out.append((src, str(exc)))
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+
+class BackgroundRemovalCache:
+    """Content-addressed store of rembg leaf masks for one segmenter model."""
+
+    def __init__(
+        self,
+        root: str | Path = DEFAULT_CACHE_ROOT,
+        model_name: str = DEFAULT_SEGMENTER_MODEL,
+    ) -> None:
+        self.model_name = model_name
+        self.root = Path(root) / f"rembg-{model_name}"
+        self._digests: dict[str, str] = {}
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+
+    def digest(self, path: str | Path) -> str:
+        key = str(path)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = file_sha256(path)
+            self._digests[key] = digest
+        return digest
+
+    def mask_path(self, path: str | Path) -> Path:
+        d = self.digest(path)
+        return self.root / d[:2] / f"{d}.png"
+
+    def missing(self, paths: Iterable[str | Path]) -> list[Path]:
+        """Return the subset of *paths* without a cached mask."""
+        return [Path(p) for p in paths if not self.mask_path(p).exists()]
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def load_mask(self, path: str | Path) -> Optional[np.ndarray]:
+        """Return the cached (H, W) bool leaf mask for *path*, or None."""
+        mp_ = self.mask_path(path)
+        if not mp_.exists():
+            return None
+        with Image.open(mp_) as m:
+            return np.asarray(m.convert("L")) > 127
+
+    def load_image(self, path: str | Path) -> Image.Image:
+        """Return the background-removed RGB image for *path*.
+
+        Raises:
+            KeyError: if no mask is cached for *path* (call :meth:`populate`).
+        """
+        mp_ = self.mask_path(path)
+        if not mp_.exists():
+            raise KeyError(f"No cached background-removal mask for {path}")
+        with Image.open(path) as img, Image.open(mp_) as mask:
+            return composite_on_black(img, mask.convert("L"))
+
+    def loader(self, path: str) -> Image.Image:
+        """``torchvision.datasets.ImageFolder``-compatible loader.
+
+        Falls back to the original image when no mask is cached (e.g. rembg
+        failed on that file).
+        """
+        try:
+            return self.load_image(path)
+        except KeyError:
+            with Image.open(path) as img:
+                return img.convert("RGB")
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def ensure(
+        self,
+        paths: Iterable[str | Path],
+        workers: int = 1,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> list[tuple[str, str]]:
+        """Make sure every path has a cached mask; return populate failures.
+
+        Raises:
+            RuntimeError: if masks are missing and rembg is not installed.
+        """
+        missing = self.missing(paths)
+        if not missing:
+            return []
+        try:
+            import rembg  # noqa: F401
+        except (ImportError, SystemExit) as exc:
+            raise RuntimeError(
+                f"{len(missing)} images have no cached background-removal mask "
+                "and rembg is not installed (pip install rembg onnxruntime)."
+            ) from exc
+        _, failures = self.populate(missing, workers=workers, progress=progress)
+        return failures
+
+    def populate(
+        self,
+        paths: Iterable[str | Path],
+        workers: int = 1,
+        batch_size: int = 8,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> tuple[int, list[tuple[str, str]]]:
+        """Compute and store masks for every path not yet cached.
+
+        Uses a spawn-based process pool; each worker builds its own rembg
+        session.  Identical files are only segmented once.
+
+        Args:
+            paths:      Source image paths.
+            workers:    Number of worker processes.
+            batch_size: Images handed to a worker per call.
+            progress:   Optional callback receiving the number of images
+                        finished after each chunk.
+
+        Returns:
+            ``(computed, failures)`` where *failures* is a list of
+            ``(path, error_message)``.
+        """
+        jobs: dict[str, tuple[str, str]] = {}
+        for p in self.missing(paths):
+            dst = self.mask_path(p)
+            jobs.setdefault(str(dst), (str(p), str(dst)))
+        pending = list(jobs.values())
+        if not pending:
+            return 0, []
+
+        batch_size = max(1, batch_size)
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        workers = max(1, min(workers, len(chunks)))
+
+        computed = 0
+        failures: list[tuple[str, str]] = []
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker,
+                                 initargs=(self.model_name,)) as pool:
+            futures = [pool.submit(_compute_masks, c) for c in chunks]
+            for fut in as_completed(futures):
+                results = fut.result()
+                for src, err in results:
+                    if err is None:
+                        computed += 1
+                    else:
+                        failures.append((src, err))
+                if progress is not None:
+                    progress(len(results))
+        return computed, failures
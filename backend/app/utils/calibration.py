@@ -0,0 +1,195 @@
+"""Temperature scaling and confidence-threshold sweeps for the uncertainty gate.
+
+``DiseaseClassifier`` answers "Uncertain" when the top-class probability is
+below ``confidence_threshold``.  Choosing that threshold needs two things,
+both computed here from a single array of logits (normally the cached
+test-set pass, see :mod:`app.utils.inference_cache`):
+
+* :func:`fit_temperature` – the scalar ``T`` minimising the negative
+  log-likelihood of ``softmax(logits / T)``.  The NLL is convex in
+  ``β = 1 / T``, so a safeguarded Newton iteration on ``β`` converges in a
+  handful of vectorised passes.  ``T`` is stored in the checkpoint metadata
+  and folded into the classifier head at load time.
+* :func:`threshold_sweep` – coverage (fraction of images answered) and
+  selective accuracy (accuracy on those images) at every threshold of a
+  dense grid.  Confidences are sorted once and correct answers are
+  cumulatively summed, so each grid point costs one ``searchsorted``.
+
+:func:`recommend_threshold` then picks the lowest threshold – i.e. the
+highest coverage – whose selective accuracy reaches a target.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .metrics import expected_calibration_error
+
+DEFAULT_THRESHOLD_STEP = 0.001
+DEFAULT_TARGET_ACCURACY = 0.95
+
+# β = 1 / T is searched inside this bracket (T between 0.01 and 100).
+_BETA_BOUNDS = (0.01, 100.0)
+
+
+# ---------------------------------------------------------------------------
+# Temperature scaling
+# ---------------------------------------------------------------------------
+
+
+def softmax(logits: np.ndarray, temperature: float = 1.0) -> np.ndarray:
+    """Row-wise softmax of ``logits / temperature`` in float64."""
+    z = np.asarray(logits, dtype=np.float64) / temperature
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def nll(logits: np.ndarray, labels, temperature: float = 1.0) -> float:
+    """Mean negative log-likelihood of *labels* under ``softmax(logits / T)``."""
+    z = np.asarray(logits, dtype=np.float64) / temperature
+    z_max = z.max(axis=1, keepdims=True)
+    log_norm = np.log(np.exp(z - z_max).sum(axis=1)) + z_max[:, 0]
+    labels = np.asarray(labels, dtype=np.int64)
+    return float((log_norm - z[np.arange(len(z)), labels]).mean())
+
+
+def _nll_derivatives(z: np.ndarray, z_true: np.ndarray, beta: float) -> tuple[float, float]:
+    """First and second derivative of the mean NLL with respect to β."""
+    p = softmax(z, 1.0 / beta)
+    mean_z = (p * z).sum(axis=1)
+    var_z = (p * z * z).sum(axis=1) - mean_z ** 2
+    return float((mean_z - z_true).mean()), float(np.maximum(var_z, 0.0).mean())
+
+
+def fit_temperature(logits: np.ndarray, labels, max_iter: int = 50, tol: float = 1e-8) -> float:
+    """Temperature ``T`` minimising the NLL of ``softmax(logits / T)``.
+
+    ``T > 1`` softens over-confident predictions, ``T < 1`` sharpens
+    under-confident ones; the arg-max (and so accuracy) never changes.
+
+    Args:
+        logits:   ``(N, C)`` raw model outputs.
+        labels:   ``(N,)`` true class indices.
+        max_iter: Newton iterations before giving up on further refinement.
+        tol:      stop when the bracket on β is narrower than this.
+
+    Returns:
+        The fitted temperature, clamped to ``[0.01, 100]``.
+
+    Raises:
+        ValueError: for empty input or mismatched lengths.
+    """
+    z = np.asarray(logits, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    if z.ndim != 2 or len(z) == 0 or len(z) != len(labels):
+        raise ValueError(f"Expected (N, C) logits and N labels, got {z.shape} and {labels.shape}")
+    z_true = z[np.arange(len(z)), labels]
+
+    lo, hi = _BETA_BOUNDS
+    if _nll_derivatives(z, z_true, hi)[0] <= 0:
+        return 1.0 / hi  # still improving at the sharpest end (separable data)
+    if _nll_derivatives(z, z_true, lo)[0] >= 0:
+        return 1.0 / lo
+
+    beta = 1.0
+    for _ in range(max_iter):
+        grad, hess = _nll_derivatives(z, z_true, beta)
+        if grad > 0:
+            hi = beta
+        else:
+            lo = beta
+        if hi - lo < tol or grad == 0:
+            break
+        step = beta - grad / hess if hess > 0 else np.nan
+        # Newton where it stays inside the bracket, bisection otherwise.
+        beta = step if lo < step < hi else 0.5 * (lo + hi)
+    return float(1.0 / beta)
+
+
+# ---------------------------------------------------------------------------
+# Threshold sweep
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ThresholdSweep:
+    """Coverage / selective accuracy of the uncertainty gate per threshold.
+
+    ``accuracy`` is NaN where no prediction passes the threshold.
+    """
+
+    thresholds: np.ndarray
+    coverage: np.ndarray
+    accuracy: np.ndarray
+    n_accepted: np.ndarray
+    n_total: int
+
+    def at(self, threshold: float) -> tuple[float, float]:
+        """``(coverage, accuracy)`` at the grid point nearest *threshold*."""
+        i = int(np.abs(self.thresholds - threshold).argmin())
+        return float(self.coverage[i]), float(self.accuracy[i])
+
+    def as_dict(self) -> dict:
+        return {
+            "thresholds": self.thresholds.tolist(),
+            "coverage": self.coverage.tolist(),
+            "accuracy": [None if np.isnan(a) else float(a) for a in self.accuracy],
+            "n_accepted": self.n_accepted.tolist(),
+            "n_total": self.n_total,
+        }
+
+
+def threshold_grid(step: float = DEFAULT_THRESHOLD_STEP) -> np.ndarray:
+    """Thresholds ``0, step, 2·step, …, 1``.
+
+    Rounded so that e.g. ``0.7`` is exactly the float a user would pass as
+    ``confidence_threshold`` (``linspace`` gives ``0.7000000000000001``).
+    """
+    return np.linspace(0.0, 1.0, int(round(1.0 / step)) + 1).round(9)
+
+
+def threshold_sweep(probs: np.ndarray, labels, thresholds: np.ndarray | None = None) -> ThresholdSweep:
+    """Coverage and selective accuracy at every threshold of *thresholds*.
+
+    A prediction is accepted when its top probability is ``>= threshold``,
+    the same rule as ``DiseaseClassifier``.
+    """
+    probs = np.asarray(probs)
+    thresholds = threshold_grid() if thresholds is None else np.asarray(thresholds, dtype=np.float64)
+    conf = probs.max(axis=1)
+    correct = probs.argmax(axis=1) == np.asarray(labels)
+    n = len(conf)
+
+    order = np.argsort(-conf, kind="stable")
+    desc = conf[order]
+    cum_correct = np.concatenate([[0], np.cumsum(correct[order])])
+    # Number of confidences >= t in a descending array.
+    n_accepted = np.searchsorted(-desc, -thresholds, side="right")
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        accuracy = np.where(n_accepted > 0, cum_correct[n_accepted] / n_accepted, np.nan)
+    coverage = n_accepted / n if n else np.zeros_like(thresholds)
+    return ThresholdSweep(thresholds, coverage, accuracy, n_accepted, n)
+
+
+def recommend_threshold(sweep: ThresholdSweep, target_accuracy: float = DEFAULT_TARGET_ACCURACY) -> float | None:
+    """Lowest threshold (highest coverage) whose selective accuracy ≥ *target_accuracy*.
+
+    Returns None when no threshold on the grid reaches the target.
+    """
+    ok = np.nan_to_num(sweep.accuracy, nan=-1.0) >= target_accuracy
+    if not ok.any():
+        return None
+    return float(sweep.thresholds[np.argmax(ok)])
+
+
+def calibration_summary(logits: np.ndarray, labels, temperature: float) -> dict:
+    """NLL and ECE before and after scaling by *temperature*."""
+    return {
+        "nll_before": nll(logits, labels),
+        "nll_after": nll(logits, labels, temperature),
+        "ece_before": expected_calibration_error(softmax(logits), labels),
+        "ece_after": expected_calibration_error(softmax(logits, temperature), labels),
+    }
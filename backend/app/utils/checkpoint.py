@@ -0,0 +1,88 @@
+"""Helpers for resumable training checkpoints.
+
+``train.py`` writes a full training checkpoint (model, optimiser, GradScaler,
+scheduler, RNG states, epoch / batch position, early-stopping state and
+history) so a preempted run can continue where it stopped.  This module keeps
+the parts that are independent of the training loop:
+
+* :func:`atomic_torch_save` – write to a temporary file and ``os.replace`` so
+  an interruption never leaves a truncated checkpoint behind;
+* :func:`capture_rng_state` / :func:`restore_rng_state` – Python, NumPy and
+  torch (CPU + CUDA) generator states;
+* :class:`ResumableRandomSampler` – a shuffling sampler whose order is a pure
+  function of ``(seed, epoch)`` and that can start part-way into an epoch.
+"""
+from __future__ import annotations
+
+import os
+import random
+from pathlib import Path
+from typing import Any, Iterator
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+
+def atomic_torch_save(obj: Any, path: str | Path) -> None:
+    """``torch.save`` *obj* to *path* atomically."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def capture_rng_state() -> dict[str, Any]:
+    """Return the state of every random generator training depends on."""
+    state: dict[str, Any] = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state: dict[str, Any]) -> None:
+    """Restore generator states captured by :func:`capture_rng_state`."""
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"].cpu())
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([s.cpu() for s in state["cuda"]])
+
+
+class ResumableRandomSampler(Sampler[int]):
+    """Shuffle ``range(num_samples)`` deterministically per epoch.
+
+    The permutation of epoch ``e`` is drawn from a generator seeded with
+    ``seed + e``, so it can be reproduced after a restart.  ``set_epoch``
+    with a non-zero *start* skips the samples already consumed.
+
+    Args:
+        num_samples: Dataset length.
+        seed:        Base seed of the per-epoch permutations.
+    """
+
+    def __init__(self, num_samples: int, seed: int = 0) -> None:
+        self.num_samples = num_samples
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch: int, start: int = 0) -> None:
+        self.epoch = epoch
+        self.start = max(0, min(start, self.num_samples))
+
+    def permutation(self, epoch: int) -> torch.Tensor:
+        g = torch.Generator()
+        g.manual_seed(self.seed + epoch)
+        return torch.randperm(self.num_samples, generator=g)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.permutation(self.epoch)[self.start:].tolist())
+
+    def __len__(self) -> int:
+        return self.num_samples - self.start
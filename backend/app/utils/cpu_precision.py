@@ -0,0 +1,103 @@
+"""Opt-in bfloat16 mixed precision for CPU training and inference.
+
+Recent x86 CPUs (AVX512-BF16, AMX) run bf16 convolutions and matmuls through
+oneDNN much faster than fp32.  The ``bf16`` mode combines
+``torch.autocast("cpu", dtype=torch.bfloat16)`` with the channels_last memory
+format, which oneDNN needs to pick its fast kernels.  Weights stay fp32;
+autocast only lowers the precision of individual ops, so checkpoints are
+unchanged and Grad-CAM (which runs outside autocast) keeps working.
+
+Precision modes
+---------------
+``fp32``  default, plain NCHW fp32
+``bf16``  channels_last + bf16 autocast; falls back to fp32 with a warning
+          when the CPU has no native bf16 support
+``auto``  ``bf16`` when supported, silently ``fp32`` otherwise
+
+Environment variables
+---------------------
+CPU_PRECISION  fp32 | bf16 | auto, default fp32 (serving classifier)
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import logging
+import os
+from typing import ContextManager
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ("fp32", "bf16", "auto")
+DEFAULT_CPU_PRECISION = "fp32"
+
+_BF16_CPU_FLAGS = {"avx512_bf16", "amx_bf16"}
+
+
+@functools.lru_cache(maxsize=1)
+def cpu_bf16_supported() -> bool:
+    """Return True when the CPU has native bf16 support usable by oneDNN."""
+    probe = getattr(getattr(torch.ops, "mkldnn", None), "_is_mkldnn_bf16_supported", None)
+    if probe is not None:
+        try:
+            return bool(probe())
+        except Exception:  # pragma: no cover - depends on the torch build
+            pass
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith("flags"):
+                    return bool(_BF16_CPU_FLAGS & set(line.split(":", 1)[1].split()))
+    except OSError:
+        pass
+    return False
+
+
+def resolve_cpu_precision(requested: str | None, device: torch.device | str = "cpu") -> str:
+    """Return the effective precision (``"fp32"`` or ``"bf16"``) for *device*.
+
+    Args:
+        requested: ``"fp32"``, ``"bf16"`` or ``"auto"``; ``None`` reads the
+                   ``CPU_PRECISION`` environment variable.
+        device:    Target device; anything other than CPU always gets fp32
+                   (CUDA has its own AMP path).
+
+    Raises:
+        ValueError: for an unknown precision name.
+    """
+    if requested is None:
+        requested = os.environ.get("CPU_PRECISION", DEFAULT_CPU_PRECISION)
+    requested = requested.strip().lower()
+    if requested not in PRECISIONS:
+        raise ValueError(f"CPU precision must be one of {PRECISIONS}; got {requested!r}")
+
+    if requested == "fp32" or torch.device(device).type != "cpu":
+        return "fp32"
+    if cpu_bf16_supported():
+        return "bf16"
+    if requested == "bf16":
+        logger.warning("⚠️  bf16 requested but this CPU has no native bf16 support – using fp32.")
+    return "fp32"
+
+
+def autocast_context(precision: str, device: torch.device | str = "cpu") -> ContextManager:
+    """bf16 autocast on CPU for ``precision == "bf16"``, otherwise a no-op."""
+    if precision == "bf16" and torch.device(device).type == "cpu":
+        return torch.autocast("cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def prepare_model(model: torch.nn.Module, precision: str) -> torch.nn.Module:
+    """Switch *model* to channels_last when running in bf16 mode."""
+    if precision == "bf16":
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+
+def prepare_input(tensor: torch.Tensor, precision: str) -> torch.Tensor:
+    """Match the input layout to :func:`prepare_model`."""
+    if precision == "bf16" and tensor.dim() == 4:
+        return tensor.contiguous(memory_format=torch.channels_last)
+    return tensor
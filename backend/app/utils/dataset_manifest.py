@@ -0,0 +1,347 @@
+"""Manifest-driven dataset splits: one JSON file instead of copied folders.
+
+``split_dataset.py`` used to shuffle ``dataset_processed/<class>/`` and copy
+every image into ``dataset/{train,val,test}/<class>/``; re-splitting meant
+deleting and re-copying the whole tree.  A *manifest* records the same split
+as metadata, so the images stay where they are::
+
+    {
+      "version": 1,
+      "root": "dataset_processed",        # relative to the manifest file
+      "classes": ["blight", "healthy", "other", "spot"],
+      "seed": 42,
+      "ratios": {"train": 0.7, "val": 0.15, "test": 0.15},
+      "paths":  ["blight/a.jpg", ...],    # relative to root
+      "labels": [0, ...],
+      "groups": [0, ...],                 # duplicate-group id per image
+      "sha256": ["9f86d0…", ...],         # content hash per image
+      "splits": ["train", ...]
+    }
+
+Images with identical content always share a group, and so do the
+near-duplicate groups of ``deduplicate.py``; every group lands in a single
+split.  :func:`resplit` reassigns splits from the stored labels and groups
+without touching the images, so trying another seed or ratio takes
+milliseconds.
+
+``ManifestDataset`` is a drop-in for ``torchvision.datasets.ImageFolder``
+(``classes``, ``class_to_idx``, ``samples``, ``targets``, ``loader``), and
+:func:`split_samples` returns the ``(path, label, class_name)`` triples used
+by the evaluation scripts.  Where a directory layout is unavoidable,
+:func:`materialize` builds it from hardlinks.
+"""
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import random
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Hashable, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+
+from .dedup import connected_groups
+from .hashing import file_sha256
+
+MANIFEST_VERSION = 1
+SPLITS = ("train", "val", "test")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".JPG", ".JPEG", ".PNG"}
+
+
+def is_manifest(path: str | Path | None) -> bool:
+    """True if *path* names a manifest file rather than a dataset directory."""
+    return path is not None and Path(path).suffix == ".json" and Path(path).is_file()
+
+
+# ---------------------------------------------------------------------------
+# Split assignment
+# ---------------------------------------------------------------------------
+
+
+def assign_units(
+    items: Sequence,
+    keys: Sequence[Hashable],
+    bounds: Sequence[int],
+    names: Sequence,
+    assigned: Optional[dict] = None,
+) -> dict:
+    """Deal shuffled *items* into the bins *names*, keeping equal keys together.
+
+    Items sharing a key form one unit, placed where its first member falls:
+    the unit goes to ``names[b]`` where ``b`` is the number of *bounds* at or
+    below the running item count.  A key already in *assigned* (e.g. a group
+    spanning several classes) is forced to its recorded bin.  With unique
+    keys this is exactly the slice ``items[bounds[b-1]:bounds[b]]``.
+    """
+    assigned = {} if assigned is None else assigned
+    units: dict = {}
+    for item, key in zip(items, keys, strict=True):
+        units.setdefault(key, []).append(item)
+    bins = {name: [] for name in names}
+    placed = 0
+    for key, members in units.items():
+        name = assigned.get(key)
+        if name is None:
+            name = names[bisect.bisect_right(bounds, placed)]
+            assigned[key] = name
+        bins[name].extend(members)
+        placed += len(members)
+    return bins
+
+
+def split_bounds(total: int, train_ratio: float, val_ratio: float) -> list[int]:
+    """Cumulative ``[train_end, val_end]`` for *total* items."""
+    train_end = int(total * train_ratio)
+    return [train_end, train_end + int(total * val_ratio)]
+
+
+def assign_splits(
+    labels: Sequence[int],
+    groups: Sequence[Hashable],
+    train_ratio: float,
+    val_ratio: float,
+    seed: int,
+) -> list[str]:
+    """Stratified, group-aware train/val/test split of every item.
+
+    Each class is shuffled with one ``random.Random(seed)`` in label order,
+    so without shared groups the result equals the per-class shuffle-and-slice
+    of ``split_dataset.py`` for the same seed.
+    """
+    rng = random.Random(seed)
+    labels = np.asarray(labels)
+    splits = [""] * len(labels)
+    assigned: dict = {}
+    for label in range(int(labels.max()) + 1 if len(labels) else 0):
+        idx = np.flatnonzero(labels == label).tolist()
+        rng.shuffle(idx)
+        bins = assign_units(idx, [groups[i] for i in idx],
+                            split_bounds(len(idx), train_ratio, val_ratio), SPLITS, assigned)
+        for name, members in bins.items():
+            for i in members:
+                splits[i] = name
+    return splits
+
+
+# ---------------------------------------------------------------------------
+# Building and reading
+# ---------------------------------------------------------------------------
+
+
+def scan_class_folders(source_dir: str | Path, class_folders: Sequence[str]) -> list[tuple[Path, int]]:
+    """``(path, label)`` of every image in ``source_dir/<class>/``, label = folder position."""
+    samples = []
+    for label, cls in enumerate(class_folders):
+        folder = Path(source_dir) / cls
+        if folder.exists():
+            samples += [(fp, label) for fp in folder.iterdir() if fp.suffix in IMAGE_EXTENSIONS]
+    return samples
+
+
+def build_manifest(
+    source_dir: str | Path,
+    class_folders: Sequence[str],
+    train_ratio: float,
+    val_ratio: float,
+    seed: int,
+    group_of: Optional[dict[str, int]] = None,
+    workers: int = 8,
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """Hash, group and split the images of ``source_dir/<class>/``.
+
+    Args:
+        group_of: Resolved path → near-duplicate group (see
+            ``app.utils.dedup.load_groups``); images with identical content
+            are grouped regardless.
+    """
+    samples = scan_class_folders(source_dir, class_folders)
+    paths = [p for p, _ in samples]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        hashes = []
+        for h in pool.map(file_sha256, paths):
+            hashes.append(h)
+            if progress is not None:
+                progress(1)
+
+    # Link identical content and every near-duplicate group into components.
+    pairs = []
+    first_with: dict = {}
+    for i, key in enumerate(hashes):
+        pairs.append((first_with.setdefault(("sha", key), i), i))
+    if group_of:
+        for i, p in enumerate(paths):
+            gid = group_of.get(str(p.resolve()))
+            if gid is not None:
+                pairs.append((first_with.setdefault(("dup", gid), i), i))
+    groups = connected_groups(len(paths), np.array(pairs, dtype=np.int64).reshape(-1, 2))
+
+    labels = [label for _, label in samples]
+    ratios = {"train": train_ratio, "val": val_ratio, "test": round(1 - train_ratio - val_ratio, 6)}
+    return {
+        "version": MANIFEST_VERSION,
+        "root": str(source_dir),
+        "classes": list(class_folders),
+        "seed": seed,
+        "ratios": ratios,
+        "paths": [p.relative_to(source_dir).as_posix() for p in paths],
+        "labels": labels,
+        "groups": groups.tolist(),
+        "sha256": hashes,
+        "splits": assign_splits(labels, groups.tolist(), train_ratio, val_ratio, seed),
+    }
+
+
+def resplit(manifest: dict, seed: int, train_ratio: float, val_ratio: float) -> dict:
+    """Copy of *manifest* with splits reassigned – no image is read."""
+    out = dict(manifest)
+    out["seed"] = seed
+    out["ratios"] = {"train": train_ratio, "val": val_ratio,
+                     "test": round(1 - train_ratio - val_ratio, 6)}
+    out["splits"] = assign_splits(manifest["labels"], manifest["groups"], train_ratio, val_ratio, seed)
+    return out
+
+
+def write_manifest(path: str | Path, manifest: dict) -> None:
+    """Atomically write *manifest* as JSON, storing ``root`` relative to *path*."""
+    path = Path(path)
+    root = os.path.relpath(Path(manifest["root"]).resolve(), path.parent.resolve())
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({**manifest, "root": Path(root).as_posix()}, fh)
+    os.replace(tmp, path)
+
+
+def read_manifest(path: str | Path) -> dict:
+    """Parsed manifest with ``root`` resolved against the manifest's directory."""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Dataset manifest not found: {path}")
+    with open(path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version {manifest.get('version')!r} in {path}")
+    manifest["root"] = str(path.parent / manifest["root"])
+    return manifest
+
+
+def split_counts(manifest: dict) -> dict[str, list[int]]:
+    """Per-split image counts per class."""
+    counts = {s: [0] * len(manifest["classes"]) for s in SPLITS}
+    for split, label in zip(manifest["splits"], manifest["labels"], strict=True):
+        counts[split][label] += 1
+    return counts
+
+
+def split_samples(manifest: dict | str | Path, split: str) -> tuple[list[tuple[Path, int, str]], list[str]]:
+    """``(path, label, class_name)`` triples of one split, plus the class names."""
+    if not isinstance(manifest, dict):
+        manifest = read_manifest(manifest)
+    root, classes = Path(manifest["root"]), manifest["classes"]
+    samples = [
+        (root / p, label, classes[label])
+        for p, label, s in zip(manifest["paths"], manifest["labels"], manifest["splits"], strict=True)
+        if s == split
+    ]
+    return samples, list(classes)
+
+
+def _pil_loader(path: str) -> Image.Image:
+    with Image.open(path) as img:
+        return img.convert("RGB")
+
+
+class ManifestDataset(Dataset):
+    """``ImageFolder``-compatible view of one split of a manifest.
+
+    Args:
+        manifest: Manifest dict or path.
+        split: ``"train"``, ``"val"``, ``"test"`` or None for every image.
+        transform: Applied to the PIL image returned by ``loader``.
+    """
+
+    def __init__(
+        self,
+        manifest: dict | str | Path,
+        split: Optional[str] = None,
+        transform: Optional[Callable] = None,
+        loader: Callable[[str], Image.Image] = _pil_loader,
+    ) -> None:
+        if not isinstance(manifest, dict):
+            manifest = read_manifest(manifest)
+        self.root = Path(manifest["root"])
+        self.transform = transform
+        self.loader = loader
+        self.classes: list[str] = list(manifest["classes"])
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+
+        keep = [i for i, s in enumerate(manifest["splits"]) if split is None or s == split]
+        self.samples: list[tuple[str, int]] = [
+            (str(self.root / manifest["paths"][i]), int(manifest["labels"][i])) for i in keep
+        ]
+        self.imgs = self.samples
+        self.targets: list[int] = [label for _, label in self.samples]
+        self.groups: list[int] = [int(manifest["groups"][i]) for i in keep]
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def load_image(self, idx: int) -> Image.Image:
+        return self.loader(self.samples[idx][0])
+
+    def __getitem__(self, idx: int):
+        image = self.load_image(idx)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[idx]
+
+
+# ---------------------------------------------------------------------------
+# Directory layout
+# ---------------------------------------------------------------------------
+
+
+def link_or_copy(src: str | Path, dst: str | Path) -> bool:
+    """Hardlink *src* to *dst*, copying when linking is impossible.
+
+    Returns True if a link was made.
+    """
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        shutil.copy2(src, dst)
+        return False
+
+
+def materialize(manifest: dict, out_dir: str | Path) -> int:
+    """Build ``out_dir/<split>/<class>/`` from hardlinks; return the number linked.
+
+    Files in those folders that the manifest does not place there (e.g. from
+    an earlier split) are removed first, so a re-split never leaves an image
+    in two splits.
+    """
+    root, classes = Path(manifest["root"]), manifest["classes"]
+    wanted: dict[Path, set[str]] = {Path(out_dir) / s / c: set() for s in SPLITS for c in classes}
+    for p, label, split in zip(manifest["paths"], manifest["labels"], manifest["splits"], strict=True):
+        wanted[Path(out_dir) / split / classes[label]].add(Path(p).name)
+    for dest, names in wanted.items():
+        if dest.is_dir():
+            for stale in dest.iterdir():
+                if stale.is_file() and stale.name not in names:
+                    stale.unlink()
+
+    linked = 0
+    for p, label, split in zip(manifest["paths"], manifest["labels"], manifest["splits"], strict=True):
+        dest = Path(out_dir) / split / classes[label]
+        dest.mkdir(parents=True, exist_ok=True)
+        target = dest / Path(p).name
+        if target.exists():
+            target.unlink()
+        linked += link_or_copy(root / p, target)
+    return linked
@@ -0,0 +1,264 @@
+"""Near-duplicate detection for dataset hygiene and leakage-free splits.
+
+Two signals, both computed in batches and matched without an all-pairs loop:
+
+* **pHash** – the 64-bit perceptual hash of ``imagehash.phash`` (32×32
+  grayscale, 2-D DCT, top-left 8×8 block thresholded at its median), computed
+  for a whole batch with two matrix multiplies.  Pairs within Hamming
+  distance ``r`` are found by *multi-index hashing*: the hash is cut into
+  ``r + 1`` chunks and, by pigeonhole, any such pair agrees exactly on at
+  least one chunk, so only items sharing a chunk bucket are compared.
+* **CNN embeddings** – cosine similarity of L2-normalised embeddings (e.g.
+  ``DiseaseClassifier.forward_features``), thresholded one matrix-multiply
+  tile at a time so memory stays constant in N.
+
+Matched pairs are merged into groups (connected components).  ``deduplicate.py``
+reports cross-split pairs (leakage) and within-class clusters from them, and
+``split_dataset.py --groups`` keeps every group in a single split.
+"""
+from __future__ import annotations
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+PHASH_SIZE = 32        # side of the grayscale thumbnail
+PHASH_LOWFREQ = 8      # side of the low-frequency DCT block → 64-bit hash
+DEFAULT_HAMMING_THRESHOLD = 3
+DEFAULT_COSINE_THRESHOLD = 0.95
+_COSINE_BLOCK = 2048
+
+
+# ---------------------------------------------------------------------------
+# Perceptual hash
+# ---------------------------------------------------------------------------
+
+
+def _dct_matrix(n: int = PHASH_SIZE) -> np.ndarray:
+    """Rows of the (unnormalised) DCT-II basis, as ``scipy.fftpack.dct`` uses."""
+    k = np.arange(n)[:, None]
+    return 2.0 * np.cos(np.pi * k * (2 * np.arange(n)[None, :] + 1) / (2 * n))
+
+
+_DCT_LOW = _dct_matrix()[:PHASH_LOWFREQ]
+_BIT_WEIGHTS = (np.uint64(1) << np.arange(63, -1, -1, dtype=np.uint64))
+
+
+def phash_thumbnail(path: str | Path) -> np.ndarray:
+    """``(32, 32)`` float32 grayscale thumbnail that :func:`phash_batch` hashes."""
+    with Image.open(path) as img:
+        gray = img.convert("L").resize((PHASH_SIZE, PHASH_SIZE), Image.LANCZOS)
+    return np.asarray(gray, dtype=np.float32)
+
+
+def phash_batch(thumbnails: np.ndarray) -> np.ndarray:
+    """64-bit pHashes of a ``(N, 32, 32)`` stack as ``uint64`` (first bit = MSB).
+
+    Bit-for-bit the ``imagehash.phash`` hash of the same thumbnails.
+    """
+    x = np.asarray(thumbnails, dtype=np.float64)
+    low = _DCT_LOW @ x @ _DCT_LOW.T                       # (N, 8, 8)
+    flat = low.reshape(len(x), -1)
+    bits = flat > np.median(flat, axis=1, keepdims=True)
+    return (bits.astype(np.uint64) * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)
+
+
+def _safe_thumbnail(path: str) -> Optional[np.ndarray]:
+    try:
+        return phash_thumbnail(path)
+    except (OSError, ValueError):
+        return None
+
+
+def phash_paths(
+    paths: Sequence[str | Path],
+    workers: int = 1,
+    progress: Optional[Callable[[int], None]] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """pHashes of image files, decoded by a process pool.
+
+    Returns:
+        ``(hashes, ok)``: ``(N,)`` uint64 hashes and a boolean mask that is
+        False for unreadable files (whose hash is meaningless).
+    """
+    thumbs = np.zeros((len(paths), PHASH_SIZE, PHASH_SIZE), dtype=np.float32)
+    ok = np.zeros(len(paths), dtype=bool)
+    workers = max(1, workers)
+    chunksize = max(1, len(paths) // (workers * 16))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, thumb in enumerate(pool.map(_safe_thumbnail, map(str, paths), chunksize=chunksize)):
+            if thumb is not None:
+                thumbs[i], ok[i] = thumb, True
+            if progress is not None:
+                progress(1)
+    return phash_batch(thumbs), ok
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    """Number of set bits of each ``uint64``."""
+    x = np.asarray(x, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(x).astype(np.int64)
+    return np.unpackbits(x.view(np.uint8).reshape(*x.shape, 8), axis=-1).sum(axis=-1).astype(np.int64)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return popcount(np.bitwise_xor(a, b))
+
+
+# ---------------------------------------------------------------------------
+# Pair search
+# ---------------------------------------------------------------------------
+
+
+def _pairs_in_buckets(keys: np.ndarray) -> np.ndarray:
+    """All ``(i, j)`` with ``i < j`` and ``keys[i] == keys[j]``, as ``(P, 2)``."""
+    order = np.argsort(keys, kind="stable")
+    _, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    chunks = []
+    for start, count in zip(starts[counts > 1], counts[counts > 1], strict=True):
+        members = order[start:start + count]
+        a, b = np.triu_indices(count, k=1)
+        chunks.append(np.stack([members[a], members[b]], axis=1))
+    if not chunks:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.concatenate(chunks)
+    return np.sort(pairs, axis=1)
+
+
+def hamming_pairs(hashes: np.ndarray, threshold: int = DEFAULT_HAMMING_THRESHOLD) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs of 64-bit hashes within Hamming distance *threshold*.
+
+    Multi-index hashing with ``threshold + 1`` chunks; candidates are the
+    union of per-chunk bucket collisions, verified with the full distance.
+
+    Returns:
+        ``(pairs, distances)``: ``(P, 2)`` index pairs with ``i < j`` and
+        their ``(P,)`` Hamming distances, sorted by distance.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n = len(hashes)
+    bounds = np.linspace(0, 64, min(threshold + 1, 64) + 1).round().astype(int)
+    candidates = []
+    for lo, hi in zip(bounds[:-1], bounds[1:], strict=True):
+        mask = np.uint64((1 << (hi - lo)) - 1)
+        chunk = (hashes >> np.uint64(64 - hi)) & mask
+        candidates.append(_pairs_in_buckets(chunk))
+    pairs = np.concatenate(candidates) if candidates else np.empty((0, 2), dtype=np.int64)
+    if len(pairs):
+        pairs = np.unique(pairs[:, 0] * n + pairs[:, 1])
+        pairs = np.stack([pairs // n, pairs % n], axis=1)
+    dist = hamming(hashes[pairs[:, 0]], hashes[pairs[:, 1]]) if len(pairs) else np.empty(0, np.int64)
+    keep = dist <= threshold
+    pairs, dist = pairs[keep], dist[keep]
+    order = np.argsort(dist, kind="stable")
+    return pairs[order], dist[order]
+
+
+def cosine_pairs(
+    embeddings: np.ndarray,
+    threshold: float = DEFAULT_COSINE_THRESHOLD,
+    block: int = _COSINE_BLOCK,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs whose embeddings have cosine similarity ≥ *threshold*.
+
+    The similarity matrix is computed one ``(block, block)`` tile at a time,
+    upper-triangle tiles only, so memory stays constant in N.
+
+    Returns:
+        ``(pairs, similarities)`` sorted by decreasing similarity.
+    """
+    x = np.asarray(embeddings, dtype=np.float32)
+    x = x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+    found, sims = [], []
+    for i in range(0, len(x), block):
+        for j in range(i, len(x), block):
+            s = x[i:i + block] @ x[j:j + block].T
+            hit = s >= threshold
+            if i == j:
+                hit = np.triu(hit, k=1)
+            rows, cols = np.nonzero(hit)
+            found.append(np.stack([rows + i, cols + j], axis=1))
+            sims.append(s[rows, cols])
+    pairs = np.concatenate(found) if found else np.empty((0, 2), dtype=np.int64)
+    sims = np.concatenate(sims) if sims else np.empty(0, dtype=np.float32)
+    order = np.argsort(-sims, kind="stable")
+    return pairs[order].astype(np.int64), sims[order]
+
+
+# ---------------------------------------------------------------------------
+# Groups
+# ---------------------------------------------------------------------------
+
+
+def connected_groups(n: int, pairs: np.ndarray) -> np.ndarray:
+    """Group id (smallest member index) of every item, linking each pair.
+
+    Vectorised min-label propagation with pointer jumping; converges in a
+    few passes even for long chains.
+    """
+    labels = np.arange(n)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    if not len(pairs):
+        return labels
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        new = labels.copy()
+        np.minimum.at(new, a, low)
+        np.minimum.at(new, b, low)
+        new = new[new]  # pointer jumping
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+
+def group_members(groups: np.ndarray, min_size: int = 2) -> list[np.ndarray]:
+    """Member indices of every group with at least *min_size* items, largest first."""
+    order = np.argsort(groups, kind="stable")
+    _, starts, counts = np.unique(groups[order], return_index=True, return_counts=True)
+    members = [order[s:s + c] for s, c in zip(starts, counts, strict=True) if c >= min_size]
+    return sorted(members, key=len, reverse=True)
+
+
+# ---------------------------------------------------------------------------
+# Report I/O (shared by deduplicate.py and split_dataset.py)
+# ---------------------------------------------------------------------------
+
+
+def duplicate_groups(
+    paths: Sequence[str | Path],
+    threshold: int = DEFAULT_HAMMING_THRESHOLD,
+    workers: int = 1,
+) -> list[list[str]]:
+    """pHash near-duplicate groups (two or more members) among *paths*.
+
+    Unreadable files are left out.
+    """
+    hashes, ok = phash_paths(paths, workers)
+    keep = np.flatnonzero(ok)
+    pairs, _ = hamming_pairs(hashes[keep], threshold)
+    groups = connected_groups(len(keep), pairs)
+    return [[str(paths[keep[i]]) for i in members] for members in group_members(groups)]
+
+
+def group_index(groups: Iterable[Sequence[str | Path]]) -> dict[str, int]:
+    """Map of resolved image path → group number."""
+    return {str(Path(p).resolve()): gid for gid, members in enumerate(groups) for p in members}
+
+
+def write_groups(path: str | Path, groups: Iterable[Sequence[str]], extra: Optional[dict] = None) -> None:
+    """Write duplicate groups (lists of image paths) as JSON."""
+    report = {**(extra or {}), "groups": [list(map(str, g)) for g in groups]}
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+
+
+def load_groups(path: str | Path) -> dict[str, int]:
+    """Map of resolved image path → group number from a :func:`write_groups` file."""
+    with open(path, encoding="utf-8") as fh:
+        return group_index(json.load(fh)["groups"])
@@ -0,0 +1,18 @@
+"""Content hashes of files on disk.
+
+Shared by the serving classifier (checkpoint identity), the caches and the
+offline dataset tools, so none of them has to import the others.
+"""
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+
+def file_sha256(path: str | Path) -> str:
+    """Return the hex SHA-256 of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,224 @@
+"""On-disk cache of per-image model outputs for the offline evaluation scripts.
+
+evaluate.py, evaluate2.py, error_analysis.py, robustness_test.py and
+ablation_background_removal.py all run the same checkpoint over the same test
+split and only differ in the report they build from the outputs.  This module
+stores one inference pass – logits, softmax probabilities, labels and image
+paths – so every script after the first only loads an ``.npz`` file.
+
+An entry is keyed by
+
+    sha256(checkpoint bytes) + manifest hash + transform id
+
+where the manifest hash covers (path, label, size, mtime) of every image, so
+retraining, editing or adding a test image, or changing the preprocessing
+produces a new entry.  The manifest is hashed in sorted path order and results
+are re-aligned to the caller's sample order on load, so scripts that list the
+split in different orders still share an entry.
+
+Layout::
+
+    <root>/<key[:2]>/<key>.npz
+
+Typical use::
+
+    cache = InferenceCache()
+    result = cache.get_or_compute(
+        MODEL_PATH, samples, transform_id(transform),
+        compute=lambda: collect_logits(load_model(), loader, DEVICE),
+    )
+    result.preds, result.confidences, result.probs
+
+Environment variables
+---------------------
+INFERENCE_CACHE_DIR   cache root, default ``.cache/inference``
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import torch
+
+from .hashing import file_sha256
+
+DEFAULT_CACHE_ROOT = os.environ.get("INFERENCE_CACHE_DIR", ".cache/inference")
+FORMAT_VERSION = 1
+
+Samples = Sequence[tuple]  # (path, label, ...) – extra fields are ignored
+
+
+# ---------------------------------------------------------------------------
+# Keys
+# ---------------------------------------------------------------------------
+
+
+def _norm_path(path: str | Path) -> str:
+    return os.path.abspath(str(path))
+
+
+def manifest_hash(samples: Samples) -> str:
+    """Hash of (path, label, size, mtime) for every sample, order-independent."""
+    h = hashlib.sha256()
+    for path, label in sorted((_norm_path(s[0]), int(s[1])) for s in samples):
+        try:
+            st = os.stat(path)
+            stamp = f"{st.st_size}\0{st.st_mtime_ns}"
+        except OSError:
+            stamp = "-"  # e.g. source paths recorded in a packed index
+        h.update(f"{path}\0{label}\0{stamp}\n".encode())
+    return h.hexdigest()
+
+
+def transform_id(transform) -> str:
+    """Stable identifier of a torchvision transform pipeline (its ``repr``)."""
+    return repr(transform)
+
+
+# ---------------------------------------------------------------------------
+# Results
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class InferenceResult:
+    """Outputs of one model over one sample list, in sample order."""
+
+    logits: np.ndarray        # (N, C) float32
+    labels: np.ndarray        # (N,)   int64
+    paths: list[str]
+    class_names: list[str]
+    key: str = ""
+    cached: bool = False
+
+    @property
+    def probs(self) -> np.ndarray:
+        z = self.logits - self.logits.max(axis=1, keepdims=True)
+        e = np.exp(z)
+        return (e / e.sum(axis=1, keepdims=True)).astype(np.float32)
+
+    @property
+    def preds(self) -> np.ndarray:
+        return self.logits.argmax(axis=1)
+
+    @property
+    def confidences(self) -> np.ndarray:
+        return self.probs.max(axis=1)
+
+
+def collect_logits(model: torch.nn.Module, loader, device) -> np.ndarray:
+    """Run *model* over *loader* (batches start with the input tensor) and
+    return the stacked ``(N, C)`` float32 logits in loader order."""
+    model.eval()
+    out = []
+    with torch.no_grad():
+        for batch in loader:
+            out.append(model(batch[0].to(device)).float().cpu().numpy())
+    return np.concatenate(out).astype(np.float32) if out else np.zeros((0, 0), np.float32)
+
+
+# ---------------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------------
+
+
+class InferenceCache:
+    """Content-addressed store of :class:`InferenceResult` artifacts.
+
+    Args:
+        root:     Cache directory.
+        enabled:  When False, :meth:`get_or_compute` always recomputes and
+                  never writes (the scripts' ``--no-cache`` flag).
+    """
+
+    def __init__(self, root: str | Path = DEFAULT_CACHE_ROOT, enabled: bool = True) -> None:
+        self.root = Path(root)
+        self.enabled = enabled
+
+    def key(self, checkpoint: str | Path, samples: Samples, transform: str) -> str:
+        h = hashlib.sha256()
+        h.update(f"v{FORMAT_VERSION}\n".encode())
+        h.update(file_sha256(checkpoint).encode() + b"\n")
+        h.update(manifest_hash(samples).encode() + b"\n")
+        h.update(transform.encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.npz"
+
+    def load(self, key: str, samples: Samples) -> Optional[InferenceResult]:
+        """Return the entry for *key* aligned to *samples*, or None."""
+        path = self.path(key)
+        if not path.is_file():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                logits = data["logits"]
+                stored_paths = [str(p) for p in data["paths"]]
+                class_names = [str(c) for c in data["class_names"]]
+        except (OSError, ValueError, KeyError):
+            return None  # truncated / foreign file: recompute
+        index = {p: i for i, p in enumerate(stored_paths)}
+        try:
+            order = [index[_norm_path(s[0])] for s in samples]
+        except KeyError:
+            return None
+        return InferenceResult(
+            logits=logits[order],
+            labels=np.array([int(s[1]) for s in samples], dtype=np.int64),
+            paths=[str(s[0]) for s in samples],
+            class_names=class_names,
+            key=key,
+            cached=True,
+        )
+
+    def save(self, key: str, result: InferenceResult) -> Path:
+        """Write *result* atomically (temp file + rename)."""
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez_compressed(
+            tmp,
+            logits=result.logits.astype(np.float32),
+            labels=result.labels.astype(np.int64),
+            paths=np.array([_norm_path(p) for p in result.paths]),
+            class_names=np.array(result.class_names),
+        )
+        os.replace(tmp, path)
+        return path
+
+    def get_or_compute(
+        self,
+        checkpoint: str | Path,
+        samples: Samples,
+        transform: str,
+        compute: Callable[[], np.ndarray],
+        class_names: Sequence[str] = (),
+    ) -> InferenceResult:
+        """Return cached outputs for *samples*, running ``compute()`` on a miss.
+
+        ``compute`` must return the ``(N, C)`` logits in *samples* order; the
+        model is therefore only built when the cache cannot answer.
+        """
+        key = self.key(checkpoint, samples, transform) if self.enabled else ""
+        if self.enabled:
+            hit = self.load(key, samples)
+            if hit is not None:
+                return hit
+        logits = np.asarray(compute(), dtype=np.float32)
+        if len(logits) != len(samples):
+            raise ValueError(f"compute() returned {len(logits)} rows for {len(samples)} samples")
+        result = InferenceResult(
+            logits=logits,
+            labels=np.array([int(s[1]) for s in samples], dtype=np.int64),
+            paths=[str(s[0]) for s in samples],
+            class_names=list(class_names),
+            key=key,
+        )
+        if self.enabled:
+            self.save(key, result)
+        return result
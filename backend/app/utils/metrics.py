@@ -0,0 +1,388 @@
+"""Vectorised classification metrics shared by the evaluation scripts.
+
+evaluate.py, evaluate2.py, error_analysis.py, robustness_test.py,
+ablation_background_removal.py, cross_validate.py and baseline_comparison.py
+all need the same numbers.  Everything here is plain numpy without Python
+loops over samples:
+
+* confusion matrices via ``np.bincount`` on ``true * C + pred`` codes;
+* precision / recall / F1 from the diagonal and marginals, for one matrix or
+  a stack of them (``(..., C, C)``), which is what makes the bootstrap cheap;
+* ROC and precision-recall curves from a single sort of the scores and
+  cumulative true/false-positive counts (same conventions as scikit-learn);
+* expected calibration error over equal-width confidence bins;
+* bootstrap confidence intervals that resample all replicates at once.
+
+For evaluations too large to hold every prediction, the ``*Accumulator``
+classes keep only fixed-size counts: a confusion matrix, per-bin calibration
+sums and per-class score histograms (from which ROC-AUC / AP are computed to
+within the histogram resolution).
+
+The ``eps`` guard mirrors the original per-script code, so empty classes give
+0 instead of NaN and reported numbers are unchanged.
+"""
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+
+EPS = 1e-12
+DEFAULT_ECE_BINS = 15
+DEFAULT_SCORE_BINS = 1000
+
+
+# ---------------------------------------------------------------------------
+# Confusion-matrix metrics
+# ---------------------------------------------------------------------------
+
+
+def confusion_matrix(y_true, y_pred, num_classes: int) -> np.ndarray:
+    """``(C, C)`` int64 counts, rows = true class, columns = predicted class."""
+    y_true = np.asarray(y_true, dtype=np.int64)
+    y_pred = np.asarray(y_pred, dtype=np.int64)
+    codes = y_true * num_classes + y_pred
+    return np.bincount(codes, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+
+def per_class_metrics(cm: np.ndarray) -> dict[str, np.ndarray]:
+    """Precision, recall, F1 and support per class.
+
+    *cm* may be a single ``(C, C)`` matrix or a stack ``(..., C, C)``; the
+    returned arrays have shape ``(..., C)``.
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    tp = np.diagonal(cm, axis1=-2, axis2=-1)
+    predicted = cm.sum(axis=-2)
+    support = cm.sum(axis=-1)
+    precision = tp / (predicted + EPS)
+    recall = tp / (support + EPS)
+    f1 = 2 * precision * recall / (precision + recall + EPS)
+    return {"precision": precision, "recall": recall, "f1": f1, "support": support}
+
+
+def accuracy_from_cm(cm: np.ndarray) -> np.ndarray | float:
+    cm = np.asarray(cm, dtype=np.float64)
+    acc = np.trace(cm, axis1=-2, axis2=-1) / (cm.sum(axis=(-2, -1)) + EPS)
+    return float(acc) if acc.ndim == 0 else acc
+
+
+def summarize_confusion(cm: np.ndarray) -> dict:
+    """Accuracy, macro and per-class precision/recall/F1 of one matrix (JSON-ready)."""
+    m = per_class_metrics(cm)
+    return {
+        "accuracy": accuracy_from_cm(cm),
+        "macro_precision": float(m["precision"].mean()),
+        "macro_recall": float(m["recall"].mean()),
+        "macro_f1": float(m["f1"].mean()),
+        "per_class_precision": m["precision"].tolist(),
+        "per_class_recall": m["recall"].tolist(),
+        "per_class_f1": m["f1"].tolist(),
+        "confusion_matrix": np.asarray(cm).astype(int).tolist(),
+    }
+
+
+def compute_metrics(y_true, y_pred, num_classes: int) -> dict:
+    """Return accuracy + per-class precision/recall/F1 + macro averages."""
+    return summarize_confusion(confusion_matrix(y_true, y_pred, num_classes))
+
+
+def format_report(cm: np.ndarray, class_names: Sequence[str], digits: int = 3) -> str:
+    """Plain-text per-class report (precision, recall, F1, support, accuracy)."""
+    m = per_class_metrics(cm)
+    w = digits + 6
+    lines = [
+        "Per-class metrics:",
+        "-" * 72,
+        f"{'class':28s}  {'precision':>{w}s}  {'recall':>{w}s}  {'f1':>{w}s}  {'support':>9s}",
+        "-" * 72,
+    ]
+    for i, name in enumerate(class_names):
+        lines.append(f"{name:28s}  {m['precision'][i]:{w}.{digits}f}  {m['recall'][i]:{w}.{digits}f}  "
+                     f"{m['f1'][i]:{w}.{digits}f}  {int(m['support'][i]):9d}")
+    lines.append("-" * 72)
+    lines.append(f"{'macro avg':28s}  {m['precision'].mean():{w}.{digits}f}  {m['recall'].mean():{w}.{digits}f}  "
+                 f"{m['f1'].mean():{w}.{digits}f}  {int(m['support'].sum()):9d}")
+    lines.append(f"{'overall accuracy':28s}  {accuracy_from_cm(cm):{w}.{digits}f}")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# Ranking curves (one-vs-rest)
+# ---------------------------------------------------------------------------
+
+
+def _binary_counts(y_true, scores) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Cumulative (tps, fps, thresholds) at every distinct score, high → low."""
+    y_true = np.asarray(y_true).astype(bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(-scores, kind="mergesort")
+    scores, y_true = scores[order], y_true[order]
+    last = np.r_[np.flatnonzero(np.diff(scores)), scores.size - 1]
+    tps = np.cumsum(y_true)[last]
+    fps = (last + 1) - tps
+    return tps, fps, scores[last]
+
+
+def _roc_from_counts(tps, fps):
+    tps = np.r_[0, tps].astype(np.float64)
+    fps = np.r_[0, fps].astype(np.float64)
+    fpr = fps / fps[-1] if fps[-1] > 0 else np.full_like(fps, np.nan)
+    tpr = tps / tps[-1] if tps[-1] > 0 else np.full_like(tps, np.nan)
+    return fpr, tpr
+
+
+def _pr_from_counts(tps, fps):
+    tps = np.asarray(tps, dtype=np.float64)
+    fps = np.asarray(fps, dtype=np.float64)
+    precision = tps / np.maximum(tps + fps, EPS)
+    recall = tps / tps[-1] if tps.size and tps[-1] > 0 else np.zeros_like(tps)
+    # Stop once full recall is reached; reverse so recall decreases.
+    stop = int(np.searchsorted(tps, tps[-1])) + 1 if tps.size else 0
+    return np.r_[precision[:stop][::-1], 1.0], np.r_[recall[:stop][::-1], 0.0]
+
+
+def _trapezoid(y, x) -> float:
+    return float(np.sum(np.diff(x) * (y[1:] + y[:-1]) / 2.0))
+
+
+def roc_curve(y_true, scores) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Binary ROC curve: ``(fpr, tpr, thresholds)``; thresholds[0] is ``inf``."""
+    tps, fps, thr = _binary_counts(y_true, scores)
+    fpr, tpr = _roc_from_counts(tps, fps)
+    return fpr, tpr, np.r_[np.inf, thr]
+
+
+def roc_auc(y_true, scores) -> float:
+    """Area under the ROC curve; NaN when only one class is present."""
+    tps, fps, _ = _binary_counts(y_true, scores)
+    if tps.size == 0 or tps[-1] == 0 or fps[-1] == 0:
+        return float("nan")
+    fpr, tpr = _roc_from_counts(tps, fps)
+    return _trapezoid(tpr, fpr)
+
+
+def precision_recall_curve(y_true, scores) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Binary PR curve: ``(precision, recall, thresholds)`` with recall decreasing."""
+    tps, fps, thr = _binary_counts(y_true, scores)
+    precision, recall = _pr_from_counts(tps, fps)
+    stop = len(precision) - 1
+    return precision, recall, thr[:stop][::-1]
+
+
+def average_precision(y_true, scores) -> float:
+    """Step-wise area under the PR curve: Σ (Rₙ − Rₙ₋₁) · Pₙ."""
+    tps, fps, _ = _binary_counts(y_true, scores)
+    if tps.size == 0 or tps[-1] == 0:
+        return float("nan")
+    precision, recall = _pr_from_counts(tps, fps)
+    return float(-np.sum(np.diff(recall) * precision[:-1]))
+
+
+def one_vs_rest(y_true, probs: np.ndarray, metric=roc_auc) -> np.ndarray:
+    """Apply a binary *metric* (roc_auc, average_precision) to every class column."""
+    y_true = np.asarray(y_true)
+    return np.array([metric(y_true == c, probs[:, c]) for c in range(probs.shape[1])])
+
+
+# ---------------------------------------------------------------------------
+# Calibration
+# ---------------------------------------------------------------------------
+
+
+def calibration_bins(probs: np.ndarray, y_true, n_bins: int = DEFAULT_ECE_BINS):
+    """Per-bin ``(count, confidence_sum, correct_sum)`` of the top-1 prediction."""
+    probs = np.asarray(probs, dtype=np.float64)
+    conf = probs.max(axis=1)
+    correct = (probs.argmax(axis=1) == np.asarray(y_true)).astype(np.float64)
+    bins = np.minimum((conf * n_bins).astype(np.int64), n_bins - 1)
+    return (np.bincount(bins, minlength=n_bins),
+            np.bincount(bins, weights=conf, minlength=n_bins),
+            np.bincount(bins, weights=correct, minlength=n_bins))
+
+
+def _ece_from_bins(count, conf_sum, correct_sum) -> float:
+    total = count.sum()
+    if total == 0:
+        return float("nan")
+    return float(np.abs(correct_sum - conf_sum).sum() / total)
+
+
+def expected_calibration_error(probs: np.ndarray, y_true, n_bins: int = DEFAULT_ECE_BINS) -> float:
+    """ECE = Σ_b (n_b / N) · |accuracy_b − confidence_b| over equal-width bins."""
+    return _ece_from_bins(*calibration_bins(probs, y_true, n_bins))
+
+
+# ---------------------------------------------------------------------------
+# Bootstrap
+# ---------------------------------------------------------------------------
+
+
+def bootstrap_confusions(
+    y_true, y_pred, num_classes: int, n_boot: int = 1000, seed: int = 0,
+    max_block: int = 1 << 24,
+) -> np.ndarray:
+    """``(n_boot, C, C)`` confusion matrices of bootstrap resamples.
+
+    Each replicate resamples the N predictions with replacement.  Replicates
+    are drawn as an index matrix of up to *max_block* elements at a time and
+    counted with one ``bincount`` per block, so memory stays bounded for
+    large B × N (B = N = 10 000 takes a few seconds).  The generator is
+    consumed in the same order whatever the block size, so results depend
+    only on *seed*.
+    """
+    codes = (np.asarray(y_true, dtype=np.int64) * num_classes
+             + np.asarray(y_pred, dtype=np.int64))
+    n, cc = codes.size, num_classes * num_classes
+    rng = np.random.default_rng(seed)
+    out = np.empty((n_boot, cc), dtype=np.int64)
+    per_block = max(1, max_block // max(n, 1))
+    for start in range(0, n_boot, per_block):
+        b = min(per_block, n_boot - start)
+        idx = rng.integers(0, n, size=(b, n))
+        shifted = codes[idx] + (np.arange(b, dtype=np.int64) * cc)[:, None]
+        out[start:start + b] = np.bincount(shifted.ravel(), minlength=b * cc).reshape(b, cc)
+    return out.reshape(n_boot, num_classes, num_classes)
+
+
+def _interval(values: np.ndarray, point, ci: float) -> dict:
+    lo, hi = np.percentile(values, [(1 - ci) / 2 * 100, (1 + ci) / 2 * 100], axis=0)
+    if np.ndim(point) == 0:
+        return {"point": float(point), "low": float(lo), "high": float(hi)}
+    return {"point": np.asarray(point).tolist(), "low": lo.tolist(), "high": hi.tolist()}
+
+
+def bootstrap_ci(
+    y_true, y_pred, num_classes: int, n_boot: int = 1000, ci: float = 0.95, seed: int = 0,
+) -> dict:
+    """Percentile bootstrap intervals for accuracy, macro-F1 and per-class recall.
+
+    Returns ``{"accuracy": {"point", "low", "high"}, "macro_f1": {...},
+    "per_class_recall": {"point": [...], "low": [...], "high": [...]},
+    "n_boot": B, "ci": ci}``.
+    """
+    point_cm = confusion_matrix(y_true, y_pred, num_classes)
+    point = per_class_metrics(point_cm)
+    cms = bootstrap_confusions(y_true, y_pred, num_classes, n_boot=n_boot, seed=seed)
+    reps = per_class_metrics(cms)
+    return {
+        "accuracy": _interval(accuracy_from_cm(cms), accuracy_from_cm(point_cm), ci),
+        "macro_f1": _interval(reps["f1"].mean(axis=-1), point["f1"].mean(), ci),
+        "per_class_recall": _interval(reps["recall"], point["recall"], ci),
+        "n_boot": int(n_boot),
+        "ci": ci,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Streaming accumulators
+# ---------------------------------------------------------------------------
+
+
+class ConfusionAccumulator:
+    """Running confusion matrix; feed batches with :meth:`update`."""
+
+    def __init__(self, num_classes: int) -> None:
+        self.num_classes = num_classes
+        self.matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+
+    def update(self, y_true, y_pred) -> None:
+        self.matrix += confusion_matrix(y_true, y_pred, self.num_classes)
+
+    def metrics(self) -> dict:
+        return summarize_confusion(self.matrix)
+
+
+class CalibrationAccumulator:
+    """Running per-bin calibration sums; :meth:`ece` matches the batch version."""
+
+    def __init__(self, n_bins: int = DEFAULT_ECE_BINS) -> None:
+        self.n_bins = n_bins
+        self.count = np.zeros(n_bins, dtype=np.int64)
+        self.conf_sum = np.zeros(n_bins)
+        self.correct_sum = np.zeros(n_bins)
+
+    def update(self, probs: np.ndarray, y_true) -> None:
+        c, s, k = calibration_bins(probs, y_true, self.n_bins)
+        self.count += c
+        self.conf_sum += s
+        self.correct_sum += k
+
+    def ece(self) -> float:
+        return _ece_from_bins(self.count, self.conf_sum, self.correct_sum)
+
+
+class ScoreHistogramAccumulator:
+    """Per-class histograms of positive / negative scores.
+
+    ROC-AUC and AP are computed from the cumulative histogram counts, i.e.
+    exactly as with the raw scores rounded down to ``1 / n_bins``.
+    """
+
+    def __init__(self, num_classes: int, n_bins: int = DEFAULT_SCORE_BINS) -> None:
+        self.num_classes = num_classes
+        self.n_bins = n_bins
+        self.pos = np.zeros((num_classes, n_bins), dtype=np.int64)
+        self.neg = np.zeros((num_classes, n_bins), dtype=np.int64)
+
+    def update(self, probs: np.ndarray, y_true) -> None:
+        probs = np.asarray(probs, dtype=np.float64)
+        y_true = np.asarray(y_true, dtype=np.int64)
+        n, c = probs.shape
+        bins = np.minimum((probs * self.n_bins).astype(np.int64), self.n_bins - 1)
+        flat = (np.arange(c) * self.n_bins)[None, :] + bins             # (N, C)
+        is_pos = y_true[:, None] == np.arange(c)[None, :]
+        size = c * self.n_bins
+        self.pos += np.bincount(flat[is_pos], minlength=size).reshape(c, self.n_bins)
+        self.neg += np.bincount(flat[~is_pos], minlength=size).reshape(c, self.n_bins)
+
+    def _counts(self, cls: int):
+        # Empty bins only repeat a curve point, which changes neither area.
+        return np.cumsum(self.pos[cls, ::-1]), np.cumsum(self.neg[cls, ::-1])
+
+    def roc_auc(self) -> np.ndarray:
+        out = np.full(self.num_classes, np.nan)
+        for c in range(self.num_classes):
+            tps, fps = self._counts(c)
+            if tps.size and tps[-1] > 0 and fps[-1] > 0:
+                fpr, tpr = _roc_from_counts(tps, fps)
+                out[c] = _trapezoid(tpr, fpr)
+        return out
+
+    def average_precision(self) -> np.ndarray:
+        out = np.full(self.num_classes, np.nan)
+        for c in range(self.num_classes):
+            tps, fps = self._counts(c)
+            if tps.size and tps[-1] > 0:
+                precision, recall = _pr_from_counts(tps, fps)
+                out[c] = -np.sum(np.diff(recall) * precision[:-1])
+        return out
+
+
+class MetricsAccumulator:
+    """Confusion, calibration and ranking metrics from streamed probabilities."""
+
+    def __init__(self, num_classes: int, ece_bins: int = DEFAULT_ECE_BINS,
+                 score_bins: int = DEFAULT_SCORE_BINS) -> None:
+        self.confusion = ConfusionAccumulator(num_classes)
+        self.calibration = CalibrationAccumulator(ece_bins)
+        self.scores = ScoreHistogramAccumulator(num_classes, score_bins)
+
+    def update(self, y_true, probs: np.ndarray) -> None:
+        probs = np.asarray(probs)
+        self.confusion.update(y_true, probs.argmax(axis=1))
+        self.calibration.update(probs, y_true)
+        self.scores.update(probs, y_true)
+
+    def result(self) -> dict:
+        out = self.confusion.metrics()
+        auc = self.scores.roc_auc()
+        ap = self.scores.average_precision()
+        out.update({
+            "ece": self.calibration.ece(),
+            "per_class_roc_auc": auc.tolist(),
+            "macro_roc_auc": float(np.nanmean(auc)) if np.isfinite(auc).any() else float("nan"),
+            "per_class_average_precision": ap.tolist(),
+            "macro_average_precision": float(np.nanmean(ap)) if np.isfinite(ap).any() else float("nan"),
+        })
+        return out
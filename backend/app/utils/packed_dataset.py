@@ -0,0 +1,260 @@
+"""Pre-decoded, pre-resized image shards for decode-free training.
+
+Training on CPU hosts is dominated by JPEG decoding and resizing: every epoch
+``ImageFolder`` re-decodes each full-size photo before ``Resize`` throws most
+of the pixels away.  ``pack_dataset.py`` decodes every image once, resizes it
+to a fixed square (256×256 by default) and stores the pixels in uint8 ``.npy``
+shards that are memory-mapped at load time, so an epoch only pays for a page
+cache read plus the random augmentations.
+
+Layout of one packed split::
+
+    <root>/<split>/index.json          # classes, image size, labels, paths
+    <root>/<split>/shard_00000.npy     # uint8 (n, S, S, 3)
+    <root>/<split>/shard_00001.npy
+    ...
+
+:func:`write_packed_split` produces that layout (used by ``pack_dataset.py``)
+and :func:`ensure_packed_cache` keeps a content-keyed packed copy of a sample
+list under ``.cache/`` for scripts that want decode-once behaviour without a
+separate packing step.
+
+``PackedImageDataset`` mirrors the parts of ``torchvision.datasets.ImageFolder``
+the training scripts rely on (``classes``, ``targets``, ``samples``) and
+returns ``(uint8 CHW tensor, label)`` pairs.  Use :func:`packed_transform` to
+turn an existing PIL pipeline into its tensor equivalent.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import transforms
+
+INDEX_NAME = "index.json"
+FORMAT_VERSION = 1
+DEFAULT_PACKED_SIZE = 256
+DEFAULT_SHARD_SIZE = 1024
+DEFAULT_PACKED_CACHE_ROOT = os.environ.get("PACKED_CACHE_DIR", ".cache/packed")
+
+
+def shard_name(i: int) -> str:
+    return f"shard_{i:05d}.npy"
+
+
+def read_index(split_dir: str | Path) -> dict:
+    """Return the parsed ``index.json`` of a packed split."""
+    index_path = Path(split_dir) / INDEX_NAME
+    if not index_path.exists():
+        raise FileNotFoundError(f"Packed split index not found: {index_path}")
+    with open(index_path, encoding="utf-8") as fh:
+        index = json.load(fh)
+    if index.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported packed format version {index.get('version')!r} in {index_path}"
+        )
+    return index
+
+
+class PackedImageDataset(Dataset):
+    """Memory-mapped dataset over the shards of one packed split.
+
+    Shards are opened lazily with ``np.load(mmap_mode="r")`` in whichever
+    process first touches them, so DataLoader workers never pickle array data.
+
+    Args:
+        split_dir: Directory containing ``index.json`` and the shards.
+        transform: Optional callable applied to the uint8 ``(3, S, S)`` tensor.
+    """
+
+    def __init__(
+        self,
+        split_dir: str | Path,
+        transform: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+    ) -> None:
+        self.root = Path(split_dir)
+        self.transform = transform
+        index = read_index(self.root)
+
+        self.classes: list[str] = list(index["classes"])
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+        self.image_size: int = int(index["image_size"])
+        self.targets: list[int] = [int(t) for t in index["labels"]]
+        self.paths: list[str] = list(index["paths"])
+        self.samples: list[tuple[str, int]] = list(zip(self.paths, self.targets, strict=True))
+
+        self._shard_files = [s["file"] for s in index["shards"]]
+        counts = np.array([s["count"] for s in index["shards"]], dtype=np.int64)
+        self._shard_starts = np.concatenate([[0], np.cumsum(counts)])
+        if int(self._shard_starts[-1]) != len(self.targets):
+            raise ValueError(
+                f"{self.root}: shards hold {int(self._shard_starts[-1])} images "
+                f"but the index lists {len(self.targets)}"
+            )
+        self._shards: dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_shards"] = {}  # re-mapped on first access in the new process
+        return state
+
+    def _shard(self, i: int) -> np.ndarray:
+        arr = self._shards.get(i)
+        if arr is None:
+            arr = np.load(self.root / self._shard_files[i], mmap_mode="r")
+            self._shards[i] = arr
+        return arr
+
+    def load_image(self, idx: int) -> torch.Tensor:
+        """Return image *idx* as a uint8 ``(3, S, S)`` tensor (no transform)."""
+        if idx < 0:
+            idx += len(self)
+        shard = int(np.searchsorted(self._shard_starts, idx, side="right")) - 1
+        pixels = np.array(self._shard(shard)[idx - self._shard_starts[shard]])
+        return torch.from_numpy(pixels).permute(2, 0, 1)
+
+    def __getitem__(self, idx: int):
+        image = self.load_image(idx)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[idx]
+
+
+def packed_transform(pipeline: transforms.Compose) -> transforms.Compose:
+    """Adapt a PIL ``transforms.Compose`` pipeline to packed uint8 tensors.
+
+    ``ToTensor`` is replaced by ``ConvertImageDtype(torch.float32)``; every
+    other torchvision transform used by the training scripts (resize, flips,
+    rotation, affine, colour jitter, normalise) accepts tensors unchanged, so
+    augmentations stay identical between packed and folder datasets.
+    """
+    steps = [
+        transforms.ConvertImageDtype(torch.float32) if isinstance(t, transforms.ToTensor) else t
+        for t in pipeline.transforms
+    ]
+    return transforms.Compose(steps)
+
+
+def open_packed_split(
+    packed_root: str | Path,
+    split: str,
+    transform: Optional[transforms.Compose] = None,
+) -> PackedImageDataset:
+    """Open ``<packed_root>/<split>`` applying the tensor form of *transform*."""
+    tf = packed_transform(transform) if transform is not None else None
+    return PackedImageDataset(Path(packed_root) / split, transform=tf)
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+
+
+def decode_resized(job: tuple[str, int]) -> np.ndarray:
+    """Decode one image to a ``(size, size, 3)`` uint8 array."""
+    path, size = job
+    with Image.open(path) as img:
+        # Let the JPEG decoder downscale by a power of two before resizing.
+        img.draft("RGB", (size, size))
+        rgb = img.convert("RGB").resize((size, size), Image.BILINEAR)
+        return np.asarray(rgb, dtype=np.uint8)
+
+
+def write_packed_split(
+    samples: Sequence[tuple[str | Path, int]],
+    classes: Sequence[str],
+    out_dir: str | Path,
+    size: int = DEFAULT_PACKED_SIZE,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    workers: int = 1,
+    progress: Optional[Callable[[int], None]] = None,
+    source: str = "",
+) -> list[dict]:
+    """Decode, resize and write *samples* as a packed split in *out_dir*.
+
+    Images are decoded by a process pool one shard at a time, so at most
+    *shard_size* decoded images are held in memory.  ``index.json`` is
+    written last; a directory without it is an incomplete pack.
+
+    Returns:
+        The shard descriptors written to the index.
+    """
+    out_dir = Path(out_dir)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+
+    workers = max(1, workers)
+    shard_size = max(1, shard_size)
+    jobs = [(str(p), size) for p, _ in samples]
+    shards: list[dict] = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(jobs), shard_size):
+            shard_jobs = jobs[start:start + shard_size]
+            name = shard_name(len(shards))
+            shard = np.lib.format.open_memmap(
+                out_dir / name, mode="w+", dtype=np.uint8,
+                shape=(len(shard_jobs), size, size, 3),
+            )
+            chunksize = max(1, len(shard_jobs) // (workers * 4))
+            for i, pixels in enumerate(pool.map(decode_resized, shard_jobs, chunksize=chunksize)):
+                shard[i] = pixels
+                if progress is not None:
+                    progress(1)
+            shard.flush()
+            del shard
+            shards.append({"file": name, "count": len(shard_jobs)})
+
+    index = {
+        "version": FORMAT_VERSION,
+        "source": source,
+        "image_size": size,
+        "classes": list(classes),
+        "shards": shards,
+        "labels": [int(label) for _, label in samples],
+        "paths": [str(p) for p, _ in samples],
+    }
+    tmp = out_dir / (INDEX_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(index, fh)
+    os.replace(tmp, out_dir / INDEX_NAME)
+    return shards
+
+
+def ensure_packed_cache(
+    samples: Sequence[tuple[str | Path, int]],
+    classes: Sequence[str],
+    size: int,
+    cache_root: str | Path = DEFAULT_PACKED_CACHE_ROOT,
+    workers: int = 1,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Path:
+    """Return a packed split holding *samples*, writing it on first use.
+
+    The cache directory is keyed by the sample list (path, label, size and
+    mtime of every file), the class names and the stored image size, so any
+    change to the source images produces a fresh entry.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({"size": size, "classes": list(classes), "v": FORMAT_VERSION}).encode())
+    for path, label in samples:
+        st = os.stat(path)
+        h.update(f"{path}\0{label}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    split_dir = Path(cache_root) / h.hexdigest()[:20]
+    if not (split_dir / INDEX_NAME).exists():
+        write_packed_split(samples, classes, split_dir, size=size, workers=workers,
+                           progress=progress, source="cache")
+    return split_dir
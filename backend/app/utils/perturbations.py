@@ -0,0 +1,170 @@
+"""Batched tensor perturbations for robustness evaluation.
+
+``robustness_test.py`` used to build one PIL pipeline and one DataLoader per
+perturbation, so every test image was decoded and resized once per entry.
+Here each perturbation is a function of an already decoded and resized batch
+(float ``(B, 3, H, W)`` in ``[0, 1]``), so one data pass can feed every
+perturbation – and every severity level of a sweep – before normalisation:
+
+* ``blur``        Gaussian blur, severity = sigma in pixels (≈ PIL radius)
+* ``brightness``  multiply by a factor (``ImageEnhance.Brightness`` semantics)
+* ``noise``       additive Gaussian noise, severity = std in ``[0, 1]`` units
+* ``rotation``    random rotation in ``[-deg, deg]`` per sample, black fill
+* ``crop``        centre crop of ``severity`` × side, resized back to the
+                  input size in float (torch bilinear + antialias, not PIL)
+
+Random perturbations draw from an explicit ``torch.Generator`` so runs are
+reproducible.
+
+Typical use::
+
+    suite = default_suite()                     # or severity_sweep("blur")
+    gen = torch.Generator().manual_seed(0)
+    for p in suite:
+        logits = model(normalize(p(batch, gen)))
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torchvision.transforms import functional as TF
+
+from .batch_augment import IMAGENET_MEAN, IMAGENET_STD
+
+PerturbFn = Callable[[torch.Tensor, float, Optional[torch.Generator]], torch.Tensor]
+
+
+# ---------------------------------------------------------------------------
+# Perturbations  (batch in [0, 1] → batch in [0, 1])
+# ---------------------------------------------------------------------------
+
+
+def identity(batch: torch.Tensor, severity: float = 0.0,
+             generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    return batch
+
+
+def gaussian_blur(batch: torch.Tensor, sigma: float,
+                  generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    if sigma <= 0:
+        return batch
+    kernel = 2 * math.ceil(3.0 * sigma) + 1
+    kernel = min(kernel, 2 * (min(batch.shape[-2:]) // 2) - 1)
+    return TF.gaussian_blur(batch, [kernel, kernel], [sigma, sigma])
+
+
+def adjust_brightness(batch: torch.Tensor, factor: float,
+                      generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    return (batch * factor).clamp(0.0, 1.0)
+
+
+def gaussian_noise(batch: torch.Tensor, std: float,
+                   generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    if std <= 0:
+        return batch
+    noise = torch.randn(batch.shape, generator=generator).to(batch.device, batch.dtype)
+    return (batch + noise * std).clamp(0.0, 1.0)
+
+
+def random_rotation(batch: torch.Tensor, degrees: float,
+                    generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    if degrees <= 0:
+        return batch
+    n = batch.shape[0]
+    angle = (torch.rand(n, generator=generator) * 2.0 - 1.0) * degrees * (math.pi / 180.0)
+    cos, sin = torch.cos(angle), torch.sin(angle)
+    theta = torch.zeros(n, 2, 3)
+    theta[:, 0, 0], theta[:, 0, 1] = cos, -sin
+    theta[:, 1, 0], theta[:, 1, 1] = sin, cos
+    grid = F.affine_grid(theta.to(batch.device, batch.dtype), list(batch.shape), align_corners=False)
+    return F.grid_sample(batch, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+
+def center_crop_resize(batch: torch.Tensor, fraction: float,
+                       generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    if fraction >= 1.0:
+        return batch
+    h, w = batch.shape[-2:]
+    ch, cw = max(1, int(h * fraction)), max(1, int(w * fraction))
+    top, left = (h - ch) // 2, (w - cw) // 2
+    crop = batch[..., top:top + ch, left:left + cw]
+    return F.interpolate(crop, size=(h, w), mode="bilinear", align_corners=False, antialias=True)
+
+
+KINDS: dict[str, PerturbFn] = {
+    "blur": gaussian_blur,
+    "brightness": adjust_brightness,
+    "noise": gaussian_noise,
+    "rotation": random_rotation,
+    "crop": center_crop_resize,
+}
+
+
+# ---------------------------------------------------------------------------
+# Suites
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Perturbation:
+    """A named perturbation at one severity level."""
+
+    name: str
+    kind: str
+    severity: float
+    fn: PerturbFn
+
+    def __call__(self, batch: torch.Tensor,
+                 generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        return self.fn(batch, self.severity, generator)
+
+
+BASELINE = Perturbation("Baseline (clean)", "clean", 0.0, identity)
+
+
+def default_suite() -> list[Perturbation]:
+    """The fixed robustness table reported in the thesis (baseline first)."""
+    return [
+        BASELINE,
+        Perturbation("Blur (r=3)", "blur", 3.0, gaussian_blur),
+        Perturbation("Blur (r=5)", "blur", 5.0, gaussian_blur),
+        Perturbation("Low brightness (×0.4)", "brightness", 0.4, adjust_brightness),
+        Perturbation("Low brightness (×0.2)", "brightness", 0.2, adjust_brightness),
+        Perturbation("Gaussian noise (σ=0.10)", "noise", 0.10, gaussian_noise),
+        Perturbation("Gaussian noise (σ=0.20)", "noise", 0.20, gaussian_noise),
+        Perturbation("Rotation (±45°)", "rotation", 45.0, random_rotation),
+        Perturbation("Center crop (75%)", "crop", 0.75, center_crop_resize),
+    ]
+
+
+# Severity ranges for graded sweeps: (mildest, harshest)
+SWEEP_RANGES: dict[str, tuple[float, float]] = {
+    "blur": (0.5, 5.0),
+    "brightness": (0.9, 0.1),
+    "noise": (0.02, 0.30),
+    "rotation": (5.0, 90.0),
+    "crop": (0.95, 0.40),
+}
+
+
+def severity_sweep(kind: str, levels: int = 10) -> list[Perturbation]:
+    """Baseline followed by *levels* evenly spaced severities of *kind*."""
+    if kind not in SWEEP_RANGES:
+        raise ValueError(f"Unknown perturbation '{kind}'; choose from {sorted(SWEEP_RANGES)}")
+    low, high = SWEEP_RANGES[kind]
+    return [BASELINE] + [
+        Perturbation(f"{kind} {s:.3g}", kind, float(s), KINDS[kind])
+        for s in np.linspace(low, high, max(1, levels))
+    ]
+
+
+def normalize(batch: torch.Tensor) -> torch.Tensor:
+    """ImageNet normalisation of a ``[0, 1]`` batch (matches the eval transforms)."""
+    mean = torch.tensor(IMAGENET_MEAN, device=batch.device, dtype=batch.dtype).view(1, 3, 1, 1)
+    std = torch.tensor(IMAGENET_STD, device=batch.device, dtype=batch.dtype).view(1, 3, 1, 1)
+    return (batch - mean) / std
@@ -0,0 +1,214 @@
+"""Class balancing by sampling instead of augmented copies on disk.
+
+``augment.py`` / ``augment_blight.py`` balanced the classes by writing
+``aug_XXXX_*.jpg`` files until a class reached ``TARGET_COUNT``: the
+augmentations were frozen at generation time and the dataset grew on disk.
+:class:`BalancedClassSampler` gets the same class mix in memory – every
+epoch it draws a fixed number of indices per class (repeating minority
+images as needed), and the training transforms augment each draw afresh, so
+repeated images never look the same twice and nothing is written.
+
+Per-class targets (:func:`class_target_counts`):
+
+* ``"max"``  – every class as large as the largest one (over-sampling);
+* ``"mean"`` – every class at the mean size (large classes under-sampled);
+* an ``int`` – the same count for every class;
+* a ``{class_index: count}`` dict – explicit counts, other classes unchanged.
+
+The sampler follows :class:`app.utils.checkpoint.ResumableRandomSampler`:
+the epoch order is a pure function of ``(seed, epoch)`` and ``set_epoch``
+can start part-way through an epoch, so ``train.py --resume`` still works.
+
+When a static augmented set is required, :func:`write_augmented` is the
+materialisation mode used by the augment scripts: every generated image is
+seeded by its index, so the output is identical for any number of worker
+processes.
+"""
+from __future__ import annotations
+
+import random
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Sampler
+
+from .dataset_manifest import link_or_copy
+
+BALANCE_MODES = ("max", "mean")
+
+
+def class_target_counts(
+    targets: Sequence[int],
+    num_classes: int,
+    target: str | int | dict[int, int] = "max",
+) -> np.ndarray:
+    """Number of draws per class and epoch for a balancing *target*."""
+    counts = np.bincount(np.asarray(targets, dtype=np.int64), minlength=num_classes)
+    if isinstance(target, dict):
+        out = counts.copy()
+        for cls, n in target.items():
+            out[cls] = n
+    elif target == "max":
+        out = np.full(num_classes, counts.max())
+    elif target == "mean":
+        out = np.full(num_classes, int(round(counts[counts > 0].mean())))
+    elif isinstance(target, (int, np.integer)) and not isinstance(target, bool):
+        out = np.full(num_classes, int(target))
+    else:
+        raise ValueError(f"Unknown balance target {target!r}; expected one of {BALANCE_MODES}, "
+                         f"an int or a dict")
+    # Classes without images cannot be drawn.
+    out = np.where(counts > 0, out, 0)
+    if (out < 0).any():
+        raise ValueError(f"Negative class target in {out.tolist()}")
+    return out.astype(np.int64)
+
+
+def parse_balance(value: str, classes: Sequence[str]) -> str | int | dict[int, int]:
+    """Parse a ``--balance`` value: ``max``, ``mean``, ``600`` or ``blight=600,spot=500``."""
+    if value in BALANCE_MODES:
+        return value
+    if value.isdigit():
+        return int(value)
+    target = {}
+    for item in value.split(","):
+        name, _, count = item.partition("=")
+        if name not in classes or not count.isdigit():
+            raise ValueError(f"Bad balance entry {item!r}; expected <class>=<count> with class in {list(classes)}")
+        target[list(classes).index(name)] = int(count)
+    return target
+
+
+class BalancedClassSampler(Sampler[int]):
+    """Draw ``class_counts[c]`` indices of every class *c* per epoch.
+
+    Each class contributes every one of its images ``count // n`` times plus
+    a random ``count % n`` subset without replacement, so all images are
+    seen whenever the target is at least the class size and repeats are
+    spread evenly.  The combined draw is shuffled.
+
+    Args:
+        targets:      Class index of every dataset item.
+        class_counts: Draws per class and epoch (see :func:`class_target_counts`).
+        seed:         Base seed; epoch ``e`` uses ``seed + e``.
+    """
+
+    def __init__(self, targets: Sequence[int], class_counts: Sequence[int], seed: int = 0) -> None:
+        targets = torch.as_tensor(np.asarray(targets, dtype=np.int64))
+        self.class_counts = [int(c) for c in class_counts]
+        self.class_indices = [torch.nonzero(targets == c).flatten() for c in range(len(self.class_counts))]
+        for c, (idx, count) in enumerate(zip(self.class_indices, self.class_counts, strict=True)):
+            if count > 0 and len(idx) == 0:
+                raise ValueError(f"Class {c} has no samples but a target of {count}")
+        self.num_samples = sum(self.class_counts)
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    def set_epoch(self, epoch: int, start: int = 0) -> None:
+        self.epoch = epoch
+        self.start = max(0, min(start, self.num_samples))
+
+    def permutation(self, epoch: int) -> torch.Tensor:
+        g = torch.Generator()
+        g.manual_seed(self.seed + epoch)
+        draws = []
+        for idx, count in zip(self.class_indices, self.class_counts, strict=True):
+            if count == 0:
+                continue
+            reps, rest = divmod(count, len(idx))
+            draws.append(idx.repeat(reps))
+            draws.append(idx[torch.randperm(len(idx), generator=g)[:rest]])
+        drawn = torch.cat(draws) if draws else torch.empty(0, dtype=torch.int64)
+        return drawn[torch.randperm(len(drawn), generator=g)]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.permutation(self.epoch)[self.start:].tolist())
+
+    def __len__(self) -> int:
+        return self.num_samples - self.start
+
+
+def balanced_class_weights(class_counts: Sequence[int]) -> np.ndarray:
+    """Inverse-frequency loss weights for the per-epoch class mix."""
+    counts = np.asarray(class_counts, dtype=np.float64)
+    weights = np.zeros_like(counts)
+    present = counts > 0
+    weights[present] = counts.sum() / (present.sum() * counts[present])
+    return weights
+
+
+# ---------------------------------------------------------------------------
+# Materialisation (static augmented copies)
+# ---------------------------------------------------------------------------
+
+_worker_augment: Optional[Callable[[Image.Image], Image.Image]] = None
+
+
+def _init_augment_worker(augment: Callable[[Image.Image], Image.Image]) -> None:
+    global _worker_augment
+    _worker_augment = augment
+
+
+def _augment_one(job: tuple[str, str, int, int]) -> str:
+    src, dst, seed, quality = job
+    random.seed(seed)
+    torch.manual_seed(seed)
+    with Image.open(src) as img:
+        _worker_augment(img.convert("RGB")).save(dst, quality=quality)
+    return dst
+
+
+def augmentation_jobs(originals: Sequence[Path], target_count: int, seed: int) -> list[tuple[Path, str]]:
+    """``(source, output name)`` of every image needed to reach *target_count*."""
+    if not originals:
+        return []
+    rng = random.Random(seed)
+    jobs = []
+    for idx in range(max(0, target_count - len(originals))):
+        src = rng.choice(originals)
+        jobs.append((src, f"aug_{idx:04d}_{src.stem}.jpg"))
+    return jobs
+
+
+def write_augmented(
+    originals: Sequence[Path],
+    out_dir: str | Path,
+    target_count: int,
+    augment: Callable[[Image.Image], Image.Image],
+    seed: int = 42,
+    quality: int = 95,
+    workers: int = 1,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Fill *out_dir* with the originals plus augmented copies up to *target_count*.
+
+    Originals are hardlinked when possible.  Augmented image ``i`` is drawn
+    with ``seed + i`` in whichever worker renders it.
+
+    Returns:
+        The number of generated images.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for src in originals:
+        dst = out_dir / src.name
+        if dst.exists():
+            dst.unlink()
+        link_or_copy(src, dst)
+
+    jobs = [(str(src), str(out_dir / name), seed + i, quality)
+            for i, (src, name) in enumerate(augmentation_jobs(originals, target_count, seed))]
+    if not jobs:
+        return 0
+    workers = max(1, workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_augment_worker,
+                             initargs=(augment,)) as pool:
+        for _ in pool.map(_augment_one, jobs, chunksize=max(1, len(jobs) // (workers * 8))):
+            if progress is not None:
+                progress(1)
+    return len(jobs)
@@ -3,6 +3,8 @@ Severity estimation utilities for cardamom leaf disease detection.
 
 Provides a heuristic method that uses the Grad-CAM heatmap to approximate
 the percentage of leaf area affected, then maps that to a severity stage.
+When a leaf mask from background removal is available the affected area is
+measured relative to the leaf rather than to the whole image.
 
 Stage mapping (default thresholds: 0, 10, 25, 50, 100):
   Stage 0 – 0 %         (healthy / no lesion)
@@ -28,6 +30,7 @@ import os
 from dataclasses import dataclass
 
 import numpy as np
+from PIL import Image
 
 # ---------------------------------------------------------------------------
 # Defaults / configuration
@@ -121,16 +124,64 @@ def map_percent_to_stage(
     return 4
 
 
+def map_percents_to_stages(
+    percents: np.ndarray,
+    thresholds: list[float] | None = None,
+) -> np.ndarray:
+    """Vectorised :func:`map_percent_to_stage` for an array of percentages.
+
+    Uses ``np.searchsorted`` on the inner boundaries so the stage of every
+    element is found in one call; boundaries are inclusive on the upper side
+    exactly as in the scalar version.
+
+    Args:
+        percents:   Array of severity percentages (any shape).
+        thresholds: Five stage boundaries; defaults to ``DEFAULT_STAGE_THRESHOLDS``.
+
+    Returns:
+        Integer array (same shape as *percents*) with stages 0–4.
+    """
+    if thresholds is None:
+        thresholds = DEFAULT_STAGE_THRESHOLDS
+
+    if len(thresholds) != 5:
+        raise ValueError(f"thresholds must have exactly 5 elements; got {len(thresholds)}")
+
+    p = np.clip(np.asarray(percents, dtype=float), 0.0, 100.0)
+    inner = np.asarray(thresholds[1:4], dtype=float)
+    stages = np.searchsorted(inner, p, side="left") + 1
+    return np.where(p <= 0.0, 0, stages).astype(np.int64)
+
+
+def _leaf_weights(leaf_mask: np.ndarray, shape: tuple[int, ...]) -> np.ndarray:
+    """Return per-cell leaf coverage (0–1) of *leaf_mask* resampled to *shape*.
+
+    Grad-CAM heatmaps live at feature-map resolution (e.g. 7×7) while the
+    leaf mask is at image resolution, so the mask is box-filtered down to the
+    heatmap grid; each cell then carries the fraction of its area that is leaf.
+    """
+    mask = np.asarray(leaf_mask)
+    if mask.shape == tuple(shape):
+        return mask.astype(float)
+    mask_u8 = (mask > 0).astype(np.uint8) * 255
+    resized = Image.fromarray(mask_u8, mode="L").resize(
+        (shape[1], shape[0]), Image.BOX
+    )
+    return np.asarray(resized, dtype=float) / 255.0
+
+
 def compute_severity_from_heatmap(
     heatmap: np.ndarray,
     threshold: float | None = None,
     thresholds: list[float] | None = None,
+    leaf_mask: np.ndarray | None = None,
 ) -> SeverityResult:
     """Estimate severity from a Grad-CAM heatmap using a simple threshold heuristic.
 
     Pixels with normalised heatmap value above *threshold* are considered
     "affected".  The ratio of affected pixels to total pixels is used as the
-    severity percentage.
+    severity percentage.  When *leaf_mask* is given the ratio is
+    ``|affected ∩ leaf| / |leaf|`` instead.
 
     Args:
         heatmap:    2-D numpy array with values in [0, 1].
@@ -138,6 +189,9 @@ def compute_severity_from_heatmap(
                     value from :func:`get_heatmap_threshold`.
         thresholds: Stage boundary thresholds.  Defaults to the value
                     from :func:`get_stage_thresholds`.
+        leaf_mask:  Optional 2-D boolean leaf mask (any resolution, e.g. the
+                    one produced by background removal).  An empty mask is
+                    ignored and the whole heatmap area is used.
 
     Returns:
         :class:`SeverityResult` with ``severity_method="heuristic"`` and a
@@ -158,8 +212,21 @@ def compute_severity_from_heatmap(
         heatmap_norm = heatmap.copy()
 
     binary_mask = heatmap_norm > threshold
-    total_pixels = binary_mask.size
-    affected_pixels = int(binary_mask.sum())
+
+    weights = None
+    if leaf_mask is not None:
+        weights = _leaf_weights(leaf_mask, heatmap.shape)
+        if weights.sum() <= 0:
+            weights = None
+
+    if weights is None:
+        total_pixels = binary_mask.size
+        affected_pixels = float(binary_mask.sum())
+        basis = "whole image"
+    else:
+        total_pixels = float(weights.sum())
+        affected_pixels = float(weights[binary_mask].sum())
+        basis = "leaf area"
 
     percent = (affected_pixels / total_pixels * 100.0) if total_pixels > 0 else 0.0
     stage = map_percent_to_stage(percent, thresholds)
@@ -169,7 +236,71 @@ def compute_severity_from_heatmap(
         severity_percent=round(percent, 2),
         severity_method="heuristic",
         warning=(
-            "Severity estimated from Grad-CAM heatmap (heuristic). "
+            f"Severity estimated from Grad-CAM heatmap over {basis} (heuristic). "
             "This is an approximation and may not reflect true lesion area."
         ),
     )
+
+
+def compute_severity_batch(
+    heatmaps: np.ndarray,
+    threshold: float | None = None,
+    thresholds: list[float] | None = None,
+    leaf_masks: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Vectorised severity estimate for a stack of heatmaps.
+
+    Applies the same per-map min–max normalisation and threshold heuristic as
+    :func:`compute_severity_from_heatmap`, but for ``N`` maps at once.
+
+    Args:
+        heatmaps:   ``(N, H, W)`` array of Grad-CAM heatmaps.
+        threshold:  Binarisation threshold in [0, 1].  Defaults to
+                    :func:`get_heatmap_threshold`.
+        thresholds: Stage boundary thresholds.  Defaults to
+                    :func:`get_stage_thresholds`.
+        leaf_masks: Optional ``(N, H, W)`` leaf masks at heatmap resolution,
+                    either boolean or fractional leaf coverage in [0, 1].
+                    Maps whose mask is empty fall back to the whole area.
+
+    Returns:
+        ``(percents, stages)`` – float array of severity percentages
+        (unrounded) and int array of stages, each of shape ``(N,)``.
+    """
+    if threshold is None:
+        threshold = get_heatmap_threshold()
+    if thresholds is None:
+        thresholds = get_stage_thresholds()
+
+    maps = np.asarray(heatmaps, dtype=float)
+    if maps.ndim != 3:
+        raise ValueError(f"heatmaps must have shape (N, H, W); got {maps.shape}")
+    n = maps.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=float), np.zeros(0, dtype=np.int64)
+
+    flat = maps.reshape(n, -1)
+    h_min = flat.min(axis=1, keepdims=True)
+    h_max = flat.max(axis=1, keepdims=True)
+    span = h_max - h_min
+    # Constant maps are left as-is, matching the scalar function.
+    norm = np.where(span > 0, (flat - h_min) / np.where(span > 0, span, 1.0), flat)
+    affected = norm > threshold
+
+    if leaf_masks is None:
+        percents = affected.mean(axis=1, dtype=np.float64) * 100.0
+    else:
+        weights = np.asarray(leaf_masks, dtype=float)
+        if weights.shape != maps.shape:
+            raise ValueError(
+                f"leaf_masks shape {weights.shape} does not match heatmaps {maps.shape}"
+            )
+        weights = weights.reshape(n, -1)
+        leaf_area = weights.sum(axis=1, dtype=np.float64)
+        leaf_affected = (weights * affected).sum(axis=1, dtype=np.float64)
+        whole = affected.mean(axis=1, dtype=np.float64) * 100.0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            percents = np.where(leaf_area > 0, leaf_affected / leaf_area * 100.0, whole)
+
+    stages = map_percents_to_stages(percents, thresholds)
+    return percents, stages
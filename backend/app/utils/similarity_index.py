@@ -0,0 +1,434 @@
+"""Nearest-neighbour index over leaf embeddings for similar-leaf retrieval.
+
+``build_similarity_index.py`` embeds every labelled reference image with
+:meth:`DiseaseClassifier.forward_features` and writes one of two index kinds;
+``POST /similar`` embeds the query in the same forward pass as its prediction
+and looks up the K most similar reference leaves.  Embeddings are
+L2-normalised, so scores are cosine similarities.
+
+* ``exact``  – every vector as float16; a query is one blocked matrix
+  multiply.  Used up to :data:`EXACT_MAX_ITEMS` vectors.
+* ``ivfpq``  – inverted file + product quantisation.  A coarse k-means
+  assigns every vector to one of ``nlist`` lists; the residual to its list
+  centroid is split into ``m`` sub-vectors, each stored as a uint8 code of a
+  256-entry codebook.  A query scans only the ``nprobe`` nearest lists and
+  scores a row as ``<q, centroid> + Σ_j table[j, code_j]`` with one
+  ``(m, 256)`` lookup table per query (asymmetric distance computation).
+
+Layout of an index directory::
+
+    <root>/index.json      # kind, layer, dim, classes, labels, paths, params
+    <root>/vectors.npy     # exact:  float16 (N, D)
+    <root>/centroids.npy   # ivfpq:  float32 (nlist, D)
+    <root>/codebooks.npy   # ivfpq:  float32 (m, 256, D / m)
+    <root>/codes.npy       # ivfpq:  uint8   (N, m), rows grouped by list
+    <root>/offsets.npy     # ivfpq:  int64   (nlist + 1,), row range of each list
+
+Arrays are opened with ``np.load(mmap_mode="r")``, so start-up only reads
+``index.json`` and pages are faulted in by the first queries.  As with packed
+splits, ``index.json`` is written last; a directory without it is incomplete.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+INDEX_NAME = "index.json"
+FORMAT_VERSION = 1
+INDEX_KINDS: tuple[str, ...] = ("exact", "ivfpq")
+
+EXACT_MAX_ITEMS = 50_000
+DEFAULT_NPROBE = 8
+DEFAULT_PQ_SUBVECTORS = 64
+PQ_CODEBOOK_SIZE = 256
+KMEANS_ITERATIONS = 20
+KMEANS_MAX_TRAIN = 100_000
+
+_SEARCH_BLOCK = 65_536  # rows per matrix multiply, bounds temporary memory
+
+
+# ---------------------------------------------------------------------------
+# Vector helpers
+# ---------------------------------------------------------------------------
+
+
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    """Row-wise unit-norm float32 copy of *x* (zero rows stay zero)."""
+    x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) for every row of *x*."""
+    c_sq = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _SEARCH_BLOCK):
+        block = x[start:start + _SEARCH_BLOCK]
+        out[start:start + len(block)] = (c_sq - 2.0 * block @ centroids.T).argmin(axis=1)
+    return out
+
+
+def kmeans(x: np.ndarray, k: int, n_iter: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; returns ``(k, D)`` float32 centroids.
+
+    Assignments are one matrix multiply per iteration and the centroid update
+    is a sort plus ``np.add.reduceat``.  Empty clusters are re-seeded with
+    random points.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if not 1 <= k <= len(x):
+        raise ValueError(f"k must be between 1 and {len(x)}, got {k}")
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _nearest(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(x[order], starts, axis=0) / counts[filled, None]
+        if not filled.all():
+            centroids[~filled] = x[rng.choice(len(x), int((~filled).sum()), replace=False)]
+    return centroids
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the *k* largest entries of each row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+# ---------------------------------------------------------------------------
+# Indexes
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class Neighbor:
+    """One retrieved reference image."""
+
+    path: str
+    label: int
+    class_name: str
+    score: float  # cosine similarity (approximate for ivfpq)
+
+
+class SimilarityIndex:
+    """Shared metadata and result formatting of both index kinds."""
+
+    kind = ""
+
+    def __init__(self, meta: dict) -> None:
+        self.meta = meta
+        self.layer: str = meta["layer"]
+        self.dim: int = int(meta["dim"])
+        self.classes: list[str] = list(meta["classes"])
+        self.labels = np.asarray(meta["labels"], dtype=np.int64)
+        self.paths: list[str] = list(meta["paths"])
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """``(scores, ids)`` of the *k* best rows per query, each ``(Q, k)``.
+
+        Fewer than *k* columns are returned when the index holds fewer rows;
+        ``ivfpq`` pads with id ``-1`` / score ``-inf`` when the probed lists do.
+        """
+        raise NotImplementedError
+
+    def neighbors(self, query: np.ndarray, k: int) -> list[Neighbor]:
+        """The *k* most similar reference images to one embedding."""
+        query = np.asarray(query)
+        if query.shape[-1] != self.dim:
+            raise ValueError(f"Query has {query.shape[-1]} dims, index expects {self.dim}")
+        scores, ids = self.search(query.reshape(1, -1), k)
+        return [
+            Neighbor(
+                path=self.paths[i],
+                label=int(self.labels[i]),
+                class_name=self.classes[self.labels[i]],
+                score=float(s),
+            )
+            for s, i in zip(scores[0], ids[0], strict=True)
+            if i >= 0  # ivfpq pads when the probed lists hold fewer than k rows
+        ]
+
+
+class ExactIndex(SimilarityIndex):
+    """Brute-force cosine search over float16 vectors."""
+
+    kind = "exact"
+
+    def __init__(self, meta: dict, vectors: np.ndarray) -> None:
+        super().__init__(meta)
+        self.vectors = vectors
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        q = l2_normalize(queries)
+        scores = np.empty((len(q), len(self.vectors)), dtype=np.float32)
+        for start in range(0, len(self.vectors), _SEARCH_BLOCK):
+            block = np.asarray(self.vectors[start:start + _SEARCH_BLOCK], dtype=np.float32)
+            scores[:, start:start + len(block)] = q @ block.T
+        ids = _top_k(scores, k)
+        return np.take_along_axis(scores, ids, axis=1), ids
+
+
+class IVFPQIndex(SimilarityIndex):
+    """Inverted-file index with product-quantised residuals."""
+
+    kind = "ivfpq"
+
+    def __init__(
+        self,
+        meta: dict,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        codes: np.ndarray,
+        offsets: np.ndarray,
+        nprobe: int = DEFAULT_NPROBE,
+    ) -> None:
+        super().__init__(meta)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+        self.codes = codes
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        q = l2_normalize(queries)
+        m, _, dsub = self.codebooks.shape
+        coarse = q @ self.centroids.T                                     # (Q, nlist)
+        probes = _top_k(coarse, min(self.nprobe, self.nlist))             # (Q, nprobe)
+        tables = np.einsum("qmd,mkd->qmk", q.reshape(len(q), m, dsub), self.codebooks)
+
+        k_out = min(k, len(self))
+        scores = np.full((len(q), k_out), -np.inf, dtype=np.float32)
+        ids = np.full((len(q), k_out), -1, dtype=np.int64)
+        sub = np.arange(m)
+        for qi in range(len(q)):
+            lists = probes[qi]
+            lengths = self.offsets[lists + 1] - self.offsets[lists]
+            if not lengths.sum():
+                continue
+            rows = np.concatenate([np.arange(self.offsets[lst], self.offsets[lst + 1]) for lst in lists])
+            approx = tables[qi][sub, np.asarray(self.codes[rows])].sum(axis=1)
+            approx += np.repeat(coarse[qi, lists], lengths)
+            best = _top_k(approx[None, :], k_out)[0]
+            scores[qi, :len(best)] = approx[best]
+            ids[qi, :len(best)] = rows[best]
+        return scores, ids
+
+
+# ---------------------------------------------------------------------------
+# Build / load
+# ---------------------------------------------------------------------------
+
+
+def default_nlist(n: int) -> int:
+    """≈ 4·√N coarse lists, the usual IVF rule of thumb."""
+    return max(1, min(n, int(round(4 * math.sqrt(n)))))
+
+
+def default_subvectors(dim: int) -> int:
+    """Largest divisor of *dim* not above :data:`DEFAULT_PQ_SUBVECTORS`."""
+    return max(d for d in range(1, min(dim, DEFAULT_PQ_SUBVECTORS) + 1) if dim % d == 0)
+
+
+def _train_ivfpq(x: np.ndarray, nlist: int, m: int, seed: int) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    train = x if len(x) <= KMEANS_MAX_TRAIN else x[rng.choice(len(x), KMEANS_MAX_TRAIN, replace=False)]
+
+    centroids = kmeans(train, nlist, seed=seed)
+    assign = _nearest(x, centroids)
+    residuals = x - centroids[assign]
+    train_res = train - centroids[_nearest(train, centroids)]
+
+    dsub = x.shape[1] // m
+    ksub = min(PQ_CODEBOOK_SIZE, len(train))
+    codebooks = np.zeros((m, PQ_CODEBOOK_SIZE, dsub), dtype=np.float32)
+    codes = np.empty((len(x), m), dtype=np.uint8)
+    for j in range(m):
+        cols = slice(j * dsub, (j + 1) * dsub)
+        codebooks[j, :ksub] = kmeans(train_res[:, cols], ksub, seed=seed + 1 + j)
+        codes[:, j] = _nearest(residuals[:, cols], codebooks[j, :ksub])
+
+    order = np.argsort(assign, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+    return {"centroids": centroids, "codebooks": codebooks, "codes": codes[order],
+            "offsets": offsets.astype(np.int64), "order": order}
+
+
+def build_index(
+    out_dir: str | Path,
+    embeddings: np.ndarray,
+    labels: Sequence[int],
+    paths: Sequence[str],
+    classes: Sequence[str],
+    layer: str,
+    kind: str = "auto",
+    nlist: Optional[int] = None,
+    subvectors: Optional[int] = None,
+    seed: int = 0,
+    source: str = "",
+    extra: Optional[dict] = None,
+) -> dict:
+    """Write a similarity index over *embeddings* to *out_dir* and return its metadata.
+
+    The index is written to a sibling temporary directory and renamed into
+    place, so an existing index stays intact until the new one is complete.
+
+    Args:
+        kind:       ``"exact"``, ``"ivfpq"`` or ``"auto"`` (exact up to
+                    :data:`EXACT_MAX_ITEMS` rows).
+        nlist:      ivfpq coarse lists (default :func:`default_nlist`).
+        subvectors: ivfpq sub-vectors per code (default :func:`default_subvectors`).
+        extra:      additional JSON-serialisable fields for ``index.json``.
+
+    Raises:
+        ValueError: for an unknown kind, mismatched lengths or an invalid
+            sub-vector count.
+        FileExistsError: when *out_dir* exists and is not an index directory
+            (see :func:`check_output_dir`).
+    """
+    x = l2_normalize(embeddings)
+    n, dim = x.shape
+    if not (n == len(labels) == len(paths)) or n == 0:
+        raise ValueError(f"Need matching non-empty embeddings/labels/paths, got {n}/{len(labels)}/{len(paths)}")
+    if kind == "auto":
+        kind = "exact" if n <= EXACT_MAX_ITEMS else "ivfpq"
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind {kind!r}; expected one of {INDEX_KINDS} or 'auto'")
+
+    out_dir = Path(out_dir)
+    check_output_dir(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f".{out_dir.name}.", dir=out_dir.parent))
+    tmp_dir.chmod(0o755)  # mkdtemp creates it private to the building user
+    try:
+        meta = _write_index(tmp_dir, x, labels, paths, classes, layer, kind, nlist, subvectors,
+                            seed, source, extra)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    old_dir = None
+    if out_dir.exists():
+        old_dir = Path(tempfile.mkdtemp(prefix=f".{out_dir.name}.old.", dir=out_dir.parent))
+        os.replace(out_dir, old_dir / out_dir.name)
+    os.replace(tmp_dir, out_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return meta
+
+
+def check_output_dir(out_dir: str | Path) -> None:
+    """Raise FileExistsError unless *out_dir* is absent, empty or an index directory.
+
+    :func:`build_index` replaces *out_dir*, so this stops a mistyped
+    ``--output`` (e.g. ``models``) from deleting unrelated files.
+    """
+    out_dir = Path(out_dir)
+    if not out_dir.exists():
+        return
+    if not out_dir.is_dir():
+        raise FileExistsError(f"Index output {out_dir} exists and is not a directory")
+    if any(out_dir.iterdir()) and not (out_dir / INDEX_NAME).exists():
+        raise FileExistsError(f"Index output {out_dir} is not empty and holds no {INDEX_NAME}; "
+                              f"refusing to replace it")
+
+
+def _write_index(
+    out_dir: Path,
+    x: np.ndarray,
+    labels: Sequence[int],
+    paths: Sequence[str],
+    classes: Sequence[str],
+    layer: str,
+    kind: str,
+    nlist: Optional[int],
+    subvectors: Optional[int],
+    seed: int,
+    source: str,
+    extra: Optional[dict],
+) -> dict:
+    """Write the index files of normalised embeddings *x* into the empty *out_dir*."""
+    n, dim = x.shape
+    labels = np.asarray(labels, dtype=np.int64)
+    paths = [str(p) for p in paths]
+    params: dict = {}
+    if kind == "exact":
+        np.save(out_dir / "vectors.npy", x.astype(np.float16))
+    else:
+        nlist = default_nlist(n) if nlist is None else min(nlist, n)
+        m = default_subvectors(dim) if subvectors is None else subvectors
+        if dim % m:
+            raise ValueError(f"subvectors={m} does not divide the embedding size {dim}")
+        trained = _train_ivfpq(x, nlist, m, seed)
+        for name in ("centroids", "codebooks", "codes", "offsets"):
+            np.save(out_dir / f"{name}.npy", trained[name])
+        order = trained["order"]
+        labels, paths = labels[order], [paths[i] for i in order]
+        params = {"nlist": nlist, "subvectors": m, "nprobe": min(DEFAULT_NPROBE, nlist)}
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "kind": kind,
+        "layer": layer,
+        "dim": dim,
+        "source": source,
+        "classes": list(classes),
+        "labels": labels.tolist(),
+        "paths": paths,
+        **params,
+        **(extra or {}),
+    }
+    with open(out_dir / INDEX_NAME, "w", encoding="utf-8") as fh:
+        json.dump(meta, fh)
+    return meta
+
+
+def load_index(root: str | Path, nprobe: Optional[int] = None) -> SimilarityIndex:
+    """Open the index in *root* with memory-mapped arrays.
+
+    Raises:
+        FileNotFoundError: when *root* has no ``index.json``.
+        ValueError: for an unsupported format version or index kind.
+    """
+    root = Path(root)
+    index_path = root / INDEX_NAME
+    if not index_path.exists():
+        raise FileNotFoundError(f"Similarity index not found: {index_path}")
+    with open(index_path, encoding="utf-8") as fh:
+        meta = json.load(fh)
+    if meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported similarity index version {meta.get('version')!r} in {index_path}")
+
+    def array(name: str) -> np.ndarray:
+        return np.load(root / f"{name}.npy", mmap_mode="r")
+
+    if meta["kind"] == "exact":
+        return ExactIndex(meta, array("vectors"))
+    if meta["kind"] == "ivfpq":
+        return IVFPQIndex(
+            meta, array("centroids"), array("codebooks"), array("codes"), array("offsets"),
+            nprobe=meta.get("nprobe", DEFAULT_NPROBE) if nprobe is None else nprobe,
+        )
+    raise ValueError(f"Unknown similarity index kind {meta['kind']!r} in {index_path}")
@@ -1,21 +1,29 @@
 """
 Augments the colletotrichum_blight class to balance with other classes.
 Run this ONCE before training:  python augment_blight.py
+
+Prefer `python train.py --balance`: it balances the classes with a sampler
+and fresh augmentations every epoch, without writing any file.  This script
+remains for when a static augmented set is required; images are rendered in
+parallel (--workers) and are identical for any number of workers.
 """
+import argparse
+import os
 from pathlib import Path
-from PIL import Image, ImageFilter
-import random, shutil
+
 from torchvision import transforms
+from tqdm import tqdm
+
+from app.utils.sampling import write_augmented
 
 # ── Config ────────────────────────────────────────────────────────────────────
 SOURCE_DIR   = Path("dataset/new/Blight1000")   # your raw blight folder
 OUTPUT_DIR   = Path("dataset/new/Blight1000_augmented")
 TARGET_COUNT = 600   # how many total images you want after augmentation
 SEED         = 42
+JPEG_QUALITY = 95
 # ──────────────────────────────────────────────────────────────────────────────
 
-random.seed(SEED)
-
 augment = transforms.Compose([
     transforms.RandomHorizontalFlip(p=0.5),
     transforms.RandomVerticalFlip(p=0.5),
@@ -26,26 +34,26 @@ augment = transforms.Compose([
     transforms.GaussianBlur(kernel_size=3, sigma=(0.1, 1.5)),
 ])
 
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-# Copy originals first
-originals = list(SOURCE_DIR.glob("*.jpg")) + list(SOURCE_DIR.glob("*.png")) + list(SOURCE_DIR.glob("*.jpeg"))
-print(f"Found {len(originals)} original Blight images")
-
-for img_path in originals:
-    shutil.copy(img_path, OUTPUT_DIR / img_path.name)
-
-# Generate augmented images until we hit target
-count = len(originals)
-idx   = 0
-while count < TARGET_COUNT:
-    src = random.choice(originals)
-    img = Image.open(src).convert("RGB")
-    aug = augment(img)
-    out_name = f"aug_{idx:04d}_{src.stem}.jpg"
-    aug.save(OUTPUT_DIR / out_name, quality=95)
-    count += 1
-    idx   += 1
-
-print(f"✅ Done! {count} Blight images saved to {OUTPUT_DIR}")
-print(f"   Original: {len(originals)}  |  Generated: {count - len(originals)}")
\ No newline at end of file
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write augmented copies of one class up to a target count.")
+    parser.add_argument("--target", type=int, default=TARGET_COUNT,
+                        help=f"Total images after augmentation (default: {TARGET_COUNT})")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    originals = list(SOURCE_DIR.glob("*.jpg")) + list(SOURCE_DIR.glob("*.png")) + list(SOURCE_DIR.glob("*.jpeg"))
+    print(f"Found {len(originals)} original Blight images")
+
+    with tqdm(total=max(0, args.target - len(originals)), desc="Augmenting", unit="img") as bar:
+        generated = write_augmented(originals, OUTPUT_DIR, args.target, augment, seed=args.seed,
+                                    quality=JPEG_QUALITY, workers=args.workers, progress=bar.update)
+
+    count = len(originals) + generated
+    print(f"✅ Done! {count} Blight images saved to {OUTPUT_DIR}")
+    print(f"   Original: {len(originals)}  |  Generated: {generated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,14 +4,21 @@ Run ONCE after background removal:  python augment_blight.py
 
 Assumes blight images already have BLACK backgrounds.
 Does NOT use ColorJitter (would corrupt black background).
+
+Prefer `python train.py --balance`: it balances the classes with a sampler
+and fresh augmentations every epoch, without writing any file.  This script
+remains for when a static augmented set is required; images are rendered in
+parallel (--workers) and are identical for any number of workers.
 """
 
-import random
-import shutil
+import argparse
+import os
 from pathlib import Path
 
-from PIL import Image
 from torchvision import transforms
+from tqdm import tqdm
+
+from app.utils.sampling import write_augmented
 
 # ── Config ────────────────────────────────────────────────────────────────────
 SOURCE_DIR = Path("dataset_processed/colletotrichum_blight")
@@ -21,8 +28,6 @@ SEED         = 42
 JPEG_QUALITY = 95
 # ──────────────────────────────────────────────────────────────────────────────
 
-random.seed(SEED)
-
 # fill=0 keeps background pure black on all geometric transforms
 augment = transforms.Compose([
     transforms.RandomHorizontalFlip(p=0.5),
@@ -34,33 +39,34 @@ augment = transforms.Compose([
     # NO GaussianBlur — blurs sharp leaf-background edge
 ])
 
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-originals = (
-    list(SOURCE_DIR.glob("*.jpg"))
-    + list(SOURCE_DIR.glob("*.png"))
-    + list(SOURCE_DIR.glob("*.jpeg"))
-)
-print(f"Found {len(originals)} original Blight images")
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write augmented blight copies up to a target count.")
+    parser.add_argument("--target", type=int, default=TARGET_COUNT,
+                        help=f"Total images after augmentation (default: {TARGET_COUNT})")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    originals = (
+        list(SOURCE_DIR.glob("*.jpg"))
+        + list(SOURCE_DIR.glob("*.png"))
+        + list(SOURCE_DIR.glob("*.jpeg"))
+    )
+    print(f"Found {len(originals)} original Blight images")
+
+    if len(originals) == 0:
+        print("❌ No images found. Make sure you ran remove_bg_batch.py first.")
+        raise SystemExit(1)
 
-if len(originals) == 0:
-    print("❌ No images found. Make sure you ran remove_bg_batch.py first.")
-    raise SystemExit(1)
+    with tqdm(total=max(0, args.target - len(originals)), desc="Augmenting", unit="img") as bar:
+        generated = write_augmented(originals, OUTPUT_DIR, args.target, augment, seed=args.seed,
+                                    quality=JPEG_QUALITY, workers=args.workers, progress=bar.update)
 
-# Copy originals first
-for img_path in originals:
-    shutil.copy(img_path, OUTPUT_DIR / img_path.name)
+    count = len(originals) + generated
+    print(f"✅ Done! {count} Blight images in {OUTPUT_DIR}")
+    print(f"   Original: {len(originals)}  |  Generated: {generated}")
 
-count = len(originals)
-idx = 0
-while count < TARGET_COUNT:
-    src = random.choice(originals)
-    img = Image.open(src).convert("RGB")
-    aug = augment(img)
-    out_name = f"aug_{idx:04d}_{src.stem}.jpg"
-    aug.save(OUTPUT_DIR / out_name, quality=JPEG_QUALITY)
-    count += 1
-    idx += 1
 
-print(f"✅ Done! {count} Blight images in {OUTPUT_DIR}")
-print(f"   Original: {len(originals)}  |  Generated: {count - len(originals)}")
+if __name__ == "__main__":
+    main()
@@ -10,18 +10,40 @@ Architectures compared:
   - EfficientNet-B0
   - EfficientNetV2-S  (our chosen model)
 
+Run modes (--mode):
+  - shared     one data pipeline: each batch is decoded and augmented once
+               and fed to every model that has not early-stopped yet (default)
+  - processes  one spawned process per architecture, each with its own
+               loaders and a capped torch thread count (--threads)
+  - serial     one architecture after another (original behaviour)
+
+Besides accuracy, every architecture records wall-clock time (wall_time_s),
+its own training and validation compute time (train_compute_time_s,
+val_compute_time_s; the GPU is synchronised around each timed step),
+training and inference throughput (images/sec, counting only that model's
+compute) and peak resident memory.  Per-architecture peak RSS is only
+isolated in ``processes`` mode; the other modes report the shared process
+peak.
+
 Usage:
     cd backend
     python baseline_comparison.py
+    python baseline_comparison.py --mode processes --threads 4
+    python baseline_comparison.py --packed    # pre-decoded shards from pack_dataset.py
 
 Outputs:
-    - baseline_results.json   – per-model accuracy/F1/AUC table
+    - baseline_results.json   – per-model accuracy/F1/AUC/throughput table
     - baseline_comparison.png – bar chart comparison
 """
 from __future__ import annotations
 
+import argparse
 import json
+import multiprocessing as mp
+import os
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Any
 
@@ -32,17 +54,22 @@ import torch.optim as optim
 from torch.utils.data import DataLoader
 from torchvision import datasets, models, transforms
 
+from app.utils.metrics import compute_metrics, one_vs_rest, roc_auc
+from app.utils.packed_dataset import open_packed_split
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
 
 DATASET_PATH = "dataset"
+PACKED_PATH = "dataset_packed"
 BATCH_SIZE = 32
 NUM_EPOCHS = 30
 LEARNING_RATE = 0.001
 PATIENCE = 7
 IMG_SIZE = 224
 RANDOM_SEED = 42
+NUM_WORKERS = min(4, os.cpu_count() or 1)
 
 torch.manual_seed(RANDOM_SEED)
 np.random.seed(RANDOM_SEED)
@@ -53,12 +80,32 @@ DEVICE = torch.device(
     else "cpu"
 )
 
+
+def _sync() -> None:
+    """Wait for queued GPU kernels so the timer measures execution, not launches."""
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    elif DEVICE.type == "mps":
+        torch.mps.synchronize()
+
+
 # ---------------------------------------------------------------------------
 # Data loaders
 # ---------------------------------------------------------------------------
 
 
-def get_loaders():
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def get_loaders(packed_path: str | None = None, num_workers: int = NUM_WORKERS):
     train_tf = transforms.Compose([
         transforms.Resize((IMG_SIZE, IMG_SIZE)),
         transforms.RandomHorizontalFlip(),
@@ -74,9 +121,14 @@ def get_loaders():
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
     ])
 
-    train_ds = datasets.ImageFolder(f"{DATASET_PATH}/train", transform=train_tf)
-    val_ds = datasets.ImageFolder(f"{DATASET_PATH}/val", transform=val_tf)
-    test_ds = datasets.ImageFolder(f"{DATASET_PATH}/test", transform=val_tf)
+    if packed_path:
+        train_ds = open_packed_split(packed_path, "train", train_tf)
+        val_ds = open_packed_split(packed_path, "val", val_tf)
+        test_ds = open_packed_split(packed_path, "test", val_tf)
+    else:
+        train_ds = datasets.ImageFolder(f"{DATASET_PATH}/train", transform=train_tf)
+        val_ds = datasets.ImageFolder(f"{DATASET_PATH}/val", transform=val_tf)
+        test_ds = datasets.ImageFolder(f"{DATASET_PATH}/test", transform=val_tf)
 
     num_classes = len(train_ds.classes)
     print(f"Classes ({num_classes}): {train_ds.classes}")
@@ -87,9 +139,11 @@ def get_loaders():
         class_counts.sum() / (num_classes * class_counts), dtype=torch.float32
     ).to(DEVICE)
 
-    train_loader = DataLoader(train_ds, batch_size=BATCH_SIZE, shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_ds, batch_size=BATCH_SIZE, shuffle=False, num_workers=0)
-    test_loader = DataLoader(test_ds, batch_size=BATCH_SIZE, shuffle=False, num_workers=0)
+    loader_kw = dict(batch_size=BATCH_SIZE, num_workers=num_workers,
+                     persistent_workers=num_workers > 0)
+    train_loader = DataLoader(train_ds, shuffle=True, **loader_kw)
+    val_loader = DataLoader(val_ds, shuffle=False, **loader_kw)
+    test_loader = DataLoader(test_ds, shuffle=False, **loader_kw)
 
     return train_loader, val_loader, test_loader, num_classes, class_weights
 
@@ -156,6 +210,171 @@ def _efficientnet_v2_s(num_classes: int) -> nn.Module:
 # ---------------------------------------------------------------------------
 
 
+class ModelRun:
+    """Training state of one architecture, driven one batch at a time.
+
+    Keeping optimiser, scheduler and early-stopping state per model lets the
+    same batch be fed to several models (shared mode) or a single model to be
+    trained on its own (serial / processes mode).  ``train_compute_s`` and
+    ``val_compute_s`` accumulate only the time spent in this model's
+    training and validation passes, so training throughput excludes
+    validation; on a GPU the device is synchronised around each timed step.
+    """
+
+    def __init__(self, name: str, model: nn.Module, class_weights: torch.Tensor) -> None:
+        self.name = name
+        self.model = model.to(DEVICE)
+        self.criterion = nn.CrossEntropyLoss(weight=class_weights, label_smoothing=0.1)
+        self.optimizer = optim.Adam(self.model.parameters(), lr=LEARNING_RATE)
+        self.scheduler = optim.lr_scheduler.ReduceLROnPlateau(
+            self.optimizer, mode="min", factor=0.5, patience=3
+        )
+        self.best_val_loss = float("inf")
+        self.patience_counter = 0
+        self.best_state: dict | None = None
+        self.stopped = False
+        self.epochs = 0
+        self.train_images = 0
+        self.train_compute_s = 0.0
+        self.val_compute_s = 0.0
+        self._val_loss = 0.0
+        self._val_total = 0
+
+    def begin_epoch(self) -> None:
+        self.model.train()
+
+    def train_step(self, inputs: torch.Tensor, labels: torch.Tensor) -> None:
+        _sync()
+        start = time.perf_counter()
+        self.optimizer.zero_grad()
+        loss = self.criterion(self.model(inputs), labels)
+        loss.backward()
+        self.optimizer.step()
+        _sync()
+        self.train_compute_s += time.perf_counter() - start
+        self.train_images += inputs.size(0)
+
+    def val_step(self, inputs: torch.Tensor, labels: torch.Tensor) -> None:
+        _sync()
+        start = time.perf_counter()
+        with torch.no_grad():
+            out = self.model(inputs)
+            self._val_loss += self.criterion(out, labels).item() * inputs.size(0)
+        self._val_total += inputs.size(0)
+        self.val_compute_s += time.perf_counter() - start
+
+    def begin_validation(self) -> None:
+        self.model.eval()
+        self._val_loss, self._val_total = 0.0, 0
+
+    def end_epoch(self) -> None:
+        """Finish validation: step the scheduler and update early stopping."""
+        val_loss = self._val_loss / max(1, self._val_total)
+        self.scheduler.step(val_loss)
+        self.epochs += 1
+
+        if val_loss < self.best_val_loss - 1e-4:
+            self.best_val_loss = val_loss
+            self.patience_counter = 0
+            self.best_state = {k: v.clone() for k, v in self.model.state_dict().items()}
+        else:
+            self.patience_counter += 1
+
+        if self.patience_counter >= PATIENCE:
+            print(f"    {self.name}: early stop at epoch {self.epochs}")
+            self.stopped = True
+
+    def begin_test(self) -> None:
+        if self.best_state is not None:
+            self.model.load_state_dict(self.best_state)
+        self.model.eval()
+        self._probs: list[np.ndarray] = []
+        self._labels: list[np.ndarray] = []
+        self.infer_s = 0.0
+
+    def test_step(self, inputs: torch.Tensor, labels: torch.Tensor) -> None:
+        _sync()
+        start = time.perf_counter()
+        with torch.no_grad():
+            probs = torch.softmax(self.model(inputs), dim=1).cpu().numpy()
+        self.infer_s += time.perf_counter() - start
+        self._probs.append(probs)
+        self._labels.append(labels.cpu().numpy())
+
+    def result(self, wall_s: float, peak_rss: float | None) -> dict[str, Any]:
+        y_prob_arr = np.concatenate(self._probs)
+        y_true_arr = np.concatenate(self._labels)
+        y_pred_arr = y_prob_arr.argmax(axis=1)
+
+        num_classes = y_prob_arr.shape[1]
+        metrics = compute_metrics(y_true_arr, y_pred_arr, num_classes)
+        accuracy = metrics["accuracy"]
+        macro_f1 = metrics["macro_f1"]
+
+        # Macro ROC-AUC (one-vs-rest)
+        aucs = one_vs_rest(y_true_arr, y_prob_arr, roc_auc)
+        macro_auc = float(np.nanmean(aucs)) if np.isfinite(aucs).any() else float("nan")
+
+        n_params = sum(p.numel() for p in self.model.parameters())
+        result = {
+            "model": self.name,
+            "accuracy": round(accuracy * 100, 2),
+            "macro_f1": round(macro_f1 * 100, 2),
+            "macro_roc_auc": round(macro_auc, 4),
+            "train_compute_time_s": round(self.train_compute_s, 1),
+            "val_compute_time_s": round(self.val_compute_s, 1),
+            "wall_time_s": round(wall_s, 1),
+            "epochs": self.epochs,
+            "train_images_per_s": round(self.train_images / max(self.train_compute_s, 1e-9), 1),
+            "inference_images_per_s": round(len(y_true_arr) / max(self.infer_s, 1e-9), 1),
+            "peak_rss_mb": peak_rss,
+            "params_m": round(n_params / 1e6, 2),
+        }
+        print(
+            f"  {self.name:20s} | Acc: {result['accuracy']:.2f}%  "
+            f"F1: {result['macro_f1']:.2f}%  AUC: {result['macro_roc_auc']:.4f}  "
+            f"Train: {result['train_images_per_s']:.0f} img/s  "
+            f"Infer: {result['inference_images_per_s']:.0f} img/s  "
+            f"Time: {result['wall_time_s']:.0f}s"
+        )
+        return result
+
+
+def train_runs(
+    runs: list[ModelRun],
+    train_loader: DataLoader,
+    val_loader: DataLoader,
+    test_loader: DataLoader,
+) -> None:
+    """Train/evaluate *runs* together, decoding every batch once for all of them."""
+    for _epoch in range(NUM_EPOCHS):
+        active = [r for r in runs if not r.stopped]
+        if not active:
+            break
+        for run in active:
+            run.begin_epoch()
+        for inputs, labels in train_loader:
+            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+            for run in active:
+                run.train_step(inputs, labels)
+
+        for run in active:
+            run.begin_validation()
+        for inputs, labels in val_loader:
+            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+            for run in active:
+                run.val_step(inputs, labels)
+        for run in active:
+            run.end_epoch()
+
+    for run in runs:
+        run.begin_test()
+    for inputs, labels in test_loader:
+        inputs = inputs.to(DEVICE)
+        for run in runs:
+            run.test_step(inputs, labels)
+
+
 def train_and_evaluate(
     model_name: str,
     model: nn.Module,
@@ -164,110 +383,23 @@ def train_and_evaluate(
     test_loader: DataLoader,
     class_weights: torch.Tensor,
 ) -> dict[str, Any]:
-    model = model.to(DEVICE)
-    criterion = nn.CrossEntropyLoss(weight=class_weights, label_smoothing=0.1)
-    optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
-    scheduler = optim.lr_scheduler.ReduceLROnPlateau(
-        optimizer, mode="min", factor=0.5, patience=3
-    )
-
-    best_val_loss = float("inf")
-    patience_counter = 0
-    best_state: dict | None = None
+    """Train and test a single architecture (serial / processes mode)."""
     start_time = time.time()
-
-    for epoch in range(NUM_EPOCHS):
-        # Train
-        model.train()
-        for inputs, labels in train_loader:
-            inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
-            optimizer.zero_grad()
-            loss = criterion(model(inputs), labels)
-            loss.backward()
-            optimizer.step()
-
-        # Validate
-        model.eval()
-        val_loss = 0.0
-        total = 0
-        with torch.no_grad():
-            for inputs, labels in val_loader:
-                inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
-                out = model(inputs)
-                val_loss += criterion(out, labels).item() * inputs.size(0)
-                total += inputs.size(0)
-        val_loss /= total
-        scheduler.step(val_loss)
-
-        if val_loss < best_val_loss - 1e-4:
-            best_val_loss = val_loss
-            patience_counter = 0
-            best_state = {k: v.clone() for k, v in model.state_dict().items()}
-        else:
-            patience_counter += 1
-
-        if patience_counter >= PATIENCE:
-            print(f"    Early stop at epoch {epoch + 1}")
-            break
-
-    elapsed = time.time() - start_time
-
-    if best_state is not None:
-        model.load_state_dict(best_state)
-
-    # Evaluate on test set
-    model.eval()
-    y_true, y_pred, y_prob = [], [], []
-    with torch.no_grad():
-        for inputs, labels in test_loader:
-            inputs = inputs.to(DEVICE)
-            logits = model(inputs)
-            probs = torch.softmax(logits, dim=1).cpu().numpy()
-            preds = logits.argmax(dim=1).cpu().numpy()
-            y_prob.extend(probs.tolist())
-            y_pred.extend(preds.tolist())
-            y_true.extend(labels.numpy().tolist())
-
-    y_true_arr = np.array(y_true)
-    y_pred_arr = np.array(y_pred)
-    y_prob_arr = np.array(y_prob)
-
-    num_classes = y_prob_arr.shape[1]
-    accuracy = float((y_true_arr == y_pred_arr).mean())
-
-    # Macro F1
-    eps = 1e-12
-    f1_list = []
-    for i in range(num_classes):
-        tp = int(((y_pred_arr == i) & (y_true_arr == i)).sum())
-        fp = int(((y_pred_arr == i) & (y_true_arr != i)).sum())
-        fn = int(((y_pred_arr != i) & (y_true_arr == i)).sum())
-        p = tp / (tp + fp + eps)
-        r = tp / (tp + fn + eps)
-        f1_list.append(2 * p * r / (p + r + eps))
-    macro_f1 = float(np.mean(f1_list))
-
-    # Macro ROC-AUC (one-vs-rest)
-    try:
-        from sklearn.metrics import roc_auc_score
-        y_onehot = np.eye(num_classes)[y_true_arr]
-        macro_auc = float(roc_auc_score(y_onehot, y_prob_arr, average="macro"))
-    except Exception:
-        macro_auc = float("nan")
-
-    result = {
-        "model": model_name,
-        "accuracy": round(accuracy * 100, 2),
-        "macro_f1": round(macro_f1 * 100, 2),
-        "macro_roc_auc": round(macro_auc, 4),
-        "training_time_s": round(elapsed, 1),
-    }
-    print(
-        f"  {model_name:20s} | Acc: {result['accuracy']:.2f}%  "
-        f"F1: {result['macro_f1']:.2f}%  AUC: {result['macro_roc_auc']:.4f}  "
-        f"Time: {result['training_time_s']:.0f}s"
+    run = ModelRun(model_name, model, class_weights)
+    train_runs([run], train_loader, val_loader, test_loader)
+    return run.result(time.time() - start_time, peak_rss_mb())
+
+
+def _benchmark_in_process(name: str, packed_path: str | None, threads: int | None) -> dict[str, Any]:
+    """Process-pool entry point: train one architecture with its own loaders."""
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(RANDOM_SEED)
+    train_loader, val_loader, test_loader, num_classes, class_weights = get_loaders(
+        packed_path, num_workers=0
     )
-    return result
+    return train_and_evaluate(name, MODEL_REGISTRY[name](num_classes),
+                              train_loader, val_loader, test_loader, class_weights)
 
 
 # ---------------------------------------------------------------------------
@@ -276,27 +408,62 @@ def train_and_evaluate(
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare baseline architectures.")
+    parser.add_argument("--packed", nargs="?", const=PACKED_PATH, default=None,
+                        help=f"Read pre-decoded shards (default dir: {PACKED_PATH})")
+    parser.add_argument("--mode", choices=["shared", "processes", "serial"], default="shared",
+                        help="How to schedule the architectures (default: shared)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads per process in processes mode "
+                             "(default: CPUs / number of models)")
+    args = parser.parse_args()
+    data_root = args.packed or DATASET_PATH
+
     print("\n" + "=" * 70)
     print("Baseline Model Comparison  –  Cardamom Disease Detection")
     print(f"Device     : {DEVICE}")
-    print(f"Dataset    : {DATASET_PATH}/")
+    print(f"Dataset    : {data_root}/{'  (packed)' if args.packed else ''}")
     print(f"Epochs     : {NUM_EPOCHS}  (early stopping patience={PATIENCE})")
+    print(f"Mode       : {args.mode}")
     print("=" * 70)
 
-    if not Path(f"{DATASET_PATH}/train").exists():
-        print(f"\n❌ Dataset not found at '{DATASET_PATH}/'. Run split_dataset.py first.")
+    if not Path(f"{data_root}/train").exists():
+        hint = "pack_dataset.py" if args.packed else "split_dataset.py"
+        print(f"\n❌ Dataset not found at '{data_root}/'. Run {hint} first.")
         return
 
-    train_loader, val_loader, test_loader, num_classes, class_weights = get_loaders()
-
     results = []
-    for name, factory in MODEL_REGISTRY.items():
-        print(f"\n▶  Training {name} ...")
-        model = factory(num_classes)
-        metrics = train_and_evaluate(
-            name, model, train_loader, val_loader, test_loader, class_weights
-        )
-        results.append(metrics)
+    if args.mode == "processes":
+        threads = args.threads or max(1, (os.cpu_count() or 1) // len(MODEL_REGISTRY))
+        print(f"\n▶  Training {len(MODEL_REGISTRY)} models in parallel "
+              f"({threads} threads each) ...")
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=len(MODEL_REGISTRY), mp_context=ctx) as pool:
+            futures = [pool.submit(_benchmark_in_process, name, args.packed, threads)
+                       for name in MODEL_REGISTRY]
+            results = [f.result() for f in futures]
+    else:
+        train_loader, val_loader, test_loader, num_classes, class_weights = get_loaders(args.packed)
+        if args.mode == "shared":
+            print(f"\n▶  Training {', '.join(MODEL_REGISTRY)} on a shared data pipeline ...")
+            start_time = time.time()
+            runs = [ModelRun(name, factory(num_classes), class_weights)
+                    for name, factory in MODEL_REGISTRY.items()]
+            train_runs(runs, train_loader, val_loader, test_loader)
+            wall = time.time() - start_time
+            peak = peak_rss_mb()
+            results = [run.result(wall, peak) for run in runs]
+        else:
+            for name, factory in MODEL_REGISTRY.items():
+                print(f"\n▶  Training {name} ...")
+                model = factory(num_classes)
+                metrics = train_and_evaluate(
+                    name, model, train_loader, val_loader, test_loader, class_weights
+                )
+                results.append(metrics)
+
+    for r in results:
+        r["mode"] = args.mode
 
     # Save JSON
     out_json = Path("baseline_results.json")
@@ -305,17 +472,22 @@ def main() -> None:
     print(f"\n✓ Results saved to: {out_json}")
 
     # Summary table
-    print("\n" + "=" * 70)
-    print(f"{'Model':<22} {'Accuracy':>10} {'Macro F1':>10} {'ROC-AUC':>10} {'Time(s)':>10}")
-    print("-" * 70)
+    print("\n" + "=" * 104)
+    print(f"{'Model':<22} {'Accuracy':>10} {'Macro F1':>10} {'ROC-AUC':>10} {'Time(s)':>10} "
+          f"{'Train img/s':>12} {'Infer img/s':>12} {'Peak RSS':>12}")
+    print("-" * 104)
     for r in sorted(results, key=lambda x: x["accuracy"], reverse=True):
+        rss = f"{r['peak_rss_mb']:.0f} MB" if r["peak_rss_mb"] is not None else "n/a"
         print(
             f"{r['model']:<22} {r['accuracy']:>9.2f}%  "
             f"{r['macro_f1']:>9.2f}%  "
             f"{r['macro_roc_auc']:>10.4f}  "
-            f"{r['training_time_s']:>8.0f}s"
+            f"{r['wall_time_s']:>8.0f}s  "
+            f"{r['train_images_per_s']:>11.1f}  "
+            f"{r['inference_images_per_s']:>11.1f}  "
+            f"{rss:>11s}"
         )
-    print("=" * 70)
+    print("=" * 104)
 
     # Bar chart
     try:
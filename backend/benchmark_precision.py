@@ -0,0 +1,171 @@
+"""
+Compare fp32 and bf16 (channels_last + autocast) CPU inference.
+
+Runs the trained classifier over dataset/test once per precision and reports
+model throughput (forward pass only – data loading is excluded), accuracy,
+the accuracy delta and how often the two precisions agree on the predicted
+class.  bf16 is always measured so the numbers can be compared across
+machines; on CPUs without native bf16 support (see
+app/utils/cpu_precision.py) it runs through slow emulation, which the report
+flags with "bf16_native": false.
+
+Usage:
+    cd backend
+    python benchmark_precision.py
+    python benchmark_precision.py --packed --threads 8
+    python benchmark_precision.py --model models/cardamom_model.pt --batch-size 64
+
+Outputs:
+    - Comparison table to stdout
+    - precision_benchmark.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torchvision import datasets
+
+from app.utils.cpu_precision import (
+    autocast_context,
+    cpu_bf16_supported,
+    prepare_input,
+    prepare_model,
+)
+from app.utils.packed_dataset import open_packed_split
+from train import Config, create_model, get_data_transforms
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+WARMUP_BATCHES = 2
+OUTPUT_PATH = "precision_benchmark.json"
+
+
+def run_precision(model: torch.nn.Module, loader: DataLoader, precision: str) -> dict:
+    """Return throughput, predictions and probabilities for one precision."""
+    model = prepare_model(model, precision)
+    device = torch.device("cpu")
+    preds, probs, labels = [], [], []
+    forward_s, timed_images = 0.0, 0
+
+    with torch.no_grad():
+        for batch_idx, (inputs, targets) in enumerate(loader):
+            inputs = prepare_input(inputs, precision)
+            start = time.perf_counter()
+            with autocast_context(precision, device):
+                logits = model(inputs)
+            p = torch.softmax(logits.float(), dim=1)
+            elapsed = time.perf_counter() - start
+            if batch_idx >= WARMUP_BATCHES:
+                forward_s += elapsed
+                timed_images += inputs.size(0)
+            probs.append(p.numpy())
+            preds.append(p.argmax(dim=1).numpy())
+            labels.append(targets.numpy())
+
+    y_true = np.concatenate(labels)
+    y_pred = np.concatenate(preds)
+    return {
+        "images_per_s": timed_images / forward_s if forward_s > 0 else None,
+        "accuracy": float((y_true == y_pred).mean()),
+        "y_pred": y_pred,
+        "probs": np.concatenate(probs),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark fp32 vs bf16 CPU inference.")
+    parser.add_argument("--model", default=Config.MODEL_SAVE_PATH,
+                        help=f"Model weights (default: {Config.MODEL_SAVE_PATH})")
+    parser.add_argument("--packed", nargs="?", const="dataset_packed", default=None,
+                        help="Read packed test shards (default dir: dataset_packed)")
+    parser.add_argument("--batch-size", type=int, default=Config.BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--output", default=OUTPUT_PATH,
+                        help=f"JSON report path (default: {OUTPUT_PATH})")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    test_dir = Path(args.packed or Config.DATASET_PATH) / "test"
+    if not test_dir.exists():
+        print(f"❌ test dataset not found at: {test_dir.absolute()}")
+        sys.exit(1)
+    if not Path(args.model).exists():
+        print(f"❌ model file not found: {args.model}")
+        print("💡 Train first: python train.py")
+        sys.exit(1)
+
+    _, val_tf = get_data_transforms()
+    if args.packed:
+        test_dataset = open_packed_split(args.packed, "test", val_tf)
+    else:
+        test_dataset = datasets.ImageFolder(str(test_dir), transform=val_tf)
+    loader = DataLoader(test_dataset, batch_size=args.batch_size, shuffle=False, num_workers=4)
+
+    state = torch.load(args.model, map_location="cpu")
+    if isinstance(state, dict) and "state_dict" in state:
+        state = state["state_dict"]
+
+    native = cpu_bf16_supported()
+    print("\n" + "=" * 60)
+    print("CPU PRECISION BENCHMARK")
+    print(f"Model   : {args.model}")
+    print(f"Images  : {len(test_dataset)} ({test_dir})")
+    print(f"Threads : {torch.get_num_threads()}")
+    print(f"bf16    : {'native' if native else 'NOT supported natively – emulated, expect a slowdown'}")
+    print("=" * 60)
+
+    runs = {}
+    for precision in ("fp32", "bf16"):
+        model = create_model()
+        model.load_state_dict(state)
+        model.eval()
+        print(f"\n▶ {precision} ...")
+        runs[precision] = run_precision(model, loader, precision)
+
+    fp32, bf16 = runs["fp32"], runs["bf16"]
+    agreement = float((fp32["y_pred"] == bf16["y_pred"]).mean())
+    max_prob_diff = float(np.abs(fp32["probs"] - bf16["probs"]).max())
+    speedup = (bf16["images_per_s"] / fp32["images_per_s"]
+               if fp32["images_per_s"] and bf16["images_per_s"] else None)
+
+    print(f"\n{'Precision':<10} {'img/s':>10} {'Accuracy':>10}")
+    print("-" * 32)
+    for name, r in runs.items():
+        ips = f"{r['images_per_s']:.1f}" if r["images_per_s"] else "n/a"
+        print(f"{name:<10} {ips:>10} {r['accuracy'] * 100:>9.2f}%")
+    print("-" * 32)
+    if speedup:
+        print(f"bf16 speed-up        : {speedup:.2f}×")
+    print(f"Accuracy delta       : {(bf16['accuracy'] - fp32['accuracy']) * 100:+.2f} pp")
+    print(f"Prediction agreement : {agreement * 100:.2f}%")
+    print(f"Max |Δ probability|  : {max_prob_diff:.4f}")
+
+    report = {
+        "model": str(args.model),
+        "images": len(test_dataset),
+        "threads": torch.get_num_threads(),
+        "bf16_native": native,
+        "fp32": {"images_per_s": fp32["images_per_s"], "accuracy": fp32["accuracy"]},
+        "bf16": {"images_per_s": bf16["images_per_s"], "accuracy": bf16["accuracy"]},
+        "speedup": speedup,
+        "accuracy_delta": bf16["accuracy"] - fp32["accuracy"],
+        "prediction_agreement": agreement,
+        "max_prob_diff": max_prob_diff,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
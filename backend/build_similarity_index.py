@@ -0,0 +1,160 @@
+"""
+Build the similar-leaf retrieval index served by POST /similar.
+
+Every labelled image of the chosen splits is embedded with the serving
+classifier (DiseaseClassifier.forward_features – same architecture,
+preprocessing and weights as the API) and written as an index directory
+(see app/utils/similarity_index.py):
+
+  exact   float16 vectors, brute-force matrix multiply   (≤ 50k images)
+  ivfpq   inverted file + product-quantised uint8 codes  (larger sets)
+
+--kind auto (the default) picks between them by size.  Reference paths are
+stored relative to --dataset so the frontends can show the matching leaves.
+
+Usage:
+    cd backend
+    python build_similarity_index.py                           # dataset/train → models/similarity_index
+    python build_similarity_index.py --splits train val --layer head
+    python build_similarity_index.py --kind ivfpq --nlist 256 --subvectors 64
+    python build_similarity_index.py --bg-removed               # match servers running rembg
+
+Serve it with:
+    SIMILARITY_INDEX_PATH=models/similarity_index uvicorn app.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import ConcatDataset, DataLoader
+from torchvision import datasets
+from tqdm import tqdm
+
+from app.models.classifier import (
+    CLASS_NAMES,
+    DEFAULT_ARCHITECTURE,
+    DEFAULT_EMBEDDING_LAYER,
+    EMBEDDING_LAYERS,
+    DiseaseClassifier,
+    load_model_metadata,
+    preprocess,
+)
+from app.utils.bg_cache import BackgroundRemovalCache
+from app.utils.hashing import file_sha256
+from app.utils.similarity_index import INDEX_KINDS, build_index, check_output_dir
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+DATASET_PATH = "dataset"
+MODEL_PATH = "models/cardamom_model.pt"
+OUTPUT_PATH = "models/similarity_index"
+BATCH_SIZE = 64
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the similar-leaf index for POST /similar.")
+    parser.add_argument("--model", default=MODEL_PATH, help=f"Checkpoint (default: {MODEL_PATH})")
+    parser.add_argument("--dataset", default=DATASET_PATH, help=f"Dataset root (default: {DATASET_PATH})")
+    parser.add_argument("--splits", nargs="+", default=["train"],
+                        help="Labelled splits to index (default: train)")
+    parser.add_argument("--output", default=OUTPUT_PATH, help=f"Index directory (default: {OUTPUT_PATH})")
+    parser.add_argument("--layer", choices=EMBEDDING_LAYERS, default=DEFAULT_EMBEDDING_LAYER,
+                        help=f"Embedding to index (default: {DEFAULT_EMBEDDING_LAYER})")
+    parser.add_argument("--kind", choices=("auto", *INDEX_KINDS), default="auto",
+                        help="Index type (default: auto – exact for small sets)")
+    parser.add_argument("--nlist", type=int, default=None, help="ivfpq coarse lists (default: ≈4·√N)")
+    parser.add_argument("--subvectors", type=int, default=None,
+                        help="ivfpq sub-vectors per code (default: largest divisor of D ≤ 64)")
+    parser.add_argument("--bg-removed", action="store_true",
+                        help="Embed background-removed images (cached rembg masks)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    model_path = Path(args.model)
+    dataset_root = Path(args.dataset)
+    if not model_path.exists():
+        print(f"❌ Model not found: {model_path}")
+        sys.exit(1)
+    try:
+        check_output_dir(args.output)
+    except FileExistsError as exc:
+        print(f"❌ {exc}")
+        sys.exit(1)
+
+    metadata = load_model_metadata(str(model_path)) or {}
+    clf = DiseaseClassifier(str(model_path), architecture=metadata.get("architecture", DEFAULT_ARCHITECTURE))
+    if not clf.weights_loaded:
+        print(f"❌ Could not load model weights from {model_path}")
+        sys.exit(1)
+
+    bg_cache = BackgroundRemovalCache() if args.bg_removed else None
+    splits = []
+    for split in args.splits:
+        split_dir = dataset_root / split
+        if not split_dir.exists():
+            print(f"❌ Split not found: {split_dir}")
+            sys.exit(1)
+        ds = datasets.ImageFolder(str(split_dir), transform=preprocess)
+        if len(ds.classes) != len(CLASS_NAMES):
+            print(f"❌ Expected {len(CLASS_NAMES)} classes in {split_dir}, found {ds.classes}")
+            sys.exit(1)
+        if bg_cache is not None:
+            try:
+                bg_cache.ensure([p for p, _ in ds.samples])
+            except RuntimeError as exc:
+                print(f"❌ {exc}")
+                sys.exit(1)
+            ds.loader = bg_cache.loader
+        splits.append(ds)
+
+    samples = [s for ds in splits for s in ds.samples]
+    print(f"Model   : {model_path} ({clf.architecture}, {clf.precision} on {clf.device})")
+    print(f"Images  : {len(samples)} from {', '.join(args.splits)}")
+    print(f"Layer   : {args.layer}")
+
+    loader = DataLoader(ConcatDataset(splits), batch_size=args.batch_size,
+                        shuffle=False, num_workers=args.workers)
+    chunks = []
+    start = time.perf_counter()
+    for batch, _ in tqdm(loader, desc="Embedding", unit="batch"):
+        chunks.append(clf.forward_features(batch)[args.layer])
+    embeddings = np.concatenate(chunks)
+    print(f"✅ Embedded {len(embeddings)} images ({embeddings.shape[1]}-d) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    meta = build_index(
+        args.output,
+        embeddings,
+        labels=[label for _, label in samples],
+        paths=[os.path.relpath(path, dataset_root) for path, _ in samples],
+        classes=CLASS_NAMES,
+        layer=args.layer,
+        kind=args.kind,
+        nlist=args.nlist,
+        subvectors=args.subvectors,
+        source=str(dataset_root),
+        extra={
+            "model_path": str(model_path),
+            "model_sha256": file_sha256(model_path),
+            "architecture": clf.architecture,
+            "splits": args.splits,
+            "bg_removed": bool(args.bg_removed),
+        },
+    )
+    print(f"✅ {meta['kind']} index written to: {args.output}")
+    if meta["kind"] == "ivfpq":
+        print(f"   nlist={meta['nlist']}  subvectors={meta['subvectors']}  nprobe={meta['nprobe']}")
+    print(f"💡 Serve it with: SIMILARITY_INDEX_PATH={args.output}")
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    main()
@@ -0,0 +1,263 @@
+"""
+Calibrate the uncertainty gate of a trained Cardamom Leaf Disease model.
+
+From the model's logits on a labelled split (served by the shared inference
+cache, so a prior evaluate.py / evaluate2.py run makes this instant):
+
+  1. fits a softmax temperature T by minimising the negative log-likelihood;
+  2. sweeps the confidence threshold over a dense grid (step 0.001) and
+     reports coverage (share of images answered) and selective accuracy
+     (accuracy on the answered images), before and after calibration;
+  3. recommends the lowest threshold whose selective accuracy reaches
+     --target-accuracy;
+  4. writes T and the recommendation into the checkpoint's metadata file
+     (the one load_model_metadata() resolves, else <checkpoint stem>.json).
+     DiseaseClassifier folds T into its final layer at load time, so the
+     serving cost is unchanged.
+
+Outputs:
+  - calibration_results.json   (summary + full coverage/accuracy curves)
+  - calibration_curves.png     (requires matplotlib)
+
+Usage:
+    cd backend
+    python calibrate.py                              # test split, target 95%
+    python calibrate.py --split val                  # fit on the validation split
+    python calibrate.py --target-accuracy 0.98 --dry-run
+    python calibrate.py --no-cache                   # re-run inference
+
+Fitting on the split you report final numbers on makes those numbers
+optimistic; prefer --split val when the dataset has one.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from torchvision import datasets
+
+from app.models.classifier import (
+    CLASS_NAMES,
+    DEFAULT_ARCHITECTURE,
+    DEFAULT_CONFIDENCE_THRESHOLD,
+    build_architecture,
+    load_model_metadata,
+)
+from app.utils.calibration import (
+    DEFAULT_TARGET_ACCURACY,
+    DEFAULT_THRESHOLD_STEP,
+    calibration_summary,
+    fit_temperature,
+    recommend_threshold,
+    softmax,
+    threshold_grid,
+    threshold_sweep,
+)
+from app.utils.hashing import file_sha256
+from app.utils.inference_cache import InferenceCache, collect_logits, transform_id
+from evaluate import get_test_transforms
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+DATASET_PATH = "dataset"
+MODEL_PATH = "models/cardamom_model.pt"
+BATCH_SIZE = 32
+RESULTS_PATH = "calibration_results.json"
+CHART_PATH = "calibration_curves.png"
+REPORT_THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+DEVICE = torch.device(
+    "cuda" if torch.cuda.is_available()
+    else "mps" if torch.backends.mps.is_available()
+    else "cpu"
+)
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def load_model(model_path: Path, architecture: str) -> torch.nn.Module:
+    model = build_architecture(architecture)
+    state = torch.load(model_path, map_location=DEVICE)
+    if isinstance(state, dict) and "state_dict" in state:
+        state = state["state_dict"]
+    model.load_state_dict(state)
+    print(f"✅ Loaded {architecture} from: {model_path}")
+    return model.to(DEVICE).eval()
+
+
+def write_metadata(model_path: Path, updates: dict) -> Path:
+    """Merge *updates* into the checkpoint's metadata file and return its path."""
+    metadata = load_model_metadata(str(model_path))
+    if metadata is None:
+        meta_path, metadata = model_path.with_suffix(".json"), {}
+    else:
+        meta_path = Path(metadata.pop("metadata_path"))
+    metadata.update(updates)
+    tmp = meta_path.with_suffix(".json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(metadata, f, indent=2)
+    tmp.replace(meta_path)
+    return meta_path
+
+
+def print_sweep_table(raw, calibrated, thresholds=REPORT_THRESHOLDS) -> None:
+    print(f"\n{'Threshold':>10}  {'Coverage':>9}  {'Accuracy':>9}  │  {'Coverage':>9}  {'Accuracy':>9}")
+    print(f"{'':>10}  {'(raw)':>9}  {'(raw)':>9}  │  {'(cal.)':>9}  {'(cal.)':>9}")
+    print("─" * 60)
+    for t in thresholds:
+        cells = []
+        for sweep in (raw, calibrated):
+            cov, acc = sweep.at(t)
+            cells += [f"{cov * 100:8.1f}%", "      n/a" if np.isnan(acc) else f"{acc * 100:8.1f}%"]
+        print(f"{t:>10.2f}  {cells[0]:>9}  {cells[1]:>9}  │  {cells[2]:>9}  {cells[3]:>9}")
+
+
+def plot_curves(raw, calibrated, recommended: float | None, target: float) -> None:
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return
+
+    fig, (ax_t, ax_c) = plt.subplots(1, 2, figsize=(12, 4.5))
+    for sweep, style, label in ((raw, "--", "raw"), (calibrated, "-", "calibrated")):
+        ax_t.plot(sweep.thresholds, sweep.coverage, style, color="steelblue", label=f"coverage ({label})")
+        ax_t.plot(sweep.thresholds, sweep.accuracy, style, color="tomato", label=f"accuracy ({label})")
+        ax_c.plot(sweep.coverage, sweep.accuracy, style, label=label)
+    if recommended is not None:
+        ax_t.axvline(recommended, color="grey", lw=1, label=f"recommended ({recommended:.3f})")
+    ax_t.axhline(target, color="grey", ls=":", lw=1)
+    ax_c.axhline(target, color="grey", ls=":", lw=1, label=f"target ({target:.0%})")
+    ax_t.set_xlabel("Confidence threshold")
+    ax_t.set_ylabel("Fraction")
+    ax_t.set_title("Coverage and selective accuracy vs. threshold")
+    ax_c.set_xlabel("Coverage")
+    ax_c.set_ylabel("Selective accuracy")
+    ax_c.set_title("Accuracy–coverage trade-off")
+    for ax in (ax_t, ax_c):
+        ax.grid(alpha=0.3)
+        ax.legend(fontsize=8)
+    plt.tight_layout()
+    plt.savefig(CHART_PATH, dpi=150)
+    print(f"✅ Curves saved to: {CHART_PATH}")
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit temperature scaling and pick the confidence threshold.")
+    parser.add_argument("--model", default=MODEL_PATH, help=f"Checkpoint (default: {MODEL_PATH})")
+    parser.add_argument("--dataset", default=DATASET_PATH, help=f"Dataset root (default: {DATASET_PATH})")
+    parser.add_argument("--split", default="test", help="Labelled split to calibrate on (default: test)")
+    parser.add_argument("--target-accuracy", type=float, default=DEFAULT_TARGET_ACCURACY,
+                        help=f"Selective accuracy the threshold must reach (default: {DEFAULT_TARGET_ACCURACY})")
+    parser.add_argument("--step", type=float, default=DEFAULT_THRESHOLD_STEP,
+                        help=f"Threshold grid step (default: {DEFAULT_THRESHOLD_STEP})")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report only; do not write the checkpoint metadata")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run inference instead of reusing cached model outputs")
+    args = parser.parse_args()
+
+    model_path = Path(args.model)
+    split_dir = Path(args.dataset) / args.split
+    for path in (model_path, split_dir):
+        if not path.exists():
+            print(f"❌ Not found: {path}")
+            sys.exit(1)
+
+    metadata = load_model_metadata(str(model_path)) or {}
+    architecture = metadata.get("architecture", DEFAULT_ARCHITECTURE)
+
+    print("\n" + "=" * 60)
+    print("Calibration  –  Cardamom Disease Detection")
+    print(f"Model  : {model_path} ({architecture})")
+    print(f"Data   : {split_dir}")
+    print(f"Device : {DEVICE}")
+    print("=" * 60)
+
+    dataset = datasets.ImageFolder(str(split_dir), transform=get_test_transforms())
+    if len(dataset.classes) != len(CLASS_NAMES):
+        print(f"❌ Expected {len(CLASS_NAMES)} classes, found {dataset.classes}")
+        sys.exit(1)
+
+    def run_inference():
+        loader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=4)
+        return collect_logits(load_model(model_path, architecture), loader, DEVICE)
+
+    result = InferenceCache(enabled=not args.no_cache).get_or_compute(
+        model_path, dataset.samples, transform_id(dataset.transform), run_inference, dataset.classes
+    )
+    if result.cached:
+        print(f"✅ Reused cached model outputs ({result.key[:12]})")
+
+    logits, labels = result.logits, result.labels
+    temperature = fit_temperature(logits, labels)
+    summary = calibration_summary(logits, labels, temperature)
+
+    grid = threshold_grid(args.step)
+    raw = threshold_sweep(softmax(logits), labels, grid)
+    calibrated = threshold_sweep(softmax(logits, temperature), labels, grid)
+    recommended = recommend_threshold(calibrated, args.target_accuracy)
+
+    print(f"\nSamples      : {len(labels)}")
+    print(f"Accuracy     : {raw.accuracy[0] * 100:.2f}%")
+    print(f"Temperature  : {temperature:.4f}")
+    print(f"NLL          : {summary['nll_before']:.4f} → {summary['nll_after']:.4f}")
+    print(f"ECE          : {summary['ece_before'] * 100:.2f}% → {summary['ece_after'] * 100:.2f}%")
+    print_sweep_table(raw, calibrated)
+
+    if recommended is None:
+        print(f"\n⚠️  No threshold reaches {args.target_accuracy:.1%} selective accuracy.")
+    else:
+        cov, acc = calibrated.at(recommended)
+        print(f"\n✅ Recommended threshold: {recommended:.3f}  "
+              f"(coverage {cov * 100:.1f}%, accuracy {acc * 100:.2f}%, target {args.target_accuracy:.1%})")
+
+    calibration = {
+        "temperature": temperature,
+        "split": str(split_dir),
+        "n_samples": int(len(labels)),
+        "checkpoint_sha256": file_sha256(model_path),
+        "target_accuracy": args.target_accuracy,
+        "recommended_confidence_threshold": recommended,
+        "calibrated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **summary,
+    }
+    results = {
+        "model_path": str(model_path),
+        **calibration,
+        "default_threshold": {
+            "threshold": DEFAULT_CONFIDENCE_THRESHOLD,
+            "raw": dict(zip(("coverage", "accuracy"), raw.at(DEFAULT_CONFIDENCE_THRESHOLD))),
+            "calibrated": dict(zip(("coverage", "accuracy"), calibrated.at(DEFAULT_CONFIDENCE_THRESHOLD))),
+        },
+        "sweep_raw": raw.as_dict(),
+        "sweep_calibrated": calibrated.as_dict(),
+    }
+    with open(RESULTS_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results saved to: {RESULTS_PATH}")
+    plot_curves(raw, calibrated, recommended, args.target_accuracy)
+
+    if args.dry_run:
+        print("ℹ️  Dry run – metadata not written.")
+        return
+    meta_path = write_metadata(model_path, {"temperature": temperature, "calibration": calibration})
+    print(f"✅ Temperature written to: {meta_path}")
+    if recommended is not None:
+        print(f"💡 Serve with: CONFIDENCE_THRESHOLD={recommended:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
 from pathlib import Path
-from PIL import Image
-import imagehash
+
+import numpy as np
+
+from app.utils.dedup import hamming_pairs, phash_paths
 
 DATASET_DIR = Path("dataset")
 SPLITS = ["train", "val", "test"]
 
 # Lower = stricter matching. 0 means identical. Try 2-5 first.
+# For clusters, cross-class groups and CNN-embedding matches see deduplicate.py.
 HAMMING_THRESHOLD = 3
 
 def iter_images(split):
@@ -14,36 +17,34 @@ def iter_images(split):
         if p.suffix.lower() in [".jpg", ".jpeg", ".png", ".bmp", ".webp"]:
             yield p
 
-def phash(path):
-    # Convert to RGB to avoid mode issues
-    with Image.open(path) as img:
-        img = img.convert("RGB")
-        return imagehash.phash(img)
-
 def main():
-    # Compute hashes per split
-    hashes = {s: [] for s in SPLITS}
+    # Compute hashes for all splits in one batch
     print("Computing perceptual hashes... (this can take a bit)")
+    paths, split_of = [], []
+    for split in SPLITS:
+        found = sorted(iter_images(split))
+        paths += found
+        split_of += [split] * len(found)
 
+    hashes, ok = phash_paths(paths)
+    for i in np.flatnonzero(~ok):
+        print(f"Skip {paths[i]} (unreadable)")
     for split in SPLITS:
-        for p in iter_images(split):
-            try:
-                hashes[split].append((p, phash(p)))
-            except Exception as e:
-                print(f"Skip {p} ({e})")
+        print(f"{split}: {sum(ok[i] for i, s in enumerate(split_of) if s == split)} images hashed")
 
-        print(f"{split}: {len(hashes[split])} images hashed")
+    # Multi-index hashing: only images sharing a hash chunk are compared
+    keep = np.flatnonzero(ok)
+    pairs, dists = hamming_pairs(hashes[keep], HAMMING_THRESHOLD)
+    pairs = keep[pairs]
 
     # Compare splits
     def compare(a, b):
         print(f"\nChecking near-duplicates: {a} vs {b} (threshold={HAMMING_THRESHOLD})")
         matches = []
-        for pa, ha in hashes[a]:
-            for pb, hb in hashes[b]:
-                d = ha - hb  # Hamming distance
-                if d <= HAMMING_THRESHOLD:
-                    matches.append((d, pa, pb))
-        matches.sort(key=lambda x: x[0])
+        for (i, j), d in zip(pairs, dists):
+            if {split_of[i], split_of[j]} == {a, b}:
+                pa, pb = (paths[i], paths[j]) if split_of[i] == a else (paths[j], paths[i])
+                matches.append((int(d), pa, pb))
         print(f"Found {len(matches)} near-duplicate pairs.")
         for d, pa, pb in matches[:30]:  # print first 30
             print(f"  d={d}  {pa}  <->  {pb}")
@@ -54,4 +55,4 @@ def main():
     compare("val", "test")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,20 +4,43 @@
 Loads images directly from dataset_processed/{blight,healthy,other,spot},
 trains EfficientNetV2-S for each fold, and reports mean ± std metrics.
 
+Images are decoded once into a packed cache under .cache/packed/ (see
+app/utils/packed_dataset.py) that every fold memory-maps, instead of being
+re-opened with PIL every epoch.  With --jobs N the folds run concurrently in
+N spawned processes, each capped at --threads torch threads; cv_results.json
+is rewritten as each fold finishes, so partial results survive interruption.
+
 Usage:
     cd backend
     python cross_validate.py
+    python cross_validate.py --jobs 5 --threads 4   # all folds at once on 20 cores
+    python cross_validate.py --packed    # shards from pack_dataset.py --source dataset_processed
+    python cross_validate.py --packed --batch-augment
+    python cross_validate.py --cpu-precision bf16   # bf16 autocast + channels_last on CPU
+    python cross_validate.py --bootstrap 10000      # more bootstrap replicates for the CIs
+    python cross_validate.py --manifest splits.json # images + duplicate groups of a split manifest
 
 Outputs:
     - Per-fold accuracy/precision/recall/F1 to stdout
     - models/cv_fold_{k}.pt  (best checkpoint per fold)
-    - cv_results.json        (machine-readable summary)
+    - cv_results.json        (machine-readable summary, updated per fold)
+
+Each fold's metrics carry 95% bootstrap confidence intervals for accuracy,
+macro-F1 and per-class recall ("bootstrap_ci"); the summary adds the same
+intervals for the pooled out-of-fold predictions of all completed folds.
+
+With --manifest the images come from a split manifest (split_dataset.py
+--manifest) and its duplicate groups are kept inside a single fold.
 """
 from __future__ import annotations
 
+import argparse
 import json
+import multiprocessing as mp
+import os
 import random
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from typing import Any
 
@@ -29,6 +52,18 @@ from PIL import Image
 from torch.utils.data import DataLoader, Dataset, SubsetRandomSampler
 from torchvision import models, transforms
 
+from app.utils.batch_augment import BatchAugment, raw_uint8_transform
+from app.utils.cpu_precision import (
+    PRECISIONS,
+    autocast_context,
+    prepare_input,
+    prepare_model,
+    resolve_cpu_precision,
+)
+from app.utils.dataset_manifest import ManifestDataset, assign_units
+from app.utils.metrics import bootstrap_ci, compute_metrics
+from app.utils.packed_dataset import PackedImageDataset, ensure_packed_cache, packed_transform
+
 # ---------------------------------------------------------------------------
 # Reproducibility
 # ---------------------------------------------------------------------------
@@ -43,6 +78,7 @@ if torch.cuda.is_available():
 # Configuration
 # ---------------------------------------------------------------------------
 SOURCE_DIR = "dataset_processed"
+PACKED_DIR = "dataset_processed_packed"   # output of pack_dataset.py --source dataset_processed
 CLASS_FOLDERS = ["blight", "healthy", "other", "spot"]
 # Display names shown in reports (alphabetical, matches ImageFolder order)
 CLASS_DISPLAY_NAMES = ["blight", "healthy", "other", "spot"]
@@ -54,6 +90,8 @@ LEARNING_RATE = 0.001
 PATIENCE = 7
 IMG_SIZE = 224
 K_FOLDS = 5
+RESULTS_PATH = "cv_results.json"
+BOOTSTRAP_REPLICATES = 1000
 
 DEVICE = torch.device(
     "cuda" if torch.cuda.is_available()
@@ -93,9 +131,12 @@ class CardamomDataset(Dataset):
     def __len__(self) -> int:
         return len(self.samples)
 
+    def load_image(self, idx: int) -> Image.Image:
+        return Image.open(self.samples[idx][0]).convert("RGB")
+
     def __getitem__(self, idx: int):
-        path, label = self.samples[idx]
-        image = Image.open(path).convert("RGB")
+        image = self.load_image(idx)
+        label = self.samples[idx][1]
         if self.transform:
             image = self.transform(image)
         return image, label
@@ -119,6 +160,12 @@ def get_transforms():
     ])
     return train_tf, val_tf
 
+
+def get_batch_augment() -> BatchAugment:
+    """Batched equivalent of the train transforms in get_transforms()."""
+    return BatchAugment(out_size=IMG_SIZE, hflip=0.5, vflip=0.5, degrees=30,
+                        translate=0.1, brightness=0.2, contrast=0.2, saturation=0.2)
+
 # ---------------------------------------------------------------------------
 # Model
 # ---------------------------------------------------------------------------
@@ -136,54 +183,26 @@ def create_model() -> nn.Module:
     return model
 
 # ---------------------------------------------------------------------------
-# Per-class metrics (no sklearn dependency)
-# ---------------------------------------------------------------------------
-
-def compute_metrics(y_true: np.ndarray, y_pred: np.ndarray,
-                    num_classes: int) -> dict[str, Any]:
-    """Return accuracy + per-class precision/recall/F1 + macro averages."""
-    cm = np.zeros((num_classes, num_classes), dtype=int)
-    for t, p in zip(y_true, y_pred):
-        cm[t, p] += 1
-
-    eps = 1e-12
-    precision, recall, f1 = [], [], []
-    for i in range(num_classes):
-        tp = cm[i, i]
-        fp = cm[:, i].sum() - tp
-        fn = cm[i, :].sum() - tp
-        p_i = tp / (tp + fp + eps)
-        r_i = tp / (tp + fn + eps)
-        f1_i = 2 * p_i * r_i / (p_i + r_i + eps)
-        precision.append(float(p_i))
-        recall.append(float(r_i))
-        f1.append(float(f1_i))
-
-    accuracy = float(cm.trace() / (cm.sum() + eps))
-    return {
-        "accuracy": accuracy,
-        "macro_precision": float(np.mean(precision)),
-        "macro_recall": float(np.mean(recall)),
-        "macro_f1": float(np.mean(f1)),
-        "per_class_precision": precision,
-        "per_class_recall": recall,
-        "per_class_f1": f1,
-        "confusion_matrix": cm.tolist(),
-    }
-
-# ---------------------------------------------------------------------------
-# Single fold training
+# Fold training
 # ---------------------------------------------------------------------------
 
 def train_fold(
     fold: int,
     train_indices: list[int],
     val_indices: list[int],
-    full_dataset: CardamomDataset,
+    full_dataset: CardamomDataset | ManifestDataset | PackedImageDataset,
     train_tf,
     val_tf,
-) -> dict[str, Any]:
-    """Train one fold and return validation metrics."""
+    batch_transform: BatchAugment | None = None,
+    precision: str = "fp32",
+) -> tuple[dict[str, Any], np.ndarray, np.ndarray]:
+    """Train one fold and return (validation metrics, y_true, y_pred).
+
+    With *batch_transform* set, *train_tf* only yields uint8 tensors (or is
+    None for packed data) and augmentation runs on each collated batch.
+    *precision* "bf16" runs every forward pass channels_last under CPU bf16
+    autocast.
+    """
     print(f"\n{'='*60}")
     print(f"Fold {fold + 1}/{K_FOLDS}")
     print(f"  Train: {len(train_indices)} samples | Val: {len(val_indices)} samples")
@@ -200,9 +219,11 @@ def train_fold(
             return len(self.indices)
 
         def __getitem__(self, idx):
-            path, label = self.base.samples[self.indices[idx]]
-            image = Image.open(path).convert("RGB")
-            return self.transform(image), label
+            i = self.indices[idx]
+            image = self.base.load_image(i)
+            if self.transform is not None:
+                image = self.transform(image)
+            return image, self.base.samples[i][1]
 
     train_ds = _TransformDataset(full_dataset, train_indices, train_tf)
     val_ds = _TransformDataset(full_dataset, val_indices, val_tf)
@@ -218,7 +239,7 @@ def train_fold(
     val_loader = DataLoader(val_ds, batch_size=BATCH_SIZE, shuffle=False,
                         num_workers=0, pin_memory=False)
 
-    model = create_model().to(DEVICE)
+    model = prepare_model(create_model().to(DEVICE), precision)
     criterion = nn.CrossEntropyLoss(weight=weight_tensor, label_smoothing=0.1)
     optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
     scheduler = optim.lr_scheduler.ReduceLROnPlateau(
@@ -234,8 +255,13 @@ def train_fold(
         model.train()
         for inputs, labels in train_loader:
             inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
+            if batch_transform is not None:
+                inputs = batch_transform(inputs)
+            inputs = prepare_input(inputs, precision)
             optimizer.zero_grad()
-            loss = criterion(model(inputs), labels)
+            with autocast_context(precision, DEVICE):
+                outputs = model(inputs)
+            loss = criterion(outputs.float(), labels)
             loss.backward()
             optimizer.step()
 
@@ -246,7 +272,8 @@ def train_fold(
         with torch.no_grad():
             for inputs, labels in val_loader:
                 inputs, labels = inputs.to(DEVICE), labels.to(DEVICE)
-                out = model(inputs)
+                with autocast_context(precision, DEVICE):
+                    out = model(prepare_input(inputs, precision)).float()
                 val_loss += criterion(out, labels).item() * inputs.size(0)
                 total += inputs.size(0)
         val_loss /= total
@@ -281,41 +308,165 @@ def train_fold(
     y_true, y_pred = [], []
     with torch.no_grad():
         for inputs, labels in val_loader:
-            inputs = inputs.to(DEVICE)
-            preds = model(inputs).argmax(dim=1).cpu().numpy()
+            inputs = prepare_input(inputs.to(DEVICE), precision)
+            with autocast_context(precision, DEVICE):
+                preds = model(inputs).argmax(dim=1).cpu().numpy()
             y_pred.extend(preds.tolist())
             y_true.extend(labels.numpy().tolist())
 
-    metrics = compute_metrics(np.array(y_true), np.array(y_pred), NUM_CLASSES)
+    y_true, y_pred = np.array(y_true), np.array(y_pred)
+    metrics = compute_metrics(y_true, y_pred, NUM_CLASSES)
     print(f"\n  Fold {fold+1} results:")
     print(f"    Accuracy          : {metrics['accuracy']*100:.2f}%")
     print(f"    Macro Precision   : {metrics['macro_precision']*100:.2f}%")
     print(f"    Macro Recall      : {metrics['macro_recall']*100:.2f}%")
     print(f"    Macro F1          : {metrics['macro_f1']*100:.2f}%")
-    return metrics
+    return metrics, y_true, y_pred
+
+# ---------------------------------------------------------------------------
+# Fold dispatch (top-level so it is picklable under the spawn start method)
+# ---------------------------------------------------------------------------
+
+def run_fold(job: dict[str, Any]) -> tuple[int, dict[str, Any], np.ndarray, np.ndarray]:
+    """Build the dataset/transforms described by *job* and train one fold."""
+    fold = job["fold"]
+    if job["threads"]:
+        torch.set_num_threads(job["threads"])
+    # Seed per fold so results do not depend on --jobs or fold order.
+    random.seed(RANDOM_SEED + fold)
+    np.random.seed(RANDOM_SEED + fold)
+    torch.manual_seed(RANDOM_SEED + fold)
+
+    train_tf, val_tf = get_transforms()
+    if job["packed_split"]:
+        full_dataset = PackedImageDataset(job["packed_split"])
+        train_tf, val_tf = packed_transform(train_tf), packed_transform(val_tf)
+    elif job["manifest"]:
+        full_dataset = ManifestDataset(job["manifest"])
+    else:
+        full_dataset = CardamomDataset(SOURCE_DIR, CLASS_FOLDERS, transform=None)
+
+    batch_transform = None
+    if job["batch_augment"]:
+        batch_transform = get_batch_augment().to(DEVICE)
+        train_tf = None if job["packed_split"] else raw_uint8_transform(IMG_SIZE)
+
+    precision = resolve_cpu_precision(job["precision"], DEVICE)
+    metrics, y_true, y_pred = train_fold(fold, job["train_indices"], job["val_indices"],
+                                         full_dataset, train_tf, val_tf, batch_transform, precision)
+    metrics["fold"] = fold + 1
+    return fold, metrics, y_true, y_pred
+
+
+def summarize(all_metrics: list[dict], verbose: bool) -> dict[str, Any]:
+    """Return mean/std of the headline metrics over *all_metrics*."""
+    keys = ["accuracy", "macro_precision", "macro_recall", "macro_f1"]
+    summary: dict[str, Any] = {}
+    for key in keys:
+        values = np.array([m[key] for m in all_metrics])
+        mean, std = values.mean(), values.std()
+        if verbose:
+            label = key.replace("_", " ").title()
+            print(f"  {label:25s}: {mean*100:.2f}% ± {std*100:.2f}%")
+        summary[f"mean_{key}"] = float(mean)
+        summary[f"std_{key}"] = float(std)
+    return summary
+
+
+def format_ci(ci: dict) -> str:
+    return f"{ci['point']*100:.2f}%  [{ci['low']*100:.2f}, {ci['high']*100:.2f}]"
+
+
+def write_results(path: Path, summary: dict[str, Any]) -> None:
+    """Atomically (re)write the results JSON."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp, path)
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Stratified K-fold cross-validation.")
+    parser.add_argument("--packed", nargs="?", const=PACKED_DIR, default=None,
+                        help=f"Read pre-decoded shards from <dir>/all (default dir: {PACKED_DIR})")
+    parser.add_argument("--manifest", default=None,
+                        help="Read images from a split manifest and keep its duplicate groups in one fold")
+    parser.add_argument("--batch-augment", action="store_true",
+                        help="Augment collated uint8 batches with vectorised tensor ops")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Folds trained concurrently in separate processes (default: 1)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads per fold process (default: CPUs / jobs)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Decode JPEGs from SOURCE_DIR every epoch instead of the packed cache")
+    parser.add_argument("--cpu-precision", choices=PRECISIONS, default="fp32",
+                        help="CPU training precision; bf16/auto use bf16 autocast + channels_last "
+                             "when the CPU supports it (default: fp32)")
+    parser.add_argument("--bootstrap", type=int, default=BOOTSTRAP_REPLICATES,
+                        help=f"Bootstrap replicates for the 95%% CIs, 0 to skip (default: {BOOTSTRAP_REPLICATES})")
+    args = parser.parse_args()
+    if args.packed and args.manifest:
+        print("❌ --packed and --manifest cannot be combined")
+        sys.exit(1)
+
+    jobs = max(1, min(args.jobs, K_FOLDS))
+    threads = args.threads or (max(1, (os.cpu_count() or 1) // jobs) if jobs > 1 else None)
+
     print("\n" + "=" * 60)
     print("5-Fold Cross-Validation  –  Cardamom Disease Detection")
     print(f"Model      : EfficientNetV2-S")
     print(f"Device     : {DEVICE}")
-    print(f"Source     : {SOURCE_DIR}/")
+    source = args.manifest or (f"{args.packed}/all (packed)" if args.packed else f"{SOURCE_DIR}/")
+    print(f"Source     : {source}")
     print(f"Classes    : {CLASS_FOLDERS}")
     print(f"Seed       : {RANDOM_SEED}")
+    print(f"Jobs       : {jobs}" + (f"  ({threads} threads each)" if threads else ""))
+    print(f"Precision  : {resolve_cpu_precision(args.cpu_precision, DEVICE)}")
     print("=" * 60)
 
-    # Verify source directory exists
-    if not Path(SOURCE_DIR).exists():
-        print(f"\n❌ Source directory not found: {SOURCE_DIR}/")
-        print("   Run remove_bg_batch.py or augment.py first to populate it.")
-        sys.exit(1)
+    if args.packed:
+        packed_split = Path(args.packed) / "all"
+        if not packed_split.exists():
+            print(f"\n❌ Packed dataset not found: {packed_split}/")
+            print(f"   Run: python pack_dataset.py --source {SOURCE_DIR} --output {args.packed}")
+            sys.exit(1)
+        full_dataset = PackedImageDataset(packed_split)
+        if full_dataset.classes != CLASS_FOLDERS:
+            print(f"\n❌ Packed classes {full_dataset.classes} do not match {CLASS_FOLDERS}")
+            sys.exit(1)
+    else:
+        if args.manifest:
+            if not Path(args.manifest).is_file():
+                print(f"\n❌ Split manifest not found: {args.manifest}")
+                print(f"   Run: python split_dataset.py --manifest {args.manifest}")
+                sys.exit(1)
+            full_dataset = ManifestDataset(args.manifest)
+            if full_dataset.classes != CLASS_FOLDERS:
+                print(f"\n❌ Manifest classes {full_dataset.classes} do not match {CLASS_FOLDERS}")
+                sys.exit(1)
+        else:
+            # Verify source directory exists
+            if not Path(SOURCE_DIR).exists():
+                print(f"\n❌ Source directory not found: {SOURCE_DIR}/")
+                print("   Run remove_bg_batch.py or augment.py first to populate it.")
+                sys.exit(1)
+
+            # Load dataset without any transform (transforms applied per-split inside fold)
+            full_dataset = CardamomDataset(SOURCE_DIR, CLASS_FOLDERS, transform=None)
+        packed_split = None
+        if not args.no_cache:
+            # Decode once at the training resolution; every fold memory-maps it.
+            packed_split = ensure_packed_cache(
+                [(str(p), t) for p, t in full_dataset.samples], CLASS_FOLDERS,
+                size=IMG_SIZE, workers=os.cpu_count() or 1,
+            )
+            print(f"✅ Decoded image cache: {packed_split}")
 
-    # Load dataset without any transform (transforms applied per-split inside fold)
-    full_dataset = CardamomDataset(SOURCE_DIR, CLASS_FOLDERS, transform=None)
+    if args.batch_augment:
+        print("Batched tensor augmentation: enabled")
     n = len(full_dataset)
     print(f"\nTotal images: {n}")
 
@@ -324,56 +475,88 @@ def main() -> None:
         count = int((labels_array == i).sum())
         print(f"  {cls}: {count}")
 
-    train_tf, val_tf = get_transforms()
-
     # Manual stratified K-Fold
     indices_per_class = [np.where(labels_array == i)[0].tolist()
                          for i in range(NUM_CLASSES)]
     for idxs in indices_per_class:
         random.shuffle(idxs)
 
-    # Build fold index lists (stratified by class)
+    # Build fold index lists (stratified by class); manifest duplicate groups
+    # stay inside one fold, otherwise every image is its own unit.
+    unit_keys = full_dataset.groups if args.manifest else list(range(n))
     folds: list[list[int]] = [[] for _ in range(K_FOLDS)]
+    assigned: dict = {}
     for class_idxs in indices_per_class:
         chunk = len(class_idxs) // K_FOLDS
+        bins = assign_units(class_idxs, [unit_keys[i] for i in class_idxs],
+                            [chunk * k for k in range(1, K_FOLDS)], range(K_FOLDS), assigned)
         for k in range(K_FOLDS):
-            start = k * chunk
-            end = start + chunk if k < K_FOLDS - 1 else len(class_idxs)
-            folds[k].extend(class_idxs[start:end])
+            folds[k].extend(bins[k])
 
-    all_metrics: list[dict] = []
+    fold_jobs = []
     for fold in range(K_FOLDS):
-        val_indices = folds[fold]
         train_indices = []
         for k in range(K_FOLDS):
             if k != fold:
                 train_indices.extend(folds[k])
+        fold_jobs.append({
+            "fold": fold,
+            "train_indices": train_indices,
+            "val_indices": folds[fold],
+            "packed_split": str(packed_split) if packed_split else None,
+            "manifest": args.manifest,
+            "batch_augment": args.batch_augment,
+            "threads": threads,
+            "precision": args.cpu_precision,
+        })
 
-        metrics = train_fold(fold, train_indices, val_indices,
-                             full_dataset, train_tf, val_tf)
-        all_metrics.append(metrics)
-
-    # Aggregate
-    print("\n" + "=" * 60)
-    print("Cross-Validation Summary")
-    print("=" * 60)
-
-    keys = ["accuracy", "macro_precision", "macro_recall", "macro_f1"]
     summary: dict[str, Any] = {
         "folds": K_FOLDS,
         "random_seed": RANDOM_SEED,
         "model": "EfficientNetV2-S",
         "classes": CLASS_FOLDERS,
-        "per_fold": all_metrics,
+        "status": "running",
+        "completed_folds": 0,
+        "per_fold": [],
     }
+    out_path = Path(RESULTS_PATH)
+    results: dict[int, dict] = {}
+    oof: dict[int, tuple[np.ndarray, np.ndarray]] = {}   # out-of-fold (y_true, y_pred)
+
+    def record(fold: int, metrics: dict, y_true: np.ndarray, y_pred: np.ndarray) -> None:
+        if args.bootstrap > 0:
+            metrics["bootstrap_ci"] = bootstrap_ci(y_true, y_pred, NUM_CLASSES,
+                                                   n_boot=args.bootstrap, seed=RANDOM_SEED + fold)
+        results[fold] = metrics
+        oof[fold] = (y_true, y_pred)
+        summary["per_fold"] = [results[k] for k in sorted(results)]
+        summary["completed_folds"] = len(results)
+        summary.update(summarize(summary["per_fold"], verbose=False))
+        if args.bootstrap > 0:
+            pooled_true = np.concatenate([oof[k][0] for k in sorted(oof)])
+            pooled_pred = np.concatenate([oof[k][1] for k in sorted(oof)])
+            summary["pooled_bootstrap_ci"] = bootstrap_ci(pooled_true, pooled_pred, NUM_CLASSES,
+                                                          n_boot=args.bootstrap, seed=RANDOM_SEED)
+        write_results(out_path, summary)
+        print(f"  ✓ Fold {fold + 1} recorded in {out_path} ({len(results)}/{K_FOLDS})")
+
+    if jobs == 1:
+        for job in fold_jobs:
+            record(*run_fold(job))
+    else:
+        ctx = mp.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+            futures = [pool.submit(run_fold, job) for job in fold_jobs]
+            for fut in as_completed(futures):
+                record(*fut.result())
+
+    all_metrics = summary["per_fold"]
 
-    for key in keys:
-        values = np.array([m[key] for m in all_metrics])
-        mean, std = values.mean(), values.std()
-        label = key.replace("_", " ").title()
-        print(f"  {label:25s}: {mean*100:.2f}% ± {std*100:.2f}%")
-        summary[f"mean_{key}"] = float(mean)
-        summary[f"std_{key}"] = float(std)
+    # Aggregate
+    print("\n" + "=" * 60)
+    print("Cross-Validation Summary")
+    print("=" * 60)
+    summary.update(summarize(all_metrics, verbose=True))
 
     # Per-class F1 averages
     print("\n  Per-class macro F1 (mean ± std):")
@@ -381,10 +564,19 @@ def main() -> None:
         f1_vals = np.array([m["per_class_f1"][i] for m in all_metrics])
         print(f"    {cls:12s}: {f1_vals.mean()*100:.2f}% ± {f1_vals.std()*100:.2f}%")
 
+    if "pooled_bootstrap_ci" in summary:
+        ci = summary["pooled_bootstrap_ci"]
+        print(f"\n  Pooled out-of-fold, 95% bootstrap CI ({args.bootstrap} replicates):")
+        print(f"    {'Accuracy':12s}: {format_ci(ci['accuracy'])}")
+        print(f"    {'Macro F1':12s}: {format_ci(ci['macro_f1'])}")
+        rec = ci["per_class_recall"]
+        for i, cls in enumerate(CLASS_FOLDERS):
+            print(f"    {cls + ' recall':12s}: "
+                  f"{format_ci({k: rec[k][i] for k in ('point', 'low', 'high')})}")
+
     # Save JSON
-    out_path = Path("cv_results.json")
-    with open(out_path, "w") as f:
-        json.dump(summary, f, indent=2)
+    summary["status"] = "complete"
+    write_results(out_path, summary)
     print(f"\n✅ Results saved to: {out_path}")
 
 
@@ -0,0 +1,214 @@
+"""
+Find near-duplicate images across and within dataset splits.
+
+Replaces the all-pairs loops of check_near_duplicates.py for large datasets:
+
+  - pHash of every image (decoded by a process pool, hashed in one batch),
+    matched with multi-index hashing – only images sharing a hash chunk are
+    compared;
+  - optionally (--embeddings) CNN embeddings from the serving classifier,
+    matched by cosine similarity with a tiled matrix multiply.
+
+Matching pairs are merged into duplicate groups, and the report lists:
+
+  - cross-split pairs   (train/val/test leakage)
+  - cross-class groups  (the same leaf filed under two labels)
+  - within-class clusters
+
+The output JSON holds the groups; pass it to split_dataset.py --groups so
+every group lands in a single split.  split_dataset.py reads
+dataset_processed/, so build that report with --root dataset_processed.
+
+Usage:
+    cd backend
+    python deduplicate.py                                   # leakage in dataset/{train,val,test}
+    python deduplicate.py --embeddings --cosine 0.97        # also CNN embeddings
+
+    python deduplicate.py --root dataset_processed --output duplicates.json
+    python split_dataset.py --groups duplicates.json
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+from tqdm import tqdm
+
+from app.utils.dedup import (
+    DEFAULT_COSINE_THRESHOLD,
+    DEFAULT_HAMMING_THRESHOLD,
+    connected_groups,
+    cosine_pairs,
+    group_members,
+    hamming_pairs,
+    phash_paths,
+    write_groups,
+)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+DATASET_PATH = "dataset"
+MODEL_PATH = "models/cardamom_model.pt"
+OUTPUT_PATH = "duplicates.json"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+SPLITS = ("train", "val", "test")
+SHOW_PAIRS = 30
+
+
+def scan(root: Path) -> tuple[list[Path], list[str], list[str]]:
+    """Image paths under *root* with their split and class folder names.
+
+    ``root/<split>/<class>/img`` gives a split; ``root/<class>/img`` (e.g.
+    dataset_processed) gives an empty split.
+    """
+    files = [Path(d) / f for d, _, names in os.walk(root, followlinks=True) for f in names]
+    paths, splits, classes = [], [], []
+    for p in sorted(files):
+        if p.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        parts = p.relative_to(root).parts
+        paths.append(p)
+        splits.append(parts[0] if len(parts) >= 3 and parts[0] in SPLITS else "")
+        classes.append(parts[-2] if len(parts) >= 2 else "")
+    return paths, splits, classes
+
+
+def embed(paths: list[Path], model_path: Path, layer: str, batch_size: int, workers: int) -> np.ndarray:
+    """Serving-classifier embeddings of *paths* (zeros for unreadable files)."""
+    from app.models.classifier import DEFAULT_ARCHITECTURE, DiseaseClassifier, load_model_metadata
+    from predict import ImagePathDataset
+
+    metadata = load_model_metadata(str(model_path)) or {}
+    clf = DiseaseClassifier(str(model_path), architecture=metadata.get("architecture", DEFAULT_ARCHITECTURE))
+    if not clf.weights_loaded:
+        print(f"❌ Could not load model weights from {model_path}")
+        sys.exit(1)
+
+    loader = DataLoader(ImagePathDataset([str(p) for p in paths]), batch_size=batch_size,
+                        shuffle=False, num_workers=workers)
+    chunks = []
+    with torch.no_grad():
+        for batch, _, _ in tqdm(loader, desc="Embedding", unit="batch"):
+            chunks.append(clf.forward_features(batch)[layer])
+    return np.concatenate(chunks)
+
+
+def print_pairs(title: str, rows: list[tuple[str, float, Path, Path]]) -> None:
+    print(f"\n{title}: {len(rows)}")
+    for method, score, a, b in rows[:SHOW_PAIRS]:
+        label = f"d={int(score)}" if method == "phash" else f"cos={score:.3f}"
+        print(f"  {method:6s} {label:9s} {a}  <->  {b}")
+    if len(rows) > SHOW_PAIRS:
+        print(f"  … {len(rows) - SHOW_PAIRS} more in the JSON report")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Near-duplicate and leakage report for an image dataset.")
+    parser.add_argument("--root", default=DATASET_PATH,
+                        help=f"Dataset root with split or class folders (default: {DATASET_PATH})")
+    parser.add_argument("--hamming", type=int, default=DEFAULT_HAMMING_THRESHOLD,
+                        help=f"Max pHash Hamming distance (default: {DEFAULT_HAMMING_THRESHOLD})")
+    parser.add_argument("--embeddings", action="store_true",
+                        help="Also match CNN embeddings of the serving classifier")
+    parser.add_argument("--cosine", type=float, default=DEFAULT_COSINE_THRESHOLD,
+                        help=f"Min embedding cosine similarity (default: {DEFAULT_COSINE_THRESHOLD})")
+    parser.add_argument("--model", default=MODEL_PATH, help=f"Checkpoint for --embeddings (default: {MODEL_PATH})")
+    parser.add_argument("--layer", choices=("pooled", "head"), default="pooled",
+                        help="Embedding for --embeddings (default: pooled)")
+    parser.add_argument("--output", default=OUTPUT_PATH, help=f"Report path (default: {OUTPUT_PATH})")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    root = Path(args.root)
+    if not root.exists():
+        print(f"❌ Not found: {root}")
+        sys.exit(1)
+
+    paths, splits, classes = scan(root)
+    if not paths:
+        print(f"❌ No images under {root}")
+        sys.exit(1)
+    print(f"Found {len(paths)} images under {root}  "
+          f"({', '.join(f'{s}: {n}' for s, n in sorted(Counter(splits).items()) if s) or 'no splits'})")
+
+    start = time.perf_counter()
+    with tqdm(total=len(paths), desc="pHash", unit="img") as bar:
+        hashes, ok = phash_paths(paths, workers=args.workers, progress=bar.update)
+    for i in np.flatnonzero(~ok):
+        print(f"Skip {paths[i]} (unreadable)")
+    keep = np.flatnonzero(ok)
+    ph_pairs, ph_dist = hamming_pairs(hashes[keep], args.hamming)
+    ph_pairs = keep[ph_pairs]
+    print(f"✅ pHash: {len(ph_pairs)} pairs within d≤{args.hamming}  ({time.perf_counter() - start:.1f}s)")
+
+    all_pairs = [ph_pairs]
+    matches = [("phash", float(d), int(a), int(b)) for (a, b), d in zip(ph_pairs, ph_dist)]
+    if args.embeddings:
+        start = time.perf_counter()
+        emb = embed(paths, Path(args.model), args.layer, args.batch_size, args.workers)
+        cos_pairs, cos_sim = cosine_pairs(emb[keep], args.cosine)
+        cos_pairs = keep[cos_pairs]
+        print(f"✅ Embeddings: {len(cos_pairs)} pairs with cos≥{args.cosine}  "
+              f"({time.perf_counter() - start:.1f}s)")
+        all_pairs.append(cos_pairs)
+        matches += [("cosine", float(s), int(a), int(b)) for (a, b), s in zip(cos_pairs, cos_sim)]
+
+    groups = group_members(connected_groups(len(paths), np.concatenate(all_pairs)))
+    cross_split = [m for m in matches if splits[m[2]] != splits[m[3]]]
+    cross_class = [g for g in groups if len({classes[i] for i in g}) > 1]
+    within_class = [g for g in groups if len({classes[i] for i in g}) == 1]
+
+    print("\n" + "=" * 60)
+    print("Duplicate report")
+    print("=" * 60)
+    print(f"Duplicate groups        : {len(groups)}  ({sum(len(g) for g in groups)} images)")
+    print(f"Redundant images        : {sum(len(g) - 1 for g in groups)}")
+    print(f"Within-class clusters   : {len(within_class)}")
+    print(f"Cross-class groups      : {len(cross_class)}")
+    if any(splits):
+        leak = Counter(tuple(sorted((splits[a], splits[b]))) for _, _, a, b in cross_split)
+        for (sa, sb), n in sorted(leak.items()):
+            print(f"Leakage {sa} ↔ {sb:<12}: {n} pairs")
+        print_pairs("Cross-split pairs", [(m, s, paths[a], paths[b]) for m, s, a, b in cross_split])
+    for g in cross_class[:10]:
+        print(f"  ⚠️  cross-class: {', '.join(f'{paths[i]} [{classes[i]}]' for i in g[:4])}")
+
+    def describe(g):
+        return [{"path": str(paths[i]), "split": splits[i], "class": classes[i]} for i in g]
+
+    write_groups(
+        args.output,
+        ([str(paths[i]) for i in g] for g in groups),
+        extra={
+            "root": str(root),
+            "n_images": len(paths),
+            "hamming_threshold": args.hamming,
+            "cosine_threshold": args.cosine if args.embeddings else None,
+            "cross_split_pairs": [
+                {"method": m, "score": s, "a": str(paths[a]), "b": str(paths[b]),
+                 "splits": [splits[a], splits[b]]}
+                for m, s, a, b in cross_split
+            ],
+            "cross_class_groups": [describe(g) for g in cross_class],
+            "within_class_clusters": [describe(g) for g in within_class],
+        },
+    )
+    print(f"\n✅ Report saved to: {args.output}")
+    if root.resolve() == Path("dataset_processed").resolve():
+        print(f"💡 Keep groups together when splitting: python split_dataset.py --groups {args.output}")
+    else:
+        print("💡 To keep groups together when splitting, run with --root dataset_processed "
+              "and pass that report to split_dataset.py --groups")
+
+
+if __name__ == "__main__":
+    main()
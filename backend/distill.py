@@ -0,0 +1,287 @@
+"""
+Knowledge distillation: EfficientNetV2-S teacher → MobileNetV3-Small student.
+
+The trained production model (models/cardamom_model.pt) is the teacher.  The
+student is an ImageNet-pretrained MobileNetV3-Small with a 4-class head (the
+same head baseline_comparison.py uses) trained on
+
+    loss = α · T² · KL(softmax(student / T) ‖ softmax(teacher / T))
+         + (1 − α) · CE(student, label)
+
+The teacher sees exactly the augmented batch the student sees, so its soft
+targets follow the augmentation.  After training, teacher and student are
+evaluated on the test split and a metadata file is written next to the
+student checkpoint:
+
+    models/cardamom_student.pt
+    models/cardamom_student.json   # {"architecture": "mobilenet_v3_small", ...}
+
+Serve the student with MODEL_PATH=models/cardamom_student.pt – the app reads
+"architecture" from the metadata file and builds the matching network, and
+/health reports its test accuracy.  "accuracy_gap" (teacher − student) tracks
+what the cheaper model costs.
+
+Usage:
+    cd backend
+    python distill.py
+    python distill.py --packed --temperature 4 --alpha 0.7
+    python distill.py --teacher models/cardamom_model.pt --output models/cardamom_student.pt
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import torch.optim as optim
+from torch.utils.data import DataLoader
+from torchvision import datasets, models
+from tqdm import tqdm
+
+from app.models.classifier import CLASS_NAMES
+from app.utils.packed_dataset import open_packed_split
+from train import Config, create_model, get_data_transforms
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+STUDENT_ARCHITECTURE = "mobilenet_v3_small"
+DEFAULT_OUTPUT = "models/cardamom_student.pt"
+TEMPERATURE = 4.0
+ALPHA = 0.7            # weight of the soft-target term
+NUM_EPOCHS = 40
+LEARNING_RATE = 1e-3
+PATIENCE = 8
+RANDOM_SEED = 42
+
+
+# ---------------------------------------------------------------------------
+# Models
+# ---------------------------------------------------------------------------
+
+
+def create_student() -> nn.Module:
+    """ImageNet MobileNetV3-Small with a CLASS_NAMES head.
+
+    Must match app.models.classifier.build_architecture("mobilenet_v3_small").
+    """
+    m = models.mobilenet_v3_small(weights=models.MobileNet_V3_Small_Weights.DEFAULT)
+    m.classifier[-1] = nn.Linear(m.classifier[-1].in_features, Config.NUM_CLASSES)
+    return m
+
+
+def load_teacher(path: str) -> nn.Module:
+    teacher = create_model()
+    state = torch.load(path, map_location="cpu")
+    if isinstance(state, dict) and "state_dict" in state:
+        state = state["state_dict"]
+    teacher.load_state_dict(state)
+    return teacher.eval()
+
+
+def count_params_m(model: nn.Module) -> float:
+    return sum(p.numel() for p in model.parameters()) / 1e6
+
+
+# ---------------------------------------------------------------------------
+# Distillation
+# ---------------------------------------------------------------------------
+
+
+def distillation_loss(
+    student_logits: torch.Tensor,
+    teacher_logits: torch.Tensor,
+    labels: torch.Tensor,
+    hard_criterion: nn.Module,
+    temperature: float = TEMPERATURE,
+    alpha: float = ALPHA,
+) -> torch.Tensor:
+    """Hinton-style KD loss; the T² factor keeps soft-target gradients at the
+    scale of the hard-label term."""
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=1),
+        F.softmax(teacher_logits / temperature, dim=1),
+        reduction="batchmean",
+    ) * temperature ** 2
+    return alpha * soft + (1.0 - alpha) * hard_criterion(student_logits, labels)
+
+
+def distill_epoch(student, teacher, loader, hard_criterion, optimizer, device, temperature, alpha):
+    student.train()
+    running, total = 0.0, 0
+    for inputs, labels in tqdm(loader, desc="Distilling"):
+        inputs, labels = inputs.to(device), labels.to(device)
+        with torch.no_grad():
+            teacher_logits = teacher(inputs)
+        optimizer.zero_grad()
+        loss = distillation_loss(student(inputs), teacher_logits, labels,
+                                 hard_criterion, temperature, alpha)
+        loss.backward()
+        optimizer.step()
+        running += loss.item() * inputs.size(0)
+        total += inputs.size(0)
+    return running / total
+
+
+def evaluate(model: nn.Module, loader: DataLoader, device) -> tuple[float, float]:
+    """Return (cross-entropy loss, accuracy) of *model* on *loader*."""
+    model.eval()
+    loss, correct, total = 0.0, 0, 0
+    with torch.no_grad():
+        for inputs, labels in loader:
+            inputs, labels = inputs.to(device), labels.to(device)
+            out = model(inputs)
+            loss += F.cross_entropy(out, labels, reduction="sum").item()
+            correct += (out.argmax(dim=1) == labels).sum().item()
+            total += labels.size(0)
+    return loss / total, correct / total
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Distil the trained model into a MobileNetV3-Small student.")
+    parser.add_argument("--teacher", default=Config.MODEL_SAVE_PATH,
+                        help=f"Teacher checkpoint (default: {Config.MODEL_SAVE_PATH})")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help=f"Student checkpoint to write (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--packed", nargs="?", const="dataset_packed", default=None,
+                        help="Read packed shards instead of dataset/ (default dir: dataset_packed)")
+    parser.add_argument("--temperature", type=float, default=TEMPERATURE,
+                        help=f"Softmax temperature of the soft targets (default: {TEMPERATURE})")
+    parser.add_argument("--alpha", type=float, default=ALPHA,
+                        help=f"Weight of the soft-target loss, 0–1 (default: {ALPHA})")
+    parser.add_argument("--epochs", type=int, default=NUM_EPOCHS)
+    parser.add_argument("--workers", type=int, default=4, help="DataLoader workers")
+    args = parser.parse_args()
+
+    if not 0.0 <= args.alpha <= 1.0:
+        print("❌ --alpha must be between 0 and 1")
+        sys.exit(1)
+    if not Path(args.teacher).exists():
+        print(f"❌ Teacher checkpoint not found: {args.teacher}")
+        print("💡 Train first: python train.py")
+        sys.exit(1)
+    data_root = Path(args.packed or Config.DATASET_PATH)
+    for split in ("train", "val"):
+        if not (data_root / split).exists():
+            hint = "pack_dataset.py" if args.packed else "split_dataset.py"
+            print(f"❌ Missing split: {data_root / split}/  (run {hint})")
+            sys.exit(1)
+
+    torch.manual_seed(RANDOM_SEED)
+    np.random.seed(RANDOM_SEED)
+    device = Config.DEVICE
+
+    train_tf, val_tf = get_data_transforms()
+
+    def open_split(split, transform):
+        if args.packed:
+            return open_packed_split(data_root, split, transform)
+        return datasets.ImageFolder(str(data_root / split), transform=transform)
+
+    train_ds = open_split("train", train_tf)
+    val_ds = open_split("val", val_tf)
+    test_ds = open_split("test", val_tf) if (data_root / "test").exists() else None
+
+    train_loader = DataLoader(train_ds, batch_size=Config.BATCH_SIZE, shuffle=True,
+                              num_workers=args.workers)
+    val_loader = DataLoader(val_ds, batch_size=Config.BATCH_SIZE, num_workers=args.workers)
+
+    teacher = load_teacher(args.teacher).to(device)
+    student = create_student().to(device)
+
+    print("\n" + "=" * 60)
+    print("KNOWLEDGE DISTILLATION")
+    print(f"Device      : {device}")
+    print(f"Data        : {data_root}/{'  (packed)' if args.packed else ''}")
+    print(f"Teacher     : {args.teacher}  ({count_params_m(teacher):.1f}M params)")
+    print(f"Student     : MobileNetV3-Small  ({count_params_m(student):.1f}M params)")
+    print(f"T / alpha   : {args.temperature} / {args.alpha}")
+    print(f"Train / Val : {len(train_ds)} / {len(val_ds)}")
+    print("=" * 60)
+
+    train_labels = np.asarray(train_ds.targets, dtype=np.int64)
+    class_counts = np.bincount(train_labels, minlength=Config.NUM_CLASSES).astype(float)
+    class_weights = torch.tensor(class_counts.sum() / (Config.NUM_CLASSES * np.maximum(class_counts, 1)),
+                                 dtype=torch.float32, device=device)
+    hard_criterion = nn.CrossEntropyLoss(weight=class_weights, label_smoothing=0.1)
+    optimizer = optim.Adam(student.parameters(), lr=LEARNING_RATE)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode="min", factor=0.5, patience=3)
+
+    best_val_loss, best_state, patience_counter = float("inf"), None, 0
+    for epoch in range(args.epochs):
+        start = time.time()
+        train_loss = distill_epoch(student, teacher, train_loader, hard_criterion, optimizer,
+                                   device, args.temperature, args.alpha)
+        val_loss, val_acc = evaluate(student, val_loader, device)
+        scheduler.step(val_loss)
+
+        improved = val_loss < best_val_loss - 1e-4
+        if improved:
+            best_val_loss, patience_counter = val_loss, 0
+            best_state = {k: v.detach().cpu().clone() for k, v in student.state_dict().items()}
+        else:
+            patience_counter += 1
+        print(f"  Epoch {epoch + 1:3d} | kd_loss={train_loss:.4f} | val_loss={val_loss:.4f} "
+              f"| val_acc={val_acc * 100:.2f}% | {time.time() - start:.1f}s{'  ✓' if improved else ''}")
+        if patience_counter >= PATIENCE:
+            print(f"  Early stopping at epoch {epoch + 1}")
+            break
+
+    if best_state is None:
+        print("❌ Distillation produced no checkpoint.")
+        sys.exit(1)
+    student.load_state_dict(best_state)
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    torch.save(best_state, output)
+
+    # Accuracy gap on held-out data (test split when present, else val)
+    eval_split = "test" if test_ds is not None else "val"
+    eval_loader = DataLoader(test_ds if test_ds is not None else val_ds,
+                             batch_size=Config.BATCH_SIZE, num_workers=args.workers)
+    _, teacher_acc = evaluate(teacher, eval_loader, device)
+    _, student_acc = evaluate(student, eval_loader, device)
+
+    metadata = {
+        "architecture": STUDENT_ARCHITECTURE,
+        "version": f"student-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}",
+        "class_names": CLASS_NAMES,
+        "test_accuracy": student_acc,
+        "teacher_path": str(args.teacher),
+        "teacher_architecture": "efficientnet_v2_s",
+        "teacher_test_accuracy": teacher_acc,
+        "accuracy_gap": teacher_acc - student_acc,
+        "eval_split": eval_split,
+        "params_m": round(count_params_m(student), 3),
+        "teacher_params_m": round(count_params_m(teacher), 3),
+        "distillation": {"temperature": args.temperature, "alpha": args.alpha,
+                         "best_val_loss": best_val_loss},
+    }
+    meta_path = output.with_suffix(".json")
+    with open(meta_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    print("\n" + "=" * 60)
+    print(f"{f'Teacher {eval_split} accuracy':<22}: {teacher_acc * 100:.2f}%")
+    print(f"{f'Student {eval_split} accuracy':<22}: {student_acc * 100:.2f}%")
+    print(f"{'Accuracy gap':<22}: {(teacher_acc - student_acc) * 100:+.2f} pp")
+    print(f"✅ Student saved to: {output}")
+    print(f"✅ Metadata saved to: {meta_path}")
+    print(f"💡 Serve it with: MODEL_PATH={output}")
+
+
+if __name__ == "__main__":
+    main()
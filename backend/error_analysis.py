@@ -12,12 +12,18 @@ produces:
 Usage:
     cd backend
     python error_analysis.py
+    python error_analysis.py --no-cache    # re-run inference even if cached
+    python error_analysis.py --manifest splits.json   # test split of a manifest
+
+Model outputs are shared with the other evaluation scripts through the
+inference cache (.cache/inference, see app/utils/inference_cache.py).
 
 Optional: install matplotlib for confidence-histogram output.
     pip install matplotlib
 """
 from __future__ import annotations
 
+import argparse
 import csv
 import json
 import sys
@@ -31,6 +37,10 @@ from PIL import Image
 from torch.utils.data import DataLoader, Dataset
 from torchvision import models, transforms
 
+from app.utils.dataset_manifest import split_samples
+from app.utils.inference_cache import InferenceCache, collect_logits, transform_id
+from app.utils.metrics import confusion_matrix
+
 # ---------------------------------------------------------------------------
 # Configuration (must match train.py)
 # ---------------------------------------------------------------------------
@@ -134,28 +144,32 @@ def get_transform():
 # Inference
 # ---------------------------------------------------------------------------
 
-def run_inference(model, loader):
-    """Returns arrays: y_true, y_pred, y_conf, paths."""
-    all_true, all_pred, all_conf, all_paths = [], [], [], []
-    with torch.no_grad():
-        for inputs, labels, paths in loader:
-            inputs = inputs.to(DEVICE)
-            logits = model(inputs)
-            probs = torch.softmax(logits, dim=1).cpu().numpy()
-            preds = probs.argmax(axis=1)
-            confs = probs.max(axis=1)
-            all_true.extend(labels.numpy().tolist())
-            all_pred.extend(preds.tolist())
-            all_conf.extend(confs.tolist())
-            all_paths.extend(paths)
-    return (np.array(all_true), np.array(all_pred),
-            np.array(all_conf), all_paths)
+def run_inference(samples, class_names, use_cache: bool = True):
+    """Returns arrays: y_true, y_pred, y_conf, paths.
+
+    Reuses the shared inference cache; the model is only loaded on a miss.
+    """
+    transform = get_transform()
+
+    def compute():
+        ds = _PathDataset(samples, transform)
+        loader = DataLoader(ds, batch_size=BATCH_SIZE, shuffle=False,
+                            collate_fn=_collate_with_paths,
+                            num_workers=2, pin_memory=False)
+        return collect_logits(load_model(), loader, DEVICE)
+
+    result = InferenceCache(enabled=use_cache).get_or_compute(
+        MODEL_PATH, samples, transform_id(transform), compute, class_names
+    )
+    if result.cached:
+        print(f"✅ Reused cached model outputs ({result.key[:12]})")
+    return result.labels, result.preds, result.confidences, result.paths
 
 # ---------------------------------------------------------------------------
 # Analysis
 # ---------------------------------------------------------------------------
 
-def analyse(y_true, y_pred, y_conf, paths, class_names):
+def analyse(y_true, y_pred, y_conf, paths, class_names, dataset=DATASET_PATH):
     n = len(y_true)
     correct_mask = y_true == y_pred
     wrong_mask = ~correct_mask
@@ -192,9 +206,7 @@ def analyse(y_true, y_pred, y_conf, paths, class_names):
 
     # ── Dominant confusion pairs ─────────────────────────────────────────────
     nc = len(class_names)
-    cm = np.zeros((nc, nc), dtype=int)
-    for t, p in zip(y_true, y_pred):
-        cm[t, p] += 1
+    cm = confusion_matrix(y_true, y_pred, nc)
 
     print("\nTop confusion pairs (true → predicted):")
     off_diag = [(cm[i, j], class_names[i], class_names[j])
@@ -220,7 +232,7 @@ def analyse(y_true, y_pred, y_conf, paths, class_names):
     # ── JSON summary ─────────────────────────────────────────────────────────
     summary: dict[str, Any] = {
         "model": "EfficientNetV2-S",
-        "dataset": DATASET_PATH,
+        "dataset": dataset,
         "classes": class_names,
         "n_total": int(n),
         "n_correct": int(correct_mask.sum()),
@@ -265,29 +277,36 @@ def analyse(y_true, y_pred, y_conf, paths, class_names):
 # ---------------------------------------------------------------------------
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Error analysis on the test split.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run inference instead of reusing cached model outputs")
+    parser.add_argument("--manifest", default=None,
+                        help="Use the test split of a manifest (split_dataset.py --manifest)")
+    args = parser.parse_args()
+
     print("\n" + "=" * 60)
     print("Error Analysis  –  Cardamom Disease Detection")
     print(f"Model  : EfficientNetV2-S")
     print(f"Device : {DEVICE}")
-    print(f"Data   : {DATASET_PATH}/test")
+    print(f"Data   : {args.manifest or f'{DATASET_PATH}/test'}")
     print("=" * 60)
 
-    model = load_model()
-    samples, class_names = collect_test_samples(DATASET_PATH)
+    if not Path(MODEL_PATH).exists():
+        print(f"❌ Model not found: {Path(MODEL_PATH).absolute()}")
+        print("   Train the model first:  python train.py")
+        sys.exit(1)
+    if args.manifest:
+        samples, class_names = split_samples(args.manifest, "test")
+    else:
+        samples, class_names = collect_test_samples(DATASET_PATH)
     print(f"\nTest samples: {len(samples)}")
     for cls in class_names:
         cnt = sum(1 for _, _, c in samples if c == cls)
         print(f"  {cls}: {cnt}")
 
-    transform = get_transform()
-    ds = _PathDataset(samples, transform)
-    loader = DataLoader(ds, batch_size=BATCH_SIZE, shuffle=False,
-                        collate_fn=_collate_with_paths,
-                        num_workers=2, pin_memory=False)
-
     print("\nRunning inference…")
-    y_true, y_pred, y_conf, paths = run_inference(model, loader)
-    analyse(y_true, y_pred, y_conf, paths, class_names)
+    y_true, y_pred, y_conf, paths = run_inference(samples, class_names, use_cache=not args.no_cache)
+    analyse(y_true, y_pred, y_conf, paths, class_names, dataset=args.manifest or DATASET_PATH)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,23 @@
 """
 Evaluate trained Cardamom Leaf Disease model on dataset/test
 Prints accuracy + per-class report + confusion matrix.
+
+Usage:
+  python evaluate.py                  # raw test images
+  python evaluate.py --bg-removed     # background-removed (cached rembg masks)
+  python evaluate.py --packed         # pre-decoded shards from dataset_packed/test
+  python evaluate.py --manifest splits.json  # test split of a split manifest
+  python evaluate.py --no-cache       # ignore the shared inference cache
+
+Model outputs are stored in the shared inference cache (.cache/inference, see
+app/utils/inference_cache.py), so evaluate2.py / error_analysis.py and the
+ablation / robustness baselines reuse this pass instead of re-running it.
 """
 
+import argparse
 from pathlib import Path
 import sys
+import os
 
 import torch
 import torch.nn as nn
@@ -12,6 +25,14 @@ from torch.utils.data import DataLoader
 from torchvision import datasets, transforms, models
 
 import numpy as np
+from tqdm import tqdm
+
+from app.utils.bg_cache import BackgroundRemovalCache
+from app.utils.dataset_manifest import ManifestDataset
+from app.utils.hashing import file_sha256
+from app.utils.inference_cache import InferenceCache, collect_logits, transform_id
+from app.utils.metrics import confusion_matrix, format_report
+from app.utils.packed_dataset import INDEX_NAME, open_packed_split
 
 # --------- Configuration (match train.py) ----------
 class Config:
@@ -50,97 +71,108 @@ def get_test_transforms():
                              std=[0.229, 0.224, 0.225])
     ])
 
-def confusion_matrix_numpy(y_true, y_pred, num_classes):
-    cm = np.zeros((num_classes, num_classes), dtype=int)
-    for t, p in zip(y_true, y_pred):
-        cm[t, p] += 1
-    return cm
-
-def classification_report_from_cm(cm, class_names):
-    # precision, recall, f1 per class
-    report_lines = []
-    report_lines.append("Per-class metrics:")
-    report_lines.append("-" * 72)
-    report_lines.append(f"{'class':28s}  {'precision':>9s}  {'recall':>9s}  {'f1':>9s}  {'support':>9s}")
-    report_lines.append("-" * 72)
-
-    eps = 1e-12
-    for i, name in enumerate(class_names):
-        tp = cm[i, i]
-        fp = cm[:, i].sum() - tp
-        fn = cm[i, :].sum() - tp
-        support = cm[i, :].sum()
-
-        precision = tp / (tp + fp + eps)
-        recall = tp / (tp + fn + eps)
-        f1 = 2 * precision * recall / (precision + recall + eps)
-
-        report_lines.append(f"{name:28s}  {precision:9.3f}  {recall:9.3f}  {f1:9.3f}  {support:9d}")
-
-    report_lines.append("-" * 72)
-    acc = cm.trace() / (cm.sum() + eps)
-    report_lines.append(f"{'overall accuracy':28s}  {acc:9.3f}")
-    return "\n".join(report_lines)
+def use_bg_removed_images(dataset) -> BackgroundRemovalCache:
+    """Switch an ImageFolder to background-removed images from the mask cache."""
+    cache = BackgroundRemovalCache()
+    paths = [p for p, _ in dataset.samples]
+    n_missing = len(cache.missing(paths))
+    workers = max(1, (os.cpu_count() or 2) // 2)
+    try:
+        with tqdm(total=n_missing, desc="rembg", unit="img", disable=not n_missing) as bar:
+            failures = cache.ensure(paths, workers=workers, progress=bar.update)
+    except RuntimeError as exc:
+        print(f"❌ {exc}")
+        sys.exit(1)
+    for path, err in failures:
+        print(f"⚠️  rembg failed for {path}: {err} (using original image)")
+    dataset.loader = cache.loader
+    print(f"✅ Using background-removed images (cache: {cache.root})")
+    return cache
+
+def load_model(model_path: Path):
+    model = create_model().to(Config.DEVICE)
+    state = torch.load(model_path, map_location=Config.DEVICE)
+    model.load_state_dict(state)
+    model.eval()
+    print(f"✅ Loaded model from: {model_path}")
+    return model
 
 def main():
-    dataset_path = Path(Config.DATASET_PATH) / "test"
+    parser = argparse.ArgumentParser(description="Evaluate the trained model on dataset/test.")
+    parser.add_argument("--bg-removed", action="store_true",
+                        help="Evaluate on background-removed images (cached rembg masks)")
+    parser.add_argument("--packed", nargs="?", const="dataset_packed", default=None,
+                        help="Evaluate on packed shards (default dir: dataset_packed)")
+    parser.add_argument("--manifest", default=None,
+                        help="Evaluate the test split of a manifest (split_dataset.py --manifest)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run inference instead of reusing cached model outputs")
+    args = parser.parse_args()
+
+    if args.packed and args.bg_removed:
+        print("❌ --packed and --bg-removed cannot be combined; pack the background-removed images instead.")
+        sys.exit(1)
+    if args.packed and args.manifest:
+        print("❌ --packed and --manifest cannot be combined.")
+        sys.exit(1)
+
+    dataset_path = Path(args.manifest) if args.manifest else Path(args.packed or Config.DATASET_PATH) / "test"
     if not dataset_path.exists():
         print(f"❌ test dataset not found at: {dataset_path.absolute()}")
         sys.exit(1)
 
     # Load test dataset
-    test_dataset = datasets.ImageFolder(
-        root=str(dataset_path),
-        transform=get_test_transforms()
-    )
+    if args.packed:
+        test_dataset = open_packed_split(args.packed, "test", get_test_transforms())
+    elif args.manifest:
+        test_dataset = ManifestDataset(args.manifest, "test", transform=get_test_transforms())
+    else:
+        test_dataset = datasets.ImageFolder(
+            root=str(dataset_path),
+            transform=get_test_transforms()
+        )
     class_names = test_dataset.classes
     print(f"✅ Found test samples: {len(test_dataset)}")
     print(f"✅ Classes: {class_names}")
 
-    test_loader = DataLoader(
-        test_dataset,
-        batch_size=Config.BATCH_SIZE,
-        shuffle=False,
-        num_workers=4,
-        pin_memory=False
-    )
+    tf_id = transform_id(test_dataset.transform)
+    if args.packed:
+        tf_id = f"packed:{file_sha256(dataset_path / INDEX_NAME)}|{tf_id}"
+    if args.bg_removed:
+        bg_cache = use_bg_removed_images(test_dataset)
+        tf_id = f"{tf_id}|bg-removed:{bg_cache.model_name}"
 
-    # Load model
-    model = create_model().to(Config.DEVICE)
     model_path = Path(Config.MODEL_PATH)
     if not model_path.exists():
         print(f"❌ model file not found: {model_path.absolute()}")
         print("💡 Train first: python train.py")
         sys.exit(1)
 
-    state = torch.load(model_path, map_location=Config.DEVICE)
-    model.load_state_dict(state)
-    model.eval()
-    print(f"✅ Loaded model from: {model_path}")
-
-    y_true = []
-    y_pred = []
-
-    with torch.no_grad():
-        for inputs, labels in test_loader:
-            inputs = inputs.to(Config.DEVICE)
-            labels = labels.to(Config.DEVICE)
-
-            outputs = model(inputs)
-            preds = outputs.argmax(dim=1)
-
-            y_true.extend(labels.cpu().numpy().tolist())
-            y_pred.extend(preds.cpu().numpy().tolist())
+    def run_inference():
+        test_loader = DataLoader(
+            test_dataset,
+            batch_size=Config.BATCH_SIZE,
+            shuffle=False,
+            num_workers=4,
+            pin_memory=False
+        )
+        return collect_logits(load_model(model_path), test_loader, Config.DEVICE)
+
+    result = InferenceCache(enabled=not args.no_cache).get_or_compute(
+        model_path, test_dataset.samples, tf_id, run_inference, class_names
+    )
+    if result.cached:
+        print(f"✅ Reused cached model outputs ({result.key[:12]})")
 
-    y_true = np.array(y_true)
-    y_pred = np.array(y_pred)
+    y_true = result.labels
+    y_pred = result.preds
 
-    cm = confusion_matrix_numpy(y_true, y_pred, num_classes=len(class_names))
+    cm = confusion_matrix(y_true, y_pred, num_classes=len(class_names))
 
     print("\nConfusion matrix (rows=true, cols=pred):")
     print(cm)
 
-    print("\n" + classification_report_from_cm(cm, class_names))
+    print("\n" + format_report(cm, class_names))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
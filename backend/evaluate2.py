@@ -4,32 +4,49 @@ Generates detailed classification metrics, confusion matrix, ROC-AUC and PR-AUC
 
 Class names and number of outputs are derived automatically from the dataset folder
 so this script stays correct regardless of how many classes the model was trained on.
+
+Model outputs come from the shared inference cache (app/utils/inference_cache.py);
+pass --no-cache to force a fresh inference pass.
+
+Headline metrics, 95% bootstrap confidence intervals (accuracy, macro-F1,
+per-class recall; --bootstrap replicates, resampled in one vectorised pass)
+and ROC/PR AUCs are written to evaluation_results.json.
 """
+import argparse
+import json
+
 import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader
 from torchvision import datasets, transforms, models
-from sklearn.metrics import (
-    classification_report,
-    confusion_matrix,
-    accuracy_score,
-    roc_auc_score,
-    average_precision_score,
-    roc_curve,
-    precision_recall_curve,
-)
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 from tqdm import tqdm
 
+from app.utils.inference_cache import InferenceCache, transform_id
+from app.utils.metrics import (
+    accuracy_from_cm,
+    average_precision,
+    bootstrap_ci,
+    confusion_matrix,
+    expected_calibration_error,
+    format_report,
+    per_class_metrics,
+    precision_recall_curve,
+    roc_auc,
+    roc_curve,
+)
+
 
 class Config:
     """Evaluation configuration"""
     DATASET_PATH = "dataset"
     MODEL_PATH = "models/cardamom_model.pt"
     BATCH_SIZE = 32
+    BOOTSTRAP_REPLICATES = 1000
+    RESULTS_PATH = "evaluation_results.json"
     IMG_SIZE = 224
     DEVICE = torch.device("cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu")
 
@@ -94,30 +111,33 @@ def load_trained_model(num_classes: int):
     return model
 
 
-def evaluate_model(model, test_loader):
-    """Evaluate model on test set; return predictions, labels, and probabilities."""
+def evaluate_model(test_loader, test_dataset, num_classes: int, use_cache: bool = True):
+    """Evaluate model on test set; return predictions, labels, and probabilities.
+
+    The model is only loaded when the inference cache has no entry for this
+    checkpoint, test split and transform.
+    """
 
     print(f"\n{'='*60}")
     print("Running Evaluation on Test Set")
     print(f"{'='*60}\n")
 
-    all_predictions = []
-    all_labels = []
-    all_probabilities = []
-
-    with torch.no_grad():
-        for images, labels in tqdm(test_loader, desc="Evaluating"):
-            images = images.to(Config.DEVICE)
-
-            outputs = model(images)
-            probabilities = torch.softmax(outputs, dim=1)
-            _, predicted = torch.max(outputs, 1)
-
-            all_predictions.extend(predicted.cpu().numpy())
-            all_labels.extend(labels.numpy())
-            all_probabilities.extend(probabilities.cpu().numpy())
+    def run_inference():
+        model = load_trained_model(num_classes)
+        all_logits = []
+        with torch.no_grad():
+            for images, _ in tqdm(test_loader, desc="Evaluating"):
+                all_logits.append(model(images.to(Config.DEVICE)).cpu().numpy())
+        return np.concatenate(all_logits)
+
+    result = InferenceCache(enabled=use_cache).get_or_compute(
+        Config.MODEL_PATH, test_dataset.samples, transform_id(test_dataset.transform),
+        run_inference, test_dataset.classes,
+    )
+    if result.cached:
+        print(f"✓ Reused cached model outputs ({result.key[:12]})")
 
-    return np.array(all_predictions), np.array(all_labels), np.array(all_probabilities)
+    return result.preds, result.labels, result.probs
 
 
 def print_classification_report(y_true, y_pred, class_names):
@@ -127,15 +147,10 @@ def print_classification_report(y_true, y_pred, class_names):
     print("Classification Report")
     print(f"{'='*60}\n")
 
-    report = classification_report(
-        y_true,
-        y_pred,
-        target_names=class_names,
-        digits=4
-    )
-    print(report)
+    cm = confusion_matrix(y_true, y_pred, len(class_names))
+    print(format_report(cm, class_names, digits=4))
 
-    accuracy = accuracy_score(y_true, y_pred)
+    accuracy = accuracy_from_cm(cm)
     print(f"\n{'='*60}")
     print(f"Overall Test Accuracy: {accuracy * 100:.2f}%")
     print(f"{'='*60}\n")
@@ -144,7 +159,7 @@ def print_classification_report(y_true, y_pred, class_names):
 def plot_confusion_matrix(y_true, y_pred, class_names, save_path="confusion_matrix.png"):
     """Create and save confusion matrix visualization."""
 
-    cm = confusion_matrix(y_true, y_pred)
+    cm = confusion_matrix(y_true, y_pred, len(class_names))
     cm_percent = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis] * 100
 
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
@@ -178,12 +193,8 @@ def plot_confusion_matrix(y_true, y_pred, class_names, save_path="confusion_matr
 def plot_per_class_metrics(y_true, y_pred, class_names, save_path="per_class_metrics.png"):
     """Plot per-class performance metrics."""
 
-    from sklearn.metrics import precision_recall_fscore_support
-
-    labels_idx = list(range(len(class_names)))
-    precision, recall, f1, support = precision_recall_fscore_support(
-        y_true, y_pred, labels=labels_idx
-    )
+    m = per_class_metrics(confusion_matrix(y_true, y_pred, len(class_names)))
+    precision, recall, f1 = m["precision"], m["recall"], m["f1"]
 
     x = np.arange(len(class_names))
     width = 0.25
@@ -228,16 +239,14 @@ def plot_roc_curves(y_true, y_prob, class_names, save_path="roc_curves.png"):
     """Plot one-vs-rest ROC curves and compute macro ROC-AUC."""
 
     num_classes = len(class_names)
-    # One-hot encode labels
-    y_onehot = np.eye(num_classes)[y_true]
 
     fig, ax = plt.subplots(figsize=(10, 7))
 
     colors = _class_colors(num_classes)
     aucs = []
     for i, (cls, color) in enumerate(zip(class_names, colors)):
-        fpr, tpr, _ = roc_curve(y_onehot[:, i], y_prob[:, i])
-        auc = roc_auc_score(y_onehot[:, i], y_prob[:, i])
+        fpr, tpr, _ = roc_curve(y_true == i, y_prob[:, i])
+        auc = roc_auc(y_true == i, y_prob[:, i])
         aucs.append(auc)
         ax.plot(fpr, tpr, color=color, lw=2, label=f"{cls} (AUC = {auc:.3f})")
 
@@ -263,15 +272,14 @@ def plot_pr_curves(y_true, y_prob, class_names, save_path="pr_curves.png"):
     """Plot one-vs-rest Precision-Recall curves and compute macro AP."""
 
     num_classes = len(class_names)
-    y_onehot = np.eye(num_classes)[y_true]
 
     fig, ax = plt.subplots(figsize=(10, 7))
 
     colors = _class_colors(num_classes)
     aps = []
     for i, (cls, color) in enumerate(zip(class_names, colors)):
-        precision, recall, _ = precision_recall_curve(y_onehot[:, i], y_prob[:, i])
-        ap = average_precision_score(y_onehot[:, i], y_prob[:, i])
+        precision, recall, _ = precision_recall_curve(y_true == i, y_prob[:, i])
+        ap = average_precision(y_true == i, y_prob[:, i])
         aps.append(ap)
         ax.plot(recall, precision, color=color, lw=2, label=f"{cls} (AP = {ap:.3f})")
 
@@ -320,6 +328,8 @@ def analyze_confidence(probabilities, labels, predictions):
     else:
         print(f"\n🎉 Perfect predictions! No incorrect classifications!")
 
+    print(f"\nExpected calibration error (ECE): {expected_calibration_error(probabilities, labels) * 100:.2f}%")
+
     print(f"\nPredictions by Confidence Level:")
     thresholds = [0.9, 0.8, 0.7, 0.6, 0.5]
     for threshold in thresholds:
@@ -328,9 +338,34 @@ def analyze_confidence(probabilities, labels, predictions):
         print(f"  ≥{threshold*100:.0f}%: {count} predictions ({count/len(predictions)*100:.1f}%) - Accuracy: {accuracy:.1f}%")
 
 
+def print_bootstrap_ci(ci, class_names):
+    """Print the bootstrap confidence intervals returned by ``bootstrap_ci``."""
+
+    print(f"\n{'='*60}")
+    print(f"95% Bootstrap Confidence Intervals ({ci['n_boot']} replicates)")
+    print(f"{'='*60}\n")
+
+    def fmt(point, low, high):
+        return f"{point*100:6.2f}%  [{low*100:6.2f}, {high*100:6.2f}]"
+
+    print(f"  {'Accuracy':22s}: {fmt(**ci['accuracy'])}")
+    print(f"  {'Macro F1':22s}: {fmt(**ci['macro_f1'])}")
+    rec = ci["per_class_recall"]
+    for i, name in enumerate(class_names):
+        print(f"  {'Recall ' + name:22s}: {fmt(rec['point'][i], rec['low'][i], rec['high'][i])}")
+
+
 def main():
     """Main evaluation function."""
 
+    parser = argparse.ArgumentParser(description="Detailed evaluation of the trained model on dataset/test.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run inference instead of reusing cached model outputs")
+    parser.add_argument("--bootstrap", type=int, default=Config.BOOTSTRAP_REPLICATES,
+                        help=f"Bootstrap replicates for the 95%% CIs, 0 to skip "
+                             f"(default: {Config.BOOTSTRAP_REPLICATES})")
+    args = parser.parse_args()
+
     print(f"\n{'='*60}")
     print("Cardamom Disease Detection Model Evaluation")
     print(f"{'='*60}\n")
@@ -354,13 +389,14 @@ def main():
     for class_name, count in class_counts.items():
         print(f"    - {class_name}: {count} images")
 
-    # Load model
-    model = load_trained_model(num_classes)
-    if model is None:
+    if not Path(Config.MODEL_PATH).exists():
+        print(f"❌ Error: Model file not found at {Config.MODEL_PATH}")
+        print(f"   Please train the model first using: python train.py")
         return
 
-    # Run evaluation
-    predictions, labels, probabilities = evaluate_model(model, test_loader)
+    # Run evaluation (cached model outputs when available)
+    predictions, labels, probabilities = evaluate_model(test_loader, test_dataset, num_classes,
+                                                        use_cache=not args.no_cache)
 
     # Print classification report
     print_classification_report(labels, predictions, class_names)
@@ -368,6 +404,11 @@ def main():
     # Analyze confidence
     analyze_confidence(probabilities, labels, predictions)
 
+    ci = None
+    if args.bootstrap > 0:
+        ci = bootstrap_ci(labels, predictions, num_classes, n_boot=args.bootstrap)
+        print_bootstrap_ci(ci, class_names)
+
     # Create visualizations
     print(f"\n{'='*60}")
     print("Generating Visualizations")
@@ -375,8 +416,30 @@ def main():
 
     plot_confusion_matrix(labels, predictions, class_names, "confusion_matrix.png")
     plot_per_class_metrics(labels, predictions, class_names, "per_class_metrics.png")
-    plot_roc_curves(labels, probabilities, class_names, "roc_curves.png")
-    plot_pr_curves(labels, probabilities, class_names, "pr_curves.png")
+    macro_auc = plot_roc_curves(labels, probabilities, class_names, "roc_curves.png")
+    macro_ap = plot_pr_curves(labels, probabilities, class_names, "pr_curves.png")
+
+    cm = confusion_matrix(labels, predictions, num_classes)
+    m = per_class_metrics(cm)
+    results = {
+        "model_path": Config.MODEL_PATH,
+        "dataset": f"{Config.DATASET_PATH}/test",
+        "classes": class_names,
+        "n_samples": int(len(labels)),
+        "accuracy": accuracy_from_cm(cm),
+        "macro_f1": float(m["f1"].mean()),
+        "per_class_precision": m["precision"].tolist(),
+        "per_class_recall": m["recall"].tolist(),
+        "per_class_f1": m["f1"].tolist(),
+        "confusion_matrix": cm.tolist(),
+        "macro_roc_auc": macro_auc,
+        "macro_average_precision": macro_ap,
+        "ece": expected_calibration_error(probabilities, labels),
+        "bootstrap_ci": ci,
+    }
+    with open(Config.RESULTS_PATH, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✓ Metrics saved to: {Config.RESULTS_PATH}")
 
     print(f"\n{'='*60}")
     print("✅ Evaluation Complete!")
@@ -386,6 +449,7 @@ def main():
     print("  - per_class_metrics.png")
     print("  - roc_curves.png")
     print("  - pr_curves.png")
+    print(f"  - {Config.RESULTS_PATH}")
     print("\nNext steps:")
     print("  1. Review the metrics above")
     print("  2. Check the confusion matrix for misclassifications")
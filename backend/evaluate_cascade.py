@@ -0,0 +1,177 @@
+"""
+Evaluate the two-stage inference cascade on dataset/test.
+
+Every test image is run once through the fast model and once through the full
+model (timed separately), then each cascade threshold is scored offline with
+the same acceptance rule DiseaseClassifier uses at serving time:
+
+  accepted by the fast model  ⇔  top class ∈ accept classes and p ≥ threshold
+
+For each threshold the report lists accuracy, the share of images escalated
+to the full model, and the average cost per image
+(fast_ms + escalation_rate × full_ms) relative to running the full model
+alone.
+
+Usage:
+    cd backend
+    python evaluate_cascade.py --fast models/cardamom_student.pt
+    python evaluate_cascade.py --fast models/cardamom_student.pt --threshold 0.85
+    python evaluate_cascade.py --fast models/cardamom_student.pt --tta   # full stage with TTA
+
+Outputs:
+    - Threshold table to stdout
+    - cascade_results.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from torchvision import datasets
+from tqdm import tqdm
+
+from app.models.classifier import (
+    CLASS_NAMES,
+    DEFAULT_ARCHITECTURE,
+    DEFAULT_CASCADE_ARCHITECTURE,
+    DEFAULT_CASCADE_THRESHOLD,
+    DiseaseClassifier,
+    load_model_metadata,
+)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+TEST_DIR = "dataset/test"
+FULL_MODEL_PATH = "models/cardamom_model.pt"
+OUTPUT_PATH = "cascade_results.json"
+SWEEP_THRESHOLDS = [0.50, 0.60, 0.70, 0.80, 0.85, 0.90, 0.95, 0.98, 0.99]
+
+
+def score_thresholds(
+    clf: DiseaseClassifier,
+    y_true: np.ndarray,
+    fast_probs: np.ndarray,
+    full_probs: np.ndarray,
+    fast_ms: float,
+    full_ms: float,
+    thresholds: list[float],
+) -> list[dict]:
+    """Accuracy, escalation rate and cost of the cascade at each threshold."""
+    fast_pred = fast_probs.argmax(axis=1)
+    full_pred = full_probs.argmax(axis=1)
+    rows = []
+    for t in thresholds:
+        accepted = np.array([clf.cascade_accepts(p, t) for p in fast_probs], dtype=bool)
+        pred = np.where(accepted, fast_pred, full_pred)
+        escalation = float(1.0 - accepted.mean())
+        cost_ms = fast_ms + escalation * full_ms
+        rows.append({
+            "threshold": t,
+            "accuracy": float((pred == y_true).mean()),
+            "escalation_rate": escalation,
+            "fast_stage_accuracy": float((fast_pred[accepted] == y_true[accepted]).mean())
+            if accepted.any() else None,
+            "avg_cost_ms": cost_ms,
+            "relative_cost": cost_ms / full_ms if full_ms > 0 else None,
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate the fast → full inference cascade.")
+    parser.add_argument("--fast", required=True, help="Fast (first-stage) model checkpoint")
+    parser.add_argument("--full", default=FULL_MODEL_PATH,
+                        help=f"Full model checkpoint (default: {FULL_MODEL_PATH})")
+    parser.add_argument("--test-dir", default=TEST_DIR, help=f"Test images (default: {TEST_DIR})")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Score a single cascade threshold instead of the default sweep")
+    parser.add_argument("--tta", action="store_true", help="Run the full stage with TTA")
+    parser.add_argument("--output", default=OUTPUT_PATH,
+                        help=f"JSON report path (default: {OUTPUT_PATH})")
+    args = parser.parse_args()
+
+    for path in (args.fast, args.full, args.test_dir):
+        if not Path(path).exists():
+            print(f"❌ Not found: {path}")
+            sys.exit(1)
+
+    fast_meta = load_model_metadata(args.fast) or {}
+    full_meta = load_model_metadata(args.full) or {}
+    clf = DiseaseClassifier(
+        model_path=args.full,
+        architecture=full_meta.get("architecture", DEFAULT_ARCHITECTURE),
+        cascade_model_path=args.fast,
+        cascade_architecture=fast_meta.get("architecture", DEFAULT_CASCADE_ARCHITECTURE),
+        temperature=float(full_meta.get("temperature", 1.0)),
+        calibration_sha256=(full_meta.get("calibration") or {}).get("checkpoint_sha256", ""),
+    )
+    if not clf.cascade_enabled:
+        print(f"❌ Could not load fast model: {args.fast}")
+        sys.exit(1)
+
+    test_set = datasets.ImageFolder(args.test_dir)
+    if len(test_set.classes) != len(CLASS_NAMES):
+        print(f"❌ Expected {len(CLASS_NAMES)} classes, found {test_set.classes}")
+        sys.exit(1)
+
+    print("\n" + "=" * 60)
+    print("CASCADE EVALUATION")
+    print(f"Fast   : {args.fast}  ({fast_meta.get('architecture', DEFAULT_CASCADE_ARCHITECTURE)})")
+    print(f"Full   : {args.full}{'  + TTA' if args.tta else ''}")
+    print(f"Accept : {', '.join(clf.cascade_accept_classes)}")
+    print(f"Images : {len(test_set)}")
+    print("=" * 60)
+
+    fast_probs, full_probs = [], []
+    fast_s = full_s = 0.0
+    for path, _ in tqdm(test_set.samples, desc="Scoring"):
+        with Image.open(path) as img:
+            rgb = img.convert("RGB")
+        start = time.perf_counter()
+        fast_probs.append(clf.stage_probabilities(rgb, "fast"))
+        fast_s += time.perf_counter() - start
+        start = time.perf_counter()
+        full_probs.append(clf.stage_probabilities(rgb, "full", use_tta=args.tta))
+        full_s += time.perf_counter() - start
+
+    n = len(test_set)
+    y_true = np.asarray(test_set.targets)
+    fast_ms, full_ms = fast_s / n * 1000, full_s / n * 1000
+    thresholds = [args.threshold] if args.threshold is not None else SWEEP_THRESHOLDS
+    rows = score_thresholds(clf, y_true, np.stack(fast_probs), np.stack(full_probs),
+                            fast_ms, full_ms, thresholds)
+
+    full_acc = float((np.stack(full_probs).argmax(axis=1) == y_true).mean())
+    fast_acc = float((np.stack(fast_probs).argmax(axis=1) == y_true).mean())
+    print(f"\nFull model only : {full_acc * 100:.2f}%  ({full_ms:.1f} ms/image)")
+    print(f"Fast model only : {fast_acc * 100:.2f}%  ({fast_ms:.1f} ms/image)")
+    print(f"\n{'Threshold':>9} {'Accuracy':>9} {'Escalated':>10} {'ms/image':>9} {'Cost':>6}")
+    print("-" * 47)
+    for r in rows:
+        marker = "  ←" if r["threshold"] == DEFAULT_CASCADE_THRESHOLD else ""
+        print(f"{r['threshold']:>9.2f} {r['accuracy'] * 100:>8.2f}% {r['escalation_rate'] * 100:>9.1f}% "
+              f"{r['avg_cost_ms']:>9.1f} {r['relative_cost']:>5.2f}×{marker}")
+
+    report = {
+        "fast_model": args.fast,
+        "full_model": args.full,
+        "full_tta": args.tta,
+        "accept_classes": list(clf.cascade_accept_classes),
+        "images": n,
+        "full_only": {"accuracy": full_acc, "ms_per_image": full_ms},
+        "fast_only": {"accuracy": fast_acc, "ms_per_image": fast_ms},
+        "thresholds": rows,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
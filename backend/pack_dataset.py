@@ -0,0 +1,115 @@
+"""
+Pack an image dataset into pre-decoded, pre-resized uint8 shards.
+
+Every image is decoded once, resized to a fixed square and written into
+memory-mappable ``.npy`` shards together with an ``index.json`` holding the
+class names, labels and source paths (see app/utils/packed_dataset.py).
+Training and evaluation scripts then read the shards with ``--packed`` and
+only pay for augmentation, not JPEG decoding.
+
+Two source layouts are supported:
+  - split layout   dataset/{train,val,test}/<class>/*.jpg  → packed/{train,val,test}/
+  - flat layout    dataset_processed/<class>/*.jpg         → packed/all/
+
+Usage:
+    cd backend
+    python pack_dataset.py                                   # dataset/ → dataset_packed/
+    python pack_dataset.py --source dataset_processed --output dataset_processed_packed
+    python pack_dataset.py --size 256 --shard-size 1024 --workers 8
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from app.utils.packed_dataset import (
+    DEFAULT_PACKED_SIZE,
+    DEFAULT_SHARD_SIZE,
+    write_packed_split,
+)
+
+SPLITS = ["train", "val", "test"]
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def collect_samples(class_root: Path) -> tuple[list[str], list[tuple[Path, int]]]:
+    """Return (classes, samples) with ImageFolder's sorted class order."""
+    classes = sorted(d.name for d in class_root.iterdir() if d.is_dir())
+    samples: list[tuple[Path, int]] = []
+    for label, cls in enumerate(classes):
+        for fp in sorted((class_root / cls).iterdir()):
+            if fp.is_file() and fp.suffix.lower() in IMAGE_EXTENSIONS:
+                samples.append((fp, label))
+    return classes, samples
+
+
+def pack_split(
+    class_root: Path,
+    out_dir: Path,
+    size: int,
+    shard_size: int,
+    workers: int,
+) -> int:
+    """Pack one class-folder tree into *out_dir*; return the image count."""
+    classes, samples = collect_samples(class_root)
+    if not samples:
+        print(f"⚠️  No images under {class_root} – skipping")
+        return 0
+
+    with tqdm(total=len(samples), desc=f"Packing {out_dir.name}", unit="img") as bar:
+        shards = write_packed_split(
+            samples, classes, out_dir, size=size, shard_size=shard_size,
+            workers=workers, progress=bar.update, source=str(class_root),
+        )
+
+    counts = np.bincount([label for _, label in samples], minlength=len(classes)).tolist()
+    print(f"✅ {out_dir}: {len(samples)} images, {len(shards)} shards, "
+          f"{dict(zip(classes, counts))}")
+    return len(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pack images into memory-mappable uint8 shards.")
+    parser.add_argument("--source", default="dataset",
+                        help="Dataset root (split or flat class-folder layout)")
+    parser.add_argument("--output", default=None,
+                        help="Output directory (default: <source>_packed)")
+    parser.add_argument("--size", type=int, default=DEFAULT_PACKED_SIZE,
+                        help=f"Square side length of stored images (default: {DEFAULT_PACKED_SIZE})")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help=f"Images per shard file (default: {DEFAULT_SHARD_SIZE})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Decoder processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    source = Path(args.source)
+    output = Path(args.output) if args.output else source.with_name(source.name + "_packed")
+    if not source.exists():
+        print(f"❌ Source directory not found: {source.absolute()}")
+        sys.exit(1)
+
+    workers = max(1, args.workers)
+    shard_size = max(1, args.shard_size)
+    present = [s for s in SPLITS if (source / s).is_dir()]
+
+    print(f"Source : {source}  ({'splits: ' + ', '.join(present) if present else 'flat'})")
+    print(f"Output : {output}")
+    print(f"Size   : {args.size}×{args.size}  |  Shard size: {shard_size}  |  Workers: {workers}")
+
+    total = 0
+    if present:
+        for split in present:
+            total += pack_split(source / split, output / split, args.size, shard_size, workers)
+    else:
+        total += pack_split(source, output / "all", args.size, shard_size, workers)
+
+    print(f"\n✅ Packed {total} images into {output}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,100 +1,339 @@
 """
-Predict cardamom leaf disease class for images in a folder.
+Score a folder of images with the trained classifier.
+
+Images are decoded and preprocessed by a pool of DataLoader workers and
+scored in fixed-size batches through DiseaseClassifier, so the same
+architecture, class list (CLASS_NAMES) and preprocessing as the API are used
+(a full-resolution decode followed by preprocess).
+With --output, one row per image – predicted class, confidence, uncertainty
+flag and the probability of every class – is appended after each batch:
+
+  *.csv      CSV with a header row
+  *.jsonl    one JSON object per line
+  *.parquet  a directory of part files, one per run (needs pyarrow)
+
+--resume skips every path already present in the output, so an interrupted
+nightly run over a large archive continues where it stopped.  Unreadable
+images get a row with the "error" column set instead of aborting the run.
 
 Usage:
-  python predict.py --input external_test
+  python predict.py --input external_test                      # print one line per image
+  python predict.py --input /data/archive --output scores.csv --workers 8
+  python predict.py --input /data/archive --output scores.jsonl --resume
+  python predict.py --input /data/archive --output scores.parquet --batch-size 128
 """
 
+from __future__ import annotations
+
 import argparse
+import csv
+import json
+import os
+import time
 from pathlib import Path
+from typing import Iterator
 
+import numpy as np
 import torch
-import torch.nn as nn
-from torchvision import transforms, models
 from PIL import Image
+from torch.utils.data import DataLoader, Dataset
 
+from app.models.classifier import (
+    CLASS_NAMES,
+    DEFAULT_ARCHITECTURE,
+    DEFAULT_CONFIDENCE_THRESHOLD,
+    DiseaseClassifier,
+    load_model_metadata,
+    preprocess,
+)
 
-class Config:
-    MODEL_PATH = "models/cardamom_model.pt"
-    IMG_SIZE = 224
-    NUM_CLASSES = 3
-    DEVICE = torch.device(
-        "cuda" if torch.cuda.is_available()
-        else "mps" if torch.backends.mps.is_available()
-        else "cpu"
-    )
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+MODEL_PATH = "models/cardamom_model.pt"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+DEFAULT_BATCH_SIZE = 64
+FORMATS = ("csv", "jsonl", "parquet")
 
-    # IMPORTANT: must match training class order used by ImageFolder.
-    # We'll print this order so you can verify it matches your dataset/classes.
-    CLASS_NAMES = ["colletotrichum_blight", "healthy", "phyllosticta_leaf_spot"]
+PROB_COLUMNS = ["prob_" + name.lower().replace(" ", "_") for name in CLASS_NAMES]
+FIELDNAMES = ["path", "prediction", "confidence", "uncertain", *PROB_COLUMNS, "error"]
 
 
-def create_model():
-    model = models.efficientnet_v2_s(weights=models.EfficientNet_V2_S_Weights.DEFAULT)
-    num_features = model.classifier[1].in_features
-    model.classifier = nn.Sequential(
-        nn.Dropout(p=0.3),
-        nn.Linear(num_features, 512),
-        nn.ReLU(),
-        nn.Dropout(p=0.2),
-        nn.Linear(512, Config.NUM_CLASSES),
-    )
-    return model
+def is_image(p: Path) -> bool:
+    return p.suffix.lower() in IMAGE_EXTENSIONS
 
 
-def get_transform():
-    return transforms.Compose([
-        transforms.Resize((Config.IMG_SIZE, Config.IMG_SIZE)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                             std=[0.229, 0.224, 0.225]),
-    ])
+def iter_images(root: Path) -> Iterator[str]:
+    """Yield image paths under *root* in sorted, deterministic order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if is_image(Path(name)):
+                yield os.path.join(dirpath, name)
 
 
-def is_image(p: Path) -> bool:
-    return p.suffix.lower() in [".jpg", ".jpeg", ".png", ".bmp", ".webp"]
+# ---------------------------------------------------------------------------
+# Decoding
+# ---------------------------------------------------------------------------
+
+
+class ImagePathDataset(Dataset):
+    """Decode + preprocess images in DataLoader workers.
+
+    Returns ``(tensor, index, error)``; unreadable files yield a zero tensor
+    and the error message so one bad photo does not stop the run.
+    """
+
+    def __init__(self, paths: list[str]) -> None:
+        self.paths = paths
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, idx: int):
+        try:
+            with Image.open(self.paths[idx]) as img:
+                # Full decode, as in the API: draft-mode JPEG downscaling
+                # would shift the probabilities slightly.
+                return preprocess(img), idx, ""
+        except Exception as exc:
+            return torch.zeros(3, 224, 224), idx, f"{type(exc).__name__}: {exc}"
+
+
+# ---------------------------------------------------------------------------
+# Output writers
+# ---------------------------------------------------------------------------
+
+
+def detect_format(output: Path, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    suffix = output.suffix.lower().lstrip(".")
+    if suffix not in FORMATS:
+        raise SystemExit(f"Cannot infer format from '{output}'; pass --format {{{','.join(FORMATS)}}}")
+    return suffix
+
+
+def _truncate_partial_line(path: Path) -> None:
+    """Drop a trailing half-written row left by an interrupted run."""
+    with open(path, "rb+") as fh:
+        data = fh.read()
+        if data and not data.endswith(b"\n"):
+            fh.truncate(data.rfind(b"\n") + 1)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise SystemExit("❌ Parquet output needs pyarrow.  💡 Fix: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def scored_paths(output: Path, fmt: str) -> set[str]:
+    """Paths already present in *output* (for --resume)."""
+    if not output.exists():
+        return set()
+    if fmt == "parquet":
+        _, pq = _import_pyarrow()
+        done: set[str] = set()
+        for part in sorted(output.glob("part-*.parquet")):
+            try:
+                done.update(pq.read_table(part, columns=["path"]).column("path").to_pylist())
+            except Exception:
+                # A run killed mid-write leaves a part without its footer;
+                # its images are simply scored again.
+                print(f"⚠️  Ignoring incomplete part file {part}")
+                part.rename(part.with_suffix(".incomplete"))
+        return done
+
+    _truncate_partial_line(output)
+    with open(output, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            return {row["path"] for row in csv.DictReader(fh)}
+        return {json.loads(line)["path"] for line in fh if line.strip()}
+
+
+class ResultWriter:
+    """Append rows to CSV / JSONL, or stream Parquet row groups to a part file."""
+
+    def __init__(self, output: Path, fmt: str, append: bool) -> None:
+        self.fmt = fmt
+        self._fh = None
+        self._csv = None
+        self._parquet = None
+        if fmt == "parquet":
+            pa, pq = _import_pyarrow()
+            output.mkdir(parents=True, exist_ok=True)
+            if not append:
+                for old in output.glob("part-*.parquet"):
+                    old.unlink()
+            n = 0
+            while (output / f"part-{n:05d}.parquet").exists():
+                n += 1
+            part = output / f"part-{n:05d}.parquet"
+            self._pa = pa
+            self._schema = pa.schema(
+                [("path", pa.string()), ("prediction", pa.string()), ("confidence", pa.float32()),
+                 ("uncertain", pa.bool_())]
+                + [(c, pa.float32()) for c in PROB_COLUMNS]
+                + [("error", pa.string())]
+            )
+            self._parquet = pq.ParquetWriter(part, self._schema)
+            return
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        write_header = not (append and output.exists() and output.stat().st_size > 0)
+        self._fh = open(output, "a" if append else "w", newline="", encoding="utf-8")
+        if fmt == "csv":
+            self._csv = csv.DictWriter(self._fh, fieldnames=FIELDNAMES)
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, rows: list[dict]) -> None:
+        if self._parquet is not None:
+            columns = {name: [r[name] for r in rows] for name in FIELDNAMES}
+            self._parquet.write_table(self._pa.table(columns, schema=self._schema))
+            return
+        if self._csv is not None:
+            self._csv.writerows(rows)
+        else:
+            self._fh.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+        self._fh.flush()
+
+    def close(self) -> None:
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._fh is not None:
+            self._fh.close()
+
+
+# ---------------------------------------------------------------------------
+# Scoring
+# ---------------------------------------------------------------------------
+
+
+def rows_for_batch(
+    paths: list[str], probs: np.ndarray, errors: list[str], threshold: float
+) -> list[dict]:
+    rows = []
+    for path, p, error in zip(paths, probs, errors):
+        if error:
+            rows.append({"path": path, "prediction": None, "confidence": None, "uncertain": None,
+                         **{c: None for c in PROB_COLUMNS}, "error": error})
+            continue
+        top = int(p.argmax())
+        rows.append({
+            "path": path,
+            "prediction": CLASS_NAMES[top],
+            "confidence": round(float(p[top]), 6),
+            "uncertain": bool(p[top] < threshold),
+            **{c: round(float(v), 6) for c, v in zip(PROB_COLUMNS, p)},
+            "error": "",
+        })
+    return rows
 
 
 def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--input", required=True, help="Folder containing images")
+    parser = argparse.ArgumentParser(description="Batch-score a folder of images.")
+    parser.add_argument("--input", required=True, help="Folder containing images (searched recursively)")
+    parser.add_argument("--output", default=None,
+                        help="Results file: .csv, .jsonl or .parquet (default: print to stdout)")
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="Output format (default: from the --output extension)")
+    parser.add_argument("--model", default=MODEL_PATH, help=f"Checkpoint (default: {MODEL_PATH})")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1),
+                        help="Decode worker processes (default: min(8, CPUs))")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_CONFIDENCE_THRESHOLD,
+                        help=f"Confidence below which 'uncertain' is set (default: {DEFAULT_CONFIDENCE_THRESHOLD})")
+    parser.add_argument("--precision", choices=("fp32", "bf16", "auto"), default=None,
+                        help="CPU precision (default: CPU_PRECISION env var or fp32)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip images already present in --output and append to it")
     args = parser.parse_args()
 
     input_dir = Path(args.input)
     if not input_dir.exists():
         raise SystemExit(f"Input folder not found: {input_dir}")
-
-    model_path = Path(Config.MODEL_PATH)
+    model_path = Path(args.model)
     if not model_path.exists():
         raise SystemExit(f"Model not found: {model_path} (train first: python train.py)")
+    if args.resume and not args.output:
+        raise SystemExit("--resume requires --output")
+    if args.threads:
+        torch.set_num_threads(args.threads)
 
-    print(f"Device: {Config.DEVICE}")
-    print(f"Model: {model_path}")
-    print(f"Class order used for predictions: {Config.CLASS_NAMES}")
+    output = Path(args.output) if args.output else None
+    fmt = detect_format(output, args.format) if output else None
 
-    model = create_model().to(Config.DEVICE)
-    model.load_state_dict(torch.load(model_path, map_location=Config.DEVICE))
-    model.eval()
+    paths = list(iter_images(input_dir))
+    if not paths:
+        raise SystemExit(f"No images found in: {input_dir}")
+    total = len(paths)
+    if args.resume:
+        done = scored_paths(output, fmt)
+        paths = [p for p in paths if p not in done]
+        print(f"Resuming: {total - len(paths)} of {total} images already scored")
 
-    tfm = get_transform()
+    metadata = load_model_metadata(str(model_path)) or {}
+    clf = DiseaseClassifier(
+        str(model_path),
+        architecture=metadata.get("architecture", DEFAULT_ARCHITECTURE),
+        precision=args.precision,
+        temperature=float(metadata.get("temperature", 1.0)),
+        calibration_sha256=(metadata.get("calibration") or {}).get("checkpoint_sha256", ""),
+    )
+    if not clf.weights_loaded:
+        raise SystemExit(f"Could not load model weights from {model_path}")
 
-    images = sorted([p for p in input_dir.rglob("*") if p.is_file() and is_image(p)])
-    if not images:
-        raise SystemExit(f"No images found in: {input_dir}")
+    print(f"Device: {clf.device}  |  precision: {clf.precision}  |  architecture: {clf.architecture}")
+    print(f"Model: {model_path}")
+    print(f"Classes: {CLASS_NAMES}")
+    print(f"Images to score: {len(paths)}  (batch={args.batch_size}, workers={args.workers})")
+    if not paths:
+        return
 
-    with torch.no_grad():
-        for img_path in images:
-            img = Image.open(img_path).convert("RGB")
-            x = tfm(img).unsqueeze(0).to(Config.DEVICE)
+    loader = DataLoader(
+        ImagePathDataset(paths),
+        batch_size=args.batch_size,
+        shuffle=False,
+        num_workers=args.workers,
+        persistent_workers=False,
+    )
+    writer = ResultWriter(output, fmt, append=args.resume) if output else None
 
-            logits = model(x)
-            probs = torch.softmax(logits, dim=1).cpu().numpy()[0]
-            pred_idx = int(probs.argmax())
-            pred_name = Config.CLASS_NAMES[pred_idx]
-            conf = float(probs[pred_idx])
+    scored = failed = 0
+    start = time.perf_counter()
+    try:
+        for batch, indices, errors in loader:
+            batch_paths = [paths[i] for i in indices.tolist()]
+            probs = clf.predict_proba_batch(batch)
+            rows = rows_for_batch(batch_paths, probs, list(errors), args.threshold)
+            failed += sum(1 for e in errors if e)
+            scored += len(rows)
+            if writer is not None:
+                writer.write(rows)
+                elapsed = time.perf_counter() - start
+                print(f"\r  {scored}/{len(paths)} images  ({scored / elapsed:.1f} img/s)", end="", flush=True)
+            else:
+                for r in rows:
+                    if r["error"]:
+                        print(f"{r['path']} -> ERROR ({r['error']})")
+                    else:
+                        print(f"{r['path']} -> {r['prediction']} (confidence={r['confidence'] * 100:.2f}%)")
+    finally:
+        if writer is not None:
+            writer.close()
 
-            print(f"{img_path} -> {pred_name} (confidence={conf*100:.2f}%)")
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ Scored {scored} images in {elapsed:.1f}s ({scored / max(elapsed, 1e-9):.1f} img/s)"
+          + (f", {failed} unreadable" if failed else ""))
+    if output:
+        print(f"✅ Results: {output}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,20 +4,37 @@ Batch background removal script using rembg.
 Removes backgrounds from all images in a source folder and saves them
 with pure black backgrounds to an output folder.
 
+Images are processed by a spawn-based process pool; every worker creates its
+own rembg session once (rembg/onnxruntime sessions are not fork-safe) and
+receives images in chunks of ``--batch-size`` so the U2-Net session stays hot
+and inter-process overhead is amortised.
+
+Runs are resumable: a manifest (``.remove_bg_manifest.jsonl`` in the output
+folder) records the size, mtime and SHA-256 of every source image that was
+processed.  On the next run an image is skipped when its output exists and
+the source still matches the manifest entry, so an interrupted run picks up
+where it stopped and a changed source image is reprocessed.
+
 Usage:
     python remove_bg_batch.py --input dataset_raw/Healthy_1000 --output dataset_processed/healthy
     python remove_bg_batch.py --input dataset_raw/Healthy_1000 --output dataset_processed/healthy --limit 500
+    python remove_bg_batch.py -i dataset_raw/Healthy_1000 -o dataset_processed/healthy --workers 8 --batch-size 16
 """
 
 import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 from PIL import Image
 from tqdm import tqdm
 
 try:
-    from rembg import remove
+    from rembg import new_session, remove
 except ImportError:
     print("Error: rembg is not installed. Run: pip install rembg")
     sys.exit(1)
@@ -25,12 +42,15 @@ except ImportError:
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
 JPEG_QUALITY = 95
+MANIFEST_NAME = ".remove_bg_manifest.jsonl"
+DEFAULT_MODEL = "u2net"
+DEFAULT_BATCH_SIZE = 8
 
 
-def remove_background_to_black(input_path: Path, output_path: Path) -> None:
+def remove_background_to_black(input_path: Path, output_path: Path, session=None) -> None:
     """Remove background from an image and save with a pure black background."""
     img = Image.open(input_path).convert("RGB")
-    result = remove(img)  # returns RGBA
+    result = remove(img, session=session)  # returns RGBA
     if result.mode == "RGBA":
         black_bg = Image.new("RGB", result.size, (0, 0, 0))
         black_bg.paste(result, mask=result.split()[3])  # use alpha as mask
@@ -47,6 +67,87 @@ def collect_images(input_dir: Path) -> list[Path]:
     return sorted(set(images))
 
 
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Manifest (append-only JSONL, last entry per source wins)
+# ---------------------------------------------------------------------------
+
+
+def load_manifest(path: Path) -> dict[str, dict]:
+    entries: dict[str, dict] = {}
+    if not path.exists():
+        return entries
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written line from an interrupted run
+            entries[rec["source"]] = rec
+    return entries
+
+
+def is_up_to_date(img_path: Path, output_path: Path, entry: dict | None) -> tuple[bool, dict | None]:
+    """Return (skip, refreshed_entry_or_None) for *img_path* given its manifest entry.
+
+    The cheap size/mtime comparison is tried first; the content hash is only
+    computed when those differ (e.g. the file was touched or copied).  If the
+    content still matches, the entry with the new size/mtime is returned so
+    the caller can record it and later runs skip the hash again.
+    """
+    if entry is None or not output_path.exists():
+        return False, None
+    st = img_path.stat()
+    if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+        return True, None
+    if file_sha256(img_path) != entry.get("sha256"):
+        return False, None
+    return True, {**entry, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+_session = None
+
+
+def _init_worker(model_name: str) -> None:
+    """Create one rembg session per worker process."""
+    global _session
+    _session = new_session(model_name)
+
+
+def _process_chunk(jobs: list[tuple[str, str]]) -> list[dict]:
+    """Process a chunk of (input, output) pairs with this worker's session."""
+    records = []
+    for src, dst in jobs:
+        src_path, dst_path = Path(src), Path(dst)
+        rec: dict = {"source": src_path.name, "output": dst_path.name}
+        try:
+            st = src_path.stat()
+            rec.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=file_sha256(src_path))
+            tmp_path = dst_path.with_suffix(".tmp.jpg")
+            remove_background_to_black(src_path, tmp_path, session=_session)
+            os.replace(tmp_path, dst_path)
+            rec["ok"] = True
+        except Exception as exc:
+            rec["ok"] = False
+            rec["error"] = str(exc)
+        records.append(rec)
+    return records
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Batch-remove backgrounds from images using rembg."
@@ -64,6 +165,30 @@ def main() -> None:
         default=None,
         help="Maximum number of images to process (useful for class balancing)",
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help="Number of worker processes, each with its own rembg session",
+    )
+    parser.add_argument(
+        "--batch-size",
+        "-b",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Images sent to a worker per call (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--model",
+        default=DEFAULT_MODEL,
+        help=f"rembg model name (default: {DEFAULT_MODEL})",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Reprocess every image even if the manifest says it is up to date",
+    )
     args = parser.parse_args()
 
     input_dir: Path = args.input
@@ -84,6 +209,9 @@ def main() -> None:
     if limit is not None:
         all_images = all_images[:limit]
 
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = {} if args.force else load_manifest(manifest_path)
+
     processed = 0
     skipped = 0
     failed = 0
@@ -91,26 +219,69 @@ def main() -> None:
     print(f"Input:  {input_dir}  ({len(all_images)} images to process)")
     print(f"Output: {output_dir}")
 
-    for img_path in tqdm(all_images, desc="Removing backgrounds", unit="img"):
+    jobs: list[tuple[str, str]] = []
+    refreshed: list[dict] = []  # manifest records to append before processing
+    for img_path in tqdm(all_images, desc="Checking manifest", unit="img", leave=False):
         output_path = output_dir / (img_path.stem + ".jpg")
-        if output_path.exists():
+        entry = manifest.get(img_path.name)
+        if entry is None and output_path.exists() and not args.force:
+            # Output from a run that predates the manifest: trust it once and
+            # record the source so later changes are detected.
+            st = img_path.stat()
+            refreshed.append({
+                "source": img_path.name, "output": output_path.name,
+                "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                "sha256": file_sha256(img_path), "ok": True,
+            })
             skipped += 1
             continue
-        try:
-            remove_background_to_black(img_path, output_path)
-            processed += 1
-        except Exception as exc:
-            print(f"\nFailed to process '{img_path.name}': {exc}")
-            failed += 1
+        skip, updated = is_up_to_date(img_path, output_path, entry)
+        if updated is not None:
+            refreshed.append(updated)
+        if skip:
+            skipped += 1
+        else:
+            jobs.append((str(img_path), str(output_path)))
+
+    if refreshed:
+        with open(manifest_path, "a", encoding="utf-8") as manifest_fh:
+            for rec in refreshed:
+                manifest_fh.write(json.dumps(rec) + "\n")
+
+    batch_size = max(1, args.batch_size)
+    chunks = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    workers = max(1, min(args.workers, len(chunks))) if chunks else 1
+    print(f"Workers: {workers}  |  Batch size: {batch_size}  |  Model: {args.model}")
+
+    if chunks:
+        ctx = mp.get_context("spawn")
+        with open(manifest_path, "a", encoding="utf-8") as manifest_fh, \
+             ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker,
+                                 initargs=(args.model,)) as pool, \
+             tqdm(total=len(jobs), desc="Removing backgrounds", unit="img") as bar:
+            futures = [pool.submit(_process_chunk, chunk) for chunk in chunks]
+            for fut in as_completed(futures):
+                for rec in fut.result():
+                    if rec["ok"]:
+                        processed += 1
+                        manifest_fh.write(json.dumps(rec) + "\n")
+                    else:
+                        failed += 1
+                        tqdm.write(f"Failed to process '{rec['source']}': {rec['error']}")
+                    bar.update(1)
+                # Flush per chunk so an interrupted run keeps its progress.
+                manifest_fh.flush()
 
     print()
     print("─" * 50)
     print(f"✅ Done!")
     print(f"   Processed : {processed}")
-    print(f"   Skipped   : {skipped}  (already existed)")
+    print(f"   Skipped   : {skipped}  (up to date in manifest)")
     print(f"   Failed    : {failed}")
     print(f"   Total     : {processed + skipped + failed}")
     print(f"   Output    : {output_dir}")
+    print(f"   Manifest  : {manifest_path}")
 
 
 if __name__ == "__main__":
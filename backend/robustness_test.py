@@ -11,9 +11,29 @@ Evaluates the trained EfficientNetV2-S under common real-world perturbations:
 For each perturbation, accuracy and macro F1 are compared to the clean
 baseline so the thesis can include a robustness table.
 
+Every test image is decoded and resized to 224×224 once; all perturbations
+are then applied to that batch as tensor operations
+(app/utils/perturbations.py) and evaluated in the same data pass, so adding
+severity levels only costs model forward passes.
+
+Tables from before the batched pipeline are not directly comparable.  For
+example, "Center crop (75%)" still gives the model the central 168×168
+region resized back to 224×224. The resize now runs on the float tensor
+(torch bilinear with antialiasing), where it used to run on 8-bit pixels
+with PIL, so the accuracies shift slightly.  Re-run older results with
+this script before comparing them.
+
 Usage:
     cd backend
     python robustness_test.py
+    python robustness_test.py --bg-removed          # perturb background-removed images
+    python robustness_test.py --sweep blur          # 10 graded blur levels
+    python robustness_test.py --sweep noise --levels 5
+    python robustness_test.py --no-cache            # re-run the clean baseline too
+    python robustness_test.py --manifest splits.json   # test split of a manifest
+
+The clean baseline is read from the shared inference cache
+(app/utils/inference_cache.py) when another evaluation script already ran it.
 
 Outputs:
     - Per-perturbation metrics printed to stdout
@@ -24,18 +44,33 @@ Optional: install matplotlib for a bar-chart output.
 """
 from __future__ import annotations
 
+import argparse
 import json
+import os
 import sys
 from pathlib import Path
-from typing import Any
 
 import numpy as np
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
-from PIL import Image, ImageFilter, ImageEnhance
+from PIL import Image
 from torch.utils.data import DataLoader, Dataset
 from torchvision import models, transforms
+from tqdm import tqdm
+
+from app.utils.batch_augment import IMAGENET_MEAN, IMAGENET_STD, raw_uint8_transform
+from app.utils.bg_cache import BackgroundRemovalCache
+from app.utils.dataset_manifest import split_samples
+from app.utils.inference_cache import InferenceCache, InferenceResult, transform_id
+from app.utils.metrics import compute_metrics
+from app.utils.perturbations import (
+    BASELINE,
+    SWEEP_RANGES,
+    Perturbation,
+    default_suite,
+    normalize,
+    severity_sweep,
+)
 
 # ---------------------------------------------------------------------------
 # Configuration (must match train.py)
@@ -45,6 +80,8 @@ MODEL_PATH = "models/cardamom_model.pt"
 NUM_CLASSES = 4
 IMG_SIZE = 224
 BATCH_SIZE = 32
+SWEEP_LEVELS = 10
+RANDOM_SEED = 0           # noise / rotation draws
 _BAR_LABEL_OFFSET = 0.5   # horizontal offset (% points) for bar-chart text labels
 
 DEVICE = torch.device(
@@ -55,106 +92,12 @@ DEVICE = torch.device(
 
 EXTENSIONS = {".jpg", ".jpeg", ".png", ".JPG", ".JPEG", ".PNG"}
 
-# ---------------------------------------------------------------------------
-# Perturbation definitions
-# ---------------------------------------------------------------------------
-
-# Top-level picklable classes (required for num_workers > 0 with spawn)
-
-class _PilTransformWrapper:
-    """Wraps a picklable PIL → PIL callable as a torchvision-compatible transform."""
-    def __init__(self, pil_fn):
-        self.pil_fn = pil_fn
-
-    def __call__(self, img):
-        return self.pil_fn(img)
-
-
-class _IdentityTransform:
-    """PIL identity transform (replaces unpicklable lambda)."""
-    def __call__(self, img):
-        return img
-
-
-class _GaussianBlur:
-    """Apply Gaussian blur to a PIL image."""
-    def __init__(self, radius: float = 3.0):
-        self.radius = radius
-
-    def __call__(self, img: Image.Image) -> Image.Image:
-        return img.filter(ImageFilter.GaussianBlur(radius=self.radius))
-
-
-class _BrightnessReduce:
-    """Reduce brightness of a PIL image. factor < 1 darkens."""
-    def __init__(self, factor: float = 0.4):
-        self.factor = factor
-
-    def __call__(self, img: Image.Image) -> Image.Image:
-        return ImageEnhance.Brightness(img).enhance(self.factor)
-
-
-class _AddGaussianNoise:
-    """Add Gaussian noise in [0,1] float space after ToTensor."""
-    def __init__(self, std: float = 0.15):
-        self.std = std
-
-    def __call__(self, tensor: torch.Tensor) -> torch.Tensor:
-        noise = torch.randn_like(tensor) * self.std
-        return (tensor + noise).clamp(0.0, 1.0)
-
-
-def _to_pil_transform(pil_fn):
-    """Wrap a picklable PIL → PIL callable as a torchvision-compatible Transform."""
-    return _PilTransformWrapper(pil_fn)
-
-
-_NORMALIZE = transforms.Normalize([0.485, 0.456, 0.406],
-                                    [0.229, 0.224, 0.225])
-_RESIZE = transforms.Resize((IMG_SIZE, IMG_SIZE))
-_TO_TENSOR = transforms.ToTensor()
-
-
-def _build_transform(pil_augment=None, tensor_augment=None):
-    """Compose an evaluation transform with optional PIL/tensor augmentations."""
-    steps = [_RESIZE]
-    if pil_augment is not None:
-        steps.append(_to_pil_transform(pil_augment))
-    steps.append(_TO_TENSOR)
-    if tensor_augment is not None:
-        steps.append(tensor_augment)
-    steps.append(_NORMALIZE)
-    return transforms.Compose(steps)
-
-
-# Registry of perturbations: name → transform
-PERTURBATIONS: dict[str, Any] = {
-    "Baseline (clean)": _build_transform(),
-    "Blur (r=3)": _build_transform(pil_augment=_GaussianBlur(3.0)),
-    "Blur (r=5)": _build_transform(pil_augment=_GaussianBlur(5.0)),
-    "Low brightness (×0.4)": _build_transform(pil_augment=_BrightnessReduce(0.4)),
-    "Low brightness (×0.2)": _build_transform(pil_augment=_BrightnessReduce(0.2)),
-    "Gaussian noise (σ=0.10)": _build_transform(tensor_augment=_AddGaussianNoise(0.10)),
-    "Gaussian noise (σ=0.20)": _build_transform(tensor_augment=_AddGaussianNoise(0.20)),
-    "Rotation (±45°)": _build_transform(pil_augment=None,
-                                         tensor_augment=None),  # handled below
-    "Center crop (75%)": _build_transform(),  # handled below
-}
-
-# Build rotation / crop transforms separately (they need special compose order)
-PERTURBATIONS["Rotation (±45°)"] = transforms.Compose([
-    _RESIZE,
-    _IdentityTransform(),             # replaces unpicklable lambda
-    transforms.RandomRotation(degrees=45),
-    _TO_TENSOR,
-    _NORMALIZE,
-])
-PERTURBATIONS["Center crop (75%)"] = transforms.Compose([
-    _RESIZE,
-    transforms.CenterCrop(int(IMG_SIZE * 0.75)),
+# The clean baseline is numerically the standard evaluation transform, so it
+# shares inference-cache entries with evaluate.py / error_analysis.py.
+_EVAL_TRANSFORM = transforms.Compose([
     transforms.Resize((IMG_SIZE, IMG_SIZE)),
-    _TO_TENSOR,
-    _NORMALIZE,
+    transforms.ToTensor(),
+    transforms.Normalize(list(IMAGENET_MEAN), list(IMAGENET_STD)),
 ])
 
 # ---------------------------------------------------------------------------
@@ -190,18 +133,24 @@ def load_model() -> nn.Module:
 # Dataset
 # ---------------------------------------------------------------------------
 
-class PerturbedDataset(Dataset):
-    def __init__(self, samples, transform):
+def _pil_loader(path) -> Image.Image:
+    return Image.open(path).convert("RGB")
+
+
+class ResizedTestDataset(Dataset):
+    """Decode + resize each test image once; returns a uint8 (3, S, S) tensor."""
+
+    def __init__(self, samples, loader=_pil_loader):
         self.samples = samples
-        self.transform = transform
+        self.transform = raw_uint8_transform(IMG_SIZE)
+        self.loader = loader
 
     def __len__(self):
         return len(self.samples)
 
     def __getitem__(self, idx):
         path, label, _ = self.samples[idx]
-        image = Image.open(path).convert("RGB")
-        return self.transform(image), label
+        return self.transform(self.loader(str(path))), label
 
 
 def collect_test_samples(dataset_path: str):
@@ -224,53 +173,101 @@ def collect_test_samples(dataset_path: str):
 # Evaluation helpers
 # ---------------------------------------------------------------------------
 
-def compute_metrics(y_true: np.ndarray, y_pred: np.ndarray,
-                    num_classes: int) -> dict[str, float]:
-    cm = np.zeros((num_classes, num_classes), dtype=int)
-    for t, p in zip(y_true, y_pred):
-        cm[t, p] += 1
-    eps = 1e-12
-    f1_list = []
-    for i in range(num_classes):
-        tp = cm[i, i]
-        fp = cm[:, i].sum() - tp
-        fn = cm[i, :].sum() - tp
-        p_i = tp / (tp + fp + eps)
-        r_i = tp / (tp + fn + eps)
-        f1_list.append(2 * p_i * r_i / (p_i + r_i + eps))
-    return {
-        "accuracy": float(cm.trace() / (cm.sum() + eps)),
-        "macro_f1": float(np.mean(f1_list)),
-    }
-
-
-def evaluate(model: nn.Module, loader: DataLoader):
-    y_true, y_pred = [], []
+def evaluate_suite(model: nn.Module, loader: DataLoader, suite: list[Perturbation],
+                   seed: int = RANDOM_SEED) -> dict[str, np.ndarray]:
+    """One pass over *loader*; returns ``{name: logits (N, C)}`` for every
+    perturbation in *suite*."""
+    generator = torch.Generator().manual_seed(seed)
+    logits: dict[str, list[np.ndarray]] = {p.name: [] for p in suite}
     with torch.no_grad():
-        for inputs, labels in loader:
-            inputs = inputs.to(DEVICE)
-            preds = model(inputs).argmax(dim=1).cpu().numpy()
-            y_pred.extend(preds.tolist())
-            y_true.extend(labels.numpy().tolist())
-    return np.array(y_true), np.array(y_pred)
+        for batch, _ in tqdm(loader, desc="Evaluating", unit="batch"):
+            clean = batch.to(DEVICE).float().div_(255.0)
+            for p in suite:
+                out = model(normalize(p(clean, generator)))
+                logits[p.name].append(out.float().cpu().numpy())
+    return {name: np.concatenate(chunks) for name, chunks in logits.items()}
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Robustness tests under perturbations.")
+    parser.add_argument("--bg-removed", action="store_true",
+                        help="Apply perturbations to background-removed images "
+                             "(cached rembg masks)")
+    parser.add_argument("--sweep", choices=sorted(SWEEP_RANGES), default=None,
+                        help="Evaluate graded severities of one perturbation instead of the default table")
+    parser.add_argument("--levels", type=int, default=SWEEP_LEVELS,
+                        help=f"Severity levels for --sweep (default: {SWEEP_LEVELS})")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED,
+                        help=f"Seed for noise / rotation draws (default: {RANDOM_SEED})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Re-run the clean baseline instead of reusing cached model outputs")
+    parser.add_argument("--manifest", default=None,
+                        help="Use the test split of a manifest (split_dataset.py --manifest)")
+    args = parser.parse_args()
+
+    suite = severity_sweep(args.sweep, args.levels) if args.sweep else default_suite()
+
     print("\n" + "=" * 60)
     print("Robustness Tests  –  Cardamom Disease Detection")
     print(f"Model  : EfficientNetV2-S")
     print(f"Device : {DEVICE}")
-    print(f"Data   : {DATASET_PATH}/test")
+    print(f"Data   : {args.manifest or f'{DATASET_PATH}/test'}")
+    print(f"Suite  : {f'{args.sweep} sweep ({args.levels} levels)' if args.sweep else 'default'}")
     print("=" * 60)
 
     model = load_model()
-    samples, class_names = collect_test_samples(DATASET_PATH)
+    if args.manifest:
+        samples, class_names = split_samples(args.manifest, "test")
+    else:
+        samples, class_names = collect_test_samples(DATASET_PATH)
     n = len(class_names)
     print(f"\nTest samples: {len(samples)}")
 
+    loader_fn = _pil_loader
+    bg_suffix = ""
+    if args.bg_removed:
+        cache = BackgroundRemovalCache()
+        paths = [p for p, _, _ in samples]
+        n_missing = len(cache.missing(paths))
+        try:
+            with tqdm(total=n_missing, desc="rembg", unit="img", disable=not n_missing) as bar:
+                failures = cache.ensure(paths, workers=max(1, (os.cpu_count() or 2) // 2),
+                                        progress=bar.update)
+        except RuntimeError as exc:
+            print(f"❌ {exc}")
+            sys.exit(1)
+        for path, err in failures:
+            print(f"⚠️  rembg failed for {path}: {err} (using original image)")
+        loader_fn = cache.loader
+        bg_suffix = f"|bg-removed:{cache.model_name}"
+        print(f"Background removal: cached masks from {cache.root}")
+
+    # Clean baseline: deterministic, so it is shared with the other scripts.
+    inference_cache = InferenceCache(enabled=not args.no_cache)
+    baseline_key = ""
+    baseline_hit = None
+    if inference_cache.enabled:
+        baseline_key = inference_cache.key(MODEL_PATH, samples, transform_id(_EVAL_TRANSFORM) + bg_suffix)
+        baseline_hit = inference_cache.load(baseline_key, samples)
+    to_run = [p for p in suite if not (p is BASELINE and baseline_hit is not None)]
+
+    loader = DataLoader(ResizedTestDataset(samples, loader=loader_fn), batch_size=BATCH_SIZE,
+                        shuffle=False, num_workers=2, pin_memory=False)
+    logits = evaluate_suite(model, loader, to_run, seed=args.seed)
+    if baseline_hit is not None:
+        logits[BASELINE.name] = baseline_hit.logits
+    elif inference_cache.enabled:
+        inference_cache.save(baseline_key, InferenceResult(
+            logits=logits[BASELINE.name],
+            labels=np.array([s[1] for s in samples], dtype=np.int64),
+            paths=[str(s[0]) for s in samples],
+            class_names=class_names,
+        ))
+    y_true = np.array([s[1] for s in samples], dtype=np.int64)
+
     results: list[dict] = []
 
     print(f"\n{'Perturbation':<30s}  {'Accuracy':>9s}  {'Macro F1':>9s}  {'Δ Acc':>8s}  {'Δ F1':>8s}")
@@ -279,11 +276,8 @@ def main() -> None:
     baseline_acc: float | None = None
     baseline_f1: float | None = None
 
-    for name, tf in PERTURBATIONS.items():
-        ds = PerturbedDataset(samples, tf)
-        loader = DataLoader(ds, batch_size=BATCH_SIZE, shuffle=False,
-                            num_workers=2, pin_memory=False)
-        y_true, y_pred = evaluate(model, loader)
+    for p in suite:
+        y_pred = logits[p.name].argmax(axis=1)
         metrics = compute_metrics(y_true, y_pred, n)
         acc = metrics["accuracy"] * 100
         f1 = metrics["macro_f1"] * 100
@@ -299,19 +293,24 @@ def main() -> None:
             delta_acc_str = f"{d_acc:+.2f}%"
             delta_f1_str = f"{d_f1:+.2f}%"
 
-        print(f"{name:<30s}  {acc:>8.2f}%  {f1:>8.2f}%  {delta_acc_str:>8s}  {delta_f1_str:>8s}")
+        print(f"{p.name:<30s}  {acc:>8.2f}%  {f1:>8.2f}%  {delta_acc_str:>8s}  {delta_f1_str:>8s}")
         results.append({
-            "perturbation": name,
+            "perturbation": p.name,
+            "kind": p.kind,
+            "severity": p.severity,
             "accuracy": float(acc / 100),
             "macro_f1": float(f1 / 100),
-            "delta_accuracy_pp": float(acc - baseline_acc) if baseline_acc is not None else 0.0,
-            "delta_f1_pp": float(f1 - baseline_f1) if baseline_f1 is not None else 0.0,
+            "delta_accuracy_pp": float(acc - baseline_acc),
+            "delta_f1_pp": float(f1 - baseline_f1),
         })
 
     # ── Save JSON ──────────────────────────────────────────────────────────
     summary = {
         "model": "EfficientNetV2-S",
-        "dataset": DATASET_PATH,
+        "dataset": args.manifest or DATASET_PATH,
+        "background_removed": bool(args.bg_removed),
+        "sweep": args.sweep,
+        "seed": args.seed,
         "classes": class_names,
         "perturbations": results,
     }
@@ -320,25 +319,36 @@ def main() -> None:
         json.dump(summary, f, indent=2)
     print(f"\n✅ Robustness results saved to: {out_path}")
 
-    # ── Optional: bar chart ───────────────────────────────────────────────────
+    # ── Optional: chart ─────────────────────────────────────────────────────
     try:
         import matplotlib.pyplot as plt
 
-        names = [r["perturbation"] for r in results]
-        accs = [r["accuracy"] * 100 for r in results]
-
-        fig, ax = plt.subplots(figsize=(10, 5))
-        colors = ["steelblue" if i == 0 else "salmon" for i in range(len(names))]
-        bars = ax.barh(names, accs, color=colors)
-        ax.set_xlabel("Accuracy (%)")
-        ax.set_title("Model Robustness Under Perturbations")
-        ax.set_xlim(0, 105)
-        for bar, val in zip(bars, accs):
-            ax.text(val + _BAR_LABEL_OFFSET, bar.get_y() + bar.get_height() / 2,
-                    f"{val:.1f}%", va="center", fontsize=9)
-        ax.axvline(x=baseline_acc, color="gray", linestyle="--", linewidth=1)
+        if args.sweep:
+            graded = results[1:]
+            fig, ax = plt.subplots(figsize=(8, 4))
+            ax.plot([r["severity"] for r in graded], [r["accuracy"] * 100 for r in graded],
+                    marker="o", color="salmon")
+            ax.axhline(y=baseline_acc, color="gray", linestyle="--", linewidth=1, label="Clean")
+            ax.set_xlabel(f"{args.sweep} severity")
+            ax.set_ylabel("Accuracy (%)")
+            ax.set_title(f"Accuracy vs. {args.sweep} severity")
+            ax.legend()
+        else:
+            names = [r["perturbation"] for r in results]
+            accs = [r["accuracy"] * 100 for r in results]
+
+            fig, ax = plt.subplots(figsize=(10, 5))
+            colors = ["steelblue" if i == 0 else "salmon" for i in range(len(names))]
+            bars = ax.barh(names, accs, color=colors)
+            ax.set_xlabel("Accuracy (%)")
+            ax.set_title("Model Robustness Under Perturbations")
+            ax.set_xlim(0, 105)
+            for bar, val in zip(bars, accs):
+                ax.text(val + _BAR_LABEL_OFFSET, bar.get_y() + bar.get_height() / 2,
+                        f"{val:.1f}%", va="center", fontsize=9)
+            ax.axvline(x=baseline_acc, color="gray", linestyle="--", linewidth=1)
         plt.tight_layout()
-        chart_path = "robustness_chart.png"
+        chart_path = f"robustness_{args.sweep}_sweep.png" if args.sweep else "robustness_chart.png"
         plt.savefig(chart_path, dpi=150)
         print(f"✅ Chart saved to: {chart_path}")
     except ImportError:
@@ -346,4 +356,4 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
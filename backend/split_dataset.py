@@ -4,12 +4,49 @@ Reads from dataset_processed/{blight,healthy,other,spot}
 Writes to   dataset/{train,val,test}/{blight,healthy,other,spot}
 
 Typical split: 70% train, 15% val, 15% test
+
+Near-duplicate images (see deduplicate.py) can be kept together so the same
+leaf never ends up in both train and test:
+
+    python split_dataset.py --groups duplicates.json   # groups from deduplicate.py
+    python split_dataset.py --dedup                    # pHash groups computed here
+
+With --manifest the split is written as metadata only (see
+app/utils/dataset_manifest.py) – nothing is copied, and training/evaluation
+read the images straight from dataset_processed/:
+
+    python split_dataset.py --manifest splits.json
+    python split_dataset.py --manifest splits.json --resplit --seed 7   # metadata only
+    python train.py --manifest splits.json
+
+--link builds dataset/ from hardlinks instead of copies where a directory
+layout is still needed (with --manifest: from the manifest's split, also
+after --resplit; files an earlier split left in dataset/ are removed).
 """
+import argparse
+import os
 import shutil
+import sys
 from pathlib import Path
 import random
+from typing import Optional
+
 from tqdm import tqdm
 
+from app.utils.dataset_manifest import (
+    SPLITS,
+    assign_units,
+    build_manifest,
+    link_or_copy,
+    materialize,
+    read_manifest,
+    resplit,
+    split_bounds,
+    split_counts,
+    write_manifest,
+)
+from app.utils.dedup import DEFAULT_HAMMING_THRESHOLD, duplicate_groups, group_index, load_groups
+
 # ── Configuration ─────────────────────────────────────────────────────────────
 SOURCE_DIR = "dataset_processed"
 CLASS_FOLDERS = ["blight", "healthy", "other", "spot"]
@@ -33,13 +70,29 @@ def create_directory_structure(output_dir: str, class_names: list) -> None:
             print(f"  Created: {path}")
 
 
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".JPG", ".JPEG", ".PNG"}
+
+
+def list_images(source_dir: str, class_name: str) -> list:
+    source_path = Path(source_dir) / class_name
+    return [f for f in source_path.iterdir() if f.suffix in EXTENSIONS]
+
+
 def split_and_copy(source_dir: str, class_name: str, output_dir: str,
-                   train_ratio: float, val_ratio: float) -> None:
-    """Split images from source_dir/class_name into train/val/test."""
+                   train_ratio: float, val_ratio: float,
+                   group_of: Optional[dict] = None,
+                   assigned: Optional[dict] = None,
+                   link: bool = False) -> None:
+    """Split images from source_dir/class_name into train/val/test.
+
+    ``group_of`` maps resolved image paths to a duplicate-group id; every
+    member of a group goes to the same split (``assigned`` remembers groups
+    placed by earlier classes).  Without groups this is a plain shuffled slice.
+    With ``link`` the files are hardlinked instead of copied.
+    """
     source_path = Path(source_dir) / class_name
 
-    extensions = {".jpg", ".jpeg", ".png", ".JPG", ".JPEG", ".PNG"}
-    all_files = [f for f in source_path.iterdir() if f.suffix in extensions]
+    all_files = list_images(source_dir, class_name)
     random.shuffle(all_files)
 
     total = len(all_files)
@@ -47,14 +100,10 @@ def split_and_copy(source_dir: str, class_name: str, output_dir: str,
         print(f"⚠️  No images found in {source_path}")
         return
 
-    train_end = int(total * train_ratio)
-    val_end   = train_end + int(total * val_ratio)
-
-    splits = {
-        "train": all_files[:train_end],
-        "val":   all_files[train_end:val_end],
-        "test":  all_files[val_end:],
-    }
+    group_of = group_of or {}
+    keys = [group_of.get(str(fp.resolve()), fp) for fp in all_files]
+    splits = assign_units(all_files, keys, split_bounds(total, train_ratio, val_ratio),
+                          SPLITS, assigned)
 
     print(f"\n📊 {class_name}:")
     print(f"   Total: {total}")
@@ -65,10 +114,54 @@ def split_and_copy(source_dir: str, class_name: str, output_dir: str,
     for split_name, files in splits.items():
         dest = Path(output_dir) / split_name / class_name
         for fp in tqdm(files, desc=f"  → {split_name}", leave=False):
-            shutil.copy2(fp, dest / fp.name)
+            if link:
+                link_or_copy(fp, dest / fp.name)
+            else:
+                shutil.copy2(fp, dest / fp.name)
+
+
+def print_manifest_counts(manifest: dict) -> None:
+    counts = split_counts(manifest)
+    n_groups = len(set(manifest["groups"]))
+    print(f"   {len(manifest['paths'])} images in {n_groups} groups")
+    for label, cls in enumerate(manifest["classes"]):
+        row = "  ".join(f"{s}: {counts[s][label]:4d}" for s in SPLITS)
+        print(f"   {cls:10s} {row}")
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Split dataset_processed into train/val/test.")
+    parser.add_argument("--groups", default=None,
+                        help="Duplicate-groups JSON from deduplicate.py; each group stays in one split")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Compute pHash duplicate groups of the source images before splitting")
+    parser.add_argument("--hamming", type=int, default=DEFAULT_HAMMING_THRESHOLD,
+                        help=f"Max pHash Hamming distance for --dedup (default: {DEFAULT_HAMMING_THRESHOLD})")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED,
+                        help=f"Shuffle seed (default: {RANDOM_SEED})")
+    parser.add_argument("--manifest", default=None,
+                        help="Write the split to this manifest JSON instead of copying files")
+    parser.add_argument("--resplit", action="store_true",
+                        help="Reassign the splits of an existing --manifest (no image is read)")
+    parser.add_argument("--link", action="store_true",
+                        help="Hardlink files into dataset/ instead of copying them "
+                             "(with --manifest: also build dataset/ from the manifest)")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    if args.resplit:
+        if not args.manifest:
+            parser.error("--resplit needs --manifest")
+        manifest = resplit(read_manifest(args.manifest), args.seed, TRAIN_RATIO, VAL_RATIO)
+        write_manifest(args.manifest, manifest)
+        print(f"✅ Re-split {len(manifest['paths'])} images with seed {args.seed} → {args.manifest}")
+        print_manifest_counts(manifest)
+        if args.link:
+            linked = materialize(manifest, OUTPUT_DIR)
+            print(f"🔗 {OUTPUT_DIR}/ rebuilt from the manifest ({linked} hardlinks, "
+                  f"{len(manifest['paths']) - linked} copies)")
+        return
+
     print("=" * 60)
     print("Dataset Splitting Script")
     print("=" * 60)
@@ -93,6 +186,40 @@ def main() -> None:
         print("\nPlease create them and add images before running this script.")
         return
 
+    group_of = {}
+    if args.groups:
+        group_of = load_groups(args.groups)
+        source_root = Path(SOURCE_DIR).resolve()
+        found = sum(Path(p).is_relative_to(source_root) for p in group_of)
+        print(f"\n🔗 Loaded {len(set(group_of.values()))} duplicate groups from {args.groups} "
+              f"({found}/{len(group_of)} paths under {SOURCE_DIR}/)")
+        if group_of and not found:
+            print(f"❌ No group path is under {SOURCE_DIR}/, so no group would be kept together.")
+            print(f"   Re-run: python deduplicate.py --root {SOURCE_DIR} --output {args.groups}")
+            sys.exit(1)
+    elif args.dedup:
+        print(f"\n🔗 Hashing source images (pHash, d≤{args.hamming})...")
+        sources = [f for cls in CLASS_FOLDERS for f in list_images(SOURCE_DIR, cls)]
+        groups = duplicate_groups(sources, args.hamming, workers=min(8, os.cpu_count() or 1))
+        group_of = group_index(groups)
+        print(f"   {len(groups)} duplicate groups ({sum(len(g) for g in groups)} images)")
+
+    if args.manifest:
+        n_images = sum(len(list_images(SOURCE_DIR, cls)) for cls in CLASS_FOLDERS)
+        print(f"\n🧾 Hashing {n_images} images for the manifest...")
+        with tqdm(total=n_images, unit="img", leave=False) as bar:
+            manifest = build_manifest(SOURCE_DIR, CLASS_FOLDERS, TRAIN_RATIO, VAL_RATIO, args.seed,
+                                      group_of=group_of, progress=bar.update)
+        write_manifest(args.manifest, manifest)
+        print(f"✅ Manifest written to {args.manifest} (no files copied)")
+        print_manifest_counts(manifest)
+        if args.link:
+            linked = materialize(manifest, OUTPUT_DIR)
+            print(f"🔗 {OUTPUT_DIR}/ built from the manifest ({linked} hardlinks, "
+                  f"{len(manifest['paths']) - linked} copies)")
+        print(f"\nYou can now run:  python train.py --manifest {args.manifest}")
+        return
+
     # Create output structure
     print(f"\n📁 Creating output structure in '{OUTPUT_DIR}/'...")
     create_directory_structure(OUTPUT_DIR, CLASS_FOLDERS)
@@ -100,8 +227,10 @@ def main() -> None:
     # Split each class
     print("\n📂 Splitting images...")
     print("=" * 60)
+    assigned = {}
     for cls in CLASS_FOLDERS:
-        split_and_copy(SOURCE_DIR, cls, OUTPUT_DIR, TRAIN_RATIO, VAL_RATIO)
+        split_and_copy(SOURCE_DIR, cls, OUTPUT_DIR, TRAIN_RATIO, VAL_RATIO, group_of, assigned,
+                       link=args.link)
 
     # Summary
     print("\n" + "=" * 60)
@@ -114,6 +114,12 @@ class TestHealth:
         body = client.get("/health").json()
         assert isinstance(body.get("model_classes"), list)
 
+    def test_lists_loaded_versions_with_memory(self, client):
+        versions = client.get("/health").json()["loaded_versions"]
+        assert len(versions) == 1
+        assert versions[0]["active"] is True
+        assert versions[0]["memory_mb"] > 0
+
 
 # ---------------------------------------------------------------------------
 # /predict – happy paths
@@ -234,6 +240,14 @@ class TestPredictSuccess:
 
 
 class TestPredictErrors:
+    def test_unknown_model_version_returns_404(self, client, patched_classifier):
+        resp = client.post(
+            "/predict",
+            files={"file": ("leaf.jpg", _make_image_bytes(), "image/jpeg")},
+            data={"model_version": "does-not-exist"},
+        )
+        assert resp.status_code == 404
+
     def test_unsupported_content_type_returns_400(self, client, patched_classifier):
         resp = client.post(
             "/predict",
@@ -302,3 +316,99 @@ class TestBatchPredict:
         for item in resp.json():
             assert "top_class" in item
 
+
+
+# ---------------------------------------------------------------------------
+# /similar
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture()
+def similarity_index(tmp_path):
+    """Exact index over one unit vector per class, patched into app.main."""
+    import numpy as np
+    from app.utils.similarity_index import build_index, load_index
+
+    vectors = np.eye(len(CLASS_NAMES), 8, dtype=np.float32)
+    paths = [f"train/{name}/ref.jpg" for name in CLASS_NAMES]
+    build_index(tmp_path / "idx", vectors, list(range(len(CLASS_NAMES))), paths, CLASS_NAMES, "pooled")
+    index = load_index(tmp_path / "idx")
+    with patch("app.main._similarity_index", index):
+        yield index
+
+
+class TestSimilar:
+    def test_returns_prediction_and_neighbors(self, client, patched_classifier, similarity_index):
+        import numpy as np
+
+        query = np.array([0.1, 1.0, 0.2, 0, 0, 0, 0, 0], dtype=np.float32)
+        patched_classifier.predict_with_embedding.return_value = (_make_prediction_result(), query)
+        resp = client.post(
+            "/similar",
+            files={"file": ("leaf.jpg", _make_image_bytes(), "image/jpeg")},
+            data={"k": "2"},
+        )
+        assert resp.status_code == 200
+        body = resp.json()
+        assert body["prediction"]["top_class"] == CLASS_NAMES[1]
+        assert [n["class_name"] for n in body["neighbors"]] == [CLASS_NAMES[1], CLASS_NAMES[2]]
+        assert body["index_kind"] == "exact" and body["embedding_layer"] == "pooled"
+        patched_classifier.predict_with_embedding.assert_called_once()
+
+    def test_without_index_returns_503(self, client, patched_classifier):
+        resp = client.post(
+            "/similar",
+            files={"file": ("leaf.jpg", _make_image_bytes(), "image/jpeg")},
+        )
+        assert resp.status_code == 503
+
+    def test_embedding_size_mismatch_returns_409(self, client, patched_classifier, similarity_index):
+        import numpy as np
+
+        patched_classifier.predict_with_embedding.return_value = (
+            _make_prediction_result(), np.zeros(16, dtype=np.float32))
+        resp = client.post(
+            "/similar",
+            files={"file": ("leaf.jpg", _make_image_bytes(), "image/jpeg")},
+        )
+        assert resp.status_code == 409
+
+    def test_index_from_other_checkpoint_returns_409(self, client, patched_classifier, similarity_index):
+        patched_classifier.checkpoint_sha256 = "a" * 64
+        with patch.dict(similarity_index.meta, {"model_sha256": "b" * 64}):
+            resp = client.post(
+                "/similar",
+                files={"file": ("leaf.jpg", _make_image_bytes(), "image/jpeg")},
+            )
+        assert resp.status_code == 409
+        assert "model_sha256" in resp.json()["detail"]
+        patched_classifier.predict_with_embedding.assert_not_called()
+
+    @pytest.mark.parametrize("bg_removed, segmenting", [(False, True), (True, False)])
+    def test_background_handling_mismatch_returns_409(self, client, patched_classifier, similarity_index,
+                                                      bg_removed, segmenting):
+        segmenter = MagicMock(enabled=segmenting)
+        segmenter.segment.side_effect = lambda img: MagicMock(image=img)
+        with patch("app.main._segmenter", segmenter), \
+                patch.dict(similarity_index.meta, {"bg_removed": bg_removed}):
+            resp = client.post(
+                "/similar",
+                files={"file": ("leaf.jpg", _make_image_bytes(), "image/jpeg")},
+            )
+        assert resp.status_code == 409
+        assert "background removal" in resp.json()["detail"]
+        patched_classifier.predict_with_embedding.assert_not_called()
+
+    def test_index_from_same_checkpoint_is_served(self, client, patched_classifier, similarity_index):
+        import numpy as np
+
+        patched_classifier.checkpoint_sha256 = "a" * 64
+        patched_classifier.predict_with_embedding.return_value = (
+            _make_prediction_result(), np.eye(1, 8, dtype=np.float32)[0])
+        with patch("app.main._segmenter", None), \
+                patch.dict(similarity_index.meta, {"model_sha256": "a" * 64, "bg_removed": False}):
+            resp = client.post(
+                "/similar",
+                files={"file": ("leaf.jpg", _make_image_bytes(), "image/jpeg")},
+            )
+        assert resp.status_code == 200
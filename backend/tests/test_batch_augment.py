@@ -0,0 +1,55 @@
+"""
+Tests for the batched tensor augmentation stage.
+"""
+from __future__ import annotations
+
+import torch
+
+from app.utils.batch_augment import BatchAugment
+
+
+def _no_op(**overrides) -> BatchAugment:
+    params = dict(out_size=8, hflip=0.0, vflip=0.0, degrees=0.0, translate=0.0,
+                  brightness=0.0, contrast=0.0, saturation=0.0,
+                  mean=(0.0, 0.0, 0.0), std=(1.0, 1.0, 1.0))
+    params.update(overrides)
+    return BatchAugment(**params)
+
+
+def _batch(n=4, size=8) -> torch.Tensor:
+    return torch.randint(0, 256, (n, 3, size, size), dtype=torch.uint8,
+                         generator=torch.Generator().manual_seed(0))
+
+
+class TestBatchAugment:
+    def test_output_shape_and_dtype(self):
+        aug = BatchAugment(out_size=16)
+        out = aug(_batch(size=20))
+        assert out.shape == (4, 3, 16, 16)
+        assert out.dtype == torch.float32
+
+    def test_identity_parameters_only_rescale(self):
+        batch = _batch()
+        out = _no_op()(batch)
+        assert torch.allclose(out, batch.float() / 255.0, atol=1e-5)
+
+    def test_forced_flips_match_tensor_flips(self):
+        batch = _batch()
+        out = _no_op(hflip=1.0, vflip=1.0)(batch)
+        expected = batch.flip(-1).flip(-2).float() / 255.0
+        assert torch.allclose(out, expected, atol=1e-5)
+
+    def test_parameters_differ_per_sample(self):
+        batch = _batch(n=1).expand(16, -1, -1, -1)
+        out = BatchAugment(out_size=8, mean=(0, 0, 0), std=(1, 1, 1))(batch)
+        assert any(not torch.allclose(out[0], out[i]) for i in range(1, 16))
+
+    def test_generator_makes_output_reproducible(self):
+        batch = _batch()
+        a = BatchAugment(out_size=8, generator=torch.Generator().manual_seed(7))(batch)
+        b = BatchAugment(out_size=8, generator=torch.Generator().manual_seed(7))(batch)
+        assert torch.equal(a, b)
+
+    def test_jitter_keeps_values_in_range(self):
+        out = _no_op(brightness=0.5, contrast=0.5, saturation=0.5)(_batch(n=16))
+        assert out.min() >= 0.0 and out.max() <= 1.0
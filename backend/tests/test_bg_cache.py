@@ -0,0 +1,68 @@
+"""
+Tests for the content-addressed background-removal mask cache.
+"""
+from __future__ import annotations
+
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils.bg_cache import BackgroundRemovalCache
+
+
+def _write_leaf(path, color=(40, 160, 40)):
+    Image.new("RGB", (16, 16), color).save(path, format="PNG")
+    return path
+
+
+def _store_half_mask(cache: BackgroundRemovalCache, src) -> None:
+    """Write a mask marking the left half as leaf, as a worker would."""
+    dst = cache.mask_path(src)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    arr = np.zeros((16, 16), dtype=np.uint8)
+    arr[:, :8] = 255
+    Image.fromarray(arr, mode="L").save(dst, format="PNG")
+
+
+class TestBackgroundRemovalCache:
+    def test_missing_until_mask_stored(self, tmp_path):
+        cache = BackgroundRemovalCache(root=tmp_path / "cache")
+        src = _write_leaf(tmp_path / "a.png")
+        assert cache.missing([src]) == [src]
+        _store_half_mask(cache, src)
+        assert cache.missing([src]) == []
+
+    def test_keys_are_content_addressed(self, tmp_path):
+        cache = BackgroundRemovalCache(root=tmp_path / "cache")
+        src = _write_leaf(tmp_path / "a.png")
+        copy = tmp_path / "renamed.png"
+        shutil.copy(src, copy)
+        other = _write_leaf(tmp_path / "b.png", color=(200, 10, 10))
+        assert cache.mask_path(src) == cache.mask_path(copy)
+        assert cache.mask_path(src) != cache.mask_path(other)
+
+    def test_keys_depend_on_segmenter_model(self, tmp_path):
+        src = _write_leaf(tmp_path / "a.png")
+        a = BackgroundRemovalCache(root=tmp_path, model_name="u2net")
+        b = BackgroundRemovalCache(root=tmp_path, model_name="isnet-general-use")
+        assert a.mask_path(src) != b.mask_path(src)
+
+    def test_load_image_composites_on_black(self, tmp_path):
+        cache = BackgroundRemovalCache(root=tmp_path / "cache")
+        src = _write_leaf(tmp_path / "a.png")
+        _store_half_mask(cache, src)
+        image = cache.load_image(src)
+        assert image.getpixel((0, 0)) == (40, 160, 40)
+        assert image.getpixel((15, 0)) == (0, 0, 0)
+        mask = cache.load_mask(src)
+        assert mask.shape == (16, 16) and mask[:, :8].all() and not mask[:, 8:].any()
+
+    def test_load_image_without_mask_raises(self, tmp_path):
+        cache = BackgroundRemovalCache(root=tmp_path / "cache")
+        src = _write_leaf(tmp_path / "a.png")
+        with pytest.raises(KeyError):
+            cache.load_image(src)
+        # The dataset loader falls back to the original image instead.
+        assert cache.loader(str(src)).getpixel((15, 0)) == (40, 160, 40)
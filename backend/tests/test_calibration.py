@@ -0,0 +1,104 @@
+"""
+Tests for temperature scaling and the confidence-threshold sweep.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.utils.calibration import (
+    calibration_summary,
+    fit_temperature,
+    nll,
+    recommend_threshold,
+    softmax,
+    threshold_grid,
+    threshold_sweep,
+)
+
+
+def _overconfident(n=2000, c=4, scale=3.0, seed=0):
+    """Logits sampled from a calibrated model, then sharpened by *scale*."""
+    rng = np.random.default_rng(seed)
+    logits = rng.normal(0, 1.5, (n, c))
+    probs = softmax(logits)
+    labels = (rng.random(n)[:, None] > probs.cumsum(axis=1)).sum(axis=1)
+    return logits * scale, labels
+
+
+class TestTemperature:
+    def test_recovers_known_sharpening(self):
+        logits, labels = _overconfident(n=20000, scale=3.0)
+        assert fit_temperature(logits, labels) == pytest.approx(3.0, rel=0.05)
+
+    def test_fit_is_nll_minimum(self):
+        logits, labels = _overconfident(scale=2.0, seed=1)
+        t = fit_temperature(logits, labels)
+        grid = np.linspace(0.5, 5.0, 451)
+        best = grid[np.argmin([nll(logits, labels, g) for g in grid])]
+        assert t == pytest.approx(best, abs=0.011)
+
+    def test_separable_data_is_clamped(self):
+        logits = np.array([[5.0, 0.0], [0.0, 5.0]])
+        assert fit_temperature(logits, [0, 1]) == pytest.approx(0.01)
+
+    def test_temperature_improves_nll_and_keeps_predictions(self):
+        logits, labels = _overconfident(scale=3.0, seed=2)
+        t = fit_temperature(logits, labels)
+        summary = calibration_summary(logits, labels, t)
+        assert summary["nll_after"] < summary["nll_before"]
+        assert summary["ece_after"] < summary["ece_before"]
+        np.testing.assert_array_equal(softmax(logits, t).argmax(1), logits.argmax(1))
+
+    def test_mismatched_input_raises(self):
+        with pytest.raises(ValueError):
+            fit_temperature(np.zeros((3, 2)), [0, 1])
+
+
+class TestThresholdSweep:
+    def test_matches_loop(self):
+        logits, labels = _overconfident(n=500, seed=3)
+        probs = softmax(logits)
+        grid = threshold_grid(0.01)
+        sweep = threshold_sweep(probs, labels, grid)
+
+        conf, correct = probs.max(1), probs.argmax(1) == labels
+        for i, t in enumerate(grid):
+            mask = conf >= t
+            assert sweep.n_accepted[i] == mask.sum()
+            assert sweep.coverage[i] == pytest.approx(mask.mean())
+            if mask.any():
+                assert sweep.accuracy[i] == pytest.approx(correct[mask].mean())
+            else:
+                assert np.isnan(sweep.accuracy[i])
+
+    def test_threshold_is_inclusive(self):
+        probs = np.array([[0.6, 0.4], [0.4, 0.6]])
+        sweep = threshold_sweep(probs, [0, 0], np.array([0.6]))
+        assert sweep.n_accepted[0] == 2
+        assert sweep.accuracy[0] == pytest.approx(0.5)
+
+    def test_default_grid_is_dense(self):
+        grid = threshold_grid()
+        assert len(grid) == 1001 and grid[0] == 0.0 and grid[-1] == 1.0
+
+    def test_as_dict_is_json_friendly(self):
+        sweep = threshold_sweep(np.array([[0.9, 0.1]]), [0], np.array([0.5, 0.95]))
+        d = sweep.as_dict()
+        assert d["accuracy"] == [1.0, None]
+        assert d["n_total"] == 1
+
+
+class TestRecommendThreshold:
+    def test_lowest_threshold_reaching_target(self):
+        # Confidences 0.9 (right), 0.8 (right), 0.7 (wrong), 0.6 (right)
+        probs = np.array([[0.9, 0.1], [0.8, 0.2], [0.3, 0.7], [0.6, 0.4]])
+        labels = np.array([0, 0, 0, 0])
+        sweep = threshold_sweep(probs, labels, threshold_grid(0.05))
+        assert recommend_threshold(sweep, 1.0) == pytest.approx(0.75)
+        assert recommend_threshold(sweep, 0.75) == pytest.approx(0.0)
+
+    def test_unreachable_target_returns_none(self):
+        probs = np.array([[0.9, 0.1]])
+        sweep = threshold_sweep(probs, [1], threshold_grid(0.1))
+        assert recommend_threshold(sweep, 0.5) is None
@@ -18,6 +18,9 @@ from app.models.classifier import (
     DiseaseClassifier,
     PredictionResult,
     TopKPrediction,
+    build_architecture,
+    load_model_metadata,
+    preprocess,
 )
 
 
@@ -44,6 +47,9 @@ def _make_classifier_with_mock_logits(
     clf.confidence_threshold = confidence_threshold
     clf.top_k = min(top_k, len(CLASS_NAMES))
     clf.device = torch.device("cpu")
+    clf.precision = "fp32"
+    clf._cascade_model = None
+    clf.temperature = 1.0
 
     mock_model = MagicMock(spec=nn.Module)
     # Make the mock return a fixed logit tensor
@@ -209,3 +215,151 @@ class TestPredictionResult:
         assert result.top_probability == 0.85
         assert result.is_uncertain is False
         assert len(result.top_k) == 1
+
+
+# ---------------------------------------------------------------------------
+# Architectures and metadata
+# ---------------------------------------------------------------------------
+
+
+class TestArchitectures:
+    def test_student_checkpoint_round_trip(self, tmp_path) -> None:
+        """A mobilenet_v3_small state_dict loads into a matching classifier."""
+        student = build_architecture("mobilenet_v3_small")
+        path = tmp_path / "student.pt"
+        torch.save(student.state_dict(), path)
+
+        clf = DiseaseClassifier(str(path), architecture="mobilenet_v3_small", device="cpu")
+        for key, value in student.state_dict().items():
+            assert torch.equal(clf._model.state_dict()[key], value)
+        result = clf.predict(_make_solid_image())
+        assert len(result.top_k) == DEFAULT_TOP_K
+
+    def test_unknown_architecture_raises(self) -> None:
+        with pytest.raises(ValueError):
+            build_architecture("resnet1000")
+
+
+class TestTemperature:
+    def test_folded_temperature_matches_scaled_logits(self, tmp_path) -> None:
+        """Folding T into the head equals softmax(logits / T) of the raw checkpoint."""
+        torch.manual_seed(0)
+        student = build_architecture("mobilenet_v3_small").eval()
+        path = tmp_path / "student.pt"
+        torch.save(student.state_dict(), path)
+        batch = preprocess(_make_solid_image()).unsqueeze(0)
+        with torch.no_grad():
+            expected = torch.softmax(student(batch) / 2.5, dim=1).numpy()
+
+        clf = DiseaseClassifier(str(path), architecture="mobilenet_v3_small",
+                                device="cpu", precision="fp32", temperature=2.5)
+        np.testing.assert_allclose(clf.predict_proba_batch(batch), expected, rtol=1e-4, atol=1e-6)
+
+    def test_temperature_from_other_checkpoint_is_ignored(self, tmp_path) -> None:
+        torch.manual_seed(0)
+        student = build_architecture("mobilenet_v3_small").eval()
+        path = tmp_path / "student.pt"
+        torch.save(student.state_dict(), path)
+        batch = preprocess(_make_solid_image()).unsqueeze(0)
+        with torch.no_grad():
+            expected = torch.softmax(student(batch), dim=1).numpy()
+
+        clf = DiseaseClassifier(str(path), architecture="mobilenet_v3_small", device="cpu",
+                                precision="fp32", temperature=2.5, calibration_sha256="0" * 64)
+        assert clf.temperature == 1.0
+        np.testing.assert_allclose(clf.predict_proba_batch(batch), expected, rtol=1e-4, atol=1e-6)
+
+        matching = DiseaseClassifier(str(path), architecture="mobilenet_v3_small", device="cpu",
+                                     precision="fp32", temperature=2.5,
+                                     calibration_sha256=clf.checkpoint_sha256)
+        assert matching.temperature == 2.5
+
+    def test_non_positive_temperature_raises(self) -> None:
+        with pytest.raises(ValueError):
+            DiseaseClassifier(architecture="mobilenet_v3_small", device="cpu", temperature=0.0)
+
+
+class TestModelMetadata:
+    def test_stem_json_preferred_over_shared_file(self, tmp_path) -> None:
+        (tmp_path / "model_metadata.json").write_text('{"version": "shared"}')
+        (tmp_path / "student.json").write_text('{"version": "own"}')
+        assert load_model_metadata(str(tmp_path / "student.pt"))["version"] == "own"
+        assert load_model_metadata(str(tmp_path / "other.pt"))["version"] == "shared"
+
+    def test_missing_metadata_returns_none(self, tmp_path) -> None:
+        assert load_model_metadata(str(tmp_path / "model.pt")) is None
+
+
+# ---------------------------------------------------------------------------
+# Cascade
+# ---------------------------------------------------------------------------
+
+
+def _make_cascade_classifier(fast_logits: list[float], full_logits: list[float]) -> DiseaseClassifier:
+    clf = _make_classifier_with_mock_logits(full_logits)
+    fast = MagicMock(spec=nn.Module)
+    fast.return_value = torch.tensor([fast_logits], dtype=torch.float32)
+    clf._cascade_model = fast
+    clf.cascade_threshold = 0.90
+    clf.cascade_accept_classes = ("Healthy",)
+    return clf
+
+
+class TestCascade:
+    def test_confident_healthy_answered_by_fast_stage(self) -> None:
+        clf = _make_cascade_classifier([0.0, 10.0, 0.0, 0.0], [10.0, 0.0, 0.0, 0.0])
+        result = clf.predict(_make_solid_image())
+        assert result.stage == "fast"
+        assert result.top_class == "Healthy"
+        clf._model.assert_not_called()
+
+    def test_disease_prediction_is_escalated(self) -> None:
+        clf = _make_cascade_classifier([10.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 10.0])
+        result = clf.predict(_make_solid_image())
+        assert result.stage == "full"
+        assert result.top_class == CLASS_NAMES[3]
+
+    def test_low_confidence_healthy_is_escalated(self) -> None:
+        clf = _make_cascade_classifier([1.0, 1.5, 1.0, 1.0], [0.0, 10.0, 0.0, 0.0])
+        assert clf.predict(_make_solid_image()).stage == "full"
+
+    def test_without_cascade_stage_is_full(self) -> None:
+        clf = _make_classifier_with_mock_logits([0.0, 10.0, 0.0, 0.0])
+        assert clf.predict(_make_solid_image()).stage == "full"
+
+
+class TestBatchProbabilities:
+    def test_batch_matches_single_image_predict(self) -> None:
+        torch.manual_seed(0)
+        clf = DiseaseClassifier(None, device="cpu", precision="fp32")
+        images = [_make_solid_image((100, 150, 50)), _make_solid_image((150, 90, 30))]
+        batch = torch.stack([preprocess(img) for img in images])
+        probs = clf.predict_proba_batch(batch)
+        assert probs.shape == (2, len(CLASS_NAMES))
+        for img, row in zip(images, probs):
+            single = clf.predict(img)
+            assert row.max() == pytest.approx(single.top_probability, abs=1e-5)
+
+
+class TestEmbeddings:
+    def test_forward_features_single_pass_matches_predict(self) -> None:
+        torch.manual_seed(0)
+        clf = DiseaseClassifier(None, device="cpu", precision="fp32")
+        batch = torch.stack([preprocess(_make_solid_image()), preprocess(_make_solid_image((150, 90, 30)))])
+        out = clf.forward_features(batch)
+        assert out["pooled"].shape == (2, 1280)
+        assert out["head"].shape == (2, 512)
+        assert (out["head"] >= 0).all()  # ReLU activation of the head
+        np.testing.assert_allclose(out["probs"], clf.predict_proba_batch(batch), atol=1e-5)
+
+    def test_predict_with_embedding(self) -> None:
+        clf = DiseaseClassifier(None, architecture="mobilenet_v3_small", device="cpu", precision="fp32")
+        result, embedding = clf.predict_with_embedding(_make_solid_image(), layer="head")
+        assert isinstance(result, PredictionResult) and result.stage == "full"
+        assert embedding.shape == (1024,)
+        assert result.top_probability == pytest.approx(clf.predict(_make_solid_image()).top_probability, abs=1e-5)
+
+    def test_unknown_layer_raises(self) -> None:
+        clf = _make_classifier_with_mock_logits([1.0, 0.0, 0.0, 0.0])
+        with pytest.raises(ValueError):
+            clf.predict_with_embedding(_make_solid_image(), layer="logits")
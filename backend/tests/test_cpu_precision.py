@@ -0,0 +1,65 @@
+"""
+Tests for the opt-in CPU bf16 precision mode.
+"""
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import pytest
+import torch
+import torch.nn as nn
+
+from app.utils import cpu_precision
+from app.utils.cpu_precision import (
+    autocast_context,
+    prepare_input,
+    prepare_model,
+    resolve_cpu_precision,
+)
+
+
+class TestResolvePrecision:
+    def test_fp32_is_default(self, monkeypatch):
+        monkeypatch.delenv("CPU_PRECISION", raising=False)
+        assert resolve_cpu_precision(None) == "fp32"
+
+    def test_env_var_is_read(self, monkeypatch):
+        monkeypatch.setenv("CPU_PRECISION", "BF16")
+        with patch.object(cpu_precision, "cpu_bf16_supported", return_value=True):
+            assert resolve_cpu_precision(None) == "bf16"
+
+    @pytest.mark.parametrize("requested", ["bf16", "auto"])
+    def test_falls_back_without_hardware_support(self, requested):
+        with patch.object(cpu_precision, "cpu_bf16_supported", return_value=False):
+            assert resolve_cpu_precision(requested) == "fp32"
+
+    def test_non_cpu_device_stays_fp32(self):
+        with patch.object(cpu_precision, "cpu_bf16_supported", return_value=True):
+            assert resolve_cpu_precision("bf16", "cuda") == "fp32"
+
+    def test_unknown_precision_raises(self):
+        with pytest.raises(ValueError):
+            resolve_cpu_precision("fp16")
+
+
+class TestBf16Execution:
+    def test_channels_last_autocast_matches_fp32(self):
+        torch.manual_seed(0)
+        model = nn.Sequential(nn.Conv2d(3, 8, 3), nn.ReLU(), nn.AdaptiveAvgPool2d(1),
+                              nn.Flatten(), nn.Linear(8, 4)).eval()
+        x = torch.randn(2, 3, 16, 16)
+        with torch.no_grad():
+            ref = model(x)
+            bf16_model = prepare_model(model, "bf16")
+            xin = prepare_input(x, "bf16")
+            assert xin.is_contiguous(memory_format=torch.channels_last)
+            with autocast_context("bf16"):
+                out = bf16_model(xin)
+        assert out.dtype == torch.bfloat16
+        assert torch.allclose(out.float(), ref, atol=5e-2)
+
+    def test_fp32_is_a_no_op(self):
+        x = torch.randn(1, 3, 4, 4)
+        assert prepare_input(x, "fp32") is x
+        with autocast_context("fp32"):
+            assert torch.mm(torch.ones(2, 2), torch.ones(2, 2)).dtype == torch.float32
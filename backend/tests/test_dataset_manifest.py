@@ -0,0 +1,151 @@
+"""
+Tests for manifest-driven dataset splits.
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils.dataset_manifest import (
+    ManifestDataset,
+    assign_splits,
+    assign_units,
+    build_manifest,
+    materialize,
+    read_manifest,
+    resplit,
+    split_bounds,
+    split_samples,
+    write_manifest,
+)
+
+CLASSES = ["blight", "healthy"]
+
+
+def _make_source(tmp_path, per_class=10):
+    """dataset_processed-style folders of distinct tiny images."""
+    root = tmp_path / "source"
+    rng = np.random.default_rng(0)
+    for cls in CLASSES:
+        (root / cls).mkdir(parents=True)
+        for i in range(per_class):
+            Image.fromarray(rng.integers(0, 256, (8, 8, 3), dtype=np.uint8)).save(root / cls / f"{i}.png")
+    return root
+
+
+class TestAssignUnits:
+    @pytest.mark.parametrize("total", [0, 3, 7, 20, 101])
+    def test_unique_keys_match_slicing(self, total):
+        items = list(range(total))
+        bounds = split_bounds(total, 0.7, 0.15)
+        bins = assign_units(items, items, bounds, ("train", "val", "test"))
+        assert bins == {"train": items[:bounds[0]], "val": items[bounds[0]:bounds[1]],
+                        "test": items[bounds[1]:]}
+
+    def test_zero_width_bins_send_everything_last(self):
+        # int(3 / 5) == 0: like the original fold slicing, all items go to the last bin
+        bins = assign_units([0, 1, 2], [0, 1, 2], [0, 0, 0, 0], range(5))
+        assert bins[4] == [0, 1, 2]
+
+    def test_groups_stay_together_and_honour_earlier_placement(self):
+        assigned = {"g": "test"}
+        bins = assign_units(["a", "b", "c", "d"], ["x", "g", "x", "y"], [2, 4], ("train", "val", "test"),
+                            assigned)
+        assert bins == {"train": ["a", "c"], "val": ["d"], "test": ["b"]}
+        assert assigned["x"] == "train"
+
+
+class TestAssignSplits:
+    def test_matches_seeded_shuffle_and_slice(self):
+        labels = [0] * 20 + [1] * 13
+        splits = assign_splits(labels, list(range(len(labels))), 0.7, 0.15, seed=42)
+        rng = random.Random(42)
+        for label, count in ((0, 20), (1, 13)):
+            files = [i for i, lab in enumerate(labels) if lab == label]
+            rng.shuffle(files)
+            train_end, val_end = split_bounds(count, 0.7, 0.15)
+            assert [splits[i] for i in files] == (["train"] * train_end + ["val"] * (val_end - train_end)
+                                                  + ["test"] * (count - val_end))
+
+    def test_group_spanning_classes_shares_a_split(self):
+        labels = [0] * 10 + [1] * 10
+        groups = list(range(20))
+        groups[3] = groups[15] = 3
+        for seed in range(10):
+            splits = assign_splits(labels, groups, 0.7, 0.15, seed)
+            assert splits[3] == splits[15]
+
+
+class TestManifest:
+    def test_build_round_trip_and_dataset(self, tmp_path):
+        source = _make_source(tmp_path)
+        manifest = build_manifest(source, CLASSES, 0.7, 0.15, seed=42, workers=2)
+        out = tmp_path / "meta" / "splits.json"
+        out.parent.mkdir()
+        write_manifest(out, manifest)
+        assert json.loads(out.read_text())["root"] == "../source"
+
+        loaded = read_manifest(out)
+        train = ManifestDataset(loaded, "train")
+        assert train.classes == CLASSES
+        assert len(train) == 14 and train.targets.count(0) == 7
+        image, label = train[0]
+        assert image.size == (8, 8) and label == train.samples[0][1]
+
+        samples, classes = split_samples(out, "test")
+        assert classes == CLASSES and len(samples) == 4
+        assert all(path.exists() and classes[label] == name for path, label, name in samples)
+        assert len(ManifestDataset(out)) == 20
+
+    def test_identical_content_and_near_duplicates_are_grouped(self, tmp_path):
+        source = _make_source(tmp_path)
+        (source / "healthy" / "copy.png").write_bytes((source / "blight" / "0.png").read_bytes())
+        group_of = {str((source / "blight" / "1.png").resolve()): 0,
+                    str((source / "healthy" / "1.png").resolve()): 0}
+        manifest = build_manifest(source, CLASSES, 0.7, 0.15, seed=0, group_of=group_of, workers=2)
+        idx = {p: i for i, p in enumerate(manifest["paths"])}
+        groups, splits = manifest["groups"], manifest["splits"]
+        assert groups[idx["blight/0.png"]] == groups[idx["healthy/copy.png"]]
+        assert groups[idx["blight/1.png"]] == groups[idx["healthy/1.png"]]
+        assert len(set(groups)) == len(groups) - 2
+        for seed in range(20):
+            splits = resplit(manifest, seed, 0.5, 0.25)["splits"]
+            assert splits[idx["blight/0.png"]] == splits[idx["healthy/copy.png"]]
+            assert splits[idx["blight/1.png"]] == splits[idx["healthy/1.png"]]
+
+    def test_resplit_only_changes_splits(self, tmp_path):
+        manifest = build_manifest(_make_source(tmp_path), CLASSES, 0.7, 0.15, seed=42, workers=2)
+        other = resplit(manifest, seed=7, train_ratio=0.5, val_ratio=0.25)
+        assert other["splits"] != manifest["splits"]
+        assert other["splits"].count("train") == 10
+        assert other["seed"] == 7 and manifest["seed"] == 42
+        assert {k: v for k, v in other.items() if k not in ("splits", "seed", "ratios")} == \
+            {k: v for k, v in manifest.items() if k not in ("splits", "seed", "ratios")}
+
+    def test_materialize_uses_hardlinks(self, tmp_path):
+        source = _make_source(tmp_path, per_class=4)
+        manifest = build_manifest(source, CLASSES, 0.5, 0.25, seed=1, workers=1)
+        linked = materialize(manifest, tmp_path / "dataset")
+        assert linked == 8
+        for path, label, split in zip(manifest["paths"], manifest["labels"], manifest["splits"]):
+            target = tmp_path / "dataset" / split / CLASSES[label] / os.path.basename(path)
+            assert os.path.samefile(target, source / path)
+
+    def test_materialize_after_resplit_removes_stale_files(self, tmp_path):
+        source = _make_source(tmp_path)
+        manifest = build_manifest(source, CLASSES, 0.5, 0.25, seed=1, workers=1)
+        materialize(manifest, tmp_path / "dataset")
+        materialize(resplit(manifest, 2, 0.5, 0.25), tmp_path / "dataset")
+        files = [f for f in (tmp_path / "dataset").rglob("*") if f.is_file()]
+        assert len(files) == 20
+        assert len({(f.parent.name, f.name) for f in files}) == 20
+
+    def test_unknown_version_raises(self, tmp_path):
+        (tmp_path / "m.json").write_text(json.dumps({"version": 99, "root": "."}))
+        with pytest.raises(ValueError):
+            read_manifest(tmp_path / "m.json")
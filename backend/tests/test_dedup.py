@@ -0,0 +1,125 @@
+"""
+Tests for batched near-duplicate detection.
+"""
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils.dedup import (
+    connected_groups,
+    cosine_pairs,
+    group_members,
+    hamming,
+    hamming_pairs,
+    load_groups,
+    phash_batch,
+    phash_thumbnail,
+    popcount,
+    write_groups,
+)
+
+
+def _brute_force_hamming(hashes, threshold):
+    found = set()
+    for i in range(len(hashes)):
+        for j in range(i + 1, len(hashes)):
+            if bin(int(hashes[i]) ^ int(hashes[j])).count("1") <= threshold:
+                found.add((i, j))
+    return found
+
+
+class TestPHash:
+    def test_matches_reference_dct(self):
+        """Same bits as imagehash.phash: DCT along axis 0 then 1, 8×8 block vs median."""
+        thumb = np.random.default_rng(0).uniform(0, 255, (32, 32))
+        n = np.arange(32)
+        basis = 2 * np.cos(np.pi * n[:, None] * (2 * n[None, :] + 1) / 64)
+        dct = basis @ (basis @ thumb).T  # axis 0, then axis 1 (transposed)
+        low = dct.T[:8, :8].ravel()
+        expected = int("".join("1" if b else "0" for b in low > np.median(low)), 2)
+        assert int(phash_batch(thumb[None])[0]) == expected
+
+    def test_resized_copy_is_near_duplicate(self, tmp_path):
+        rng = np.random.default_rng(1)
+        base = Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).resize((256, 256))
+        base.save(tmp_path / "a.png")
+        base.resize((180, 180)).save(tmp_path / "b.png")
+        Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)).save(tmp_path / "c.png")
+        h = phash_batch(np.stack([phash_thumbnail(tmp_path / f"{n}.png") for n in "abc"]))
+        assert hamming(h[0], h[1]) <= 4
+        assert hamming(h[0], h[2]) > 10
+
+    def test_popcount(self):
+        x = np.array([0, 1, 0xFF, 2**64 - 1], dtype=np.uint64)
+        np.testing.assert_array_equal(popcount(x), [0, 1, 8, 64])
+
+
+class TestHammingPairs:
+    @pytest.mark.parametrize("threshold", [0, 2, 5])
+    def test_multi_index_matches_brute_force(self, threshold):
+        rng = np.random.default_rng(threshold)
+        base = rng.integers(0, 2**63, 40, dtype=np.uint64)
+        # Plant near-duplicates by flipping 0–6 random bits of each base hash.
+        noisy = base.copy()
+        for i in range(len(noisy)):
+            for bit in rng.choice(64, rng.integers(0, 7), replace=False):
+                noisy[i] ^= np.uint64(1) << np.uint64(bit)
+        hashes = np.concatenate([base, noisy])
+        pairs, dist = hamming_pairs(hashes, threshold)
+        assert {tuple(p) for p in pairs.tolist()} == _brute_force_hamming(hashes, threshold)
+        assert (np.diff(dist) >= 0).all()
+
+    def test_no_pairs(self):
+        pairs, dist = hamming_pairs(np.array([0, 2**64 - 1], dtype=np.uint64), 3)
+        assert pairs.shape == (0, 2) and dist.shape == (0,)
+
+
+class TestCosinePairs:
+    def test_tiled_matches_dense(self):
+        x = np.random.default_rng(0).normal(size=(50, 4))
+        pairs, sims = cosine_pairs(x, threshold=0.9, block=7)
+        xn = x / np.linalg.norm(x, axis=1, keepdims=True)
+        s = np.triu(xn @ xn.T, k=1)
+        expected = {tuple(p) for p in np.argwhere(s >= 0.9).tolist()}
+        assert {tuple(p) for p in pairs.tolist()} == expected
+        assert (np.diff(sims) <= 0).all()
+
+
+class TestGroups:
+    def test_chain_is_one_group(self):
+        pairs = np.array([[3, 4], [0, 1], [2, 3], [1, 2]])
+        groups = connected_groups(6, pairs)
+        np.testing.assert_array_equal(groups, [0, 0, 0, 0, 0, 5])
+
+    def test_matches_graph_search(self):
+        rng = np.random.default_rng(0)
+        n = 200
+        pairs = rng.integers(0, n, (150, 2))
+        groups = connected_groups(n, pairs)
+        adj = {i: set() for i in range(n)}
+        for a, b in pairs:
+            adj[a].add(b)
+            adj[b].add(a)
+        for start in range(n):
+            seen, stack = {start}, [start]
+            while stack:
+                for nxt in adj[stack.pop()] - seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+            assert groups[start] == min(seen)
+
+    def test_group_members_largest_first(self):
+        groups = connected_groups(6, np.array([[0, 1], [2, 3], [3, 4]]))
+        members = group_members(groups)
+        assert [m.tolist() for m in members] == [[2, 3, 4], [0, 1]]
+
+    def test_groups_file_round_trip(self, tmp_path):
+        a, b, c = (tmp_path / n for n in ("a.jpg", "b.jpg", "c.jpg"))
+        write_groups(tmp_path / "dups.json", [[a, b], [c]], extra={"threshold": 3})
+        assert json.loads((tmp_path / "dups.json").read_text())["threshold"] == 3
+        mapping = load_groups(tmp_path / "dups.json")
+        assert mapping[str(a.resolve())] == mapping[str(b.resolve())] != mapping[str(c.resolve())]
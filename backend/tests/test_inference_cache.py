@@ -0,0 +1,145 @@
+"""
+Tests for the shared inference-result cache.
+"""
+from __future__ import annotations
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.utils.inference_cache import InferenceCache, manifest_hash, transform_id
+
+
+def _make_split(tmp_path, n=4):
+    samples = []
+    for i in range(n):
+        path = tmp_path / f"img{i}.png"
+        Image.new("RGB", (8, 8), (i * 40, 100, 50)).save(path)
+        samples.append((str(path), i % 2))
+    return samples
+
+
+def _checkpoint(tmp_path, payload=b"weights-v1"):
+    path = tmp_path / "model.pt"
+    path.write_bytes(payload)
+    return path
+
+
+class _Counter:
+    """compute() stand-in that records how often inference actually ran."""
+
+    def __init__(self, logits):
+        self.logits = logits
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.logits
+
+
+class TestInferenceCache:
+    def test_second_call_is_served_from_cache(self, tmp_path):
+        samples = _make_split(tmp_path)
+        ckpt = _checkpoint(tmp_path)
+        logits = np.arange(8, dtype=np.float32).reshape(4, 2)
+        compute = _Counter(logits)
+        cache = InferenceCache(root=tmp_path / "cache")
+
+        first = cache.get_or_compute(ckpt, samples, "tf", compute, ["a", "b"])
+        second = cache.get_or_compute(ckpt, samples, "tf", compute, ["a", "b"])
+
+        assert compute.calls == 1
+        assert not first.cached and second.cached
+        np.testing.assert_array_equal(second.logits, logits)
+        np.testing.assert_array_equal(second.labels, [0, 1, 0, 1])
+        assert second.class_names == ["a", "b"]
+
+    def test_results_are_realigned_to_caller_order(self, tmp_path):
+        samples = _make_split(tmp_path)
+        ckpt = _checkpoint(tmp_path)
+        logits = np.eye(4, dtype=np.float32)
+        cache = InferenceCache(root=tmp_path / "cache")
+        cache.get_or_compute(ckpt, samples, "tf", lambda: logits)
+
+        reordered = samples[::-1]
+        hit = cache.get_or_compute(ckpt, reordered, "tf", lambda: pytest.fail("recomputed"))
+        assert hit.paths == [s[0] for s in reordered]
+        np.testing.assert_array_equal(hit.preds, [3, 2, 1, 0])
+
+    @pytest.mark.parametrize("change", ["checkpoint", "image", "transform"])
+    def test_changed_inputs_miss(self, tmp_path, change):
+        samples = _make_split(tmp_path)
+        ckpt = _checkpoint(tmp_path)
+        compute = _Counter(np.zeros((4, 2), dtype=np.float32))
+        cache = InferenceCache(root=tmp_path / "cache")
+        cache.get_or_compute(ckpt, samples, "tf", compute)
+
+        tf = "tf"
+        if change == "checkpoint":
+            ckpt.write_bytes(b"weights-v2")
+        elif change == "image":
+            st = os.stat(samples[0][0])
+            os.utime(samples[0][0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        else:
+            tf = "tf-other"
+        cache.get_or_compute(ckpt, samples, tf, compute)
+        assert compute.calls == 2
+
+    def test_disabled_cache_never_writes(self, tmp_path):
+        samples = _make_split(tmp_path)
+        ckpt = _checkpoint(tmp_path)
+        compute = _Counter(np.zeros((4, 2), dtype=np.float32))
+        cache = InferenceCache(root=tmp_path / "cache", enabled=False)
+        cache.get_or_compute(ckpt, samples, "tf", compute)
+        cache.get_or_compute(ckpt, samples, "tf", compute)
+        assert compute.calls == 2
+        assert not (tmp_path / "cache").exists()
+
+    def test_corrupt_entry_is_recomputed(self, tmp_path):
+        samples = _make_split(tmp_path)
+        ckpt = _checkpoint(tmp_path)
+        compute = _Counter(np.zeros((4, 2), dtype=np.float32))
+        cache = InferenceCache(root=tmp_path / "cache")
+        cache.get_or_compute(ckpt, samples, "tf", compute)
+        cache.path(cache.key(ckpt, samples, "tf")).write_bytes(b"truncated")
+        cache.get_or_compute(ckpt, samples, "tf", compute)
+        assert compute.calls == 2
+
+    def test_row_count_mismatch_raises(self, tmp_path):
+        samples = _make_split(tmp_path)
+        cache = InferenceCache(root=tmp_path / "cache")
+        with pytest.raises(ValueError):
+            cache.get_or_compute(_checkpoint(tmp_path), samples, "tf",
+                                 lambda: np.zeros((3, 2), dtype=np.float32))
+
+    def test_probs_are_softmax_of_logits(self, tmp_path):
+        samples = _make_split(tmp_path, n=2)
+        logits = np.array([[2.0, 0.0], [0.0, 0.0]], dtype=np.float32)
+        result = InferenceCache(root=tmp_path / "cache").get_or_compute(
+            _checkpoint(tmp_path), samples, "tf", lambda: logits)
+        np.testing.assert_allclose(result.probs.sum(axis=1), 1.0, rtol=1e-6)
+        np.testing.assert_allclose(result.confidences[1], 0.5, rtol=1e-6)
+
+
+class TestKeys:
+    def test_manifest_hash_ignores_order(self, tmp_path):
+        samples = _make_split(tmp_path)
+        assert manifest_hash(samples) == manifest_hash(samples[::-1])
+
+    def test_manifest_hash_depends_on_labels(self, tmp_path):
+        samples = _make_split(tmp_path)
+        relabelled = [(p, 1 - y) for p, y in samples]
+        assert manifest_hash(samples) != manifest_hash(relabelled)
+
+    def test_transform_id_matches_for_equal_pipelines(self):
+        from torchvision import transforms
+
+        def build():
+            return transforms.Compose([
+                transforms.Resize((224, 224)),
+                transforms.ToTensor(),
+                transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+            ])
+        assert transform_id(build()) == transform_id(build())
@@ -0,0 +1,174 @@
+"""
+Tests for the shared vectorised metrics module.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.utils.metrics import (
+    CalibrationAccumulator,
+    ConfusionAccumulator,
+    MetricsAccumulator,
+    average_precision,
+    bootstrap_ci,
+    bootstrap_confusions,
+    compute_metrics,
+    confusion_matrix,
+    expected_calibration_error,
+    format_report,
+    per_class_metrics,
+    precision_recall_curve,
+    roc_auc,
+    roc_curve,
+)
+
+
+def _predictions(n=600, c=4, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, c, n)
+    probs = rng.dirichlet(np.ones(c), n)
+    probs[np.arange(n), y] += 0.6
+    probs /= probs.sum(axis=1, keepdims=True)
+    return y, probs
+
+
+def _loop_confusion(y_true, y_pred, c):
+    cm = np.zeros((c, c), dtype=int)
+    for t, p in zip(y_true, y_pred):
+        cm[t, p] += 1
+    return cm
+
+
+class TestConfusionMetrics:
+    def test_confusion_matches_loop(self):
+        y, probs = _predictions()
+        pred = probs.argmax(axis=1)
+        np.testing.assert_array_equal(confusion_matrix(y, pred, 4), _loop_confusion(y, pred, 4))
+
+    def test_per_class_metrics_known_values(self):
+        cm = np.array([[8, 2], [1, 9]])
+        m = per_class_metrics(cm)
+        np.testing.assert_allclose(m["precision"], [8 / 9, 9 / 11])
+        np.testing.assert_allclose(m["recall"], [0.8, 0.9])
+        np.testing.assert_array_equal(m["support"], [10, 10])
+
+    def test_empty_class_gives_zero_not_nan(self):
+        out = compute_metrics([0, 0, 1], [0, 0, 1], 3)
+        assert out["per_class_f1"][2] == 0.0
+        assert out["accuracy"] == pytest.approx(1.0)
+
+    def test_stacked_matrices(self):
+        cms = np.stack([np.eye(3, dtype=int) * 5, np.ones((3, 3), dtype=int)])
+        f1 = per_class_metrics(cms)["f1"]
+        assert f1.shape == (2, 3)
+        np.testing.assert_allclose(f1[0], 1.0)
+
+    def test_format_report_lists_every_class(self):
+        report = format_report(np.array([[3, 1], [0, 4]]), ["Healthy", "Blight"])
+        assert "Healthy" in report and "Blight" in report and "overall accuracy" in report
+
+
+class TestCurves:
+    def test_roc_auc_equals_mann_whitney(self):
+        y, probs = _predictions()
+        pos, neg = probs[y == 1, 1], probs[y != 1, 1]
+        expected = (pos[:, None] > neg[None, :]).mean() + 0.5 * (pos[:, None] == neg[None, :]).mean()
+        assert roc_auc(y == 1, probs[:, 1]) == pytest.approx(expected)
+
+    def test_roc_curve_endpoints_and_ties(self):
+        fpr, tpr, thr = roc_curve([0, 1, 1, 0], [0.5, 0.5, 0.9, 0.1])
+        assert (fpr[0], tpr[0]) == (0.0, 0.0) and (fpr[-1], tpr[-1]) == (1.0, 1.0)
+        assert np.isinf(thr[0]) and len(thr) == len(fpr) == 4   # tie collapsed into one point
+
+    def test_average_precision_matches_definition(self):
+        y, probs = _predictions(seed=1)
+        s, pos = probs[:, 2], y == 2
+        order = np.argsort(-s)
+        hits = pos[order]
+        precision_at_k = np.cumsum(hits) / np.arange(1, len(hits) + 1)
+        assert average_precision(pos, s) == pytest.approx((precision_at_k * hits).sum() / hits.sum())
+
+    def test_pr_curve_shape(self):
+        precision, recall, thr = precision_recall_curve([1, 0, 1, 1], [0.9, 0.8, 0.4, 0.3])
+        assert precision[-1] == 1.0 and recall[-1] == 0.0
+        assert len(thr) == len(precision) - 1
+        assert np.all(np.diff(recall) <= 0)
+
+    def test_single_class_auc_is_nan(self):
+        assert np.isnan(roc_auc([1, 1, 1], [0.2, 0.5, 0.9]))
+
+
+class TestCalibration:
+    def test_perfectly_calibrated_bins(self):
+        # Two predictions at 0.75 confidence, one of two correct per bin → |0.5 − 0.75|
+        probs = np.array([[0.75, 0.25], [0.75, 0.25]])
+        assert expected_calibration_error(probs, [0, 1]) == pytest.approx(0.25)
+
+    def test_streaming_equals_batch(self):
+        y, probs = _predictions()
+        acc = CalibrationAccumulator()
+        for i in range(0, len(y), 97):
+            acc.update(probs[i:i + 97], y[i:i + 97])
+        assert acc.ece() == pytest.approx(expected_calibration_error(probs, y))
+
+
+class TestBootstrap:
+    def test_replicates_have_n_samples(self):
+        y, probs = _predictions(n=200)
+        cms = bootstrap_confusions(y, probs.argmax(axis=1), 4, n_boot=50, max_block=1000)
+        assert cms.shape == (50, 4, 4)
+        assert (cms.sum(axis=(1, 2)) == 200).all()
+
+    def test_block_size_does_not_change_draws(self):
+        y, probs = _predictions(n=300)
+        pred = probs.argmax(axis=1)
+        small = bootstrap_confusions(y, pred, 4, n_boot=40, seed=7, max_block=300 * 3)
+        large = bootstrap_confusions(y, pred, 4, n_boot=40, seed=7, max_block=300 * 40)
+        np.testing.assert_array_equal(small, large)
+
+    def test_matches_loop_over_replicates(self):
+        y, probs = _predictions(n=150)
+        pred = probs.argmax(axis=1)
+        cms = bootstrap_confusions(y, pred, 4, n_boot=5, seed=11)
+        rng = np.random.default_rng(11)
+        idx = rng.integers(0, 150, size=(5, 150))
+        for b in range(5):
+            np.testing.assert_array_equal(cms[b], _loop_confusion(y[idx[b]], pred[idx[b]], 4))
+
+    def test_interval_contains_point_and_is_reproducible(self):
+        y, probs = _predictions()
+        pred = probs.argmax(axis=1)
+        a = bootstrap_ci(y, pred, 4, n_boot=500, seed=3)
+        b = bootstrap_ci(y, pred, 4, n_boot=500, seed=3)
+        assert a == b
+        for key in ("accuracy", "macro_f1"):
+            assert a[key]["low"] <= a[key]["point"] <= a[key]["high"]
+        assert len(a["per_class_recall"]["low"]) == 4
+
+    def test_perfect_predictions_have_zero_width(self):
+        y = np.repeat(np.arange(3), 20)
+        ci = bootstrap_ci(y, y, 3, n_boot=200)
+        assert ci["accuracy"]["low"] == ci["accuracy"]["high"] == pytest.approx(1.0)
+
+
+class TestStreaming:
+    def test_confusion_accumulator_matches_batch(self):
+        y, probs = _predictions()
+        pred = probs.argmax(axis=1)
+        acc = ConfusionAccumulator(4)
+        for i in range(0, len(y), 64):
+            acc.update(y[i:i + 64], pred[i:i + 64])
+        assert acc.metrics() == compute_metrics(y, pred, 4)
+
+    def test_metrics_accumulator_auc_close_to_exact(self):
+        y, probs = _predictions(n=2000)
+        acc = MetricsAccumulator(4)
+        for i in range(0, len(y), 250):
+            acc.update(y[i:i + 250], probs[i:i + 250])
+        out = acc.result()
+        exact = [roc_auc(y == c, probs[:, c]) for c in range(4)]
+        np.testing.assert_allclose(out["per_class_roc_auc"], exact, atol=2e-3)
+        exact_ap = [average_precision(y == c, probs[:, c]) for c in range(4)]
+        np.testing.assert_allclose(out["per_class_average_precision"], exact_ap, atol=5e-3)
+        assert out["ece"] == pytest.approx(expected_calibration_error(probs, y))
@@ -0,0 +1,89 @@
+"""
+Tests for the memory-mapped packed image dataset.
+"""
+from __future__ import annotations
+
+import json
+import pickle
+
+import numpy as np
+import pytest
+import torch
+from torchvision import transforms
+
+from app.utils.packed_dataset import (
+    FORMAT_VERSION,
+    INDEX_NAME,
+    PackedImageDataset,
+    packed_transform,
+    shard_name,
+)
+
+
+def _write_split(root, counts=(3, 2), size=8):
+    """Write a packed split whose pixel values encode the global image index."""
+    root.mkdir(parents=True, exist_ok=True)
+    shards, labels, paths = [], [], []
+    idx = 0
+    for s, n in enumerate(counts):
+        arr = np.zeros((n, size, size, 3), dtype=np.uint8)
+        for i in range(n):
+            arr[i] = idx
+            labels.append(idx % 2)
+            paths.append(f"img_{idx}.jpg")
+            idx += 1
+        np.save(root / shard_name(s), arr)
+        shards.append({"file": shard_name(s), "count": n})
+    index = {
+        "version": FORMAT_VERSION, "image_size": size, "classes": ["a", "b"],
+        "shards": shards, "labels": labels, "paths": paths,
+    }
+    (root / INDEX_NAME).write_text(json.dumps(index))
+    return root
+
+
+class TestPackedImageDataset:
+    def test_items_span_shards(self, tmp_path):
+        ds = PackedImageDataset(_write_split(tmp_path / "train"))
+        assert len(ds) == 5
+        assert ds.classes == ["a", "b"]
+        assert ds.targets == [0, 1, 0, 1, 0]
+        for i in range(5):
+            image, label = ds[i]
+            assert image.shape == (3, 8, 8) and image.dtype == torch.uint8
+            assert int(image[0, 0, 0]) == i
+            assert label == i % 2
+        assert int(ds[-1][0][0, 0, 0]) == 4
+
+    def test_pickles_without_mapped_arrays(self, tmp_path):
+        ds = PackedImageDataset(_write_split(tmp_path / "train"))
+        ds[0]  # map the first shard
+        clone = pickle.loads(pickle.dumps(ds))
+        assert clone._shards == {}
+        assert int(clone[3][0][0, 0, 0]) == 3
+
+    def test_count_mismatch_raises(self, tmp_path):
+        root = _write_split(tmp_path / "train")
+        index = json.loads((root / INDEX_NAME).read_text())
+        index["labels"].append(0)
+        index["paths"].append("extra.jpg")
+        (root / INDEX_NAME).write_text(json.dumps(index))
+        with pytest.raises(ValueError):
+            PackedImageDataset(root)
+
+    def test_missing_index_raises(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            PackedImageDataset(tmp_path)
+
+
+class TestPackedTransform:
+    def test_to_tensor_replaced_by_dtype_conversion(self):
+        pipeline = transforms.Compose([
+            transforms.Resize((4, 4)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.5, 0.5, 0.5], [0.5, 0.5, 0.5]),
+        ])
+        tf = packed_transform(pipeline)
+        out = tf(torch.full((3, 8, 8), 255, dtype=torch.uint8))
+        assert out.shape == (3, 4, 4) and out.dtype == torch.float32
+        assert torch.allclose(out, torch.ones_like(out))
@@ -0,0 +1,95 @@
+"""
+Tests for the batched robustness perturbations.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image, ImageEnhance, ImageFilter
+
+from app.utils.perturbations import (
+    BASELINE,
+    KINDS,
+    adjust_brightness,
+    center_crop_resize,
+    default_suite,
+    gaussian_blur,
+    gaussian_noise,
+    normalize,
+    random_rotation,
+    severity_sweep,
+)
+
+
+def _batch(n=3, size=32) -> torch.Tensor:
+    return torch.rand(n, 3, size, size, generator=torch.Generator().manual_seed(0))
+
+
+class TestPerturbations:
+    @pytest.mark.parametrize("kind", sorted(KINDS))
+    def test_shape_and_range_preserved(self, kind):
+        x = _batch()
+        severity = {"blur": 2.0, "brightness": 0.5, "noise": 0.2,
+                    "rotation": 30.0, "crop": 0.6}[kind]
+        out = KINDS[kind](x, severity, torch.Generator().manual_seed(1))
+        assert out.shape == x.shape
+        assert out.min() >= 0.0 and out.max() <= 1.0
+
+    @pytest.mark.parametrize("fn,neutral", [
+        (gaussian_blur, 0.0), (adjust_brightness, 1.0), (gaussian_noise, 0.0),
+        (random_rotation, 0.0), (center_crop_resize, 1.0),
+    ])
+    def test_neutral_severity_is_identity(self, fn, neutral):
+        x = _batch()
+        assert torch.allclose(fn(x, neutral, None), x)
+
+    def test_brightness_matches_pil(self):
+        img = Image.fromarray(np.random.default_rng(0).integers(0, 256, (16, 16, 3), dtype=np.uint8))
+        expected = np.asarray(ImageEnhance.Brightness(img).enhance(0.4), dtype=np.float32) / 255
+        x = torch.from_numpy(np.asarray(img, dtype=np.float32) / 255).permute(2, 0, 1)[None]
+        got = adjust_brightness(x, 0.4)[0].permute(1, 2, 0).numpy()
+        assert np.abs(got - expected).max() <= 1.0 / 255 + 1e-6
+
+    def test_blur_close_to_pil(self):
+        rng = np.random.default_rng(0)
+        img = Image.fromarray(rng.integers(0, 256, (48, 48, 3), dtype=np.uint8))
+        expected = np.asarray(img.filter(ImageFilter.GaussianBlur(2)), dtype=np.float32) / 255
+        x = torch.from_numpy(np.asarray(img, dtype=np.float32) / 255).permute(2, 0, 1)[None]
+        got = gaussian_blur(x, 2.0)[0].permute(1, 2, 0).numpy()
+        # Interior only: PIL and torchvision pad borders differently.
+        assert np.abs(got[8:-8, 8:-8] - expected[8:-8, 8:-8]).mean() < 0.02
+
+    def test_random_perturbations_reproducible_and_per_sample(self):
+        x = _batch(n=1).expand(2, 3, 32, 32).clone()
+        a = random_rotation(x, 45.0, torch.Generator().manual_seed(3))
+        b = random_rotation(x, 45.0, torch.Generator().manual_seed(3))
+        assert torch.equal(a, b)
+        assert not torch.allclose(a[0], a[1])  # independent angle per sample
+
+
+class TestSuites:
+    def test_default_suite_starts_with_baseline(self):
+        suite = default_suite()
+        assert suite[0] is BASELINE
+        assert len({p.name for p in suite}) == len(suite)
+
+    def test_severity_sweep_levels(self):
+        sweep = severity_sweep("blur", levels=10)
+        assert sweep[0] is BASELINE
+        sev = [p.severity for p in sweep[1:]]
+        assert len(sev) == 10 and sev == sorted(sev)
+
+    def test_unknown_sweep_raises(self):
+        with pytest.raises(ValueError):
+            severity_sweep("fog")
+
+    def test_sweep_runs_in_one_pass_on_a_small_model(self):
+        model = torch.nn.Sequential(torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten(),
+                                    torch.nn.Linear(3, 4)).eval()
+        x = _batch(n=8)
+        gen = torch.Generator().manual_seed(0)
+        with torch.no_grad():
+            outs = {p.name: model(normalize(p(x, gen))) for p in severity_sweep("noise", 10)}
+        assert len(outs) == 11
+        assert all(o.shape == (8, 4) for o in outs.values())
@@ -0,0 +1,102 @@
+"""
+Tests for the hot-reloading ModelRegistry.
+"""
+from __future__ import annotations
+
+import json
+import os
+from types import SimpleNamespace
+
+from app.models.registry import ModelRegistry
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+
+class _FakeClassifier:
+    def __init__(self, path: str, metadata: dict) -> None:
+        self.path = path
+        self.metadata = metadata
+        self.weights_loaded = not metadata.get("broken", False)
+        self.predictions = 0
+
+    def predict(self, image):
+        self.predictions += 1
+        return SimpleNamespace(top_class="Healthy")
+
+
+def _publish(root, name: str, mtime: int, **metadata) -> None:
+    d = root / name
+    d.mkdir(exist_ok=True)
+    (d / "model.pt").write_bytes(b"weights-" + name.encode())
+    meta = d / "model_metadata.json"
+    meta.write_text(json.dumps(metadata))
+    os.utime(meta, ns=(mtime, mtime))
+
+
+def _registry(root, **kwargs) -> ModelRegistry:
+    return ModelRegistry(root, _FakeClassifier, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+
+class TestModelRegistry:
+    def test_unpublished_directories_are_ignored(self, tmp_path):
+        (tmp_path / "half-copied").mkdir()
+        (tmp_path / "half-copied" / "model.pt").write_bytes(b"x")
+        reg = _registry(tmp_path)
+        assert reg.refresh() is False
+        assert reg.get() is None
+
+    def test_newest_version_becomes_active_and_is_warmed(self, tmp_path):
+        _publish(tmp_path, "v1", 1_000)
+        reg = _registry(tmp_path)
+        reg.refresh()
+        in_flight = reg.get()
+        assert in_flight.version == "v1"
+        assert in_flight.classifier.predictions == 1  # warm-up
+
+        _publish(tmp_path, "v2", 2_000, version="2.0")
+        assert reg.refresh() is True
+        assert reg.get().version == "2.0"
+        # A request holding the old entry keeps its classifier; v1 stays pinnable.
+        assert in_flight.classifier.path.endswith("v1/model.pt")
+        assert reg.get("v1") is not None
+
+    def test_pinned_default_version(self, tmp_path):
+        _publish(tmp_path, "v1", 1_000)
+        _publish(tmp_path, "v2", 2_000)
+        reg = _registry(tmp_path, default_version="v1")
+        reg.refresh()
+        assert reg.active_version == "v1"
+
+    def test_changed_checkpoint_is_reloaded(self, tmp_path):
+        _publish(tmp_path, "v1", 1_000)
+        reg = _registry(tmp_path)
+        reg.refresh()
+        first = reg.get().classifier
+        assert reg.refresh() is False
+        _publish(tmp_path, "v1", 3_000, note="retrained")
+        assert reg.refresh() is True
+        assert reg.get().classifier is not first
+
+    def test_failed_load_keeps_previous_build(self, tmp_path):
+        _publish(tmp_path, "v1", 1_000)
+        reg = _registry(tmp_path)
+        reg.refresh()
+        good = reg.get().classifier
+        _publish(tmp_path, "v1", 2_000, broken=True)
+        reg.refresh()
+        assert reg.get().classifier is good
+
+    def test_max_loaded_evicts_oldest(self, tmp_path):
+        for i in range(3):
+            _publish(tmp_path, f"v{i}", 1_000 * (i + 1))
+        reg = _registry(tmp_path, max_loaded=2)
+        reg.refresh()
+        assert sorted(e.version for e in reg.entries()) == ["v1", "v2"]
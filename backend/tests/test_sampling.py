@@ -0,0 +1,112 @@
+"""
+Tests for class-balanced sampling and augmented-set materialisation.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from PIL import Image
+from torchvision import transforms
+
+from app.utils.sampling import (
+    BalancedClassSampler,
+    augmentation_jobs,
+    balanced_class_weights,
+    class_target_counts,
+    parse_balance,
+    write_augmented,
+)
+
+TARGETS = [0] * 10 + [1] * 3 + [2] * 25
+
+
+class TestTargets:
+    def test_modes(self):
+        np.testing.assert_array_equal(class_target_counts(TARGETS, 3, "max"), [25, 25, 25])
+        np.testing.assert_array_equal(class_target_counts(TARGETS, 3, "mean"), [13, 13, 13])
+        np.testing.assert_array_equal(class_target_counts(TARGETS, 3, 7), [7, 7, 7])
+        np.testing.assert_array_equal(class_target_counts(TARGETS, 3, {1: 12}), [10, 12, 25])
+
+    def test_empty_class_gets_no_draws(self):
+        np.testing.assert_array_equal(class_target_counts(TARGETS, 4, "max"), [25, 25, 25, 0])
+
+    def test_unknown_mode_raises(self):
+        with pytest.raises(ValueError):
+            class_target_counts(TARGETS, 3, "median")
+
+    def test_parse_balance(self):
+        classes = ["blight", "healthy", "spot"]
+        assert parse_balance("max", classes) == "max"
+        assert parse_balance("600", classes) == 600
+        assert parse_balance("blight=600,spot=500", classes) == {0: 600, 2: 500}
+        with pytest.raises(ValueError):
+            parse_balance("rust=5", classes)
+
+    def test_weights_of_balanced_mix_are_uniform(self):
+        np.testing.assert_allclose(balanced_class_weights([25, 25, 25]), [1.0, 1.0, 1.0])
+        np.testing.assert_allclose(balanced_class_weights([10, 0, 30]), [2.0, 0.0, 2 / 3])
+
+
+class TestBalancedClassSampler:
+    def test_exact_class_counts_and_full_coverage(self):
+        sampler = BalancedClassSampler(TARGETS, [25, 25, 25], seed=0)
+        drawn = np.array(list(sampler))
+        assert len(drawn) == len(sampler) == 75
+        labels = np.array(TARGETS)[drawn]
+        np.testing.assert_array_equal(np.bincount(labels), [25, 25, 25])
+        # Repeats are spread evenly: every minority image appears 8 or 9 times.
+        per_image = np.bincount(drawn[labels == 1], minlength=13)[10:13]
+        assert set(per_image.tolist()) <= {8, 9}
+        assert set(drawn[labels == 2].tolist()) == set(range(13, 38))
+
+    def test_undersampling_draws_without_replacement(self):
+        drawn = list(BalancedClassSampler(TARGETS, [5, 3, 5], seed=1))
+        assert len(drawn) == len(set(drawn)) == 13
+
+    def test_order_is_a_function_of_seed_and_epoch(self):
+        a = BalancedClassSampler(TARGETS, [25, 25, 25], seed=3)
+        b = BalancedClassSampler(TARGETS, [25, 25, 25], seed=3)
+        a.set_epoch(2)
+        b.set_epoch(2)
+        assert list(a) == list(b)
+        b.set_epoch(3)
+        assert list(a) != list(b)
+
+    def test_set_epoch_start_skips_consumed_samples(self):
+        sampler = BalancedClassSampler(TARGETS, [25, 25, 25], seed=0)
+        sampler.set_epoch(1)
+        full = list(sampler)
+        sampler.set_epoch(1, start=32)
+        assert list(sampler) == full[32:] and len(sampler) == 43
+
+    def test_target_for_empty_class_raises(self):
+        with pytest.raises(ValueError):
+            BalancedClassSampler(TARGETS, [5, 5, 5, 5])
+
+
+class TestWriteAugmented:
+    def _originals(self, tmp_path):
+        src = tmp_path / "src"
+        src.mkdir()
+        rng = np.random.default_rng(0)
+        paths = []
+        for i in range(3):
+            paths.append(src / f"leaf{i}.png")
+            Image.fromarray(rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)).save(paths[-1])
+        return paths
+
+    def test_output_independent_of_worker_count(self, tmp_path):
+        originals = self._originals(tmp_path)
+        augment = transforms.Compose([transforms.RandomRotation(30), transforms.RandomHorizontalFlip()])
+        assert write_augmented(originals, tmp_path / "one", 8, augment, seed=5, workers=1) == 5
+        assert write_augmented(originals, tmp_path / "two", 8, augment, seed=5, workers=2) == 5
+        names = sorted(p.name for p in (tmp_path / "one").iterdir())
+        assert len(names) == 8
+        assert names == sorted(p.name for p in (tmp_path / "two").iterdir())
+        for name in names:
+            assert (tmp_path / "one" / name).read_bytes() == (tmp_path / "two" / name).read_bytes()
+
+    def test_no_jobs_when_target_reached(self, tmp_path):
+        originals = self._originals(tmp_path)
+        assert augmentation_jobs(originals, 2, seed=0) == []
+        assert augmentation_jobs([], 10, seed=0) == []
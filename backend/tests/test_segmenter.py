@@ -0,0 +1,77 @@
+"""
+Tests for U2NetSegmenter – leaf mask output and content-hash cache.
+"""
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+from app.models import u2net_segmenter
+from app.models.u2net_segmenter import SegmentationResult, U2NetSegmenter
+
+
+def _fake_rembg(image: Image.Image) -> Image.Image:
+    """Pretend the left half of the image is leaf, the right half background."""
+    rgba = image.convert("RGBA")
+    alpha = np.zeros((image.height, image.width), dtype=np.uint8)
+    alpha[:, : image.width // 2] = 255
+    rgba.putalpha(Image.fromarray(alpha, mode="L"))
+    return rgba
+
+
+class TestSegment:
+    def test_passthrough_without_rembg(self):
+        seg = U2NetSegmenter()
+        with patch.object(u2net_segmenter, "_REMBG_AVAILABLE", False):
+            result = seg.segment(Image.new("RGB", (32, 32), (10, 200, 10)))
+        assert isinstance(result, SegmentationResult)
+        assert result.mask is None
+        assert result.image.size == (32, 32)
+
+    def test_returns_mask_and_black_background(self):
+        seg = U2NetSegmenter()
+        with patch.object(u2net_segmenter, "_REMBG_AVAILABLE", True), \
+             patch.object(u2net_segmenter, "rembg_remove", _fake_rembg, create=True):
+            result = seg.segment(Image.new("RGB", (32, 32), (10, 200, 10)))
+        assert result.mask is not None
+        assert result.mask.shape == (32, 32)
+        assert result.mask[:, :16].all() and not result.mask[:, 16:].any()
+        assert result.image.getpixel((31, 0)) == (0, 0, 0)
+        assert result.image.getpixel((0, 0)) == (10, 200, 10)
+
+
+class TestMaskCache:
+    def test_repeat_upload_hits_cache(self):
+        seg = U2NetSegmenter(cache_size=4)
+        image = Image.new("RGB", (32, 32), (10, 200, 10))
+        with patch.object(u2net_segmenter, "_REMBG_AVAILABLE", True), \
+             patch.object(u2net_segmenter, "rembg_remove", create=True,
+                          side_effect=_fake_rembg) as mock_remove:
+            first = seg.segment(image)
+            second = seg.segment(image.copy())
+        assert mock_remove.call_count == 1
+        assert not first.cache_hit
+        assert second.cache_hit
+        assert second.content_hash == first.content_hash
+
+    def test_cache_is_bounded(self):
+        seg = U2NetSegmenter(cache_size=2)
+        with patch.object(u2net_segmenter, "_REMBG_AVAILABLE", True), \
+             patch.object(u2net_segmenter, "rembg_remove", create=True,
+                          side_effect=_fake_rembg) as mock_remove:
+            for shade in (10, 20, 30):
+                seg.segment(Image.new("RGB", (32, 32), (shade, 200, 10)))
+            seg.segment(Image.new("RGB", (32, 32), (10, 200, 10)))  # evicted
+        assert mock_remove.call_count == 4
+
+    def test_cache_disabled(self):
+        seg = U2NetSegmenter(cache_size=0)
+        image = Image.new("RGB", (32, 32), (10, 200, 10))
+        with patch.object(u2net_segmenter, "_REMBG_AVAILABLE", True), \
+             patch.object(u2net_segmenter, "rembg_remove", create=True,
+                          side_effect=_fake_rembg) as mock_remove:
+            seg.segment(image)
+            seg.segment(image)
+        assert mock_remove.call_count == 2
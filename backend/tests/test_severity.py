@@ -31,8 +31,10 @@ from app.models.classifier import (
 from app.utils.severity import (
     DEFAULT_STAGE_THRESHOLDS,
     SeverityResult,
+    compute_severity_batch,
     compute_severity_from_heatmap,
     map_percent_to_stage,
+    map_percents_to_stages,
 )
 
 
@@ -234,6 +236,75 @@ class TestComputeSeverityFromHeatmap:
         assert result.severity_stage == expected_stage
 
 
+class TestSeverityWithLeafMask:
+    def test_percent_is_relative_to_leaf_area(self):
+        # Leaf covers the left half; affected region is the top-left quarter.
+        heatmap = np.zeros((4, 4))
+        heatmap[:2, :2] = 1.0
+        leaf = np.zeros((4, 4), dtype=bool)
+        leaf[:, :2] = True
+        result = compute_severity_from_heatmap(heatmap, threshold=0.5, leaf_mask=leaf)
+        assert result.severity_percent == 50.0
+
+    def test_background_activation_is_ignored(self):
+        heatmap = np.zeros((4, 4))
+        heatmap[:, 2:] = 1.0  # activation only on background
+        leaf = np.zeros((4, 4), dtype=bool)
+        leaf[:, :2] = True
+        result = compute_severity_from_heatmap(heatmap, threshold=0.5, leaf_mask=leaf)
+        assert result.severity_percent == 0.0
+        assert result.severity_stage == 0
+
+    def test_high_resolution_mask_is_resampled(self):
+        heatmap = np.zeros((7, 7))
+        heatmap[:, :3] = 1.0
+        leaf = np.zeros((224, 224), dtype=bool)
+        leaf[:, :96] = True  # exactly the first three heatmap columns
+        result = compute_severity_from_heatmap(heatmap, threshold=0.5, leaf_mask=leaf)
+        assert result.severity_percent == 100.0
+
+    def test_empty_mask_falls_back_to_whole_heatmap(self):
+        heatmap = np.zeros((4, 4))
+        heatmap[:, :2] = 1.0
+        leaf = np.zeros((4, 4), dtype=bool)
+        result = compute_severity_from_heatmap(heatmap, threshold=0.5, leaf_mask=leaf)
+        assert result.severity_percent == 50.0
+
+
+class TestSeverityBatch:
+    def test_stages_match_scalar_mapping(self):
+        percents = np.array([0.0, 0.1, 10.0, 10.01, 25.0, 25.5, 50.0, 50.1, 100.0, -3.0, 140.0])
+        stages = map_percents_to_stages(percents)
+        expected = [map_percent_to_stage(p) for p in percents]
+        assert stages.tolist() == expected
+
+    def test_batch_matches_single_heatmap_results(self):
+        rng = np.random.default_rng(0)
+        heatmaps = rng.random((6, 7, 7))
+        heatmaps[0] = 0.3  # constant map
+        percents, stages = compute_severity_batch(heatmaps, threshold=0.5)
+        for i, heatmap in enumerate(heatmaps):
+            single = compute_severity_from_heatmap(heatmap, threshold=0.5)
+            assert round(float(percents[i]), 2) == single.severity_percent
+            assert stages[i] == single.severity_stage
+
+    def test_batch_with_leaf_masks(self):
+        heatmaps = np.zeros((2, 4, 4))
+        heatmaps[:, :2, :2] = 1.0
+        leaf = np.zeros((2, 4, 4), dtype=bool)
+        leaf[0, :, :2] = True  # second mask left empty -> whole-area fallback
+        percents, _ = compute_severity_batch(heatmaps, threshold=0.5, leaf_masks=leaf)
+        assert percents.tolist() == [50.0, 25.0]
+
+    def test_mismatched_leaf_mask_shape_raises(self):
+        with pytest.raises(ValueError):
+            compute_severity_batch(np.zeros((2, 4, 4)), leaf_masks=np.zeros((2, 8, 8)))
+
+    def test_non_3d_input_raises(self):
+        with pytest.raises(ValueError):
+            compute_severity_batch(np.zeros((4, 4)))
+
+
 # ---------------------------------------------------------------------------
 # Response schema validation – /predict with and without severity
 # ---------------------------------------------------------------------------
@@ -0,0 +1,168 @@
+"""
+Tests for the similar-leaf retrieval index.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from app.utils.similarity_index import (
+    ExactIndex,
+    IVFPQIndex,
+    build_index,
+    default_subvectors,
+    kmeans,
+    l2_normalize,
+    load_index,
+)
+
+CLASSES = ["a", "b", "c", "d"]
+
+
+def _clustered(n=2000, dim=32, clusters=20, noise=0.3, seed=0):
+    """Points around *clusters* fixed random centres; label = cluster % 4.
+
+    The centres do not depend on *seed*, so different seeds sample the same
+    distribution.
+    """
+    centers = np.random.default_rng(1234).normal(size=(clusters, dim))
+    rng = np.random.default_rng(seed)
+    assign = rng.integers(0, clusters, n)
+    x = centers[assign] + noise * rng.normal(size=(n, dim))
+    return x.astype(np.float32), assign % len(CLASSES)
+
+
+def _build(tmp_path, x, labels, kind, **kwargs):
+    paths = [f"img{i}.jpg" for i in range(len(x))]
+    build_index(tmp_path / kind, x, labels, paths, CLASSES, "pooled", kind=kind, **kwargs)
+    return load_index(tmp_path / kind)
+
+
+def _brute_force(x, queries, k):
+    scores = l2_normalize(queries) @ l2_normalize(x).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+class TestExactIndex:
+    def test_matches_brute_force(self, tmp_path):
+        x, labels = _clustered(n=300)
+        index = _build(tmp_path, x, labels, "exact")
+        assert isinstance(index, ExactIndex)
+        scores, ids = index.search(x[:10], k=5)
+        exact = l2_normalize(x[:10]) @ l2_normalize(x).T
+        np.testing.assert_array_equal(ids[:, 0], np.arange(10))
+        # float16 storage: same top-k scores up to rounding (near-ties may swap ids)
+        np.testing.assert_allclose(scores, -np.sort(-exact, axis=1)[:, :5], atol=2e-3)
+
+    def test_vectors_are_memory_mapped_float16(self, tmp_path):
+        x, labels = _clustered(n=50)
+        index = _build(tmp_path, x, labels, "exact")
+        assert isinstance(index.vectors, np.memmap)
+        assert index.vectors.dtype == np.float16
+
+    def test_neighbors_carry_labels_and_paths(self, tmp_path):
+        x, labels = _clustered(n=50)
+        index = _build(tmp_path, x, labels, "exact")
+        hits = index.neighbors(x[7], k=3)
+        assert hits[0].path == "img7.jpg"
+        assert hits[0].class_name == CLASSES[labels[7]]
+        assert hits[0].score == pytest.approx(1.0, abs=1e-3)
+        assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+
+    def test_k_larger_than_index(self, tmp_path):
+        x, labels = _clustered(n=3)
+        assert len(_build(tmp_path, x, labels, "exact").neighbors(x[0], k=10)) == 3
+
+    def test_dimension_mismatch_raises(self, tmp_path):
+        x, labels = _clustered(n=10)
+        with pytest.raises(ValueError):
+            _build(tmp_path, x, labels, "exact").neighbors(np.zeros(5), k=1)
+
+
+class TestIVFPQIndex:
+    def test_recall_against_exact(self, tmp_path):
+        x, labels = _clustered(noise=1.0)
+        index = _build(tmp_path, x, labels, "ivfpq", nlist=16, subvectors=8)
+        assert isinstance(index, IVFPQIndex)
+        assert index.codes.dtype == np.uint8
+        queries = _clustered(n=100, noise=1.0, seed=1)[0]  # unseen points
+        _, ids = index.search(queries, k=10)
+        # Rows are grouped by list; map them back to input order via the paths.
+        found = [[int(index.paths[i][3:-4]) for i in row] for row in ids]
+        nearest = _brute_force(x, queries, 1)[:, 0]
+        recall = np.mean([t in row for t, row in zip(nearest, found)])  # 1-recall@10
+        assert recall > 0.9
+
+    def test_self_query_finds_same_class(self, tmp_path):
+        x, labels = _clustered()
+        index = _build(tmp_path, x, labels, "ivfpq", nlist=16, subvectors=8)
+        hits = index.neighbors(x[0], k=5)
+        assert len(hits) == 5
+        assert all(h.class_name == CLASSES[labels[0]] for h in hits)
+        # Paths stay attached to their own rows after grouping by list.
+        assert "img0.jpg" in [h.path for h in hits]
+
+    def test_sparse_probe_pads_without_inventing_rows(self, tmp_path):
+        x, labels = _clustered(n=300)
+        index = _build(tmp_path, x, labels, "ivfpq", nlist=40, subvectors=8)
+        index.nprobe = 1
+        hits = index.neighbors(x[0], k=200)
+        assert 0 < len(hits) < 200
+        assert len({h.path for h in hits}) == len(hits)
+
+    def test_bad_subvectors_raises(self, tmp_path):
+        x, labels = _clustered(n=300)
+        with pytest.raises(ValueError):
+            _build(tmp_path, x, labels, "ivfpq", subvectors=5)
+
+
+class TestBuild:
+    def test_auto_picks_exact_for_small_sets(self, tmp_path):
+        x, labels = _clustered(n=100)
+        build_index(tmp_path / "idx", x, labels, [str(i) for i in range(100)], CLASSES, "head")
+        index = load_index(tmp_path / "idx")
+        assert index.kind == "exact" and index.layer == "head" and len(index) == 100
+
+    def test_unknown_kind_raises(self, tmp_path):
+        x, labels = _clustered(n=10)
+        with pytest.raises(ValueError):
+            _build(tmp_path, x, labels, "hnsw")
+
+    def test_rebuild_replaces_existing_index(self, tmp_path):
+        x, labels = _clustered(n=100)
+        paths = [str(i) for i in range(100)]
+        build_index(tmp_path / "idx", x, labels, paths, CLASSES, "head")
+        build_index(tmp_path / "idx", x[:50], labels[:50], paths[:50], CLASSES, "pooled")
+        assert len(load_index(tmp_path / "idx")) == 50
+        assert [p.name for p in tmp_path.iterdir()] == ["idx"]
+
+    def test_refuses_to_replace_a_non_index_directory(self, tmp_path):
+        x, labels = _clustered(n=10)
+        (tmp_path / "models").mkdir()
+        (tmp_path / "models" / "cardamom_model.pt").write_bytes(b"weights")
+        with pytest.raises(FileExistsError):
+            build_index(tmp_path / "models", x, labels, [str(i) for i in range(10)], CLASSES, "head")
+        assert (tmp_path / "models" / "cardamom_model.pt").exists()
+        assert [p.name for p in tmp_path.iterdir()] == ["models"]
+
+    def test_failed_build_keeps_previous_index(self, tmp_path):
+        x, labels = _clustered(n=300)
+        _build(tmp_path, x, labels, "ivfpq")
+        with pytest.raises(ValueError):
+            _build(tmp_path, x, labels, "ivfpq", subvectors=5)
+        assert len(load_index(tmp_path / "ivfpq")) == 300
+        assert [p.name for p in tmp_path.iterdir()] == ["ivfpq"]
+
+    def test_missing_index_raises(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            load_index(tmp_path / "nothing")
+
+    def test_default_subvectors_divides_dim(self):
+        assert default_subvectors(1280) == 64
+        assert default_subvectors(512) == 64
+        assert 576 % default_subvectors(576) == 0
+
+    def test_kmeans_separates_obvious_clusters(self):
+        x = np.concatenate([np.zeros((50, 2)), np.full((50, 2), 10.0)]).astype(np.float32)
+        centroids = np.sort(kmeans(x, 2, seed=1)[:, 0])
+        np.testing.assert_allclose(centroids, [0.0, 10.0])
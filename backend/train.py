@@ -1,7 +1,36 @@
 """
 Training script for Cardamom Leaf Disease Classification
 Uses EfficientNetV2 with transfer learning
+
+Usage:
+    python train.py                          # dataset/{train,val} image folders
+    python train.py --packed dataset_packed  # pre-decoded shards (pack_dataset.py)
+    python train.py --packed --batch-augment # + batched tensor augmentation
+    python train.py --manifest splits.json   # split manifest from split_dataset.py --manifest
+    python train.py --balance                # oversample classes to the largest one per epoch
+    python train.py --balance blight=600     # per-class draws per epoch (others unchanged)
+    python train.py --resume                 # continue from models/train_checkpoint.pt
+    python train.py --checkpoint-every 200   # also checkpoint every 200 batches
+    python train.py --cpu-precision bf16     # channels_last + bf16 autocast on CPU
+
+A full training checkpoint (model, optimizer, GradScaler, scheduler, RNG
+states, epoch/batch position, early-stopping state and history) is written
+atomically to Config.CHECKPOINT_PATH after every epoch and, with
+--checkpoint-every, mid-epoch.  The training order is a deterministic
+function of (seed, epoch), so --resume continues with the remaining batches
+of an interrupted epoch.
+
+--cpu-precision bf16 (or auto) trains on CPU with channels_last tensors under
+torch.autocast("cpu", dtype=torch.bfloat16); CPUs without native bf16
+support fall back to fp32.  CUDA keeps its own AMP path.
+
+--balance replaces the augment*.py copies on disk: a BalancedClassSampler
+(app/utils/sampling.py) draws a fixed number of images per class each epoch
+and the training transforms augment every draw afresh.  The loss class
+weights are then computed from the balanced per-epoch mix.
 """
+import argparse
+import random
 import sys
 from pathlib import Path
 
@@ -46,11 +75,35 @@ except ImportError as e:
 
 import time
 
+from app.utils.checkpoint import (
+    ResumableRandomSampler,
+    atomic_torch_save,
+    capture_rng_state,
+    restore_rng_state,
+)
+from app.utils.batch_augment import BatchAugment, raw_uint8_transform
+from app.utils.cpu_precision import (
+    PRECISIONS,
+    autocast_context,
+    prepare_input,
+    prepare_model,
+    resolve_cpu_precision,
+)
+from app.utils.dataset_manifest import ManifestDataset
+from app.utils.packed_dataset import open_packed_split
+from app.utils.sampling import (
+    BalancedClassSampler,
+    balanced_class_weights,
+    class_target_counts,
+    parse_balance,
+)
+
 # Configuration
 class Config:
     # Paths
     DATASET_PATH = "dataset"  # Change this to your dataset path
     MODEL_SAVE_PATH = "models/cardamom_model.pt"
+    CHECKPOINT_PATH = "models/train_checkpoint.pt"  # full state for --resume
     
     # Training parameters
     BATCH_SIZE = 32
@@ -64,6 +117,9 @@ class Config:
     
     # Early stopping
     PATIENCE = 10
+
+    # Seed of the per-epoch shuffling order (needed to resume mid-epoch)
+    SEED = 42
     
     # Class names (alphabetical order -- matches ImageFolder sorting)
     CLASS_NAMES = ["colletotrichum_blight", "healthy", "other", "phyllosticta_leaf_spot"]
@@ -113,25 +169,61 @@ def create_model():
     return model
 
 
-def train_epoch(model, dataloader, criterion, optimizer, device, scaler=None):
-    """Train for one epoch with optional AMP support."""
+def get_batch_augment():
+    """Batched equivalent of the train transforms in get_data_transforms()."""
+    return BatchAugment(
+        out_size=Config.IMG_SIZE,
+        hflip=0.5,
+        vflip=0.5,
+        degrees=30,
+        translate=0.1,
+        brightness=0.2,
+        contrast=0.2,
+        saturation=0.2,
+    )
+
+
+def new_epoch_progress():
+    """Running totals of a (possibly resumed) training epoch."""
+    return {'batch': 0, 'running_loss': 0.0, 'correct': 0, 'total': 0}
+
+
+def train_epoch(model, dataloader, criterion, optimizer, device, scaler=None, batch_transform=None,
+                progress=None, on_batch=None, precision="fp32"):
+    """Train for one epoch with optional AMP support.
+
+    *precision* is the resolved CPU precision (see app.utils.cpu_precision);
+    "bf16" feeds channels_last inputs and runs the forward pass under CPU
+    bf16 autocast.  bf16 keeps fp32's exponent range, so no GradScaler is
+    needed.
+
+    If *batch_transform* is given, the loader yields raw uint8 batches and the
+    transform (e.g. BatchAugment) augments and normalises them on *device*.
+
+    *progress* (see new_epoch_progress) carries the running totals so that a
+    resumed epoch continues them; it is updated in place and passed to
+    *on_batch* after every batch (used for mid-epoch checkpoints).
+    """
     model.train()
-    running_loss = 0.0
-    correct = 0
-    total = 0
+    if progress is None:
+        progress = new_epoch_progress()
 
     use_amp = scaler is not None and device.type == "cuda"
 
-    progress_bar = tqdm(dataloader, desc="Training")
+    progress_bar = tqdm(dataloader, desc="Training", initial=progress['batch'],
+                        total=progress['batch'] + len(dataloader))
 
     for inputs, labels in progress_bar:
         inputs, labels = inputs.to(device), labels.to(device)
+        if batch_transform is not None:
+            inputs = batch_transform(inputs)
+        inputs = prepare_input(inputs, precision)
 
         optimizer.zero_grad()
 
-        with torch.amp.autocast("cuda", enabled=use_amp):
+        with torch.amp.autocast("cuda", enabled=use_amp), autocast_context(precision, device):
             outputs = model(inputs)
-            loss = criterion(outputs, labels)
+            loss = criterion(outputs.float(), labels)
 
         if use_amp and scaler is not None:
             scaler.scale(loss).backward()
@@ -141,23 +233,26 @@ def train_epoch(model, dataloader, criterion, optimizer, device, scaler=None):
             loss.backward()
             optimizer.step()
 
-        running_loss += loss.item() * inputs.size(0)
         _, predicted = torch.max(outputs, 1)
-        total += labels.size(0)
-        correct += (predicted == labels).sum().item()
+        progress['running_loss'] += loss.item() * inputs.size(0)
+        progress['total'] += labels.size(0)
+        progress['correct'] += (predicted == labels).sum().item()
+        progress['batch'] += 1
 
         progress_bar.set_postfix({
             'loss': f'{loss.item():.4f}',
-            'acc': f'{100 * correct / total:.2f}%'
+            'acc': f'{100 * progress["correct"] / progress["total"]:.2f}%'
         })
+        if on_batch is not None:
+            on_batch(progress)
 
-    epoch_loss = running_loss / total
-    epoch_acc = correct / total
+    epoch_loss = progress['running_loss'] / progress['total']
+    epoch_acc = progress['correct'] / progress['total']
 
     return epoch_loss, epoch_acc
 
 
-def validate(model, dataloader, criterion, device):
+def validate(model, dataloader, criterion, device, precision="fp32"):
     """Validate the model"""
     model.eval()
     running_loss = 0.0
@@ -167,8 +262,10 @@ def validate(model, dataloader, criterion, device):
     with torch.no_grad():
         for inputs, labels in tqdm(dataloader, desc="Validation"):
             inputs, labels = inputs.to(device), labels.to(device)
-            
-            outputs = model(inputs)
+            inputs = prepare_input(inputs, precision)
+
+            with autocast_context(precision, device):
+                outputs = model(inputs).float()
             loss = criterion(outputs, labels)
             
             running_loss += loss.item() * inputs.size(0)
@@ -182,8 +279,48 @@ def validate(model, dataloader, criterion, device):
     return epoch_loss, epoch_acc
 
 
-def train_model():
-    """Main training function"""
+def save_training_checkpoint(path, *, model, optimizer, scheduler, scaler, epoch, progress,
+                             best_val_loss, best_val_acc, patience_counter, history,
+                             run_config, completed=False):
+    """Atomically write the full training state needed by --resume."""
+    atomic_torch_save({
+        'format': 'cardamom-train-checkpoint-v1',
+        'model': model.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'scheduler': scheduler.state_dict(),
+        'scaler': scaler.state_dict(),
+        'rng': capture_rng_state(),
+        'epoch': epoch,                  # epoch in progress (0-based)
+        'epoch_progress': dict(progress),  # batches/totals already done in it
+        'best_val_loss': best_val_loss,
+        'best_val_acc': best_val_acc,
+        'patience_counter': patience_counter,
+        'history': history,
+        'run_config': run_config,
+        'completed': completed,
+    }, path)
+
+
+def train_model(packed_path=None, batch_augment=False, resume=None, checkpoint_every=0,
+                cpu_precision="fp32", manifest=None, balance=None):
+    """Main training function
+
+    Args:
+        packed_path:   Optional root of a packed dataset (see pack_dataset.py).
+                       When given, train/val shards are memory-mapped instead of
+                       decoding JPEGs from Config.DATASET_PATH every epoch.
+        manifest:      Optional split manifest (split_dataset.py --manifest);
+                       train/val images are read from its source folders.
+        balance:       Optional class-balancing target ("max", "mean", a
+                       count or "class=count,..."); see app/utils/sampling.py.
+        batch_augment: Augment whole uint8 batches with BatchAugment after
+                       collation instead of per image in the DataLoader workers.
+        resume:        Path of a training checkpoint to continue from.
+        checkpoint_every: Also checkpoint every N training batches (0 = only
+                       at epoch ends).
+        cpu_precision: "fp32", "bf16" or "auto" – bf16 autocast and
+                       channels_last on CPU when the hardware supports it.
+    """
     
     # Pre-flight checks
     print("\n" + "=" * 60)
@@ -191,7 +328,11 @@ def train_model():
     print("=" * 60)
     
     # Check dataset directory exists
-    dataset_path = Path(Config.DATASET_PATH)
+    dataset_path = Path(manifest or packed_path or Config.DATASET_PATH)
+    if manifest and not dataset_path.is_file():
+        print(f"\n❌ ERROR: Split manifest not found: {dataset_path.absolute()}")
+        print("\n💡 Run: python split_dataset.py --manifest " + str(manifest))
+        sys.exit(1)
     if not dataset_path.exists():
         print(f"\n❌ ERROR: Dataset directory not found!")
         print(f"   Expected: {dataset_path.absolute()}")
@@ -204,13 +345,16 @@ def train_model():
         sys.exit(1)
     
     # Check dataset structure
-    required_splits = ["train", "val", "test"]
+    required_splits = [] if manifest else ["train", "val"] if packed_path else ["train", "val", "test"]
     for split in required_splits:
         split_path = dataset_path / split
         if not split_path.exists():
             print(f"\n❌ ERROR: Missing dataset split: {split}/")
             print(f"   Expected: {split_path.absolute()}")
-            print("\n💡 Run: python split_dataset.py")
+            if packed_path:
+                print("\n💡 Run: python pack_dataset.py")
+            else:
+                print("\n💡 Run: python split_dataset.py")
             sys.exit(1)
     
     print("✅ Dataset directory structure OK")
@@ -236,23 +380,43 @@ def train_model():
     print("=" * 60 + "\n")
     
     print(f"Using device: {Config.DEVICE}")
+
+    # Seed everything so a run (and a resumed run) is reproducible
+    random.seed(Config.SEED)
+    np.random.seed(Config.SEED)
+    torch.manual_seed(Config.SEED)
     print(f"Dataset path: {dataset_path.absolute()}")
     
     # Create data transforms
     train_transforms, val_transforms = get_data_transforms()
+    batch_transform = None
+    if batch_augment:
+        batch_transform = get_batch_augment().to(Config.DEVICE)
+        # Workers only decode/resize; augmentation happens per batch.
+        train_transforms = None if packed_path else raw_uint8_transform(Config.IMG_SIZE)
+        print("Batched tensor augmentation: enabled")
     
     # Load datasets
     print("\nLoading datasets...")
     try:
-        train_dataset = datasets.ImageFolder(
-            root=f"{Config.DATASET_PATH}/train",
-            transform=train_transforms
-        )
-        
-        val_dataset = datasets.ImageFolder(
-            root=f"{Config.DATASET_PATH}/val",
-            transform=val_transforms
-        )
+        if packed_path:
+            train_dataset = open_packed_split(packed_path, "train", train_transforms)
+            val_dataset = open_packed_split(packed_path, "val", val_transforms)
+            print(f"Using packed shards ({train_dataset.image_size}×{train_dataset.image_size}, no JPEG decoding)")
+        elif manifest:
+            train_dataset = ManifestDataset(manifest, "train", transform=train_transforms)
+            val_dataset = ManifestDataset(manifest, "val", transform=val_transforms)
+            print(f"Using split manifest {manifest} (images from {train_dataset.root})")
+        else:
+            train_dataset = datasets.ImageFolder(
+                root=f"{Config.DATASET_PATH}/train",
+                transform=train_transforms
+            )
+            
+            val_dataset = datasets.ImageFolder(
+                root=f"{Config.DATASET_PATH}/val",
+                transform=val_transforms
+            )
     except Exception as e:
         print(f"\n❌ ERROR loading datasets: {e}")
         print("\n💡 Make sure your dataset has this structure:")
@@ -279,16 +443,34 @@ def train_model():
     class_counts = np.bincount(targets, minlength=len(train_dataset.classes))
     print(f"Train class counts: {dict(zip(train_dataset.classes, class_counts.tolist()))}")
 
-    # Inverse frequency weights (normalized)
-    class_weights = class_counts.sum() / (len(class_counts) * class_counts)
+    epoch_counts = None
+    if balance is not None:
+        try:
+            epoch_counts = class_target_counts(
+                targets, len(train_dataset.classes), parse_balance(balance, train_dataset.classes))
+        except ValueError as e:
+            print(f"\n❌ ERROR: {e}")
+            sys.exit(1)
+        print(f"Balanced draws per epoch: {dict(zip(train_dataset.classes, epoch_counts.tolist()))}")
+
+    # Inverse frequency weights (normalized) of what the model sees per epoch
+    if epoch_counts is not None:
+        class_weights = balanced_class_weights(epoch_counts)
+    else:
+        class_weights = class_counts.sum() / (len(class_counts) * class_counts)
     class_weights = torch.tensor(class_weights, dtype=torch.float32).to(Config.DEVICE)
     print(f"Class weights: {dict(zip(train_dataset.classes, class_weights.detach().cpu().numpy().round(3).tolist()))}")
     
-    # Create data loaders
+    # Create data loaders (seeded sampler so an epoch's order can be replayed)
+    if epoch_counts is not None:
+        train_sampler = BalancedClassSampler(targets, epoch_counts, seed=Config.SEED)
+    else:
+        train_sampler = ResumableRandomSampler(len(train_dataset), seed=Config.SEED)
     train_loader = DataLoader(
         train_dataset,
         batch_size=Config.BATCH_SIZE,
-        shuffle=True,
+        sampler=train_sampler,
+        generator=torch.Generator(),  # worker seeds, re-seeded per epoch below
         num_workers=4,
         pin_memory=False  # MPS doesn't support pin_memory
     )
@@ -304,6 +486,10 @@ def train_model():
     # Create model
     model = create_model().to(Config.DEVICE)
     print(f"\nModel created: EfficientNetV2-S")
+    precision = resolve_cpu_precision(cpu_precision, Config.DEVICE)
+    model = prepare_model(model, precision)
+    if precision == "bf16":
+        print("CPU mixed precision: bf16 autocast + channels_last")
 
     # Loss function and optimizer
     criterion = nn.CrossEntropyLoss(weight=class_weights, label_smoothing=0.1)
@@ -327,19 +513,81 @@ def train_model():
         'train_loss': [], 'train_acc': [],
         'val_loss': [], 'val_acc': []
     }
-    
+    start_epoch = 0
+    epoch_progress = new_epoch_progress()
+    run_config = {
+        'dataset': str(dataset_path), 'packed': bool(packed_path),
+        'batch_size': Config.BATCH_SIZE, 'seed': Config.SEED,
+        'train_samples': len(train_dataset),
+    }
+    if epoch_counts is not None:
+        run_config['balance'] = epoch_counts.tolist()
+
+    if resume:
+        ckpt = torch.load(resume, map_location=Config.DEVICE, weights_only=False)
+        if ckpt.get('format') != 'cardamom-train-checkpoint-v1':
+            print(f"\n❌ {resume} is not a training checkpoint (plain model weights?)")
+            sys.exit(1)
+        if ckpt['run_config'] != run_config:
+            print("\n⚠️  Checkpoint was written with a different data setup:")
+            print(f"   checkpoint: {ckpt['run_config']}")
+            print(f"   current:    {run_config}")
+        model.load_state_dict(ckpt['model'])
+        if ckpt['completed']:
+            print(f"\n✅ Checkpoint {resume} is from a finished run – nothing to resume.")
+            return model, ckpt['history']
+        optimizer.load_state_dict(ckpt['optimizer'])
+        scheduler.load_state_dict(ckpt['scheduler'])
+        scaler.load_state_dict(ckpt['scaler'])
+        restore_rng_state(ckpt['rng'])
+        start_epoch = ckpt['epoch']
+        epoch_progress = ckpt['epoch_progress']
+        best_val_loss = ckpt['best_val_loss']
+        best_val_acc = ckpt['best_val_acc']
+        patience_counter = ckpt['patience_counter']
+        history = ckpt['history']
+        print(f"\n🔁 Resuming from {resume}: epoch {start_epoch + 1}, "
+              f"batch {epoch_progress['batch']}/{len(train_loader)}")
+
+    def checkpoint(epoch, progress, completed=False):
+        save_training_checkpoint(
+            Config.CHECKPOINT_PATH, model=model, optimizer=optimizer, scheduler=scheduler,
+            scaler=scaler, epoch=epoch, progress=progress, best_val_loss=best_val_loss,
+            best_val_acc=best_val_acc, patience_counter=patience_counter, history=history,
+            run_config=run_config, completed=completed,
+        )
+
+    batches_per_epoch = -(-train_sampler.num_samples // Config.BATCH_SIZE)
+
     print(f"\nStarting training for {Config.NUM_EPOCHS} epochs...")
+    print(f"Checkpoints: {Config.CHECKPOINT_PATH}"
+          + (f" (every {checkpoint_every} batches)" if checkpoint_every else " (every epoch)"))
     print("=" * 60)
     
-    for epoch in range(Config.NUM_EPOCHS):
+    for epoch in range(start_epoch, Config.NUM_EPOCHS):
         print(f"\nEpoch {epoch + 1}/{Config.NUM_EPOCHS}")
         print("-" * 60)
+
+        # Skip the samples an interrupted run already trained on
+        train_sampler.set_epoch(epoch, start=epoch_progress['batch'] * Config.BATCH_SIZE)
+        train_loader.generator.manual_seed(Config.SEED + epoch)
+
+        def on_batch(progress, epoch=epoch):
+            # The end-of-epoch checkpoint below covers the last batch.
+            if checkpoint_every and progress['batch'] % checkpoint_every == 0 \
+                    and progress['batch'] < batches_per_epoch:
+                checkpoint(epoch, progress)
         
         # Train
-        train_loss, train_acc = train_epoch(model, train_loader, criterion, optimizer, Config.DEVICE, scaler)
+        train_loss, train_acc = train_epoch(
+            model, train_loader, criterion, optimizer, Config.DEVICE, scaler,
+            batch_transform=batch_transform, progress=epoch_progress, on_batch=on_batch,
+            precision=precision,
+        )
+        epoch_progress = new_epoch_progress()
         
         # Validate
-        val_loss, val_acc = validate(model, val_loader, criterion, Config.DEVICE)
+        val_loss, val_acc = validate(model, val_loader, criterion, Config.DEVICE, precision)
         
         # Update scheduler
         scheduler.step(val_loss)
@@ -361,15 +609,17 @@ def train_model():
             best_val_acc = val_acc
             patience_counter = 0
 
-            Path("models").mkdir(exist_ok=True)
-            torch.save(model.state_dict(), Config.MODEL_SAVE_PATH)
+            atomic_torch_save(model.state_dict(), Config.MODEL_SAVE_PATH)
             print(f"✓ Best model saved! (Val Loss: {val_loss:.4f} | Val Acc: {val_acc * 100:.2f}%)")
         else:
             patience_counter += 1
             print(f"✗ No improvement. Patience: {patience_counter}/{Config.PATIENCE}")
         
         # Early stopping
-        if patience_counter >= Config.PATIENCE:
+        stop = patience_counter >= Config.PATIENCE
+        checkpoint(epoch + 1, epoch_progress,
+                   completed=stop or epoch + 1 == Config.NUM_EPOCHS)
+        if stop:
             print(f"\nEarly stopping triggered after {epoch + 1} epochs")
             break
     
@@ -383,7 +633,36 @@ def train_model():
 
 
 if __name__ == "__main__":
-    model, history = train_model()
+    parser = argparse.ArgumentParser(description="Train the cardamom leaf disease classifier.")
+    parser.add_argument("--packed", nargs="?", const="dataset_packed", default=None,
+                        help="Train from packed shards (default dir: dataset_packed)")
+    parser.add_argument("--manifest", default=None,
+                        help="Train from a split manifest (split_dataset.py --manifest) instead of dataset/")
+    parser.add_argument("--batch-augment", action="store_true",
+                        help="Augment collated uint8 batches with vectorised tensor ops")
+    parser.add_argument("--balance", nargs="?", const="max", default=None,
+                        help="Class-balanced sampling per epoch: max (default), mean, a count, "
+                             "or class=count,... – replaces augment*.py copies")
+    parser.add_argument("--resume", nargs="?", const=Config.CHECKPOINT_PATH, default=None,
+                        help=f"Continue from a training checkpoint (default: {Config.CHECKPOINT_PATH})")
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="Also write a checkpoint every N training batches (default: epoch ends only)")
+    parser.add_argument("--cpu-precision", choices=PRECISIONS, default="fp32",
+                        help="CPU training precision; bf16/auto use bf16 autocast + channels_last "
+                             "when the CPU supports it (default: fp32)")
+    args = parser.parse_args()
+
+    if args.packed and args.manifest:
+        print("❌ --packed and --manifest cannot be combined")
+        sys.exit(1)
+    if args.resume and not Path(args.resume).exists():
+        print(f"❌ Checkpoint not found: {args.resume}")
+        sys.exit(1)
+
+    model, history = train_model(packed_path=args.packed, batch_augment=args.batch_augment,
+                                 resume=args.resume, checkpoint_every=args.checkpoint_every,
+                                 cpu_precision=args.cpu_precision, manifest=args.manifest,
+                                 balance=args.balance)
     
     # Optional: Plot training history
     try:
@@ -0,0 +1,301 @@
+"""
+Linear-probe / head-only training on cached backbone features.
+
+Most retraining only tunes the classifier head (Dropout → Linear 512 → ReLU →
+Dropout → Linear) on top of a frozen EfficientNetV2-S trunk.  Running the
+trunk every epoch is wasted work in that case, so this script:
+
+  1. runs the frozen trunk once over train/val and stores the pooled 1280-d
+     features in memory-mapped float16 files under --cache-dir (optionally
+     K augmented views per training image; view 0 is always the clean one);
+  2. trains the head on the cached features – seconds per epoch on CPU;
+  3. writes a full model state_dict (trunk + trained head) that
+     DiseaseClassifier._load_weights and evaluate.py load directly.
+
+Feature files are keyed by trunk weights, split contents, view count and
+image size, so re-running with different head hyper-parameters skips step 1.
+
+Usage:
+    cd backend
+    python train_head.py                                  # ImageNet trunk, dataset/
+    python train_head.py --views 4                        # + 3 augmented views per image
+    python train_head.py --trunk models/cardamom_model.pt # re-tune the head of a trained model
+    python train_head.py --packed dataset_packed --output models/cardamom_head.pt
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+from torchvision import datasets
+from tqdm import tqdm
+
+from app.utils.packed_dataset import open_packed_split
+from train import Config, create_model, get_data_transforms
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+FEATURE_DIM = 1280
+HEAD_BATCH_SIZE = 256
+HEAD_EPOCHS = 100
+HEAD_LEARNING_RATE = 1e-3
+HEAD_PATIENCE = 10
+RANDOM_SEED = 42
+DEFAULT_CACHE_DIR = ".cache/features"
+DEFAULT_OUTPUT = "models/cardamom_model_head.pt"
+
+
+# ---------------------------------------------------------------------------
+# Trunk
+# ---------------------------------------------------------------------------
+
+
+def build_model(trunk_path: str | None) -> nn.Module:
+    """Return the full classifier with ImageNet or checkpoint trunk weights."""
+    model = create_model()
+    if trunk_path:
+        state = torch.load(trunk_path, map_location="cpu")
+        if isinstance(state, dict) and "state_dict" in state:
+            state = state["state_dict"]
+        model.load_state_dict(state)
+    return model
+
+
+def pooled_features(model: nn.Module, inputs: torch.Tensor) -> torch.Tensor:
+    """Pooled (B, 1280) trunk output – the input of model.classifier."""
+    return torch.flatten(model.avgpool(model.features(inputs)), 1)
+
+
+def trunk_fingerprint(trunk_path: str | None) -> str:
+    if not trunk_path:
+        return "imagenet:efficientnet_v2_s"
+    st = os.stat(trunk_path)
+    return f"{os.path.abspath(trunk_path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+# ---------------------------------------------------------------------------
+# Feature cache
+# ---------------------------------------------------------------------------
+
+
+def feature_cache_path(cache_dir: Path, split: str, samples: list, trunk: str, views: int) -> Path:
+    key = json.dumps({
+        "trunk": trunk, "split": split, "views": views,
+        "img_size": Config.IMG_SIZE, "seed": RANDOM_SEED,
+        "samples": [(str(p), int(t)) for p, t in samples],
+    }, sort_keys=True)
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return cache_dir / f"{split}_{digest}.npy"
+
+
+def extract_features(
+    model: nn.Module,
+    dataset_for_view,
+    n_images: int,
+    views: int,
+    out_path: Path,
+    num_workers: int,
+) -> np.ndarray:
+    """Fill a (views, N, 1280) float16 memmap at *out_path* and return it.
+
+    The file is written under a temporary name and renamed when complete, so
+    an interrupted run never leaves a cache entry that looks finished.
+    """
+    if out_path.exists():
+        print(f"✅ Using cached features: {out_path}")
+        return np.load(out_path, mmap_mode="r")
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".tmp.npy")
+    feats = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float16, shape=(views, n_images, FEATURE_DIM)
+    )
+    model.eval()
+    for view in range(views):
+        torch.manual_seed(RANDOM_SEED + view)
+        loader = DataLoader(dataset_for_view(view), batch_size=Config.BATCH_SIZE,
+                            shuffle=False, num_workers=num_workers)
+        pos = 0
+        with torch.no_grad():
+            for inputs, _ in tqdm(loader, desc=f"{out_path.stem} view {view + 1}/{views}"):
+                f = pooled_features(model, inputs.to(Config.DEVICE))
+                feats[view, pos:pos + f.shape[0]] = f.cpu().numpy().astype(np.float16)
+                pos += f.shape[0]
+    feats.flush()
+    del feats
+    os.replace(tmp_path, out_path)
+    return np.load(out_path, mmap_mode="r")
+
+
+# ---------------------------------------------------------------------------
+# Head training
+# ---------------------------------------------------------------------------
+
+
+def train_head(
+    head: nn.Module,
+    train_feats: np.ndarray,
+    train_labels: np.ndarray,
+    val_feats: np.ndarray,
+    val_labels: np.ndarray,
+    class_weights: torch.Tensor,
+) -> tuple[dict, float, float]:
+    """Train *head* on cached features; return (best_state, best_loss, best_acc).
+
+    Every epoch each training image contributes one randomly chosen view.
+    """
+    device = Config.DEVICE
+    head.to(device)
+    criterion = nn.CrossEntropyLoss(weight=class_weights.to(device), label_smoothing=0.1)
+    optimizer = optim.Adam(head.parameters(), lr=HEAD_LEARNING_RATE)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode="min", factor=0.5, patience=5)
+    rng = np.random.default_rng(RANDOM_SEED)
+
+    views, n_train, _ = train_feats.shape
+    y_train = torch.from_numpy(train_labels).long()
+    x_val = torch.from_numpy(np.asarray(val_feats[0], dtype=np.float32)).to(device)
+    y_val = torch.from_numpy(val_labels).long().to(device)
+
+    best_state, best_loss, best_acc = None, float("inf"), 0.0
+    patience_counter = 0
+    for epoch in range(HEAD_EPOCHS):
+        start = time.time()
+        head.train()
+        order = rng.permutation(n_train)
+        view_idx = rng.integers(0, views, size=n_train)
+        running = 0.0
+        for i in range(0, n_train, HEAD_BATCH_SIZE):
+            idx = order[i:i + HEAD_BATCH_SIZE]
+            x = torch.from_numpy(np.asarray(train_feats[view_idx[idx], idx], dtype=np.float32)).to(device)
+            y = y_train[idx].to(device)
+            optimizer.zero_grad()
+            loss = criterion(head(x), y)
+            loss.backward()
+            optimizer.step()
+            running += loss.item() * len(idx)
+
+        head.eval()
+        with torch.no_grad():
+            out = head(x_val)
+            val_loss = criterion(out, y_val).item()
+            val_acc = (out.argmax(dim=1) == y_val).float().mean().item()
+        scheduler.step(val_loss)
+
+        improved = val_loss < best_loss - 1e-4
+        if improved:
+            best_loss, best_acc, patience_counter = val_loss, val_acc, 0
+            best_state = {k: v.detach().cpu().clone() for k, v in head.state_dict().items()}
+        else:
+            patience_counter += 1
+        print(f"  Epoch {epoch + 1:3d} | train_loss={running / n_train:.4f} "
+              f"| val_loss={val_loss:.4f} | val_acc={val_acc * 100:.2f}% "
+              f"| {time.time() - start:.2f}s{'  ✓' if improved else ''}")
+        if patience_counter >= HEAD_PATIENCE:
+            print(f"  Early stopping at epoch {epoch + 1}")
+            break
+
+    return best_state, best_loss, best_acc
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the classifier head on cached trunk features.")
+    parser.add_argument("--packed", nargs="?", const="dataset_packed", default=None,
+                        help="Read packed shards instead of dataset/ (default dir: dataset_packed)")
+    parser.add_argument("--trunk", default=None,
+                        help="Checkpoint to take the frozen trunk from (default: ImageNet weights)")
+    parser.add_argument("--views", type=int, default=1,
+                        help="Feature views per training image; view 0 is un-augmented (default: 1)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Feature cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help=f"Checkpoint to write (default: {DEFAULT_OUTPUT})")
+    parser.add_argument("--workers", type=int, default=4, help="DataLoader workers for extraction")
+    args = parser.parse_args()
+
+    torch.manual_seed(RANDOM_SEED)
+    views = max(1, args.views)
+    data_root = Path(args.packed or Config.DATASET_PATH)
+    for split in ("train", "val"):
+        if not (data_root / split).exists():
+            hint = "pack_dataset.py" if args.packed else "split_dataset.py"
+            print(f"❌ Missing split: {data_root / split}/  (run {hint})")
+            sys.exit(1)
+
+    print("\n" + "=" * 60)
+    print("HEAD TRAINING ON CACHED FEATURES")
+    print(f"Device : {Config.DEVICE}")
+    print(f"Data   : {data_root}/{'  (packed)' if args.packed else ''}")
+    print(f"Trunk  : {args.trunk or 'ImageNet EfficientNetV2-S'}")
+    print(f"Views  : {views}")
+    print("=" * 60)
+
+    train_tf, val_tf = get_data_transforms()
+
+    def open_split(split, transform):
+        if args.packed:
+            return open_packed_split(data_root, split, transform)
+        return datasets.ImageFolder(str(data_root / split), transform=transform)
+
+    train_clean = open_split("train", val_tf)
+    train_aug = open_split("train", train_tf)
+    val_ds = open_split("val", val_tf)
+    print(f"Train: {len(train_clean)}  |  Val: {len(val_ds)}  |  Classes: {train_clean.classes}")
+
+    model = build_model(args.trunk).to(Config.DEVICE)
+    trunk = trunk_fingerprint(args.trunk)
+    cache_dir = Path(args.cache_dir)
+
+    train_feats = extract_features(
+        model, lambda v: train_clean if v == 0 else train_aug, len(train_clean), views,
+        feature_cache_path(cache_dir, "train", train_clean.samples, trunk, views), args.workers,
+    )
+    val_feats = extract_features(
+        model, lambda v: val_ds, len(val_ds), 1,
+        feature_cache_path(cache_dir, "val", val_ds.samples, trunk, 1), args.workers,
+    )
+
+    train_labels = np.asarray(train_clean.targets, dtype=np.int64)
+    val_labels = np.asarray(val_ds.targets, dtype=np.int64)
+    class_counts = np.bincount(train_labels, minlength=Config.NUM_CLASSES).astype(float)
+    class_weights = torch.tensor(class_counts.sum() / (Config.NUM_CLASSES * class_counts),
+                                 dtype=torch.float32)
+
+    print("\nTraining head ...")
+    head = model.classifier
+    best_state, best_loss, best_acc = train_head(
+        head, train_feats, train_labels, val_feats, val_labels, class_weights
+    )
+    if best_state is None:
+        print("❌ Head training produced no checkpoint.")
+        sys.exit(1)
+    head.load_state_dict(best_state)
+
+    # Full state_dict (trunk + head) – same format train.py saves.
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    torch.save({k: v.cpu() for k, v in model.state_dict().items()}, output)
+
+    print("\n" + "=" * 60)
+    print(f"Best validation loss: {best_loss:.4f}")
+    print(f"Val accuracy at best loss: {best_acc * 100:.2f}%")
+    print(f"✅ Model saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ Usage
         --leaf-mask-dir  data/masks/leaf \\
         --lesion-mask-dir  data/masks/lesion \\
         --output  data/severity_labels.csv \\
-        [--stage-thresholds "0,10,25,50,100"]
+        [--stage-thresholds "0,10,25,50,100"] [--workers 8]
 
 The script expects corresponding files in each directory to share the same
 base filename (stem), e.g.::
@@ -30,6 +30,12 @@ The output CSV has columns:
 
 If ``--output`` already exists the rows are merged (updated) by
 ``image_path``.
+
+Each mask directory is scanned once to build a stem → path index, mask pairs
+are scored in a process pool (``--workers``), and rows are streamed to a
+temporary file that replaces ``--output`` when the run finishes.  Freshly
+computed rows come first, followed by the existing rows that were not
+recomputed; the existing CSV is read row by row, never held in memory.
 """
 
 from __future__ import annotations
@@ -38,7 +44,9 @@ import argparse
 import csv
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Iterator
 
 import numpy as np
 from PIL import Image
@@ -82,10 +90,26 @@ def map_percent_to_stage(percent: float, thresholds: list[float]) -> int:
 _IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp"}
 
 
+# Preferred extension when several masks share a stem (earlier wins).
+_MASK_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tiff")
+
+FIELDNAMES = [
+    "image_path",
+    "leaf_mask_path",
+    "lesion_mask_path",
+    "severity_percent",
+    "severity_stage",
+]
+
+
 def _mask_pixels(mask_path: Path) -> int:
     """Count foreground (> 127) pixels in a grayscale mask PNG."""
-    arr = np.array(Image.open(mask_path).convert("L"))
-    return int((arr > 127).sum())
+    with Image.open(mask_path) as img:
+        if img.mode == "1":
+            return int(np.count_nonzero(np.asarray(img)))
+        if img.mode != "L":
+            img = img.convert("L")
+        return int(np.count_nonzero(np.asarray(img) > 127))
 
 
 def compute_severity(leaf_mask: Path, lesion_mask: Path) -> float:
@@ -102,13 +126,41 @@ def compute_severity(leaf_mask: Path, lesion_mask: Path) -> float:
 # ---------------------------------------------------------------------------
 
 
-def _find_mask(mask_dir: Path, stem: str) -> Path | None:
-    """Search for a mask file matching *stem* (any image extension)."""
-    for ext in (".png", ".jpg", ".jpeg", ".bmp", ".tiff"):
-        candidate = mask_dir / (stem + ext)
-        if candidate.exists():
-            return candidate
-    return None
+def _index_masks(mask_dir: Path) -> dict[str, Path]:
+    """Map file stem → mask path with a single scan of *mask_dir*."""
+    priority = {ext: i for i, ext in enumerate(_MASK_EXTENSIONS)}
+    index: dict[str, tuple[int, Path]] = {}
+    with os.scandir(mask_dir) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            rank = priority.get(ext)
+            if rank is None or not entry.is_file():
+                continue
+            current = index.get(stem)
+            if current is None or rank < current[0]:
+                index[stem] = (rank, mask_dir / entry.name)
+    return {stem: path for stem, (_, path) in index.items()}
+
+
+def _score(job: tuple[str, str, str]) -> tuple[str, str, str, float | None, str | None]:
+    """Worker: return (image, leaf, lesion, percent, error) for one mask pair."""
+    img_path, leaf_mask, lesion_mask = job
+    try:
+        pct = compute_severity(Path(leaf_mask), Path(lesion_mask))
+    except Exception as exc:
+        return img_path, leaf_mask, lesion_mask, None, str(exc)
+    return img_path, leaf_mask, lesion_mask, pct, None
+
+
+def _iter_scores(
+    jobs: list[tuple[str, str, str]], workers: int
+) -> Iterator[tuple[str, str, str, float | None, str | None]]:
+    if workers <= 1 or len(jobs) < 2:
+        yield from map(_score, jobs)
+        return
+    chunksize = max(1, min(256, len(jobs) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_score, jobs, chunksize=chunksize)
 
 
 def run(
@@ -117,6 +169,7 @@ def run(
     lesion_mask_dir: Path,
     output_csv: Path,
     thresholds: list[float],
+    workers: int = 1,
 ) -> None:
     # Collect image files
     image_files = sorted(
@@ -127,53 +180,56 @@ def run(
         print(f"No images found in {image_dir}", file=sys.stderr)
         sys.exit(1)
 
-    # Load existing CSV rows if present (keyed by image_path)
-    existing: dict[str, dict] = {}
-    fieldnames = [
-        "image_path",
-        "leaf_mask_path",
-        "lesion_mask_path",
-        "severity_percent",
-        "severity_stage",
-    ]
-    if output_csv.exists():
-        with output_csv.open(newline="") as fh:
-            reader = csv.DictReader(fh)
-            for row in reader:
-                existing[row["image_path"]] = row
+    leaf_index = _index_masks(leaf_mask_dir)
+    lesion_index = _index_masks(lesion_mask_dir)
 
-    processed = 0
+    jobs: list[tuple[str, str, str]] = []
     skipped = 0
-
     for img_path in image_files:
-        stem = img_path.stem
-        leaf_mask = _find_mask(leaf_mask_dir, stem)
-        lesion_mask = _find_mask(lesion_mask_dir, stem)
-
+        leaf_mask = leaf_index.get(img_path.stem)
+        lesion_mask = lesion_index.get(img_path.stem)
         if leaf_mask is None or lesion_mask is None:
             skipped += 1
             continue
+        jobs.append((str(img_path), str(leaf_mask), str(lesion_mask)))
 
-        pct = compute_severity(leaf_mask, lesion_mask)
-        stage = map_percent_to_stage(pct, thresholds)
-
-        existing[str(img_path)] = {
-            "image_path": str(img_path),
-            "leaf_mask_path": str(leaf_mask),
-            "lesion_mask_path": str(lesion_mask),
-            "severity_percent": pct,
-            "severity_stage": stage,
-        }
-        processed += 1
+    processed = 0
+    failed = 0
+    written: set[str] = set()
 
-    # Write out
     output_csv.parent.mkdir(parents=True, exist_ok=True)
-    with output_csv.open("w", newline="") as fh:
-        writer = csv.DictWriter(fh, fieldnames=fieldnames)
+    tmp_csv = output_csv.with_name(output_csv.name + ".tmp")
+    with tmp_csv.open("w", newline="") as out_fh:
+        writer = csv.DictWriter(out_fh, fieldnames=FIELDNAMES, extrasaction="ignore")
         writer.writeheader()
-        writer.writerows(existing.values())
 
-    print(f"Processed: {processed}  Skipped (missing masks): {skipped}")
+        for img_path, leaf_mask, lesion_mask, pct, err in _iter_scores(jobs, workers):
+            if pct is None:
+                print(f"Failed to read masks for {img_path}: {err}", file=sys.stderr)
+                failed += 1
+                continue
+            writer.writerow({
+                "image_path": img_path,
+                "leaf_mask_path": leaf_mask,
+                "lesion_mask_path": lesion_mask,
+                "severity_percent": pct,
+                "severity_stage": map_percent_to_stage(pct, thresholds),
+            })
+            written.add(img_path)
+            processed += 1
+
+        # Carry over existing rows that were not recomputed (keyed by image_path)
+        if output_csv.exists():
+            with output_csv.open(newline="") as in_fh:
+                for row in csv.DictReader(in_fh):
+                    key = row.get("image_path")
+                    if key and key not in written:
+                        writer.writerow(row)
+                        written.add(key)
+
+    os.replace(tmp_csv, output_csv)
+
+    print(f"Processed: {processed}  Skipped (missing masks): {skipped}  Failed: {failed}")
     print(f"Output written to: {output_csv}")
 
 
@@ -213,6 +269,12 @@ def main() -> None:
             f"(default: {','.join(str(t) for t in DEFAULT_STAGE_THRESHOLDS)})."
         ),
     )
+    parser.add_argument(
+        "--workers",
+        default=os.cpu_count() or 1,
+        type=int,
+        help="Number of worker processes (default: number of CPUs; 1 = serial).",
+    )
     args = parser.parse_args()
 
     thresholds = parse_thresholds(args.stage_thresholds)
@@ -222,6 +284,7 @@ def main() -> None:
         lesion_mask_dir=args.lesion_mask_dir,
         output_csv=args.output,
         thresholds=thresholds,
+        workers=args.workers,
     )
 
 